@@ -0,0 +1 @@
+# Network analysis package
@@ -0,0 +1,265 @@
+import copy
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from data_parsing.adjacency import build_adjacency, bus_components
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_NAME = '_candidate'
+
+# Only the candidate's P/Q changes between runs, so pandapower can reuse its ppc and Ybus
+RECYCLE = {'bus_pq': True, 'trafo': False, 'gen': False}
+
+# Below this many candidates the study runs in-process rather than paying for a process pool
+MIN_PARALLEL_CANDIDATES = 8
+
+
+@dataclass
+class Candidate:
+    """A potential new load or generator. Give either a bus label or a lat/lon to attach to the nearest bus."""
+    name: str
+    p_mw: float
+    q_mvar: float = 0.0
+    kind: str = 'load'  # 'load' or 'sgen'
+    bus: object = None
+    lat: float = None
+    lon: float = None
+
+
+@dataclass
+class StudyResult:
+    """Results of a connection study for a batch of candidates.
+
+    summary has one row per candidate; vm_delta_pu (candidates x buses) and loading_percent
+    (candidates x lines) are aligned with bus_index and line_index. Buses not connected to a slack
+    and candidates whose power flow did not converge come back as NaN.
+    """
+    summary: pd.DataFrame
+    bus_index: pd.Index
+    line_index: pd.Index
+    base_vm_pu: np.ndarray
+    base_loading_percent: np.ndarray
+    vm_delta_pu: np.ndarray
+    loading_percent: np.ndarray
+    timings: dict = field(default_factory=dict)
+
+
+def add_island_slacks(net, vm_pu=1.0):
+    """Add an ext_grid at the best-connected bus of every multi-bus island (joined by lines or transformers)
+    that has no slack yet.
+
+    The Transpower and Vector nets are built without any sources, so a power flow needs at least one
+    slack per island. Returns the list of buses that were given an ext_grid.
+    """
+    adjacency = build_adjacency(net, in_service_only=True)
+    n_islands, labels = bus_components(net, in_service_only=True)
+    degree = adjacency.degree()
+    sizes = np.bincount(labels, minlength=n_islands)
+    has_slack = np.zeros(n_islands, dtype=bool)
+    slack_buses = net.ext_grid.loc[net.ext_grid['in_service'].astype(bool), 'bus'].to_numpy()
+    has_slack[labels[adjacency.bus_index.get_indexer(slack_buses)]] = True
+
+    added = []
+    for island in np.flatnonzero((sizes > 1) & ~has_slack):
+        members = np.flatnonzero(labels == island)
+        bus = adjacency.bus_index[members[np.argmax(degree[members])]]
+        pp.create_ext_grid(net, bus=bus, vm_pu=vm_pu, name=f"slack_{net.bus.at[bus, 'name']}")
+        added.append(bus)
+    logger.info(f"Added {len(added)} island slack(s) across {n_islands} islands")
+    return added
+
+
+def prepare_study_net(net):
+    """Return a study-ready copy of a network: island slacks, idle candidate elements and a solved base case.
+
+    An idle (zero power, in service) candidate load and sgen are created on every bus, so running a
+    candidate only changes P/Q values and never which buses carry injections. That keeps pandapower's
+    recycled ppc/Ybus valid between candidates: its bus_pq recycle only rewrites buses that have
+    elements, so moving a single candidate element between buses would leave a stale injection behind.
+    """
+    study_net = copy.deepcopy(net)
+    if study_net.ext_grid.empty:
+        add_island_slacks(study_net)
+    buses = study_net.bus.index
+    pp.create_loads(study_net, buses=buses, p_mw=0.0, q_mvar=0.0, name=CANDIDATE_NAME)
+    pp.create_sgens(study_net, buses=buses, p_mw=0.0, q_mvar=0.0, name=CANDIDATE_NAME)
+    pp.runpp(study_net)
+    return study_net
+
+
+def resolve_candidate_buses(candidates, spatial_index=None, network='transpower'):
+    """Return the bus label for each candidate, looking up lat/lon candidates in the spatial index in one batch."""
+    buses = [c.bus for c in candidates]
+    needs_lookup = [i for i, c in enumerate(candidates) if c.bus is None]
+    if needs_lookup:
+        if spatial_index is None:
+            raise ValueError("Candidates without a bus need a spatial index to find the nearest bus")
+        lat = np.array([candidates[i].lat for i in needs_lookup], dtype=float)
+        lon = np.array([candidates[i].lon for i in needs_lookup], dtype=float)
+        rows, _ = spatial_index.nearest_wgs84(lat, lon, k=1, networks=[network])
+        bus_idx = spatial_index.sites['bus_idx'].to_numpy()
+        for i, row in zip(needs_lookup, rows[:, 0]):
+            if row < 0:
+                raise ValueError(f"No {network} bus found near candidate {candidates[i].name}")
+            buses[i] = bus_idx[row]
+    return buses
+
+
+class _CandidateRunner:
+    """Holds one prepared study net and runs candidates against it, recycling the internal ppc/Ybus."""
+
+    def __init__(self, study_net):
+        self.net = study_net
+        loads = study_net.load[study_net.load['name'] == CANDIDATE_NAME]
+        sgens = study_net.sgen[study_net.sgen['name'] == CANDIDATE_NAME]
+        self.load_for_bus = pd.Series(loads.index, index=loads['bus'].to_numpy())
+        self.sgen_for_bus = pd.Series(sgens.index, index=sgens['bus'].to_numpy())
+        # Solve the base case here so the internal ppc/Ybus exist in this process (they don't survive pickling)
+        pp.runpp(self.net)
+        self.base_vm_pu = self.net.res_bus['vm_pu'].to_numpy(dtype=float, copy=True)
+        self.base_loading_percent = self.net.res_line['loading_percent'].to_numpy(dtype=float, copy=True)
+
+    def run(self, candidate, bus):
+        if candidate.kind == 'sgen':
+            element, idx = self.net.sgen, self.sgen_for_bus[bus]
+        else:
+            element, idx = self.net.load, self.load_for_bus[bus]
+        element.at[idx, 'p_mw'] = candidate.p_mw
+        element.at[idx, 'q_mvar'] = candidate.q_mvar
+        start = time.perf_counter()
+        try:
+            pp.runpp(self.net, recycle=RECYCLE)
+            converged = True
+            vm_pu = self.net.res_bus['vm_pu'].to_numpy(dtype=float, copy=True)
+            # Copy: pandapower writes the next solve's results into the same arrays
+            loading = self.net.res_line['loading_percent'].to_numpy(dtype=float, copy=True)
+        except pp.LoadflowNotConverged:
+            converged = False
+            vm_pu = np.full(len(self.net.bus), np.nan)
+            loading = np.full(len(self.net.line), np.nan)
+        finally:
+            element.at[idx, 'p_mw'] = 0.0
+            element.at[idx, 'q_mvar'] = 0.0
+        if not converged:
+            # Start the next candidate from a clean base case rather than from a failed solve
+            pp.runpp(self.net)
+        return converged, vm_pu - self.base_vm_pu, loading, time.perf_counter() - start
+
+
+_worker_runner = None
+
+
+def _init_worker(study_net):
+    global _worker_runner
+    _worker_runner = _CandidateRunner(study_net)
+
+
+def _run_in_worker(task):
+    candidate, bus = task
+    try:
+        return _worker_runner.run(candidate, bus)
+    except Exception as e:
+        logger.error(f"Error running candidate {candidate.name}: {e}")
+        logger.error(traceback.format_exc())
+        n_bus, n_line = len(_worker_runner.net.bus), len(_worker_runner.net.line)
+        return False, np.full(n_bus, np.nan), np.full(n_line, np.nan), 0.0
+
+
+def _summarize(candidates, buses, outcomes, study_net):
+    """Return (summary, vm_delta, loading) for candidates and their run outcomes, in order."""
+    n_bus, n_line = len(study_net.bus), len(study_net.line)
+    vm_delta = np.vstack([o[1] for o in outcomes]) if outcomes else np.empty((0, n_bus))
+    loading = np.vstack([o[2] for o in outcomes]) if outcomes else np.empty((0, n_line))
+    with np.errstate(all='ignore'):
+        summary = pd.DataFrame({
+            'name': [c.name for c in candidates],
+            'kind': [c.kind for c in candidates],
+            'bus': buses,
+            'bus_name': study_net.bus['name'].reindex(buses).to_numpy(),
+            'p_mw': [c.p_mw for c in candidates],
+            'q_mvar': [c.q_mvar for c in candidates],
+            'converged': [o[0] for o in outcomes],
+            'max_abs_vm_delta_pu': np.nanmax(np.abs(vm_delta), axis=1, initial=0.0) if n_bus else 0.0,
+            'max_loading_percent': np.nanmax(loading, axis=1, initial=0.0) if n_line else 0.0,
+            'overloaded_lines': (loading > 100.0).sum(axis=1),
+            'solve_s': [o[3] for o in outcomes],
+        })
+    summary.loc[~summary['converged'], ['max_abs_vm_delta_pu', 'max_loading_percent']] = np.nan
+    return summary, vm_delta, loading
+
+
+def run_connection_study(net, candidates, spatial_index=None, max_workers=None, study_net=None,
+                         batch_size=None, on_batch=None, network='transpower'):
+    """Run a power flow for every candidate load/generator and report voltage deltas and line loadings.
+
+    The base net is prepared once (see prepare_study_net) and shipped to each worker of a process
+    pool, which keeps it for the whole study and reuses pandapower's internal ppc/Ybus between
+    candidates instead of deep-copying the net per run. Pass a prepared study_net to skip the
+    preparation step. Candidates given by lat/lon are snapped to the nearest bus of network
+    in spatial_index, which should be the network net is.
+
+    on_batch, if given, is called with the summary rows of every batch_size candidates (in order)
+    as their results arrive, so long studies can report partial results from the one pool.
+    """
+    timings = {}
+    start = time.perf_counter()
+    if study_net is None:
+        study_net = prepare_study_net(net)
+    else:
+        # Runs mutate the net they are given, so keep the caller's prepared net untouched
+        study_net = copy.deepcopy(study_net)
+    timings['prepare_s'] = time.perf_counter() - start
+
+    buses = resolve_candidate_buses(candidates, spatial_index, network)
+    missing = [b for b in buses if b not in study_net.bus.index]
+    if missing:
+        raise ValueError(f"Unknown candidate buses: {missing[:10]}")
+
+    base_vm_pu = study_net.res_bus['vm_pu'].to_numpy(dtype=float, copy=True)
+    base_loading_percent = study_net.res_line['loading_percent'].to_numpy(dtype=float, copy=True)
+    tasks = list(zip(candidates, buses))
+    batch_size = batch_size or len(tasks) or 1
+    max_workers = max_workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    pool = None
+    if max_workers == 1 or len(tasks) < MIN_PARALLEL_CANDIDATES:
+        _init_worker(study_net)
+        results = map(_run_in_worker, tasks)
+    else:
+        # Chunks no bigger than a batch, so each batch's results come back without waiting on the next
+        chunksize = max(1, min(len(tasks) // (max_workers * 4), batch_size))
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(study_net,))
+        results = pool.map(_run_in_worker, tasks, chunksize=chunksize)
+    outcomes = []
+    try:
+        for outcome in results:
+            outcomes.append(outcome)
+            if on_batch is not None and (len(outcomes) % batch_size == 0 or len(outcomes) == len(tasks)):
+                first, done = (len(outcomes) - 1) // batch_size * batch_size, len(outcomes)
+                on_batch(_summarize(candidates[first:done], buses[first:done], outcomes[first:], study_net)[0])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    timings['solve_s'] = time.perf_counter() - start
+    logger.info(f"Ran {len(tasks)} connection study candidates in {timings['solve_s']:.3f}s")
+
+    summary, vm_delta, loading = _summarize(candidates, buses, outcomes, study_net)
+    return StudyResult(
+        summary=summary,
+        bus_index=pd.Index(study_net.bus.index),
+        line_index=pd.Index(study_net.line.index),
+        base_vm_pu=base_vm_pu,
+        base_loading_percent=base_loading_percent,
+        vm_delta_pu=vm_delta,
+        loading_percent=loading,
+        timings=timings,
+    )
@@ -0,0 +1,314 @@
+import copy
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from analysis.connection_study import add_island_slacks
+from data_parsing.adjacency import build_adjacency
+
+logger = logging.getLogger(__name__)
+
+# Below this many outages the analysis runs in-process rather than paying for a process pool
+MIN_PARALLEL_OUTAGES = 16
+
+# Log progress roughly this often (as a fraction of all outages)
+PROGRESS_STEP = 0.1
+
+
+@dataclass
+class ContingencyResult:
+    """Results of an N-1 / substation-isolation study.
+
+    outages has one row per outage (kind 'line', 'trafo' or 'bus', the element, its name, the lines
+    and transformers it switches out, status and solve time). loading_percent (outages x monitored
+    lines) and vm_pu (outages x monitored buses) are float32 matrices aligned with line_index and
+    bus_index; de-energised buses and outages that didn't solve are NaN. Status is 'solved',
+    'radial' (skipped, see run_contingency_analysis), 'not_converged' or 'error' (the solver
+    raised something other than a convergence failure).
+    """
+    outages: pd.DataFrame
+    line_index: pd.Index
+    bus_index: pd.Index
+    base_loading_percent: np.ndarray
+    base_vm_pu: np.ndarray
+    loading_percent: np.ndarray
+    vm_pu: np.ndarray
+    timings: dict = field(default_factory=dict)
+
+    def worst(self, n=10):
+        """Return the n outages with the highest monitored line loading."""
+        outages = self.outages.copy()
+        with np.errstate(all='ignore'):
+            outages['max_loading_percent'] = np.nanmax(self.loading_percent, axis=1, initial=0.0)
+        return outages.sort_values('max_loading_percent', ascending=False).head(n)
+
+
+class _Topology:
+    """Precomputed graph view used to find outages that only drop a passive radial branch.
+
+    Branches are the in-service lines (in adjacency order) followed by the in-service transformers,
+    so buses fed through a transformer count as energised and transformers can be switched out too.
+    Outages are given as branch positions.
+    """
+
+    def __init__(self, net):
+        self.adjacency = build_adjacency(net, in_service_only=True)
+        self.bridges = self.adjacency.bridges()
+        n_bus = len(self.adjacency.bus_index)
+        bus_index = self.adjacency.bus_index
+        lines = net.line.loc[self.adjacency.line_index]
+        trafos = net.trafo[net.trafo['in_service'].astype(bool)]
+        self.trafo_index = pd.Index(trafos.index)
+        self.n_lines = len(self.adjacency.line_index)
+        self.from_pos = bus_index.get_indexer(np.concatenate([lines['from_bus'].to_numpy(), trafos['hv_bus'].to_numpy()]))
+        self.to_pos = bus_index.get_indexer(np.concatenate([lines['to_bus'].to_numpy(), trafos['lv_bus'].to_numpy()]))
+        # Three-winding transformers are never switched out here; they just keep their buses joined
+        trafo3w = net.trafo3w[net.trafo3w['in_service'].astype(bool)]
+        hv3w = bus_index.get_indexer(trafo3w['hv_bus'].to_numpy())
+        self.fixed_from = np.concatenate([hv3w, hv3w])
+        self.fixed_to = bus_index.get_indexer(np.concatenate([trafo3w['mv_bus'].to_numpy(), trafo3w['lv_bus'].to_numpy()]))
+
+        self.slack = np.zeros(n_bus, dtype=bool)
+        slack_buses = net.ext_grid.loc[net.ext_grid['in_service'].astype(bool), 'bus']
+        if len(net.gen) and 'slack' in net.gen:
+            slack_gens = net.gen['in_service'].astype(bool) & net.gen['slack'].fillna(False).astype(bool)
+            slack_buses = pd.concat([slack_buses, net.gen.loc[slack_gens, 'bus']])
+        self.slack[bus_index.get_indexer(slack_buses.to_numpy())] = True
+
+        # Buses with any non-zero in-service injection; dropping one of these always needs a solve
+        self.injection = np.zeros(n_bus, dtype=bool)
+        for table in ('load', 'sgen', 'gen', 'storage'):
+            df = net[table]
+            if len(df):
+                active = df['in_service'].astype(bool) & (df['p_mw'].fillna(0) != 0)
+                if 'q_mvar' in df:
+                    active |= df['in_service'].astype(bool) & (df['q_mvar'].fillna(0) != 0)
+                self.injection[bus_index.get_indexer(df.loc[active, 'bus'].to_numpy())] = True
+        for table in ('ward', 'xward'):
+            df = net[table]
+            if len(df):
+                self.injection[bus_index.get_indexer(df.loc[df['in_service'].astype(bool), 'bus'].to_numpy())] = True
+
+        self.base_energised = self.energised(np.zeros(len(self.from_pos), dtype=bool))
+
+    def branches(self, positions):
+        """Split branch positions into (line labels, trafo labels)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        is_line = positions < self.n_lines
+        return (self.adjacency.line_index[positions[is_line]],
+                self.trafo_index[positions[~is_line] - self.n_lines])
+
+    def energised(self, removed):
+        """Return a bus mask of buses connected to a slack with the given branch positions removed."""
+        n_bus = len(self.adjacency.bus_index)
+        keep = ~removed
+        rows = np.concatenate([self.from_pos[keep], self.fixed_from])
+        cols = np.concatenate([self.to_pos[keep], self.fixed_to])
+        graph = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_bus, n_bus))
+        _, labels = connected_components(graph, directed=False)
+        return np.isin(labels, labels[self.slack])
+
+    def radial_effect(self, line_positions):
+        """Return the newly de-energised bus mask if the outage only drops a passive radial branch, else None.
+
+        line_positions are branch positions. That is the case when no removed branch joins two buses
+        that stay energised, the dropped part has no injections, and it hung off the energised network
+        by a single branch. The rest of the network then sees no change apart from the branch's line
+        charging and transformer magnetising losses, which are neglected.
+        """
+        if len(line_positions) == 1 and line_positions[0] < self.n_lines:
+            # Fast path: losing a line that is meshed even without the transformers always needs a solve
+            pos = line_positions[0]
+            if not self.bridges[pos] and self.base_energised[self.from_pos[pos]] and self.base_energised[self.to_pos[pos]]:
+                return None
+        removed = np.zeros(len(self.from_pos), dtype=bool)
+        removed[line_positions] = True
+        energised = self.energised(removed)
+        dropped = self.base_energised & ~energised
+        if (removed & energised[self.from_pos] & energised[self.to_pos]).any():
+            return None
+        if self.injection[dropped].any():
+            return None
+        boundary = (energised[self.from_pos] & dropped[self.to_pos]) | (dropped[self.from_pos] & energised[self.to_pos])
+        if boundary.sum() > 1:
+            return None
+        return dropped
+
+
+class _OutageRunner:
+    """Holds one solved base net and re-solves it per outage, warm-started from the base-case voltages."""
+
+    def __init__(self, net):
+        self.net = net
+        pp.runpp(self.net)
+        self.base_res_bus = self.net.res_bus[['vm_pu', 'va_degree']].copy()
+
+    def run(self, branches):
+        lines, trafos = branches
+        start = time.perf_counter()
+        self.net.line.loc[lines, 'in_service'] = False
+        self.net.trafo.loc[trafos, 'in_service'] = False
+        self.net.res_bus[['vm_pu', 'va_degree']] = self.base_res_bus
+        try:
+            pp.runpp(self.net, init='results')
+            status = 'solved'
+            loading = self.net.res_line['loading_percent'].to_numpy(dtype=np.float32, copy=True)
+            vm_pu = self.net.res_bus['vm_pu'].to_numpy(dtype=np.float32, copy=True)
+        except pp.LoadflowNotConverged:
+            status = 'not_converged'
+            loading = np.full(len(self.net.line), np.nan, dtype=np.float32)
+            vm_pu = np.full(len(self.net.bus), np.nan, dtype=np.float32)
+        finally:
+            self.net.line.loc[lines, 'in_service'] = True
+            self.net.trafo.loc[trafos, 'in_service'] = True
+        return status, loading, vm_pu, time.perf_counter() - start
+
+
+_worker_runner = None
+
+
+def _init_worker(net):
+    global _worker_runner
+    _worker_runner = _OutageRunner(net)
+
+
+def _run_in_worker(branches):
+    try:
+        return _worker_runner.run(branches)
+    except Exception as e:
+        logger.error(f"Error running outage of lines {list(branches[0])}, transformers {list(branches[1])}: {e}")
+        logger.error(traceback.format_exc())
+        n_line, n_bus = len(_worker_runner.net.line), len(_worker_runner.net.bus)
+        return 'error', np.full(n_line, np.nan, dtype=np.float32), np.full(n_bus, np.nan, dtype=np.float32), 0.0
+
+
+def define_outages(net, kinds=('line', 'bus'), topology=None):
+    """List the outages to study: each in-service line, each in-service transformer, and each bus with all
+    of its lines and transformers switched out. Each outage's branches are _Topology branch positions.
+    """
+    if topology is None:
+        topology = _Topology(net)
+    adjacency, n_lines = topology.adjacency, topology.n_lines
+    outages = []
+    if 'line' in kinds:
+        for pos, line in enumerate(adjacency.line_index):
+            outages.append(('line', line, str(net.line.at[line, 'name']), [pos]))
+    if 'trafo' in kinds:
+        for pos, trafo in enumerate(topology.trafo_index, start=n_lines):
+            outages.append(('trafo', trafo, str(net.trafo.at[trafo, 'name']), [pos]))
+    if 'bus' in kinds:
+        trafo_pos = {}
+        for pos in range(n_lines, len(topology.from_pos)):
+            for bus_pos in (topology.from_pos[pos], topology.to_pos[pos]):
+                trafo_pos.setdefault(bus_pos, set()).add(pos)
+        for pos, bus in enumerate(adjacency.bus_index):
+            start, stop = adjacency.indptr[pos], adjacency.indptr[pos + 1]
+            branches = set(adjacency.line_pos[start:stop].tolist()) | trafo_pos.get(pos, set())
+            if branches:
+                outages.append(('bus', bus, str(net.bus.at[bus, 'name']), sorted(branches)))
+    return outages
+
+
+def run_contingency_analysis(net, kinds=('line', 'bus'), max_workers=None, progress=None, skip_radial=True):
+    """Run N-1 line and/or transformer outages and substation isolations across a process pool.
+
+    Every outage is solved from the base-case voltages (warm start). Outages that only drop a
+    passive radial branch (no loads or generation, attached by a single line or transformer) are
+    not solved: their result is the base case with the dropped buses de-energised (pass
+    skip_radial=False to solve them anyway). The net is copied once; if it has no ext_grid, island
+    slacks are added as for connection studies. progress, if given, is called as
+    progress(done, total) as results arrive.
+    """
+    timings = {}
+    start = time.perf_counter()
+    study_net = copy.deepcopy(net)
+    if study_net.ext_grid.empty:
+        add_island_slacks(study_net)
+    topology = _Topology(study_net)
+    outages = define_outages(study_net, kinds, topology)
+    timings['prepare_s'] = time.perf_counter() - start
+
+    runner = _OutageRunner(study_net)
+    base_loading = study_net.res_line['loading_percent'].to_numpy(dtype=np.float32, copy=True)
+    base_vm = study_net.res_bus['vm_pu'].to_numpy(dtype=np.float32, copy=True)
+    line_index = pd.Index(study_net.line.index)
+    line_pos_in_net = line_index.get_indexer(topology.adjacency.line_index)
+
+    n = len(outages)
+    loading = np.empty((n, len(line_index)), dtype=np.float32)
+    vm_pu = np.empty((n, len(study_net.bus)), dtype=np.float32)
+    status = np.empty(n, dtype=object)
+    solve_s = np.zeros(n)
+
+    # Resolve radial outages up front; only the rest go to the pool
+    start = time.perf_counter()
+    to_solve = []
+    for i, (_, _, _, line_positions) in enumerate(outages):
+        dropped = topology.radial_effect(line_positions) if skip_radial else None
+        if dropped is None:
+            to_solve.append(i)
+            continue
+        row_loading = base_loading.copy()
+        n_lines = topology.n_lines
+        touches_dropped = (dropped[topology.from_pos] | dropped[topology.to_pos])[:n_lines]
+        # Match pandapower: switched-out lines and lines into de-energised buses have no result
+        row_loading[line_pos_in_net[touches_dropped]] = np.nan
+        row_loading[line_pos_in_net[[pos for pos in line_positions if pos < n_lines]]] = np.nan
+        row_vm = base_vm.copy()
+        row_vm[dropped] = np.nan
+        loading[i], vm_pu[i], status[i] = row_loading, row_vm, 'radial'
+    timings['topology_check_s'] = time.perf_counter() - start
+    logger.info(f"Contingency analysis: {n} outages, {n - len(to_solve)} skipped as radial, {len(to_solve)} to solve")
+
+    tasks = [topology.branches(outages[i][3]) for i in to_solve]
+    max_workers = max_workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if max_workers == 1 or len(tasks) < MIN_PARALLEL_OUTAGES:
+        results = map(runner.run, tasks)
+        pool = None
+    else:
+        chunksize = max(1, len(tasks) // (max_workers * 8))
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(study_net,))
+        results = pool.map(_run_in_worker, tasks, chunksize=chunksize)
+    try:
+        next_report = PROGRESS_STEP
+        for done, (i, (row_status, row_loading, row_vm, seconds)) in enumerate(zip(to_solve, results), start=1):
+            loading[i], vm_pu[i], status[i], solve_s[i] = row_loading, row_vm, row_status, seconds
+            if progress is not None:
+                progress(done, len(tasks))
+            if done / len(tasks) >= next_report:
+                logger.info(f"Solved {done}/{len(tasks)} outages ({time.perf_counter() - start:.1f}s)")
+                next_report += PROGRESS_STEP
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    timings['solve_s'] = time.perf_counter() - start
+
+    outage_df = pd.DataFrame({
+        'kind': [o[0] for o in outages],
+        'element': [o[1] for o in outages],
+        'name': [o[2] for o in outages],
+        'lines_out': [sum(pos < topology.n_lines for pos in o[3]) for o in outages],
+        'trafos_out': [sum(pos >= topology.n_lines for pos in o[3]) for o in outages],
+        'status': status,
+        'solve_s': solve_s,
+    })
+    return ContingencyResult(
+        outages=outage_df,
+        line_index=line_index,
+        bus_index=pd.Index(study_net.bus.index),
+        base_loading_percent=base_loading,
+        base_vm_pu=base_vm,
+        loading_percent=loading,
+        vm_pu=vm_pu,
+        timings=timings,
+    )
@@ -0,0 +1,133 @@
+import copy
+import hashlib
+import logging
+import warnings
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+import pandapower.shortcircuit as sc
+
+from analysis.connection_study import add_island_slacks
+from data_parsing.adjacency import build_adjacency
+
+logger = logging.getLogger(__name__)
+
+# Short-circuit strength assumed for the grid behind each island's source, where the net has none
+# (the Transpower and Vector nets are built without generation data)
+FAULT_SOURCE = {'s_sc_max_mva': 10000.0, 's_sc_min_mva': 8000.0, 'rx_max': 0.1, 'rx_min': 0.1}
+
+# Conductor end temperature for the minimum fault current case (IEC 60909)
+LINE_END_TEMP_DEGREE = 80.0
+
+FAULT_COLUMNS = ['ikss_max_ka', 'skss_max_mw', 'rk_max_ohm', 'xk_max_ohm', 'ikss_min_ka', 'skss_min_mw']
+
+# Columns whose values determine an island's fault levels, and so go into its key
+_BUS_KEY = ['vn_kv', 'in_service']
+_LINE_KEY = ['from_bus', 'to_bus', 'length_km', 'r_ohm_per_km', 'x_ohm_per_km', 'c_nf_per_km', 'parallel']
+_SOURCE_KEY = ['bus', 'vm_pu', 'va_degree', 's_sc_max_mva', 's_sc_min_mva', 'rx_max', 'rx_min']
+
+
+def _settings_digest():
+    settings = repr((sorted(FAULT_SOURCE.items()), LINE_END_TEMP_DEGREE, pp.__version__))
+    return hashlib.sha256(settings.encode('utf-8')).digest()
+
+
+def _key_columns(frame, columns):
+    """Return the key columns of a table as a float64 matrix, NaN where a column is missing."""
+    values = np.full((len(frame), len(columns)), np.nan)
+    for i, col in enumerate(columns):
+        if col in frame:
+            values[:, i] = pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype=float)
+    return values
+
+
+def _group_rows(labels, values):
+    """Split the rows of values by island label; return {label: rows}."""
+    order = np.argsort(labels, kind='stable')
+    labels, values = labels[order], values[order]
+    bounds = np.flatnonzero(np.diff(labels)) + 1
+    return {int(group[0]): rows for group, rows in zip(np.split(labels, bounds), np.split(values, bounds)) if len(group)}
+
+
+def island_keys(net):
+    """Split a network into islands and fingerprint each one.
+
+    Returns (island label per bus in bus-table order, {island: key}). An island's key is a hash of
+    its buses, in-service lines and sources (with their parameters) and the fault settings, so a
+    change anywhere in an island changes its key and nothing else's.
+    """
+    adjacency = build_adjacency(net, in_service_only=True)
+    _, labels = adjacency.components()
+    labels = labels.astype(np.int64)
+    bus_pos = adjacency.bus_index
+
+    bus_rows = np.column_stack([bus_pos.to_numpy(dtype=float), _key_columns(net.bus, _BUS_KEY)])
+    lines = net.line.loc[adjacency.line_index]
+    line_rows = np.column_stack([lines.index.to_numpy(dtype=float), _key_columns(lines, _LINE_KEY)])
+    sources = net.ext_grid[net.ext_grid['in_service'].astype(bool)]
+    source_rows = _key_columns(sources, _SOURCE_KEY)
+    groups = {
+        'bus': _group_rows(labels, bus_rows),
+        'line': _group_rows(labels[bus_pos.get_indexer(lines['from_bus'].to_numpy())], line_rows),
+        'source': _group_rows(labels[bus_pos.get_indexer(sources['bus'].to_numpy())], source_rows),
+    }
+
+    settings = _settings_digest()
+    empty = np.empty((0, 0))
+    keys = {}
+    for island in np.unique(labels).tolist():
+        digest = hashlib.sha256(settings)
+        for kind in ('bus', 'line', 'source'):
+            digest.update(kind.encode('ascii'))
+            digest.update(np.ascontiguousarray(groups[kind].get(island, empty)).tobytes())
+        keys[island] = digest.hexdigest()[:32]
+    return labels, keys
+
+
+def topology_hash(keys):
+    """Combine island keys into one hash for the whole network."""
+    return hashlib.sha256(''.join(sorted(keys.values())).encode('ascii')).hexdigest()[:32]
+
+
+def prepare_fault_net(net):
+    """Return a copy of a network ready for calc_sc: a source per island and the short-circuit parameters.
+
+    Islands without a source get one at their best-connected bus (see add_island_slacks); sources
+    and lines missing short-circuit parameters get FAULT_SOURCE and LINE_END_TEMP_DEGREE.
+    """
+    fault_net = copy.deepcopy(net)
+    add_island_slacks(fault_net)
+    for col, value in FAULT_SOURCE.items():
+        fault_net.ext_grid[col] = fault_net.ext_grid[col].fillna(value) if col in fault_net.ext_grid else value
+    if 'endtemp_degree' in fault_net.line:
+        fault_net.line['endtemp_degree'] = fault_net.line['endtemp_degree'].fillna(LINE_END_TEMP_DEGREE)
+    else:
+        fault_net.line['endtemp_degree'] = LINE_END_TEMP_DEGREE
+    return fault_net
+
+
+def calc_fault_levels(fault_net, buses=None):
+    """Max and min three-phase fault levels for buses (all by default) in one calc_sc run per case.
+
+    fault_net comes from prepare_fault_net. Returns a DataFrame indexed by bus with FAULT_COLUMNS;
+    buses with no source in their island are NaN.
+    """
+    buses = fault_net.bus.index if buses is None else pd.Index(buses)
+    result = pd.DataFrame(index=buses, columns=FAULT_COLUMNS, dtype=float)
+    if not len(buses):
+        return result
+    with warnings.catch_warnings():
+        # calc_sc warns about buses that are not connected to a source; those stay NaN
+        warnings.simplefilter('ignore')
+        sc.calc_sc(fault_net, bus=buses.to_numpy(), case='max', check_connectivity=True)
+        res = fault_net.res_bus_sc.reindex(buses)
+        result['ikss_max_ka'] = res['ikss_ka'].to_numpy(dtype=float)
+        result['skss_max_mw'] = res['skss_mw'].to_numpy(dtype=float)
+        result['rk_max_ohm'] = res['rk_ohm'].to_numpy(dtype=float)
+        result['xk_max_ohm'] = res['xk_ohm'].to_numpy(dtype=float)
+        sc.calc_sc(fault_net, bus=buses.to_numpy(), case='min', check_connectivity=True)
+        res = fault_net.res_bus_sc.reindex(buses)
+        result['ikss_min_ka'] = res['ikss_ka'].to_numpy(dtype=float)
+        result['skss_min_mw'] = res['skss_mw'].to_numpy(dtype=float)
+    return result
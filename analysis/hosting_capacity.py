@@ -0,0 +1,300 @@
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from scipy.sparse.csgraph import breadth_first_order
+
+from analysis.connection_study import Candidate, _CandidateRunner, prepare_study_net
+from analysis.timeseries import MAX_LOADING_PERCENT, VM_LIMITS
+from data_parsing.adjacency import build_adjacency
+
+logger = logging.getLogger(__name__)
+
+# Largest connection searched for; buses that can take this much report the 'max_mw' limit
+MAX_HOSTING_MW = 2000.0
+
+# The bisection stops once the feasible/infeasible bracket is this narrow
+TOLERANCE_MW = 1.0
+
+# Without a neighbour's result to start from, the first trial is this fraction of max_mw
+COLD_START_FRACTION = 0.1
+
+# Give up refining after this many power flows for one bus and kind (keeping the feasible size found)
+MAX_SEARCH_SOLVES = 40
+
+# Slack on the limits so solver round-off at the base case is not reported as a breach
+VM_TOLERANCE_PU = 1e-6
+LOADING_TOLERANCE_PERCENT = 1e-3
+
+# Below this many buses the search runs in-process rather than paying for a process pool
+MIN_PARALLEL_BUSES = 8
+
+# Chunks per worker, so a worker that drew a slow chunk does not hold up the rest
+CHUNKS_PER_WORKER = 4
+
+# What stopped the search at a bus, indexed by the codes in the result's *_limit arrays
+LIMITS = ('max_mw', 'under_voltage', 'over_voltage', 'thermal', 'not_converged')
+WITHIN_LIMITS, UNDER_VOLTAGE, OVER_VOLTAGE, THERMAL, NOT_CONVERGED = range(len(LIMITS))
+
+KINDS = {'load': 'load', 'generation': 'sgen'}
+
+
+@dataclass
+class HostingCapacityResult:
+    """Maximum load and generation each bus can take before a voltage or thermal limit is breached.
+
+    load_mw and generation_mw are float32 arrays aligned with bus_index (NaN for buses with no slack
+    in their island); load_limit and generation_limit are int8 codes into LIMITS naming the limit
+    that capped each search.
+    """
+    bus_index: pd.Index
+    load_mw: np.ndarray
+    generation_mw: np.ndarray
+    load_limit: np.ndarray
+    generation_limit: np.ndarray
+    settings: dict = field(default_factory=dict)
+    solves: int = 0
+    timings: dict = field(default_factory=dict)
+
+    def save(self, path):
+        """Write the result arrays to an .npz file."""
+        np.savez(path, bus_index=self.bus_index.to_numpy(), load_mw=self.load_mw, generation_mw=self.generation_mw,
+                 load_limit=self.load_limit, generation_limit=self.generation_limit,
+                 setting_names=np.array(list(self.settings), dtype=str),
+                 setting_values=np.array(list(self.settings.values()), dtype=float), solves=self.solves)
+
+    @classmethod
+    def load(cls, path):
+        """Read a result written by save()."""
+        with np.load(path) as saved:
+            return cls(pd.Index(saved['bus_index']), saved['load_mw'], saved['generation_mw'], saved['load_limit'],
+                       saved['generation_limit'],
+                       settings=dict(zip(saved['setting_names'].tolist(), saved['setting_values'].tolist())),
+                       solves=int(saved['solves']))
+
+    def frame(self):
+        """Return the result as a DataFrame indexed by bus, with limit names instead of codes."""
+        limits = np.array(LIMITS, dtype=object)
+        return pd.DataFrame({
+            'load_mw': self.load_mw,
+            'load_limit': np.where(np.isnan(self.load_mw), None, limits[self.load_limit]),
+            'generation_mw': self.generation_mw,
+            'generation_limit': np.where(np.isnan(self.generation_mw), None, limits[self.generation_limit]),
+        }, index=self.bus_index)
+
+
+def _first_crossing(p_a, slacks_a, p_b, slacks_b):
+    """Estimate the size at which the first limit is reached from the slacks at two sizes.
+
+    Each element's slack (see _HostingRunner.slacks) is interpolated linearly between p_a and p_b;
+    returns the smallest size above min(p_a, p_b) at which a falling slack reaches zero, or inf.
+    """
+    with np.errstate(all='ignore'):
+        rate = (slacks_b - slacks_a) / (p_b - p_a)
+        crossing = p_a - slacks_a / rate
+    crossing = crossing[(rate < 0) & (crossing >= min(p_a, p_b))]
+    return crossing.min(initial=np.inf)
+
+
+class _HostingRunner(_CandidateRunner):
+    """A _CandidateRunner that checks a connection at a bus against the voltage and thermal limits."""
+
+    def __init__(self, study_net, vm_limits=VM_LIMITS, max_loading_percent=MAX_LOADING_PERCENT):
+        super().__init__(study_net)
+        vm_min, vm_max = vm_limits
+        # A limit already breached in the base case only counts if the connection makes it worse
+        self.vm_min = np.fmin(vm_min, self.base_vm_pu) - VM_TOLERANCE_PU
+        self.vm_max = np.fmax(vm_max, self.base_vm_pu) + VM_TOLERANCE_PU
+        self.max_loading = np.fmax(max_loading_percent, self.base_loading_percent) + LOADING_TOLERANCE_PERCENT
+        self.base_slacks = self.slacks(self.base_vm_pu, self.base_loading_percent)
+        self.solves = 0
+
+    def slacks(self, vm_pu, loading):
+        """Return every limit's slack: under/over voltage per bus in pu, then line loading in pu of rating.
+
+        Negative entries are breaches; de-energised buses and lines are NaN.
+        """
+        return np.concatenate([vm_pu - self.vm_min, self.vm_max - vm_pu, (self.max_loading - loading) / 100.0])
+
+    def check(self, kind, bus, p_mw):
+        """Return (limit code, slacks) with p_mw of kind ('load' or 'sgen') at bus.
+
+        The code is WITHIN_LIMITS or the first limit breached; slacks is None if the power flow did
+        not converge.
+        """
+        self.solves += 1
+        converged, vm_delta, loading, _ = self.run(Candidate('hosting_capacity', p_mw, kind=kind), bus)
+        if not converged:
+            return NOT_CONVERGED, None
+        slacks = self.slacks(vm_delta + self.base_vm_pu, loading)
+        n_bus = len(vm_delta)
+        for code, part in ((UNDER_VOLTAGE, slacks[:n_bus]), (OVER_VOLTAGE, slacks[n_bus:2 * n_bus]),
+                           (THERMAL, slacks[2 * n_bus:])):
+            if (part < 0).any():
+                return code, slacks
+        return WITHIN_LIMITS, slacks
+
+    def search(self, kind, bus, guess=None, max_mw=MAX_HOSTING_MW, tolerance_mw=TOLERANCE_MW):
+        """Find the largest p_mw in [0, max_mw] within limits, to tolerance_mw; return (p_mw, limit code).
+
+        Each trial goes where the first limit is predicted to be reached (see _first_crossing), from
+        the two nearest feasible sizes until a breach is found and from the feasible/infeasible
+        bracket after that. Trials are nudged half the tolerance towards the end of the bracket that
+        did not just move, so an accurate prediction closes it from both sides. Starting from a guess
+        (a neighbouring bus's capacity) this usually takes two to four power flows. Trials that do
+        not converge, or a bracket that stops halving, fall back to bisection.
+        """
+        previous, previous_slacks = None, None
+        low, low_slacks = 0.0, self.base_slacks
+        high, high_slacks, high_limit = None, None, WITHIN_LIMITS
+        trial = guess if guess is not None and np.isfinite(guess) else max_mw * COLD_START_FRACTION
+        trial = min(max(trial, tolerance_mw), max_mw)
+        widths = []
+        for _ in range(MAX_SEARCH_SOLVES):
+            limit, slacks = self.check(kind, bus, trial)
+            raised_low = limit == WITHIN_LIMITS
+            if raised_low:
+                previous, previous_slacks = low, low_slacks
+                low, low_slacks = trial, slacks
+            else:
+                high, high_slacks, high_limit = trial, slacks, limit
+
+            if high is None:
+                if low >= max_mw:
+                    return max_mw, WITHIN_LIMITS
+                crossing = _first_crossing(previous, previous_slacks, low, low_slacks)
+                trial = crossing + tolerance_mw / 2 if np.isfinite(crossing) else 2 * low
+                trial = min(max(trial, low + tolerance_mw), max_mw)
+                continue
+
+            width = high - low
+            if width <= tolerance_mw:
+                break
+            widths.append(width)
+            trial = (low + high) / 2
+            if high_slacks is not None and (len(widths) < 3 or width < widths[-3] / 2):
+                crossing = _first_crossing(low, low_slacks, high, high_slacks)
+                if np.isfinite(crossing):
+                    trial = crossing + (tolerance_mw / 2 if raised_low else -tolerance_mw / 2)
+            trial = min(max(trial, low + tolerance_mw / 4), high - tolerance_mw / 4)
+        return low, high_limit
+
+
+_worker_runner = None
+_worker_found = {}
+
+
+def _init_worker(study_net, vm_limits, max_loading_percent):
+    global _worker_runner, _worker_found
+    _worker_runner = _HostingRunner(study_net, vm_limits, max_loading_percent)
+    # Capacities found by this worker, by (kind, bus), for warm-starting later buses
+    _worker_found = {}
+
+
+def _run_in_worker(task):
+    buses, parents, max_mw, tolerance_mw = task
+    n = len(buses)
+    capacity = np.full((len(KINDS), n), np.nan)
+    limits = np.zeros((len(KINDS), n), dtype=np.int8)
+    solves = _worker_runner.solves
+    for i, (bus, parent) in enumerate(zip(buses, parents)):
+        for k, kind in enumerate(KINDS.values()):
+            try:
+                capacity[k, i], limits[k, i] = _worker_runner.search(kind, bus, _worker_found.get((kind, parent)),
+                                                                     max_mw, tolerance_mw)
+                _worker_found[(kind, bus)] = capacity[k, i]
+            except Exception as e:
+                logger.error(f"Error searching {kind} hosting capacity at bus {bus}: {e}")
+                logger.error(traceback.format_exc())
+    return capacity, limits, _worker_runner.solves - solves
+
+
+def search_order(study_net, buses):
+    """Return (buses, parents): buses in breadth-first order and the neighbour each was reached from.
+
+    Consecutive buses are then electrically close, so a chunk of the order handled by one worker can
+    warm-start each bus from its parent. Roots of each island have parent -1.
+    """
+    adjacency = build_adjacency(study_net, in_service_only=True)
+    graph = adjacency.to_csr()
+    wanted = np.zeros(len(adjacency.bus_index), dtype=bool)
+    wanted[adjacency.bus_index.get_indexer(buses)] = True
+    seen = np.zeros(len(wanted), dtype=bool)
+    order, parents = [], []
+    for root in np.flatnonzero(wanted):
+        if seen[root]:
+            continue
+        nodes, predecessors = breadth_first_order(graph, root, directed=False, return_predecessors=True)
+        seen[nodes] = True
+        nodes = nodes[wanted[nodes]]
+        order.append(nodes)
+        parents.append(predecessors[nodes])
+    order = np.concatenate(order) if order else np.empty(0, dtype=np.int64)
+    parents = np.concatenate(parents) if parents else np.empty(0, dtype=np.int64)
+    parent_labels = np.where(parents >= 0, adjacency.bus_index.to_numpy()[np.maximum(parents, 0)], -1)
+    return adjacency.bus_index.to_numpy()[order], parent_labels
+
+
+def run_hosting_capacity(net, buses=None, max_mw=MAX_HOSTING_MW, tolerance_mw=TOLERANCE_MW, vm_limits=VM_LIMITS,
+                         max_loading_percent=MAX_LOADING_PERCENT, max_workers=None, progress=None):
+    """Find the load and generation hosting capacity of buses (all by default) by bisection of power flows.
+
+    Connections are at unity power factor. The base net is prepared once (see prepare_study_net);
+    buses are searched in breadth-first order, split into contiguous chunks across a process pool,
+    and each search starts from its neighbour's result where the same worker has one (see
+    _HostingRunner.search). progress, if given, is called as progress(buses_done, buses).
+    """
+    timings = {}
+    start = time.perf_counter()
+    study_net = prepare_study_net(net)
+    bus_index = pd.Index(study_net.bus.index if buses is None else buses)
+    missing = bus_index.difference(study_net.bus.index)
+    if len(missing):
+        raise ValueError(f"Unknown buses: {list(missing[:10])}")
+    # Buses without a slack in their island have no power flow result, so no capacity
+    energised = study_net.res_bus['vm_pu'].reindex(bus_index).notna().to_numpy()
+    order, parents = search_order(study_net, bus_index[energised])
+    timings['prepare_s'] = time.perf_counter() - start
+
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_size = max(1, -(-len(order) // (max_workers * CHUNKS_PER_WORKER)))
+    bounds = [(s, min(s + chunk_size, len(order))) for s in range(0, len(order), chunk_size)]
+    tasks = [(order[s:e], parents[s:e], max_mw, tolerance_mw) for s, e in bounds]
+    initargs = (study_net, vm_limits, max_loading_percent)
+    start = time.perf_counter()
+    outcomes = []
+    if max_workers == 1 or len(order) < MIN_PARALLEL_BUSES:
+        _init_worker(*initargs)
+        results = map(_run_in_worker, tasks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)), initializer=_init_worker,
+                                   initargs=initargs)
+        results = pool.map(_run_in_worker, tasks)
+    try:
+        for (_, stop), outcome in zip(bounds, results):
+            outcomes.append(outcome)
+            if progress is not None:
+                progress(stop, len(order))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    timings['solve_s'] = time.perf_counter() - start
+
+    capacity = np.full((len(KINDS), len(bus_index)), np.nan, dtype=np.float32)
+    limits = np.zeros((len(KINDS), len(bus_index)), dtype=np.int8)
+    if outcomes:
+        positions = bus_index.get_indexer(order)
+        capacity[:, positions] = np.concatenate([o[0] for o in outcomes], axis=1)
+        limits[:, positions] = np.concatenate([o[1] for o in outcomes], axis=1)
+    solves = int(sum(o[2] for o in outcomes))
+    logger.info(f"Hosting capacity for {len(order)} buses took {solves} power flows in {timings['solve_s']:.3f}s")
+    settings = {'max_mw': max_mw, 'tolerance_mw': tolerance_mw, 'vm_min': vm_limits[0], 'vm_max': vm_limits[1],
+                'max_loading_percent': max_loading_percent}
+    return HostingCapacityResult(bus_index, capacity[0], capacity[1], limits[0], limits[1], settings=settings,
+                                 solves=solves, timings=timings)
@@ -0,0 +1,175 @@
+import copy
+import hashlib
+import inspect
+import json
+import logging
+from dataclasses import dataclass, replace
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+logger = logging.getLogger(__name__)
+
+# Element tables a scenario can add to, change or switch out of service, and how a new row is created
+CREATORS = {
+    'bus': pp.create_bus,
+    'line': pp.create_line_from_parameters,
+    'trafo': pp.create_transformer_from_parameters,
+    'load': pp.create_load,
+    'sgen': pp.create_sgen,
+    'gen': pp.create_gen,
+    'ext_grid': pp.create_ext_grid,
+    'shunt': pp.create_shunt,
+    'storage': pp.create_storage,
+}
+
+# Scenario row fields that refer to a bus, so they can be given by bus name
+BUS_FIELDS = ('bus', 'from_bus', 'to_bus', 'hv_bus', 'lv_bus')
+
+
+def _creator_arguments(table):
+    """(required, accepted) argument names of a table's CREATORS function, not counting the net."""
+    parameters = list(inspect.signature(CREATORS[table]).parameters.values())[1:]
+    required = {p.name for p in parameters if p.default is p.empty and p.kind is not p.VAR_KEYWORD}
+    return required, {p.name for p in parameters if p.kind is not p.VAR_KEYWORD}
+
+
+def _value(value):
+    """A JSON-able scalar for a scenario value (NumPy scalars become Python ones)."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """A what-if change to a base network, kept as a delta instead of a modified copy of the net.
+
+    added holds new rows as (table, ((column, value), ...)), in creation order; changed holds
+    (table, index, column, value) cell overrides and out_of_service (table, index) elements to switch
+    out. A scenario is immutable and only a few tuples in size: add(), set() and switch_out() return
+    a new one, and key is a content hash for caching results per scenario. materialize() turns it
+    into a solver-ready net that shares every unchanged table with the base.
+    """
+    added: tuple = ()
+    changed: tuple = ()
+    out_of_service: tuple = ()
+
+    def add(self, table, **values):
+        """Return this scenario plus a new element in table (created with its CREATORS function)."""
+        if table not in CREATORS:
+            raise ValueError(f"Scenarios can't add to {table}")
+        row = tuple(sorted((column, _value(value)) for column, value in values.items()))
+        return replace(self, added=self.added + ((table, row),))
+
+    def set(self, table, index, column, value):
+        """Return this scenario with one cell of an existing element overridden (replacing any earlier override)."""
+        index, value = int(index), _value(value)
+        kept = tuple(c for c in self.changed if c[:3] != (table, index, column))
+        return replace(self, changed=tuple(sorted(kept + ((table, index, column, value),), key=repr)))
+
+    def switch_out(self, table, index):
+        """Return this scenario with an existing element out of service."""
+        entry = (table, int(index))
+        if entry in self.out_of_service:
+            return self
+        return replace(self, out_of_service=tuple(sorted(self.out_of_service + (entry,))))
+
+    def tables(self):
+        """The element tables this scenario touches."""
+        return ({table for table, _ in self.added} | {c[0] for c in self.changed}
+                | {table for table, _ in self.out_of_service})
+
+    def to_dict(self):
+        return {
+            'add': [{'table': table, **dict(row)} for table, row in self.added],
+            'set': [{'table': t, 'index': i, 'column': c, 'value': v} for t, i, c, v in self.changed],
+            'out_of_service': [{'table': t, 'index': i} for t, i in self.out_of_service],
+        }
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Build a scenario from its to_dict() form. Raises KeyError/ValueError for malformed entries."""
+        scenario = cls()
+        for row in spec.get('add') or []:
+            row = dict(row)
+            scenario = scenario.add(row.pop('table'), **row)
+        for change in spec.get('set') or []:
+            scenario = scenario.set(change['table'], change['index'], change['column'], change['value'])
+        for element in spec.get('out_of_service') or []:
+            scenario = scenario.switch_out(element['table'], element['index'])
+        return scenario
+
+    @property
+    def key(self):
+        """Content hash of the delta; equal scenarios have equal keys however they were built."""
+        content = json.dumps(self.to_dict(), sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()[:24]
+
+    def validate(self, net):
+        """Raise ValueError unless every change refers to an existing element and column of net.
+
+        Added rows must give their creator's required arguments and only known columns, and the
+        whole scenario is then applied to a copy of net, so one that fails to apply is rejected here.
+        """
+        # Buses the scenario adds can be used by the elements added after them
+        buses = set(net.bus.index)
+        for table, row in self.added:
+            required, accepted = _creator_arguments(table)
+            columns = {column for column, _ in row}
+            unknown = columns - accepted - set(net[table].columns)
+            if required - columns:
+                raise ValueError(f"New {table} needs {', '.join(sorted(required - columns))}")
+            if unknown:
+                raise ValueError(f"Unknown {table} columns: {', '.join(sorted(unknown))}")
+            for column, value in row:
+                if column in BUS_FIELDS and value not in buses:
+                    raise ValueError(f"Unknown bus for new {table}: {value}")
+            if table == 'bus':
+                buses.add(dict(row).get('index', max(buses, default=-1) + 1))
+        for table, index, column, _ in self.changed:
+            if table not in CREATORS or index not in net[table].index:
+                raise ValueError(f"Unknown {table}: {index}")
+            if column not in net[table].columns or column in BUS_FIELDS:
+                raise ValueError(f"Can't change {table} column {column}")
+        for table, index in self.out_of_service:
+            if table not in CREATORS or index not in net[table].index:
+                raise ValueError(f"Unknown {table}: {index}")
+        try:
+            materialize(net, self)
+        except (TypeError, ValueError, KeyError, UserWarning) as e:
+            raise ValueError(f"Scenario can't be applied: {e}") from e
+
+
+@lru_cache(maxsize=1)
+def _empty_network():
+    return pp.create_empty_network()
+
+
+def materialize(net, scenario, writable=()):
+    """Return a net with the scenario applied, for handing to a solver. The base net is not modified.
+
+    Only the tables the scenario touches (plus writable ones, for callers that add elements of their
+    own) are copied; every other table is a shallow copy sharing the base's column arrays, and the
+    results and solver internals start out empty.
+    """
+    result = copy.copy(net)
+    own = scenario.tables() | set(writable)
+    for key, value in net.items():
+        if isinstance(value, pd.DataFrame):
+            if key.startswith('res_'):
+                result[key] = value.iloc[:0].copy()
+            elif key in own:
+                result[key] = value.copy()
+            else:
+                result[key] = value.copy(deep=False)
+        elif key.startswith('_'):
+            # Solver internals belong to the net they were computed for; start from an empty net's
+            result[key] = copy.deepcopy(_empty_network().get(key))
+    for table, index, column, value in scenario.changed:
+        result[table].at[index, column] = value
+    for table, index in scenario.out_of_service:
+        result[table].at[index, 'in_service'] = False
+    for table, row in scenario.added:
+        CREATORS[table](result, **dict(row))
+    return result
@@ -0,0 +1,183 @@
+import logging
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from data_parsing.geo import wgs84_to_nztm_array
+
+logger = logging.getLogger(__name__)
+
+SITE_COLUMNS = ['network', 'bus_idx', 'name', 'type', 'vn_kv', 'x', 'y', 'lat', 'lon']
+
+# Bounding boxes wider or taller than this (in degrees) are filtered without the KD-tree
+BBOX_TREE_MAX_DEGREES = 20.0
+
+# Relative margin added around a projected bounding box before querying the KD-tree
+BBOX_MARGIN = 0.01
+
+
+def sites_from_bus_data(network, net, bus_data):
+    """Build the spatial index site table for one network from its bus_data and bus voltages."""
+    sites = bus_data[['bus_idx', 'name', 'type', 'x', 'y', 'lat', 'lon']].copy()
+    sites['network'] = network
+    sites['vn_kv'] = net.bus['vn_kv'].reindex(sites['bus_idx']).to_numpy(dtype=float)
+    return sites[SITE_COLUMNS]
+
+
+class SpatialIndex:
+    """KD-tree over the NZTM coordinates of substations for nearest and within-radius queries.
+
+    Distances are in metres on the NZTM plane. Filtered queries (by network, site type or voltage)
+    run against a tree built over just the matching sites; those trees are built on first use and
+    cached, so repeated filters cost the same as unfiltered queries.
+    """
+
+    def __init__(self, sites):
+        self.sites = sites.reset_index(drop=True)
+        self._xy = self.sites[['x', 'y']].to_numpy(dtype=np.float64)
+        self._subset = lru_cache(maxsize=64)(self._build_subset)
+        logger.info(f"Built spatial index over {len(self.sites)} sites")
+
+    @classmethod
+    def from_networks(cls, networks):
+        """Build an index from an iterable of (network label, pandapowerNet, bus_data) tuples."""
+        frames = [sites_from_bus_data(label, net, bus_data) for label, net, bus_data in networks if len(bus_data)]
+        sites = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SITE_COLUMNS)
+        return cls(sites)
+
+    def with_network(self, label, net, bus_data):
+        """Return an index with one network's sites rebuilt from its net and bus_data; the other networks'
+        rows are reused as they are, in the same order."""
+        fresh = sites_from_bus_data(label, net, bus_data)
+        order = list(dict.fromkeys([*self.sites['network'], label]))
+        frames = [fresh if network == label else self.sites[self.sites['network'] == network] for network in order]
+        return SpatialIndex(pd.concat(frames, ignore_index=True))
+
+    def _build_subset(self, networks=None, types=None, vn_kv=None):
+        mask = np.ones(len(self.sites), dtype=bool)
+        if networks:
+            mask &= self.sites['network'].isin(networks).to_numpy()
+        if types:
+            mask &= self.sites['type'].isin(types).to_numpy()
+        if vn_kv is not None:
+            mask &= np.isclose(self.sites['vn_kv'].to_numpy(dtype=float), vn_kv)
+        rows = np.flatnonzero(mask)
+        tree = cKDTree(self._xy[rows]) if len(rows) else None
+        return rows, tree
+
+    def _subset_for(self, networks, types, vn_kv):
+        networks = tuple(sorted(networks)) if networks else None
+        types = tuple(sorted(types)) if types else None
+        vn_kv = float(vn_kv) if vn_kv is not None else None
+        return self._subset(networks, types, vn_kv)
+
+    def nearest(self, x, y, k=1, networks=None, types=None, vn_kv=None):
+        """Return the k nearest sites to each NZTM point.
+
+        Returns (rows, distances): (n, k) arrays of row positions into self.sites and distances in
+        metres. When fewer than k sites match the filters, missing neighbours have row -1 and
+        distance inf.
+        """
+        points = np.column_stack([np.atleast_1d(x), np.atleast_1d(y)]).astype(np.float64)
+        rows = np.full((len(points), k), -1, dtype=np.int64)
+        distances = np.full((len(points), k), np.inf)
+        subset_rows, tree = self._subset_for(networks, types, vn_kv)
+        if tree is None or len(points) == 0:
+            return rows, distances
+
+        # Points that couldn't be projected get no neighbours
+        valid = np.isfinite(points).all(axis=1)
+        k_eff = min(k, len(subset_rows))
+        dist, pos = tree.query(points[valid], k=k_eff)
+        rows[valid, :k_eff] = subset_rows[pos.reshape(-1, k_eff)]
+        distances[valid, :k_eff] = dist.reshape(-1, k_eff)
+        return rows, distances
+
+    def within(self, x, y, radius_m, networks=None, types=None, vn_kv=None):
+        """Return, for each NZTM point, (rows, distances) arrays of all sites within radius_m, nearest first."""
+        points = np.column_stack([np.atleast_1d(x), np.atleast_1d(y)]).astype(np.float64)
+        subset_rows, tree = self._subset_for(networks, types, vn_kv)
+        if tree is None:
+            return [(np.empty(0, dtype=np.int64), np.empty(0)) for _ in range(len(points))]
+
+        results = []
+        valid = np.isfinite(points).all(axis=1)
+        all_hits = [[] for _ in range(len(points))]
+        if valid.any():
+            for i, hits in zip(np.flatnonzero(valid), tree.query_ball_point(points[valid], r=radius_m)):
+                all_hits[i] = hits
+        for point, hits in zip(points, all_hits):
+            hits = np.asarray(hits, dtype=np.int64)
+            dist = np.hypot(*(self._xy[subset_rows[hits]] - point).T) if len(hits) else np.empty(0)
+            order = np.argsort(dist, kind='stable')
+            results.append((subset_rows[hits[order]], dist[order]))
+        return results
+
+    def within_bbox(self, west, south, east, north, networks=None, types=None, vn_kv=None):
+        """Return the row positions (in site order) of sites inside a WGS84 bounding box.
+
+        The box is projected to NZTM and its enclosing rectangle is queried in the KD-tree; the hits
+        are then checked against the exact latitude/longitude bounds. Boxes too large to project
+        sensibly (e.g. the whole world at low zoom) are checked against every matching site instead.
+        """
+        subset_rows, tree = self._subset_for(networks, types, vn_kv)
+        if tree is None or west > east or south > north:
+            return np.empty(0, dtype=np.int64)
+        candidates = subset_rows
+        if east - west <= BBOX_TREE_MAX_DEGREES and north - south <= BBOX_TREE_MAX_DEGREES:
+            # Sample corners and edge midpoints: a lat/lon box's edges are slightly curved in NZTM
+            lat = np.array([south, south, north, north, south, north, (south + north) / 2, (south + north) / 2])
+            lon = np.array([west, east, west, east, (west + east) / 2, (west + east) / 2, west, east])
+            x, y = wgs84_to_nztm_array(lat, lon)
+            if np.isfinite(x).all() and np.isfinite(y).all():
+                half = max(x.max() - x.min(), y.max() - y.min()) / 2 * (1 + BBOX_MARGIN)
+                centre = [(x.max() + x.min()) / 2, (y.max() + y.min()) / 2]
+                hits = tree.query_ball_point(centre, r=half, p=np.inf)
+                candidates = subset_rows[np.sort(np.asarray(hits, dtype=np.int64))]
+        lat = self.sites['lat'].to_numpy(dtype=float)[candidates]
+        lon = self.sites['lon'].to_numpy(dtype=float)[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return candidates[inside]
+
+    def nearest_wgs84(self, lat, lon, k=1, **filters):
+        """Like nearest(), for WGS84 latitude/longitude query points."""
+        x, y = wgs84_to_nztm_array(lat, lon)
+        return self.nearest(x, y, k=k, **filters)
+
+    def within_wgs84(self, lat, lon, radius_m, **filters):
+        """Like within(), for WGS84 latitude/longitude query points."""
+        x, y = wgs84_to_nztm_array(lat, lon)
+        return self.within(x, y, radius_m, **filters)
+
+    def describe(self, rows, distances):
+        """Turn row/distance arrays into column arrays (name, network, type, vn_kv, lat, lon, distance_km).
+
+        Works for any array shape; entries with row -1 come back as None / NaN.
+        """
+        rows = np.asarray(rows)
+        missing = rows < 0
+        safe = np.where(missing, 0, rows)
+        result = {}
+        for col in ('name', 'network', 'type'):
+            values = self.sites[col].to_numpy(dtype=object)[safe] if len(self.sites) else np.full(rows.shape, None)
+            values[missing] = None
+            result[col] = values
+        for col in ('vn_kv', 'lat', 'lon'):
+            values = self.sites[col].to_numpy(dtype=float)[safe] if len(self.sites) else np.full(rows.shape, np.nan)
+            values[missing] = np.nan
+            result[col] = values
+        result['distance_km'] = np.where(missing, np.nan, np.asarray(distances) / 1000.0)
+        return result
+
+
+def to_json_columns(columns):
+    """Convert describe() output to JSON-safe nested lists, with NaN/inf as None."""
+    result = {}
+    for col, values in columns.items():
+        values = np.asarray(values)
+        if values.dtype.kind == 'f':
+            values = np.where(np.isfinite(values), values, None).astype(object)
+        result[col] = values.tolist()
+    return result
@@ -0,0 +1,412 @@
+import copy
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+from scipy.sparse import csc_matrix, csr_matrix
+from scipy.sparse.linalg import splu
+
+from analysis.connection_study import add_island_slacks, resolve_candidate_buses
+from data_parsing.buses import bus_name_lookup
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_YEAR = 8760
+
+# Hours per process pool task (about a month); each chunk warm-starts from the base case
+CHUNK_HOURS = 730
+
+# Below this many hours the study runs in-process rather than paying for a process pool
+MIN_PARALLEL_HOURS = 2 * CHUNK_HOURS
+
+# Newton-Raphson settings: mismatch tolerance in p.u., and how many iterations may reuse a stale
+# Jacobian factorization before it is refactorized at the current voltages
+TOLERANCE_PU = 1e-8
+MAX_ITERATIONS = 20
+CHORD_ITERATIONS = 3
+
+# Default voltage band (p.u.) and line loading limit (%) for the excursion/overload hour counts
+VM_LIMITS = (0.95, 1.05)
+MAX_LOADING_PERCENT = 100.0
+
+# Power factor for background loads given without a reactive power profile
+BACKGROUND_POWER_FACTOR = 0.95
+
+
+@dataclass
+class TimeSeriesResult:
+    """Results of a time-series study.
+
+    vm_pu (hours x buses) and loading_percent (hours x lines) are float32 arrays aligned with
+    bus_index and line_index; isolated buses, out-of-service lines and hours that did not converge
+    are NaN. line_summary and bus_summary have one row per line / bus with peaks and hours over the
+    limits, and summary the network-wide figures.
+    """
+    bus_index: pd.Index
+    line_index: pd.Index
+    vm_pu: np.ndarray
+    loading_percent: np.ndarray
+    converged: np.ndarray
+    iterations: np.ndarray
+    line_summary: pd.DataFrame
+    bus_summary: pd.DataFrame
+    summary: dict
+    timings: dict = field(default_factory=dict)
+
+    def save(self, path):
+        """Write the hourly arrays to a compressed .npz, column-major so each bus/line's year is contiguous."""
+        np.savez_compressed(
+            path,
+            bus_index=self.bus_index.to_numpy(),
+            line_index=self.line_index.to_numpy(),
+            vm_pu=np.asfortranarray(self.vm_pu),
+            loading_percent=np.asfortranarray(self.loading_percent),
+            converged=self.converged,
+            iterations=self.iterations,
+        )
+
+
+def read_profile(path, key=None):
+    """Read a profile from .npy (memory-mapped), .npz (array key, or the first), .parquet or .csv."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        return np.load(path, mmap_mode='r')
+    if ext == '.npz':
+        with np.load(path) as arrays:
+            return arrays[key or arrays.files[0]]
+    if ext == '.parquet':
+        return pd.read_parquet(path)
+    if ext == '.csv':
+        return pd.read_csv(path)
+    raise ValueError(f"Unsupported profile format: {path}")
+
+
+def _nan_max(values, axis=0):
+    """Max and argmax along axis ignoring NaN; all-NaN slices give NaN and -1."""
+    filled = np.where(np.isnan(values), -np.inf, values)
+    peak = filled.max(axis=axis, initial=-np.inf)
+    arg = filled.argmax(axis=axis) if values.shape[axis] else np.full(peak.shape, -1)
+    return np.where(np.isinf(peak), np.nan, peak), np.where(np.isinf(peak), -1, arg)
+
+
+class _TimeSeriesRunner:
+    """Solves hours of a study against one net's internal admittance model, reusing Ybus and the Jacobian LU.
+
+    The net is solved once with pandapower to build its internal ppci; after that each hour is a
+    Newton-Raphson solve on Ybus with the hour's injections, warm-started from the previous hour's
+    voltages. The Jacobian factorization is kept across iterations and hours (a chord method) and
+    only refactorized when an hour needs more than CHORD_ITERATIONS steps, which for smooth
+    profiles means most hours solve with no factorization at all.
+    """
+
+    def __init__(self, study_net, injection_buses, p_mw, q_mvar):
+        self.net = study_net
+        # Solve here so the internal ppc/Ybus exist in this process (they don't survive pickling)
+        pp.runpp(self.net)
+        ppci = self.net._ppc['internal']
+        self.Ybus = csr_matrix(ppci['Ybus'])
+        self.Ybus.sum_duplicates()
+        self.Yf = csr_matrix(ppci['Yf'])
+        self.Yt = csr_matrix(ppci['Yt'])
+        base_mva = ppci['baseMVA']
+        self.pq = np.asarray(ppci['pq'], dtype=np.int64)
+        self.pvpq = np.concatenate([np.asarray(ppci['pv'], dtype=np.int64), self.pq])
+        self.V0 = np.asarray(ppci['V'], dtype=complex).copy()
+        # At the solved base case these are exactly the specified injections on every PV/PQ bus
+        self.S0 = self.V0 * np.conj(self.Ybus @ self.V0)
+        n_ppci = len(self.V0)
+
+        lookup = self.net._pd2ppc_lookups['bus']
+        self.bus_ppci = lookup[self.net.bus.index.to_numpy()]
+        self.bus_valid = self.bus_ppci < n_ppci
+        inj_ppci = lookup[np.asarray(injection_buses)]
+        usable = inj_ppci < n_ppci
+        if not usable.all():
+            logger.warning(f"{int((~usable).sum())} profile buses are isolated and were ignored")
+        # Injection matrix: ppci buses x profile columns, in p.u. (loads are negative injections)
+        self.inject = csr_matrix((np.full(int(usable.sum()), -1.0 / base_mva), (inj_ppci[usable], np.flatnonzero(usable))),
+                                 shape=(n_ppci, len(inj_ppci)))
+        self.p_mw = p_mw
+        self.q_mvar = q_mvar
+
+        start, stop = self.net._pd2ppc_lookups['branch'].get('line', (0, 0))
+        branch_is = np.asarray(ppci['branch_is'], dtype=bool)
+        ppci_branch = np.cumsum(branch_is) - 1
+        line_is = branch_is[start:stop]
+        self.line_valid = line_is
+        self.line_branch = ppci_branch[start:stop][line_is]
+        lines = self.net.line
+        vn_kv = self.net.bus['vn_kv']
+        i_max_ka = (lines['max_i_ka'] * lines['df'].fillna(1.0) * lines['parallel'].fillna(1)).to_numpy(dtype=float)
+        # p.u. branch current -> kA at each end, then -> percent of the thermal limit
+        self.from_scale = (base_mva / (np.sqrt(3) * vn_kv.loc[lines['from_bus']].to_numpy(dtype=float)))[line_is]
+        self.to_scale = (base_mva / (np.sqrt(3) * vn_kv.loc[lines['to_bus']].to_numpy(dtype=float)))[line_is]
+        self.i_max_ka = i_max_ka[line_is]
+
+        self._jacobian_layout()
+        self.base_lu = self.lu = splu(self._jacobian(self.V0))
+
+    def _jacobian_layout(self):
+        """Fix the Jacobian's sparsity pattern once, so refreshing it is a gather into J.data.
+
+        Every Jacobian entry is the real or imaginary part of dS/dVa or dS/dVm at one Ybus entry
+        (diagonal included); source maps each CSC slot of J to its place in those four value arrays.
+        """
+        n = len(self.V0)
+        coo = self.Ybus.tocoo()
+        missing = np.setdiff1d(np.arange(n), coo.row[coo.row == coo.col])
+        self.y_row = np.concatenate([coo.row, missing]).astype(np.int64)
+        self.y_col = np.concatenate([coo.col, missing]).astype(np.int64)
+        self.y_data = np.concatenate([coo.data, np.zeros(len(missing), dtype=complex)])
+        self.y_diag = self.y_row == self.y_col
+        nnz = len(self.y_row)
+        pos_pvpq = np.full(n, -1)
+        pos_pvpq[self.pvpq] = np.arange(len(self.pvpq))
+        pos_pq = np.full(n, -1)
+        pos_pq[self.pq] = len(self.pvpq) + np.arange(len(self.pq))
+        rows, cols, sources = [], [], []
+        # Blocks: d P/d Va, d P/d Vm, d Q/d Va, d Q/d Vm over (pvpq | pq) rows and columns
+        for block, (row_pos, col_pos) in enumerate([(pos_pvpq, pos_pvpq), (pos_pvpq, pos_pq),
+                                                    (pos_pq, pos_pvpq), (pos_pq, pos_pq)]):
+            keep = (row_pos[self.y_row] >= 0) & (col_pos[self.y_col] >= 0)
+            rows.append(row_pos[self.y_row[keep]])
+            cols.append(col_pos[self.y_col[keep]])
+            sources.append(block * nnz + np.flatnonzero(keep))
+        size = len(self.pvpq) + len(self.pq)
+        sources = np.concatenate(sources)
+        # Building the CSC from entry numbers reveals which entry lands in each slot
+        template = csc_matrix((np.arange(1, len(sources) + 1, dtype=float), (np.concatenate(rows), np.concatenate(cols))),
+                              shape=(size, size))
+        self.J = template
+        self.J_source = sources[template.data.astype(np.int64) - 1]
+
+    def _jacobian(self, V):
+        Vnorm = V / np.abs(V)
+        Ibus = self.Ybus @ V
+        V_row = V[self.y_row]
+        # dS/dVa = j diag(V) conj(diag(Ibus) - Ybus diag(V)); dS/dVm = diag(V) conj(Ybus diag(Vnorm)) + conj(diag(Ibus)) diag(Vnorm)
+        dVa = 1j * V_row * np.conj(-self.y_data * V[self.y_col])
+        dVm = V_row * np.conj(self.y_data * Vnorm[self.y_col])
+        diag = self.y_row[self.y_diag]
+        dVa[self.y_diag] += 1j * V[diag] * np.conj(Ibus[diag])
+        dVm[self.y_diag] += np.conj(Ibus[diag]) * Vnorm[diag]
+        values = np.concatenate([dVa.real, dVm.real, dVa.imag, dVm.imag])
+        self.J.data = values[self.J_source]
+        return self.J
+
+    def _mismatch(self, V, S):
+        mis = V * np.conj(self.Ybus @ V) - S
+        return np.concatenate([mis[self.pvpq].real, mis[self.pq].imag])
+
+    def _solve(self, V, S):
+        """Newton-Raphson from V for injections S; return (V, iterations), V None if it did not converge."""
+        n_pvpq = len(self.pvpq)
+        Va, Vm = np.angle(V), np.abs(V)
+        stale = 0
+        for iteration in range(MAX_ITERATIONS + 1):
+            F = self._mismatch(V, S)
+            if not np.all(np.isfinite(F)):
+                return None, iteration
+            if np.abs(F).max(initial=0.0) < TOLERANCE_PU:
+                return V, iteration
+            if stale >= CHORD_ITERATIONS:
+                self.lu = splu(self._jacobian(V))
+                stale = 0
+            dx = -self.lu.solve(F)
+            stale += 1
+            Va[self.pvpq] += dx[:n_pvpq]
+            Vm[self.pq] += dx[n_pvpq:]
+            V = Vm * np.exp(1j * Va)
+        return None, MAX_ITERATIONS
+
+    def run(self, start, stop):
+        """Solve hours [start, stop); return vm_pu, loading_percent, converged and iterations for the chunk."""
+        hours = stop - start
+        injections = np.asarray(self.p_mw[start:stop], dtype=float) + 1j * np.asarray(self.q_mvar[start:stop], dtype=float)
+        S = self.S0[:, None] + self.inject @ injections.T
+        V_all = np.full((len(self.V0), hours), np.nan, dtype=complex)
+        converged = np.zeros(hours, dtype=bool)
+        iterations = np.zeros(hours, dtype=np.int16)
+        V = self.V0
+        for h in range(hours):
+            solved, iterations[h] = self._solve(V, S[:, h])
+            if solved is None:
+                # Start the next hour from the base case rather than from a failed solve
+                V, self.lu = self.V0, self.base_lu
+                continue
+            V_all[:, h] = V = solved
+            converged[h] = True
+
+        vm_pu = np.full((hours, len(self.bus_ppci)), np.nan, dtype=np.float32)
+        vm_pu[:, self.bus_valid] = np.abs(V_all[self.bus_ppci[self.bus_valid]]).T
+        i_from = np.abs(self.Yf[self.line_branch] @ V_all) * self.from_scale[:, None]
+        i_to = np.abs(self.Yt[self.line_branch] @ V_all) * self.to_scale[:, None]
+        loading = np.full((hours, len(self.line_valid)), np.nan, dtype=np.float32)
+        loading[:, self.line_valid] = (np.maximum(i_from, i_to) / self.i_max_ka[:, None] * 100.0).T
+        return vm_pu, loading, converged, iterations
+
+
+_worker_runner = None
+
+
+def _init_worker(study_net, injection_buses, p_mw, q_mvar):
+    global _worker_runner
+    _worker_runner = _TimeSeriesRunner(study_net, injection_buses, p_mw, q_mvar)
+
+
+def _run_in_worker(bounds):
+    start, stop = bounds
+    try:
+        return _worker_runner.run(start, stop)
+    except Exception as e:
+        logger.error(f"Error running hours {start}-{stop}: {e}")
+        logger.error(traceback.format_exc())
+        hours = stop - start
+        return (np.full((hours, len(_worker_runner.net.bus)), np.nan, dtype=np.float32),
+                np.full((hours, len(_worker_runner.net.line)), np.nan, dtype=np.float32),
+                np.zeros(hours, dtype=bool), np.zeros(hours, dtype=np.int16))
+
+
+def _background_columns(net, load_p_mw, load_q_mvar, load_buses):
+    """Return (bus labels, p_mw, q_mvar) arrays for the background load profiles."""
+    if load_p_mw is None:
+        return np.empty(0, dtype=np.int64), None, None
+    if isinstance(load_p_mw, pd.DataFrame):
+        load_buses = list(load_p_mw.columns)
+        load_p_mw = load_p_mw.to_numpy(dtype=float)
+        if isinstance(load_q_mvar, pd.DataFrame):
+            load_q_mvar = load_q_mvar[load_buses].to_numpy(dtype=float)
+    if load_buses is None:
+        raise ValueError("Background load arrays need load_buses (or DataFrame columns) naming their buses")
+    names = bus_name_lookup(net)
+    # Columns may be bus labels or bus names (e.g. Parquet files keyed by substation)
+    buses = np.array([names[b] if isinstance(b, str) else b for b in load_buses], dtype=np.int64)
+    load_p_mw = np.asarray(load_p_mw, dtype=float)
+    if load_q_mvar is None:
+        load_q_mvar = load_p_mw * np.tan(np.arccos(BACKGROUND_POWER_FACTOR))
+    return buses, load_p_mw, np.asarray(load_q_mvar, dtype=float)
+
+
+def run_timeseries_study(net, candidate, candidate_profile, load_p_mw=None, load_q_mvar=None, load_buses=None,
+                         spatial_index=None, max_workers=None, chunk_hours=CHUNK_HOURS, vm_limits=VM_LIMITS,
+                         max_loading_percent=MAX_LOADING_PERCENT, output=None, progress=None,
+                         network='transpower'):
+    """Run an hourly (e.g. 8760-hour) power flow study of a candidate connection.
+
+    candidate is a connection_study.Candidate sized at its rated p_mw/q_mvar; candidate_profile is
+    a per-unit array (one value per hour) scaling it. Background loads are given as load_p_mw, a
+    DataFrame of MW per hour with bus labels or names as columns (or an hours x buses array with
+    load_buses); without load_q_mvar they run at BACKGROUND_POWER_FACTOR. Profiles can be read with
+    read_profile. The year is split into chunk_hours chunks solved in parallel on a process pool;
+    see _TimeSeriesRunner for how each chunk reuses the admittance model. With output, the hourly
+    arrays are also written there as a compressed .npz. progress, if given, is called as
+    progress(hours_done, hours) as chunks finish. A candidate given by lat/lon is snapped to the
+    nearest bus of network in spatial_index.
+    """
+    timings = {}
+    start = time.perf_counter()
+    study_net = copy.deepcopy(net)
+    if study_net.ext_grid.empty:
+        add_island_slacks(study_net)
+    candidate_bus = resolve_candidate_buses([candidate], spatial_index, network)[0]
+    if candidate_bus not in study_net.bus.index:
+        raise ValueError(f"Unknown candidate bus: {candidate_bus}")
+
+    profile = np.asarray(candidate_profile, dtype=float)
+    hours = len(profile)
+    # Candidate generation is a negative load
+    sign = -1.0 if candidate.kind == 'sgen' else 1.0
+    background_buses, background_p, background_q = _background_columns(study_net, load_p_mw, load_q_mvar, load_buses)
+    injection_buses = np.concatenate([[candidate_bus], background_buses]).astype(np.int64)
+    p_mw = np.empty((hours, len(injection_buses)))
+    q_mvar = np.empty_like(p_mw)
+    p_mw[:, 0] = sign * candidate.p_mw * profile
+    q_mvar[:, 0] = sign * candidate.q_mvar * profile
+    if background_p is not None:
+        if background_p.shape != (hours, len(background_buses)):
+            raise ValueError(f"Background profiles must be {hours} hours x {len(background_buses)} buses")
+        p_mw[:, 1:] = background_p
+        q_mvar[:, 1:] = background_q
+    timings['prepare_s'] = time.perf_counter() - start
+
+    bounds = [(s, min(s + chunk_hours, hours)) for s in range(0, hours, chunk_hours)]
+    max_workers = max_workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    initargs = (study_net, injection_buses, p_mw, q_mvar)
+    outcomes = []
+    if max_workers == 1 or hours < MIN_PARALLEL_HOURS:
+        _init_worker(*initargs)
+        results = map(_run_in_worker, bounds)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(max_workers, len(bounds)), initializer=_init_worker,
+                                   initargs=initargs)
+        results = pool.map(_run_in_worker, bounds)
+    try:
+        for (_, stop), outcome in zip(bounds, results):
+            outcomes.append(outcome)
+            if progress is not None:
+                progress(stop, hours)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    timings['solve_s'] = time.perf_counter() - start
+    logger.info(f"Solved {hours} hours for candidate {candidate.name} in {timings['solve_s']:.3f}s")
+
+    n_bus, n_line = len(study_net.bus), len(study_net.line)
+    vm_pu = np.concatenate([o[0] for o in outcomes]) if outcomes else np.empty((0, n_bus), dtype=np.float32)
+    loading = np.concatenate([o[1] for o in outcomes]) if outcomes else np.empty((0, n_line), dtype=np.float32)
+    converged = np.concatenate([o[2] for o in outcomes]) if outcomes else np.empty(0, dtype=bool)
+    iterations = np.concatenate([o[3] for o in outcomes]) if outcomes else np.empty(0, dtype=np.int16)
+    result = summarize_timeseries(study_net, vm_pu, loading, converged, iterations, vm_limits, max_loading_percent)
+    result.summary['candidate_bus'] = int(candidate_bus)
+    result.timings = timings
+    if output is not None:
+        result.save(output)
+    return result
+
+
+def summarize_timeseries(net, vm_pu, loading, converged, iterations, vm_limits=VM_LIMITS,
+                         max_loading_percent=MAX_LOADING_PERCENT):
+    """Build a TimeSeriesResult with peak loading, voltage excursion and hours-over-limit summaries."""
+    vm_min, vm_max = vm_limits
+    peak_loading, peak_hour = _nan_max(loading)
+    overloaded = loading > max_loading_percent
+    line_summary = pd.DataFrame({
+        'name': net.line['name'].to_numpy(),
+        'peak_loading_percent': peak_loading,
+        'peak_hour': peak_hour,
+        'hours_over_limit': overloaded.sum(axis=0),
+    }, index=net.line.index)
+    low, high = vm_pu < vm_min, vm_pu > vm_max
+    max_vm, _ = _nan_max(vm_pu)
+    min_vm, _ = _nan_max(-vm_pu)
+    bus_summary = pd.DataFrame({
+        'name': net.bus['name'].to_numpy(),
+        'min_vm_pu': -min_vm,
+        'max_vm_pu': max_vm,
+        'hours_under_voltage': low.sum(axis=0),
+        'hours_over_voltage': high.sum(axis=0),
+    }, index=net.bus.index)
+
+    worst = int(np.nanargmax(peak_loading)) if np.isfinite(peak_loading).any() else None
+    summary = {
+        'hours': int(len(converged)),
+        'converged_hours': int(converged.sum()),
+        'peak_loading_percent': float(peak_loading[worst]) if worst is not None else None,
+        'peak_loading_line': str(line_summary['name'].iloc[worst]) if worst is not None else None,
+        'peak_loading_hour': int(peak_hour[worst]) if worst is not None else None,
+        'min_vm_pu': float(np.nanmin(-min_vm)) if np.isfinite(min_vm).any() else None,
+        'max_vm_pu': float(np.nanmax(max_vm)) if np.isfinite(max_vm).any() else None,
+        'hours_with_overload': int(overloaded.any(axis=1).sum()),
+        'hours_with_voltage_excursion': int((low | high).any(axis=1).sum()),
+        'mean_iterations': float(iterations[converged].mean()) if converged.any() else None,
+    }
+    return TimeSeriesResult(pd.Index(net.bus.index), pd.Index(net.line.index), vm_pu, loading, converged, iterations,
+                            line_summary, bus_summary, summary)
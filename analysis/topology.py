@@ -0,0 +1,460 @@
+import copy
+import logging
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from analysis.scenario import materialize
+from data_parsing.adjacency import build_adjacency
+from data_parsing.buses import bus_name_lookup
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS = ('hops', 'impedance')
+
+# Memory budget per weight for cached shortest-path trees (a float32 distance and int32 predecessor per bus)
+PATH_CACHE_BYTES = 64 << 20
+
+# Up to this many buses, every bus's shortest-path tree is computed along with the topology
+PRECOMPUTE_MAX_BUSES = 1000
+
+# Lower bound for a line's impedance weight, so zero-length lines still count as edges
+MIN_IMPEDANCE_OHM = 1e-6
+
+
+def _low_link(graph, active, roots, allowed=None):
+    """Iterative Tarjan low-link search over the active lines reachable from roots.
+
+    graph is (indptr, neighbours, lines) as Python lists in build_adjacency's CSR layout, active a
+    per-line bytearray and allowed, if given, the set of bus positions the search may enter.
+    Returns (trees, bridges, blocks): the buses of each DFS tree, the bridge line positions, and for
+    every visited bus the number of biconnected blocks it belongs to (2 or more means it is an
+    articulation point). O(buses + lines) over the part of the graph searched.
+    """
+    indptr, neighbours, lines = graph
+    disc = {}
+    low = {}
+    blocks = {}
+    bridges = []
+    trees = []
+    timer = 0
+    for root in roots:
+        if root in disc:
+            continue
+        disc[root] = low[root] = timer
+        timer += 1
+        blocks[root] = 0
+        members = [root]
+        # Stack entries: [bus, line used to reach it, next CSR slot to visit]
+        stack = [[root, -1, indptr[root]]]
+        while stack:
+            frame = stack[-1]
+            v, parent_line, i = frame
+            if i < indptr[v + 1]:
+                frame[2] = i + 1
+                e = lines[i]
+                if e == parent_line or not active[e]:
+                    continue
+                w = neighbours[i]
+                if allowed is not None and w not in allowed:
+                    continue
+                if w not in disc:
+                    disc[w] = low[w] = timer
+                    timer += 1
+                    # A non-root bus shares one block with its DFS parent
+                    blocks[w] = 1
+                    members.append(w)
+                    stack.append([w, e, indptr[w]])
+                elif disc[w] < low[v]:
+                    low[v] = disc[w]
+            else:
+                stack.pop()
+                if stack:
+                    u = stack[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+                    if low[v] >= disc[u]:
+                        # v's subtree hangs off u: it starts a new block containing u
+                        blocks[u] += 1
+                        if low[v] > disc[u]:
+                            bridges.append(parent_line)
+        trees.append(members)
+    return trees, bridges, blocks
+
+
+class NetworkTopology:
+    """Graph view of a network's lines: islands, bridges, articulation points and shortest paths.
+
+    Built once per network from net.line from_bus/to_bus (including out-of-service lines, so
+    switching is cheap; lines at an out-of-service bus count as out) and kept up to date by
+    set_in_service, which only recomputes the island or meshed section a switched line belongs to.
+    Masks and labels are aligned with bus_index / line_index. A bus's section is its 2-edge-connected
+    component: buses in a section of more than one bus are meshed, the rest hang off the network
+    radially, and a line is radial exactly when it is a bridge.
+
+    Shortest-path trees (by hop count or by line impedance) are cached per source bus, and for small
+    networks all of them are computed up front, so path() walks predecessors in O(path length).
+    The topology does not touch the pandapower net; callers switching lines update net.line as well.
+    """
+
+    def __init__(self, net, precompute_paths=None):
+        adjacency = build_adjacency(net)
+        self.bus_index = adjacency.bus_index
+        self.line_index = adjacency.line_index
+        lines = net.line.loc[self.line_index]
+        self.bus_names = net.bus['name'].astype(str).to_numpy()
+        self.line_names = lines['name'].astype(str).to_numpy()
+        self.from_pos = self.bus_index.get_indexer(lines['from_bus'].to_numpy())
+        self.to_pos = self.bus_index.get_indexer(lines['to_bus'].to_numpy())
+        parallel = lines['parallel'].fillna(1).to_numpy(dtype=float) if 'parallel' in lines else 1.0
+        impedance = (np.hypot(lines['r_ohm_per_km'].to_numpy(dtype=float), lines['x_ohm_per_km'].to_numpy(dtype=float))
+                     * lines['length_km'].to_numpy(dtype=float) / parallel)
+        self.impedance_ohm = np.maximum(np.nan_to_num(impedance, nan=MIN_IMPEDANCE_OHM), MIN_IMPEDANCE_OHM)
+        self._names = bus_name_lookup(net)
+        self._graph = (adjacency.indptr.tolist(), adjacency.other_pos.tolist(), adjacency.line_pos.tolist())
+        # A line at an out-of-service bus carries nothing, whatever its own in_service says
+        live = net.bus['in_service'].astype(bool).reindex(self.bus_index).to_numpy()
+        active = lines['in_service'].astype(bool).to_numpy() & live[self.from_pos] & live[self.to_pos]
+        # Hot-loop state lives in bytearrays; in_service / bridges are numpy views of them
+        self._active = bytearray(active.tobytes())
+        self._bridge = bytearray(len(self.line_index))
+
+        n_bus = len(self.bus_index)
+        self.component = np.zeros(n_bus, dtype=np.int64)
+        self.section = np.zeros(n_bus, dtype=np.int64)
+        self.blocks = np.zeros(n_bus, dtype=np.int32)
+        self._next_label = 0
+        self._recompute()
+
+        self._cache_rows = max(8, PATH_CACHE_BYTES // (8 * max(n_bus, 1)))
+        self._trees = {weight: OrderedDict() for weight in WEIGHTS}
+        self._csgraphs = {}
+        if precompute_paths is None:
+            precompute_paths = n_bus <= PRECOMPUTE_MAX_BUSES
+        if precompute_paths and n_bus:
+            for weight in WEIGHTS:
+                self._precompute(weight)
+
+    @property
+    def in_service(self):
+        return np.frombuffer(self._active, dtype=bool)
+
+    @property
+    def bridges(self):
+        """Line mask of in-service bridges: lines whose loss splits an island (the radial lines)."""
+        return np.frombuffer(self._bridge, dtype=bool)
+
+    @property
+    def articulation_points(self):
+        """Bus mask of buses whose loss splits an island."""
+        return self.blocks >= 2
+
+    @property
+    def meshed(self):
+        """Bus mask of buses in a meshed section (a 2-edge-connected section of more than one bus)."""
+        _, inverse, counts = np.unique(self.section, return_inverse=True, return_counts=True)
+        return counts[inverse] > 1
+
+    def copy(self):
+        """Return a topology that can be switched independently of this one.
+
+        The cached shortest-path trees are shared until set_in_service drops those of an affected island.
+        """
+        other = copy.copy(self)
+        other._active = bytearray(self._active)
+        other._bridge = bytearray(self._bridge)
+        other.component = self.component.copy()
+        other.section = self.section.copy()
+        other.blocks = self.blocks.copy()
+        other._trees = {weight: OrderedDict(trees) for weight, trees in self._trees.items()}
+        other._csgraphs = dict(self._csgraphs)
+        return other
+
+    def _label(self):
+        self._next_label += 1
+        return self._next_label
+
+    def _flood(self, start, allowed=None, sections=False):
+        """Yield the buses reachable from start over in-service lines (and only non-bridges with sections)."""
+        indptr, neighbours, lines = self._graph
+        active, bridge = self._active, self._bridge
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            v = queue.popleft()
+            yield v
+            for i in range(indptr[v], indptr[v + 1]):
+                e, w = lines[i], neighbours[i]
+                if w in seen or not active[e] or (sections and bridge[e]):
+                    continue
+                if allowed is not None and w not in allowed:
+                    continue
+                seen.add(w)
+                queue.append(w)
+
+    def _recompute(self, nodes=None):
+        """Recompute bridges, block counts and sections for a set of bus positions, or for all buses.
+
+        nodes must be a whole island or a whole meshed section; island labels are only reassigned
+        on a full recompute, since switching within a section never splits its island.
+        """
+        indptr, neighbours, lines = self._graph
+        if nodes is None:
+            allowed = None
+            roots = range(len(self.bus_index))
+            self._bridge[:] = bytes(len(self._bridge))
+            leaving = {}
+        else:
+            allowed = set(nodes.tolist())
+            roots = allowed
+            leaving = {}
+            for v in allowed:
+                for i in range(indptr[v], indptr[v + 1]):
+                    e = lines[i]
+                    if neighbours[i] in allowed:
+                        self._bridge[e] = 0
+                    elif self._active[e]:
+                        # Lines leaving a section are bridges, and each is a block of its own
+                        leaving[v] = leaving.get(v, 0) + 1
+        trees, bridges, blocks = _low_link(self._graph, self._active, roots, allowed)
+        for e in bridges:
+            self._bridge[e] = 1
+        visited = np.fromiter(blocks.keys(), dtype=np.int64, count=len(blocks))
+        self.blocks[visited] = np.fromiter((blocks[v] + leaving.get(v, 0) for v in blocks.keys()),
+                                           dtype=np.int32, count=len(blocks))
+        if nodes is None:
+            for tree in trees:
+                self.component[tree] = self._label()
+        assigned = set()
+        for v in (allowed if allowed is not None else range(len(self.bus_index))):
+            if v not in assigned:
+                members = list(self._flood(v, allowed, sections=True))
+                assigned.update(members)
+                self.section[members] = self._label()
+
+    def set_in_service(self, lines, in_service):
+        """Switch lines (labels in line_index) in or out of service and update the topology incrementally.
+
+        Losing a bridge relabels the smaller half of the split island; any other change recomputes
+        only the meshed section (or, when it meshes two sections, the island) the line belongs to.
+        Cached shortest-path trees are dropped for the affected islands only.
+        """
+        lines = np.atleast_1d(lines)
+        positions = self.line_index.get_indexer(lines)
+        if (positions < 0).any():
+            raise KeyError(f"Unknown lines: {lines[positions < 0].tolist()}")
+        changed = False
+        for pos in positions.tolist():
+            if bool(self._active[pos]) == bool(in_service):
+                continue
+            self._active[pos] = 1 if in_service else 0
+            changed = True
+            if self.from_pos[pos] != self.to_pos[pos]:
+                if in_service:
+                    self._switch_in(pos)
+                else:
+                    self._switch_out(pos)
+        if changed:
+            self._csgraphs.clear()
+
+    def _switch_out(self, pos):
+        u, v = int(self.from_pos[pos]), int(self.to_pos[pos])
+        if self._bridge[pos]:
+            self._bridge[pos] = 0
+            self.blocks[[u, v]] -= 1
+            # The island splits in two; sections and the other bridges are unchanged. Cached paths
+            # within either half never used the bridge, and path() checks island labels first.
+            self.component[self._smaller_side(u, v)] = self._label()
+            return
+        self._invalidate(self.component[u])
+        self._recompute(np.flatnonzero(self.section == self.section[u]))
+
+    def _switch_in(self, pos):
+        u, v = int(self.from_pos[pos]), int(self.to_pos[pos])
+        if self.component[u] != self.component[v]:
+            # Joining two islands: the new line is a bridge between them
+            self._bridge[pos] = 1
+            self.blocks[[u, v]] += 1
+            self._invalidate(self.component[u])
+            self._invalidate(self.component[v])
+            side_u = self.component == self.component[u]
+            side_v = self.component == self.component[v]
+            if side_u.sum() < side_v.sum():
+                self.component[side_u] = self.component[v]
+            else:
+                self.component[side_v] = self.component[u]
+            return
+        self._invalidate(self.component[u])
+        if self.section[u] == self.section[v]:
+            self._recompute(np.flatnonzero(self.section == self.section[u]))
+        else:
+            # Closing a loop across sections merges every section along the way
+            self._recompute(np.flatnonzero(self.component == self.component[u]))
+
+    def _smaller_side(self, a, b):
+        """Flood from a and b in lock-step and return the buses of whichever side runs out first."""
+        floods = (self._flood(a), self._flood(b))
+        sides = ([], [])
+        while True:
+            for flood, side in zip(floods, sides):
+                bus = next(flood, None)
+                if bus is None:
+                    return side
+                side.append(bus)
+
+    def _invalidate(self, component):
+        for trees in self._trees.values():
+            for source in [s for s in trees if self.component[s] == component]:
+                del trees[source]
+
+    def _csgraph(self, weight):
+        """Symmetric bus-by-bus matrix of in-service lines, keeping the lightest of any parallel lines."""
+        if weight not in self._csgraphs:
+            keep = self.in_service & (self.from_pos != self.to_pos)
+            values = np.ones(int(keep.sum())) if weight == 'hops' else self.impedance_ohm[keep]
+            rows = np.concatenate([self.from_pos[keep], self.to_pos[keep]])
+            cols = np.concatenate([self.to_pos[keep], self.from_pos[keep]])
+            data = np.concatenate([values, values])
+            order = np.lexsort((data, cols, rows))
+            rows, cols, data = rows[order], cols[order], data[order]
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            n_bus = len(self.bus_index)
+            self._csgraphs[weight] = csr_matrix((data[first], (rows[first], cols[first])), shape=(n_bus, n_bus))
+        return self._csgraphs[weight]
+
+    def _precompute(self, weight):
+        dist, pred = dijkstra(self._csgraph(weight), indices=np.arange(len(self.bus_index)),
+                              return_predecessors=True, unweighted=(weight == 'hops'))
+        dist, pred = dist.astype(np.float32), pred.astype(np.int32)
+        self._cache_rows = max(self._cache_rows, len(self.bus_index))
+        trees = self._trees[weight]
+        for source in range(len(self.bus_index)):
+            trees[source] = (dist[source], pred[source])
+
+    def _tree(self, source, weight):
+        """Return the (distance, predecessor) arrays of the shortest-path tree from a bus position."""
+        trees = self._trees[weight]
+        if source in trees:
+            trees.move_to_end(source)
+            return trees[source]
+        dist, pred = dijkstra(self._csgraph(weight), indices=source, return_predecessors=True,
+                              unweighted=(weight == 'hops'))
+        trees[source] = (dist.astype(np.float32), pred.astype(np.int32))
+        while len(trees) > self._cache_rows:
+            trees.popitem(last=False)
+        return trees[source]
+
+    def bus_position(self, bus):
+        """Return the position of a bus given by name (str) or by label."""
+        if isinstance(bus, str):
+            if bus not in self._names.index:
+                raise KeyError(f"Unknown bus name: {bus}")
+            bus = self._names[bus]
+        return self.bus_index.get_loc(bus)
+
+    def _line_between(self, a, b, weight):
+        """Return the position of the lightest in-service line between two adjacent bus positions."""
+        indptr, neighbours, lines = self._graph
+        candidates = [lines[i] for i in range(indptr[a], indptr[a + 1]) if neighbours[i] == b and self._active[lines[i]]]
+        return candidates[0] if weight == 'hops' else min(candidates, key=lambda e: self.impedance_ohm[e])
+
+    def path(self, source, target, weight='hops'):
+        """Return the shortest path between two buses (names or labels) by hop count or line impedance.
+
+        The result has the buses and lines along the path (labels and names), the hop count, the
+        summed line impedance in ohms and the distance in the chosen weight; None if they are in
+        different islands.
+        """
+        if weight not in WEIGHTS:
+            raise ValueError(f"weight must be one of {', '.join(WEIGHTS)}")
+        s, t = self.bus_position(source), self.bus_position(target)
+        if self.component[s] != self.component[t]:
+            return None
+        dist, pred = self._tree(s, weight)
+        buses = [t]
+        while buses[-1] != s:
+            buses.append(int(pred[buses[-1]]))
+        buses.reverse()
+        lines = [self._line_between(a, b, weight) for a, b in zip(buses, buses[1:])]
+        return {
+            'buses': self.bus_index[buses].tolist(),
+            'bus_names': self.bus_names[buses].tolist(),
+            'lines': self.line_index[lines].tolist(),
+            'line_names': self.line_names[lines].tolist(),
+            'hops': len(lines),
+            'impedance_ohm': float(self.impedance_ohm[lines].sum()),
+            'distance': float(dist[t]),
+        }
+
+    def islands(self):
+        """Return one row per island: its label, bus count, in-service line count, bridges and articulation points."""
+        active = self.in_service
+        line_island = self.component[self.from_pos]
+        labels, inverse, n_buses = np.unique(self.component, return_inverse=True, return_counts=True)
+        position = pd.Index(labels)
+        n_lines = np.bincount(position.get_indexer(line_island[active]), minlength=len(labels))
+        n_bridges = np.bincount(position.get_indexer(line_island[active & self.bridges]), minlength=len(labels))
+        n_articulation = np.bincount(inverse[self.articulation_points], minlength=len(labels))
+        return pd.DataFrame({'island': labels, 'buses': n_buses, 'lines': n_lines, 'bridges': n_bridges,
+                             'articulation_points': n_articulation}).sort_values('buses', ascending=False,
+                                                                                 ignore_index=True)
+
+    def summary(self):
+        """Return island counts, radial/meshed breakdown and the articulation points of the network."""
+        islands = self.islands()
+        meshed = self.meshed
+        active = self.in_service & (self.from_pos != self.to_pos)
+        return {
+            'buses': len(self.bus_index),
+            'lines_in_service': int(active.sum()),
+            'islands': int((islands['buses'] > 1).sum()),
+            'isolated_buses': int((islands['buses'] == 1).sum()),
+            'largest_island_buses': int(islands['buses'].iloc[0]) if len(islands) else 0,
+            'radial_lines': int((active & self.bridges).sum()),
+            'meshed_lines': int((active & ~self.bridges).sum()),
+            'meshed_buses': int(meshed.sum()),
+            'meshed_sections': int(len(np.unique(self.section[meshed]))),
+            'articulation_points': self.bus_names[self.articulation_points].tolist(),
+        }
+
+
+def scenario_topology(topology, net, scenario):
+    """Return the topology of net with a scenario (analysis.scenario.Scenario) applied; topology is untouched.
+
+    A scenario that only switches lines, or switches buses out, is applied with set_in_service to a
+    copy of the net's topology, so only the affected islands are recomputed; a bus out of service
+    takes every line at it out. One that adds buses or lines, changes line parameters or bus names,
+    or switches a bus back in, is rebuilt from the materialized net. Transformers are not part of
+    this graph, so switching them has no effect here.
+    """
+    rebuild = any(table in ('bus', 'line') for table, _ in scenario.added)
+    switched, buses_out = {}, set()
+    for table, index, column, value in scenario.changed:
+        if table == 'line' and column == 'in_service':
+            switched[index] = bool(value)
+        elif table == 'bus' and column == 'in_service':
+            if not value:
+                buses_out.add(index)
+            elif not net.bus.at[index, 'in_service']:
+                rebuild = True
+        elif (table == 'line' and column in ('length_km', 'r_ohm_per_km', 'x_ohm_per_km', 'parallel', 'name')
+              or table == 'bus' and column == 'name'):
+            rebuild = True
+    # As in materialize(), out_of_service wins over a changed in_service
+    switched.update({index: False for table, index in scenario.out_of_service if table == 'line'})
+    buses_out.update(index for table, index in scenario.out_of_service if table == 'bus')
+    if buses_out:
+        at_bus = net.line['from_bus'].isin(buses_out) | net.line['to_bus'].isin(buses_out)
+        switched.update({index: False for index in net.line.index[at_bus.to_numpy()]})
+    if rebuild:
+        return NetworkTopology(materialize(net, scenario))
+    result = topology.copy()
+    for in_service in (True, False):
+        lines = [line for line, value in switched.items() if value == in_service]
+        if lines:
+            result.set_in_service(lines, in_service)
+    return result
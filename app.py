@@ -3,9 +3,8 @@ import pandas as pd
 import folium
 from folium import plugins
 import json
-from shapely.geometry import LineString, Point
-import geopandas as gpd
 import numpy as np
+from data_parsing.geo import nztm_to_wgs84_array
 
 app = Flask(__name__)
 
@@ -19,19 +18,15 @@ def load_network_data():
     # Load distribution network
     dist_df = pd.read_csv('data/Vector/distribution_feeder_network_and_zone_substations_5064571612058702982.csv')
     
-    # Convert coordinates to proper format for transmission network
-    sites_df['geometry'] = sites_df.apply(lambda row: Point(float(row['X']), float(row['Y'])), axis=1)
-    sites_gdf = gpd.GeoDataFrame(sites_df, geometry='geometry', crs="EPSG:2193")
-    
-    # Convert to WGS84 (latitude/longitude)
-    sites_gdf = sites_gdf.to_crs("EPSG:4326")
+    # Convert all substation coordinates to WGS84 (latitude/longitude) in one call
+    site_lats, site_lons = nztm_to_wgs84_array(sites_df['X'], sites_df['Y'])
     
     # Create a dictionary of substation locations
     substation_locations = {}
-    for _, row in sites_gdf.iterrows():
+    for pos, (_, row) in enumerate(sites_df.iterrows()):
         substation_locations[row['MXLOCATION']] = {
-            'lat': float(row.geometry.y),
-            'lon': float(row.geometry.x),
+            'lat': float(site_lats[pos]),
+            'lon': float(site_lons[pos]),
             'name': str(row['description']),
             'type': str(row['type'])
         }
@@ -56,27 +51,19 @@ def load_network_data():
                     'end_coords': [substation_locations[end]['lat'], substation_locations[end]['lon']]
                 })
     
-    # Process distribution network
+    # Process distribution network, projecting every zone substation in one call
     distribution_data = []
-    for _, row in dist_df.iterrows():
-        try:
-            # Convert coordinates to WGS84
-            point = Point(float(row['x']), float(row['y']))
-            point_gdf = gpd.GeoDataFrame(geometry=[point], crs="EPSG:2193")
-            point_gdf = point_gdf.to_crs("EPSG:4326")
-            
-            # Extract coordinates from the converted point
-            coords = point_gdf.geometry.iloc[0]
-            
-            distribution_data.append({
-                'id': int(row['OBJECTID']),
-                'name': str(row['Primary Substation Name']),
-                'coordinates': [float(coords.y), float(coords.x)],  # [lat, lon]
-                'type': 'distribution'  # Add type for frontend filtering
-            })
-        except (ValueError, TypeError) as e:
-            print(f"Error processing distribution substation {row['OBJECTID']}: {e}")
+    dist_lats, dist_lons = nztm_to_wgs84_array(dist_df['x'], dist_df['y'])
+    for pos, (_, row) in enumerate(dist_df.iterrows()):
+        if np.isnan(dist_lats[pos]) or np.isnan(dist_lons[pos]):
+            print(f"Error processing distribution substation {row['OBJECTID']}: invalid coordinates")
             continue
+        distribution_data.append({
+            'id': int(row['OBJECTID']),
+            'name': str(row['Primary Substation Name']),
+            'coordinates': [float(dist_lats[pos]), float(dist_lons[pos])],  # [lat, lon]
+            'type': 'distribution'  # Add type for frontend filtering
+        })
     
     return substation_locations, lines_data, distribution_data
 
@@ -0,0 +1,59 @@
+"""Compare cold-start time of building the network model from CSV vs loading the binary snapshot.
+
+Each run is a fresh interpreter, so the timings include importing pandapower, pandas and pyproj.
+Run from the repository root:
+
+    python -m benchmarks.bench_cold_start --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in a fresh interpreter; prints the elapsed seconds as JSON. Mode 'populate' builds from
+# CSV through a snapshotting cache, which writes the snapshot the 'snapshot' runs then load.
+CHILD = """
+import json, logging, sys, time
+start = time.perf_counter()
+logging.disable(logging.CRITICAL)
+from services.network_cache import NetworkCache, build_network_model
+mode, snapshot_dir = sys.argv[1], sys.argv[2]
+cache = NetworkCache(builder=lambda: build_network_model(export_substations=False),
+                     snapshot_dir=None if mode == 'csv' else snapshot_dir)
+model = cache.get()
+assert model is not None and cache.last_build_source == ('snapshot' if mode == 'snapshot' else 'csv')
+print(json.dumps({'total_s': time.perf_counter() - start, 'model_s': cache.last_build_seconds}))
+"""
+
+
+def _run(mode, snapshot_dir):
+    out = subprocess.run([sys.executable, '-c', CHILD, mode, snapshot_dir], cwd=REPO_ROOT,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_dir = os.path.join(tmp, 'snapshot')
+        _run('populate', snapshot_dir)
+        results = {}
+        for mode in ('csv', 'snapshot'):
+            runs = [_run(mode, snapshot_dir) for _ in range(args.runs)]
+            results[mode] = {key: statistics.median(r[key] for r in runs) for key in ('total_s', 'model_s')}
+            print(f"{mode:>8}: cold start {results[mode]['total_s']:.3f}s "
+                  f"(model {results[mode]['model_s']:.3f}s), median of {args.runs}")
+        print(f"Snapshot model load is {results['csv']['model_s'] / results['snapshot']['model_s']:.1f}x faster "
+              f"than the CSV build")
+
+
+if __name__ == '__main__':
+    main()
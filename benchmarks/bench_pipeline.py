@@ -0,0 +1,190 @@
+"""Benchmark the network pipeline on synthetic data at 1x-1000x the current size.
+
+Times create_transpower_network, load_transmission_lines, create_vector_network, load_vector_lines,
+create_substation_files and the /network_data handler (first request, which assembles the model,
+and a warm request), and measures each stage's peak Python allocation in a separate traced pass.
+Run from the repository root:
+
+    python -m benchmarks.bench_pipeline --scales 1,10,100 --save benchmarks/baseline.json
+    python -m benchmarks.bench_pipeline --scales 1,10,100 --compare benchmarks/baseline.json
+
+--compare exits with status 1 when a stage is slower (or uses more memory) than the baseline by more
+than --threshold. Scale 1000 is a national-scale register and takes several minutes.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandapower as pp
+
+from benchmarks.synthetic import BASE_COUNTS, generate_dataset
+from data_parsing.profiling import reset_stage_stats, stage_stats
+
+STAGES = ('create_transpower_network', 'load_transmission_lines', 'create_vector_network', 'load_vector_lines',
+          'create_substation_files', 'network_data_cold', 'network_data_warm')
+
+DEFAULT_SCALES = '1,10,100'
+
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.005
+MIN_BYTES_DELTA = 1 << 20
+
+
+class _Recorder:
+    """Times (or, when tracing, measures the peak allocation of) each named step of one pipeline pass."""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    def __call__(self, name, func, *args):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        value = func(*args)
+        seconds = time.perf_counter() - start
+        self.results[name] = (tracemalloc.get_traced_memory()[1] - base) if self.trace_memory else seconds
+        return value
+
+
+def run_pipeline(paths, work_dir, trace_memory=False):
+    """Run every benchmarked stage once on the CSVs in paths; return {stage: seconds or peak bytes}."""
+    import main
+    from data_parsing.transpower.transpower_data_parser import create_substation_files, create_transpower_network
+    from data_parsing.transpower.transpower_lines import load_transmission_lines
+    from data_parsing.vector.vector_data_parser import create_vector_network
+    from data_parsing.vector.vector_lines import load_vector_lines
+    from services.network_cache import NetworkCache, assemble_model
+
+    substation_dir = os.path.join(work_dir, 'substations')
+    shutil.rmtree(substation_dir, ignore_errors=True)
+    record = _Recorder(trace_memory)
+
+    transpower_net, transpower_bus_data = record('create_transpower_network', create_transpower_network,
+                                                 paths['sites'])
+    record('load_transmission_lines', load_transmission_lines, transpower_net, paths['lines'])
+    vector_net, vector_bus_data = record('create_vector_network', create_vector_network, paths['vector_sites'])
+    record('load_vector_lines', load_vector_lines, vector_net, paths['vector_lines'])
+    record('create_substation_files', create_substation_files, transpower_net, transpower_bus_data, substation_dir)
+
+    main.network_cache = NetworkCache(
+        source_files=list(paths.values()),
+        builder=lambda: assemble_model(transpower_net, transpower_bus_data, vector_net, vector_bus_data))
+    client = main.app.test_client()
+    for name in ('network_data_cold', 'network_data_warm'):
+        response = record(name, client.get, '/network_data')
+        assert response.status_code == 200, response.data[:200]
+    counts = {'buses': len(transpower_net.bus) + len(vector_net.bus),
+              'lines': len(transpower_net.line) + len(vector_net.line)}
+    return record.results, counts
+
+
+def bench_scale(scale, data_dir, repeat, trace_memory):
+    """Benchmark one scale (a string such as '10').
+
+    Returns best-of-repeat timings and traced peak memory per benchmarked stage, plus the mean
+    data_parsing.profiling breakdown (csv_read, bus_creation, ...) of the timed passes.
+    """
+    scale_dir = os.path.join(data_dir, f'scale_{scale}')
+    paths = generate_dataset(scale_dir, float(scale))
+    timings = []
+    for _ in range(repeat):
+        reset_stage_stats()
+        seconds, counts = run_pipeline(paths, scale_dir)
+        timings.append(seconds)
+    breakdown = {name: {'seconds': stats.seconds / repeat, 'rows': stats.rows // repeat}
+                 for name, stats in sorted(stage_stats().items())}
+
+    peaks = {}
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            peaks, _ = run_pipeline(paths, scale_dir, trace_memory=True)
+        finally:
+            tracemalloc.stop()
+
+    stages = {name: {'seconds': min(t[name] for t in timings), 'peak_bytes': peaks.get(name)} for name in STAGES}
+    return {'rows': {kind: int(round(count * float(scale))) for kind, count in BASE_COUNTS.items()},
+            'network': counts, 'stages': stages, 'pipeline_stages': breakdown}
+
+
+def compare(baseline, current, threshold, min_seconds=MIN_SECONDS_DELTA, min_bytes=MIN_BYTES_DELTA):
+    """Return a message for every stage that regressed past threshold (0.2 = 20% slower) versus baseline."""
+    regressions = []
+    for scale, result in current['scales'].items():
+        base_stages = baseline.get('scales', {}).get(scale, {}).get('stages', {})
+        for name, now in result['stages'].items():
+            before = base_stages.get(name)
+            if before is None:
+                continue
+            for key, floor in (('seconds', min_seconds), ('peak_bytes', min_bytes)):
+                old, new = before.get(key), now.get(key)
+                if old is None or new is None or old <= 0:
+                    continue
+                if new > old * (1 + threshold) and new - old > floor:
+                    regressions.append(f"{scale}x {name} {key}: {old:.4g} -> {new:.4g} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _print_scale(scale, result):
+    print(f"\n{scale}x: {result['network']['buses']} buses, {result['network']['lines']} lines")
+    for name, stage in result['stages'].items():
+        peak = stage['peak_bytes']
+        memory = f"{peak / (1 << 20):9.1f} MiB" if peak is not None else ''
+        print(f"  {name:<26} {stage['seconds'] * 1000:10.1f} ms {memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default=DEFAULT_SCALES, help="comma-separated scale factors, e.g. 1,10,100,1000")
+    parser.add_argument('--repeat', type=int, default=3, help="timed passes per scale (the fastest is kept)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced peak-memory pass")
+    parser.add_argument('--data-dir', help="where to write the synthetic CSVs (a temporary directory by default)")
+    parser.add_argument('--save', metavar='JSON', help="write the results as a baseline")
+    parser.add_argument('--compare', metavar='JSON', help="compare against a baseline and fail on regressions")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before --compare fails")
+    args = parser.parse_args()
+
+    # The rejected-row summaries are expected with synthetic data
+    logging.disable(logging.WARNING)
+    scales = [s.strip() for s in args.scales.split(',') if s.strip()]
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='bench_pipeline_')
+    try:
+        current = {
+            'meta': {'python': platform.python_version(), 'pandapower': pp.__version__,
+                     'machine': platform.machine(), 'repeat': args.repeat},
+            'scales': {},
+        }
+        for scale in scales:
+            current['scales'][scale] = bench_scale(scale, data_dir, args.repeat, not args.no_memory)
+            _print_scale(scale, current['scales'][scale])
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
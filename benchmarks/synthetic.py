@@ -0,0 +1,150 @@
+"""Generate synthetic source CSVs shaped like the real Transpower and Vector exports, at any scale.
+
+Scale 1 matches the current data (216 sites, 227 transmission lines, 138 Vector sites); scale 1000
+is a national-scale asset register. Sites get unique MXLOCATION-style codes ('ALB', 'ABCD', ...),
+lines connect nearby sites ('ALB-HEN-A'), and a few rows of each file are deliberately unmatched or
+malformed so the rejection paths are exercised too. Output is deterministic for a given seed.
+"""
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from data_parsing.vector.vector_lines import FEEDER_TO_SUBSTATION
+
+# Row counts at scale 1 (the Vector feeder export is not in the repo; 250 is a typical feeder count)
+BASE_COUNTS = {'sites': 216, 'lines': 227, 'vector_sites': 138, 'vector_lines': 250}
+
+FILENAMES = {
+    'sites': 'Sites.csv',
+    'lines': 'Transmission_Lines.csv',
+    'vector_sites': 'Vector_Sites.csv',
+    'vector_lines': 'Vector_Lines.csv',
+}
+
+# NZTM extents of the country and of Vector's Auckland network
+NZ_EXTENT = ((1090000.0, 2090000.0), (4750000.0, 6190000.0))
+AUCKLAND_EXTENT = ((1720000.0, 1800000.0), (5860000.0, 6000000.0))
+
+# Category mixes taken from the real exports
+SITE_TYPES = (['ACSTN', 'TEE', 'HVDC'], [0.84, 0.13, 0.03])
+DESIGN_VOLTS = ([110, 220, 66, 350, 33, 11, 400], [0.53, 0.37, 0.07, 0.01, 0.01, 0.005, 0.005])
+
+# Share of rows that should be rejected by the parsers
+BAD_ROW_FRACTION = 0.03
+
+
+def _codes(rng, n, min_length=3):
+    """Return n unique upper-case codes, as short as possible but at least min_length letters."""
+    length = min_length
+    while 26 ** length < n:
+        length += 1
+    picks = rng.choice(26 ** length, size=n, replace=False)
+    digits = (picks[:, None] // 26 ** np.arange(length - 1, -1, -1)) % 26
+    return np.frombuffer((digits + ord('A')).astype(np.uint8).tobytes(), dtype=f'S{length}').astype(str)
+
+
+def _global_ids(rng, n):
+    return [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n)]
+
+
+def _points(rng, n, extent):
+    (x0, x1), (y0, y1) = extent
+    return rng.uniform(x0, x1, n).round(4), rng.uniform(y0, y1, n).round(4)
+
+
+def _bad_rows(rng, n):
+    return rng.random(n) < BAD_ROW_FRACTION
+
+
+def _write(frame, path):
+    # The ArcGIS exports start with a byte order mark
+    frame.to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def generate_sites(rng, n):
+    codes = _codes(rng, n)
+    x, y = _points(rng, n, NZ_EXTENT)
+    types, weights = SITE_TYPES
+    return pd.DataFrame({
+        'X': x,
+        'Y': y,
+        'OBJECTID': np.arange(1, n + 1),
+        'MXLOCATION': codes,
+        'type': rng.choice(types, size=n, p=weights),
+        'status': 'COMMISSIONED',
+        'description': np.char.add('Site ', codes),
+        'GlobalID': _global_ids(rng, n),
+    })
+
+
+def generate_lines(rng, n, site_codes, site_x):
+    """Transmission lines between sites that are close in easting, like a real radial/meshed grid."""
+    order = np.asarray(site_codes)[np.argsort(site_x)]
+    start = rng.integers(0, len(order), n)
+    end = (start + rng.integers(1, 6, n)) % len(order)
+    circuit = rng.choice(['A', 'B'], size=n, p=[0.8, 0.2])
+    mxlocation = pd.Series(order[start]) + '-' + pd.Series(order[end]) + '-' + circuit
+    cable = rng.random(n) < 0.1
+    mxlocation[cable] = mxlocation[cable] + '1-CBL'
+    # Two-letter codes are never generated, so these lines can't be matched to buses
+    mxlocation[_bad_rows(rng, n)] = 'ZZ-YY-A'
+    volts, weights = DESIGN_VOLTS
+    designvolt = rng.choice(volts, size=n, p=weights)
+    line_type = np.where(cable, 'CABLE', 'TRANSLINE')
+    return pd.DataFrame({
+        'OBJECTID': np.arange(1, n + 1),
+        'MXLOCATION': mxlocation,
+        'designvolt': designvolt,
+        'status': 'COMMISSIONED',
+        'description': mxlocation + ' Section',
+        'type': line_type,
+        'Symbol': pd.Series(designvolt).astype(str) + ' ' + line_type,
+        'GlobalID': _global_ids(rng, n),
+        'Shape__Length': rng.uniform(200.0, 60000.0, n),
+    })
+
+
+def generate_vector_sites(rng, n):
+    """Vector zone substations; the ones feeder names refer to come first so every feeder can match."""
+    known = sorted(set(FEEDER_TO_SUBSTATION.values()))
+    n = max(n, len(known))
+    extra = np.char.add(_codes(rng, n - len(known), min_length=4),
+                        rng.choice([' 33/11KV', ' 33/11kV', ' 110/33KV'], size=n - len(known)))
+    x, y = _points(rng, n, AUCKLAND_EXTENT)
+    return pd.DataFrame({
+        'OBJECTID': np.arange(1, n + 1),
+        'Primary Substation Name': np.concatenate([known, extra]),
+        'x': x,
+        'y': y,
+    })
+
+
+def generate_vector_lines(rng, n):
+    """Feeders named '<CODE> H<nn> - <CODE> H<nn>' between the substations FEEDER_TO_SUBSTATION knows."""
+    codes = np.array(sorted(FEEDER_TO_SUBSTATION))
+    feeder = (pd.Series(rng.choice(codes, n)) + ' H' + pd.Series(rng.integers(1, 100, n)).astype(str).str.zfill(2)
+              + ' - ' + pd.Series(rng.choice(codes, n)) + ' H'
+              + pd.Series(rng.integers(1, 100, n)).astype(str).str.zfill(2))
+    feeder[_bad_rows(rng, n)] = 'SPARE H01'
+    return pd.DataFrame({
+        'Feeder Name': feeder,
+        'OPVOLTAGE_': rng.choice(['11kV', '33kV'], size=n, p=[0.85, 0.15]),
+        'Shape__Length': rng.uniform(100.0, 20000.0, n).round(3),
+    })
+
+
+def generate_dataset(out_dir, scale=1, seed=0):
+    """Write the four synthetic CSVs for a scale factor into out_dir; return {kind: path}."""
+    rng = np.random.default_rng(seed)
+    counts = {kind: max(1, int(round(count * scale))) for kind, count in BASE_COUNTS.items()}
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {kind: os.path.join(out_dir, filename) for kind, filename in FILENAMES.items()}
+
+    sites = generate_sites(rng, counts['sites'])
+    _write(sites, paths['sites'])
+    _write(generate_lines(rng, counts['lines'], sites['MXLOCATION'], sites['X']), paths['lines'])
+    _write(generate_vector_sites(rng, counts['vector_sites']), paths['vector_sites'])
+    _write(generate_vector_lines(rng, counts['vector_lines']), paths['vector_lines'])
+    return paths
@@ -0,0 +1,59 @@
+import pandas as pd
+import pandapower as pp
+import pytest
+
+from data_parsing.buses import create_site_buses
+from services.network_cache import NetworkCache, assemble_model
+
+
+@pytest.fixture
+def small_net():
+    """Ring A-B-C with a spur to D, isolated E, and a separate island F-G."""
+    net = pp.create_empty_network()
+    pp.create_buses(net, nr_buses=7, vn_kv=110.0, name=list('ABCDEFG'))
+    pp.create_lines_from_parameters(net, from_buses=[0, 1, 2, 0, 5], to_buses=[1, 2, 0, 3, 6], length_km=10.0,
+                                    r_ohm_per_km=0.1, x_ohm_per_km=0.4, c_nf_per_km=10.0, max_i_ka=0.5)
+    return net
+
+
+@pytest.fixture
+def ring_net():
+    """Ring A-B-C with a spur to D and an isolated bus E."""
+    net = pp.create_empty_network()
+    pp.create_buses(net, nr_buses=5, vn_kv=110.0, name=['A', 'B', 'C', 'D', 'E'])
+    pp.create_lines_from_parameters(net, from_buses=[0, 1, 2, 0], to_buses=[1, 2, 0, 3], length_km=10.0,
+                                    r_ohm_per_km=0.1, x_ohm_per_km=0.4, c_nf_per_km=10.0, max_i_ka=0.5)
+    return net
+
+
+@pytest.fixture
+def model_cache(tmp_path, small_net):
+    """A NetworkCache serving small_net as both networks, its sites 1 km apart near Auckland."""
+    net = small_net
+    bus_data = pd.DataFrame({'bus_idx': net.bus.index, 'name': net.bus['name'], 'type': 'SUB', 'description': '',
+                             'x': 1748000.0 + 1000 * net.bus.index, 'y': 5920000.0, 'lat': -36.8, 'lon': 174.7})
+    source = tmp_path / 'Sites.csv'
+    source.write_text('X,Y\n1,2\n')
+    return NetworkCache(source_files=[str(source)], builder=lambda: assemble_model(net, bus_data, net, bus_data))
+
+
+@pytest.fixture
+def two_site_builder():
+    """A model builder for two sites, A and B, joined by one line."""
+    def build():
+        net = pp.create_empty_network()
+        sites = pd.DataFrame({'name': ['A', 'B'], 'x': [1748000.0, 1749000.0], 'y': [5920000.0, 5921000.0],
+                              'type': ['SUB', 'SUB']})
+        bus_data, _ = create_site_buses(net, sites, 'name', 'x', 'y', attributes={'type': sites['type']})
+        pp.create_lines_from_parameters(net, from_buses=[0], to_buses=[1], length_km=1.0, r_ohm_per_km=0.1,
+                                        x_ohm_per_km=0.1, c_nf_per_km=10, max_i_ka=1, name=['A-B'])
+        return assemble_model(net, bus_data, net, bus_data)
+    return build
+
+
+@pytest.fixture
+def wait_for_job():
+    """Return a function that streams a job's events until it finishes and returns them."""
+    def wait(queue, job):
+        return [item for item in queue.stream(job.id, keepalive_s=1.0) if item is not None]
+    return wait
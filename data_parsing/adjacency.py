@@ -0,0 +1,129 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+@dataclass
+class Adjacency:
+    """CSR-style bus -> incident line index for a pandapower network.
+
+    The incident lines of the bus at position p are line_pos[indptr[p]:indptr[p + 1]], in line-table
+    order, and other_pos holds the bus position at the far end of each of those lines. Positions are
+    row positions in net.bus / net.line; use bus_index / line_index to map them back to labels.
+    """
+    bus_index: pd.Index
+    line_index: pd.Index
+    indptr: np.ndarray
+    line_pos: np.ndarray
+    other_pos: np.ndarray
+
+    def incident(self, bus):
+        """Return (line labels, far-end bus labels) for the lines connected to a bus label."""
+        p = self.bus_index.get_loc(bus)
+        start, stop = self.indptr[p], self.indptr[p + 1]
+        return self.line_index[self.line_pos[start:stop]], self.bus_index[self.other_pos[start:stop]]
+
+    def to_csr(self):
+        """Return the bus-by-bus adjacency as a scipy.sparse CSR matrix (entries count parallel lines)."""
+        n = len(self.bus_index)
+        return csr_matrix((np.ones(len(self.other_pos)), self.other_pos, self.indptr), shape=(n, n))
+
+    def components(self):
+        """Return (n_components, labels): the connected island each bus (in bus-table order) belongs to."""
+        return connected_components(self.to_csr(), directed=False)
+
+    def bridges(self):
+        """Return a boolean mask over line positions marking bridges: lines whose loss splits an island.
+
+        Iterative Tarjan low-link search, O(buses + lines). Parallel lines are never bridges.
+        """
+        n = len(self.bus_index)
+        indptr = self.indptr.tolist()
+        neighbours = self.other_pos.tolist()
+        edges = self.line_pos.tolist()
+        disc = [-1] * n
+        low = [0] * n
+        is_bridge = np.zeros(len(self.line_index), dtype=bool)
+        timer = 0
+        for root in range(n):
+            if disc[root] != -1:
+                continue
+            disc[root] = low[root] = timer
+            timer += 1
+            # Stack entries: [bus, line used to reach it, next CSR slot to visit]
+            stack = [[root, -1, indptr[root]]]
+            while stack:
+                frame = stack[-1]
+                v, parent_edge, i = frame
+                if i < indptr[v + 1]:
+                    frame[2] = i + 1
+                    w, e = neighbours[i], edges[i]
+                    if e == parent_edge:
+                        continue
+                    if disc[w] == -1:
+                        disc[w] = low[w] = timer
+                        timer += 1
+                        stack.append([w, e, indptr[w]])
+                    elif disc[w] < low[v]:
+                        low[v] = disc[w]
+                else:
+                    stack.pop()
+                    if stack:
+                        u = stack[-1][0]
+                        if low[v] < low[u]:
+                            low[u] = low[v]
+                        if low[v] > disc[u]:
+                            is_bridge[parent_edge] = True
+        return is_bridge
+
+    def degree(self):
+        """Return the number of incident lines for every bus, in bus-table order."""
+        return np.diff(self.indptr)
+
+
+def build_adjacency(net, in_service_only=False):
+    """Build the bus -> incident lines index from net.line from_bus/to_bus in one vectorized pass.
+
+    With in_service_only, lines that are out of service are left out of the index.
+    """
+    lines_df = net.line[net.line['in_service'].astype(bool)] if in_service_only else net.line
+    bus_index = pd.Index(net.bus.index)
+    line_index = pd.Index(lines_df.index)
+    from_pos = bus_index.get_indexer(lines_df['from_bus'].to_numpy())
+    to_pos = bus_index.get_indexer(lines_df['to_bus'].to_numpy())
+    if (from_pos < 0).any() or (to_pos < 0).any():
+        raise ValueError("net.line references buses that are not in net.bus")
+
+    n_lines = len(line_index)
+    lines = np.arange(n_lines)
+    # Each line is incident to both of its ends; a line looped back onto one bus is listed once
+    not_loop = from_pos != to_pos
+    ends = np.concatenate([from_pos, to_pos[not_loop]])
+    others = np.concatenate([to_pos, from_pos[not_loop]])
+    line_pos = np.concatenate([lines, lines[not_loop]])
+
+    order = np.lexsort((line_pos, ends))
+    counts = np.bincount(ends, minlength=len(bus_index))
+    indptr = np.zeros(len(bus_index) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return Adjacency(bus_index, line_index, indptr, line_pos[order], others[order])
+
+
+def bus_components(net, in_service_only=False):
+    """Return (n_components, labels) over net.bus order, with buses joined by lines and by transformers.
+
+    Adjacency itself only indexes lines; this is for nets such as the integrated network whose
+    islands are joined through net.trafo.
+    """
+    adjacency = build_adjacency(net, in_service_only)
+    graph = adjacency.to_csr()
+    trafos = net.trafo[net.trafo['in_service'].astype(bool)] if in_service_only else net.trafo
+    if len(trafos):
+        n = len(adjacency.bus_index)
+        hv_pos = adjacency.bus_index.get_indexer(trafos['hv_bus'].to_numpy())
+        lv_pos = adjacency.bus_index.get_indexer(trafos['lv_bus'].to_numpy())
+        graph = graph + csr_matrix((np.ones(len(trafos)), (hv_pos, lv_pos)), shape=(n, n))
+    return connected_components(graph, directed=False)
@@ -0,0 +1,119 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import pandapower as pp
+from data_parsing.geo import nztm_to_wgs84_array
+from data_parsing.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+BUS_DATA_COLUMNS = ['bus_idx', 'name', 'type', 'description', 'lat', 'lon', 'x', 'y']
+
+# How many rejected site names to spell out in the summary warning
+MAX_REPORTED_REJECTS = 20
+
+
+def empty_bus_data():
+    """Return an empty columnar bus_data frame."""
+    return pd.DataFrame({col: pd.Series(dtype=object if col in ('name', 'type', 'description') else float)
+                         for col in BUS_DATA_COLUMNS}).astype({'bus_idx': np.int64})
+
+
+def create_site_buses(net, sites_df, name_col, x_col, y_col, attributes=None, vn_kv=110.0, label='site', id_col=None):
+    """Validate a whole sites frame and create one bus per valid site with a single pp.create_buses call.
+
+    Coordinates are parsed and projected column-wise. Rows whose NZTM coordinates are missing,
+    unparseable or can't be projected are skipped and reported in one summary warning.
+    `attributes` maps extra bus_data columns (e.g. 'type', 'description') to Series aligned with sites_df.
+    With id_col, each bus keeps its row's stable source ID (e.g. GlobalID) in a source_id column of
+    net.bus, which is what incremental updates match rows to buses by.
+
+    Returns (bus_data, rejected): bus_data is a DataFrame with BUS_DATA_COLUMNS, one row per created
+    bus, and rejected is the slice of sites_df that was skipped.
+    """
+    names = sites_df[name_col].astype(str).to_numpy()
+    with stage('projection', rows=len(sites_df)):
+        x = pd.to_numeric(sites_df[x_col], errors='coerce').to_numpy(dtype=np.float64)
+        y = pd.to_numeric(sites_df[y_col], errors='coerce').to_numpy(dtype=np.float64)
+        lat, lon = nztm_to_wgs84_array(x, y)
+
+    valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(lat) & np.isfinite(lon)
+    rejected = sites_df[~valid]
+    if len(rejected):
+        shown = ', '.join(names[~valid][:MAX_REPORTED_REJECTS])
+        more = f" (and {len(rejected) - MAX_REPORTED_REJECTS} more)" if len(rejected) > MAX_REPORTED_REJECTS else ""
+        logger.warning(f"Skipped {len(rejected)} {label}s with invalid coordinates: {shown}{more}")
+
+    nr_buses = int(valid.sum())
+    if nr_buses == 0:
+        return empty_bus_data(), rejected
+
+    with stage('bus_creation', rows=nr_buses):
+        extra = {'source_id': sites_df[id_col].astype(str).to_numpy()[valid]} if id_col else {}
+        bus_idx = pp.create_buses(
+            net,
+            nr_buses=nr_buses,
+            vn_kv=vn_kv,  # Default voltage level
+            name=names[valid],
+            in_service=True,
+            geodata=list(zip(x[valid], y[valid])),  # Store NZTM coordinates
+            **extra
+        )
+
+    bus_data = pd.DataFrame({
+        'bus_idx': np.asarray(bus_idx, dtype=np.int64),
+        'name': names[valid],
+        'type': label,
+        'description': '',
+        'lat': lat[valid],
+        'lon': lon[valid],
+        'x': x[valid],
+        'y': y[valid],
+    })
+    for col, values in (attributes or {}).items():
+        bus_data[col] = pd.Series(values).astype(str).to_numpy()[valid]
+    return bus_data[BUS_DATA_COLUMNS], rejected
+
+
+def create_site_buses_from_chunks(net, chunks, name_col, x_col, y_col, attributes=None, vn_kv=110.0, label='site',
+                                  id_col=None):
+    """Run create_site_buses over a stream of site chunks (see data_parsing.ingest.read_csv_chunks).
+
+    Buses are created chunk by chunk, so only one chunk of the raw CSV is held at a time.
+    `attributes`, if given, is a function of a chunk returning that chunk's attributes dict.
+    Returns the concatenated (bus_data, rejected).
+    """
+    bus_parts, rejected_parts = [], []
+    for chunk in chunks:
+        bus_data, rejected = create_site_buses(net, chunk, name_col, x_col, y_col,
+                                               attributes=attributes(chunk) if attributes else None,
+                                               vn_kv=vn_kv, label=label, id_col=id_col)
+        bus_parts.append(bus_data)
+        rejected_parts.append(rejected)
+    bus_data = concat_chunks(bus_parts, empty_bus_data(), ignore_index=True)
+    rejected = concat_chunks(rejected_parts, pd.DataFrame())
+    return bus_data, rejected
+
+
+def concat_chunks(parts, empty, **kwargs):
+    """Concatenate per-chunk frames, skipping empty ones; return `empty` (or the first part's schema) if all are."""
+    non_empty = [part for part in parts if len(part)]
+    if not non_empty:
+        return parts[0] if parts else empty
+    if len(non_empty) == 1:
+        return non_empty[0]
+    # Each chunk has its own categories and pd.concat would fall back to object; give them one set
+    for col in non_empty[0].columns:
+        if all(isinstance(part[col].dtype, pd.CategoricalDtype) for part in non_empty):
+            categories = union_categoricals([part[col] for part in non_empty]).categories
+            non_empty = [part.assign(**{col: part[col].cat.set_categories(categories)}) for part in non_empty]
+    return pd.concat(non_empty, **kwargs)
+
+
+def bus_name_lookup(net):
+    """Build a name -> bus index hash map for the network, keeping the first bus for duplicate names."""
+    names = net.bus['name'].astype(str)
+    first = ~names.duplicated(keep='first')
+    return pd.Series(net.bus.index[first.to_numpy()], index=names[first].to_numpy())
@@ -0,0 +1,69 @@
+import logging
+import traceback
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+logger = logging.getLogger(__name__)
+
+NZTM = "EPSG:2193"
+WGS84 = "EPSG:4326"
+
+
+@lru_cache(maxsize=None)
+def get_transformer(from_crs=NZTM, to_crs=WGS84):
+    """Return a process-wide cached pyproj Transformer (always_xy) between two CRSs."""
+    return Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+
+def _as_float_array(values):
+    """Convert a scalar, list, NumPy array or pandas Series to a float64 array, with unparseable values as NaN."""
+    arr = np.asarray(values)
+    if arr.dtype.kind in 'fiu':
+        return arr.astype(np.float64, copy=False)
+    parsed = pd.to_numeric(pd.Series(arr.ravel(), dtype=object), errors='coerce')
+    return parsed.to_numpy(dtype=np.float64, na_value=np.nan).reshape(arr.shape)
+
+
+def nztm_to_wgs84_array(x, y):
+    """Project whole columns of NZTM coordinates to WGS84 in a single call.
+
+    Returns (lat, lon) float64 arrays. Rows that can't be parsed or projected come back as NaN.
+    """
+    x = _as_float_array(x)
+    y = _as_float_array(y)
+    lon, lat = get_transformer(NZTM, WGS84).transform(x, y)
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    invalid = ~(np.isfinite(lat) & np.isfinite(lon))
+    lat[invalid] = np.nan
+    lon[invalid] = np.nan
+    return lat, lon
+
+
+def wgs84_to_nztm_array(lat, lon):
+    """Project whole columns of WGS84 latitude/longitude to NZTM. Returns (x, y) float64 arrays."""
+    lat = _as_float_array(lat)
+    lon = _as_float_array(lon)
+    x, y = get_transformer(WGS84, NZTM).transform(lon, lat)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    invalid = ~(np.isfinite(x) & np.isfinite(y))
+    x[invalid] = np.nan
+    y[invalid] = np.nan
+    return x, y
+
+
+def nztm_to_wgs84(x, y):
+    """Convert NZTM coordinates to WGS84 (latitude/longitude)"""
+    try:
+        lon, lat = get_transformer(NZTM, WGS84).transform(float(x), float(y))
+        if not (np.isfinite(lat) and np.isfinite(lon)):
+            return None, None
+        return lat, lon
+    except Exception as e:
+        logger.error(f"Error converting coordinates: {e}")
+        logger.error(traceback.format_exc())
+        return None, None
@@ -0,0 +1,178 @@
+import copy
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+from pandapower.toolbox import drop_buses, drop_lines
+
+from data_parsing.buses import BUS_DATA_COLUMNS, bus_name_lookup, concat_chunks, create_site_buses
+from data_parsing.ingest import read_csv_chunks
+from data_parsing.transpower.transpower_data_parser import SITES_SCHEMA, transpower_site_attributes
+from data_parsing.transpower.transpower_lines import LINES_SCHEMA, _create_line_chunk, parse_line_endpoints
+from data_parsing.vector.vector_data_parser import VECTOR_SITES_SCHEMA, vector_site_attributes
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SiteSource:
+    """How one sites CSV becomes buses (the create_site_buses arguments), and its stable row key."""
+    network: str
+    schema: object
+    key: str
+    name_col: str
+    x_col: str
+    y_col: str
+    attributes: object
+    label: str = 'site'
+
+
+@dataclass(frozen=True)
+class LineSource:
+    """A Transpower-style lines CSV: lines named by MXLOCATION 'FROM-TO-...' site codes, keyed by key."""
+    network: str
+    schema: object
+    key: str
+    name_col: str = 'MXLOCATION'
+
+
+TRANSPOWER_SITES = SiteSource('transpower', SITES_SCHEMA, 'GlobalID', 'MXLOCATION', 'X', 'Y',
+                              transpower_site_attributes)
+TRANSPOWER_LINES = LineSource('transpower', LINES_SCHEMA, 'GlobalID')
+VECTOR_SITES = SiteSource('vector', VECTOR_SITES_SCHEMA, 'OBJECTID', 'Primary Substation Name', 'x', 'y',
+                          vector_site_attributes, label='Vector site')
+
+
+def read_source_rows(path, source):
+    """Read a whole source CSV into one frame with the source's schema."""
+    return concat_chunks(list(read_csv_chunks(path, source.schema)), pd.DataFrame(columns=source.schema.columns),
+                         ignore_index=True)
+
+
+def diff_rows(old, new, key):
+    """Diff two versions of a source table by its key column, hashing each row's values.
+
+    Returns (inserted, updated, deleted): inserted and updated are the new rows (indexed by key) that
+    are new or whose values changed, deleted is an Index of keys that are gone. Raises ValueError if
+    either version has missing or duplicate keys, since rows can't be matched up then.
+    """
+    frames = []
+    for frame in (old, new):
+        keys = frame[key].astype(str)
+        if frame[key].isna().any() or keys.duplicated().any():
+            raise ValueError(f"{key} has missing or duplicate values")
+        frames.append(frame.set_index(keys.rename(key)).drop(columns=key))
+    old, new = frames
+    old_hash = pd.util.hash_pandas_object(old, index=False)
+    new_hash = pd.util.hash_pandas_object(new, index=False)
+    existed = new.index.isin(old.index)
+    changed = existed.copy()
+    changed[existed] = old_hash.reindex(new.index[existed]).to_numpy() != new_hash.to_numpy()[existed]
+    return new[~existed], new[changed], old.index[~old.index.isin(new.index)]
+
+
+@lru_cache(maxsize=1)
+def _empty_network():
+    return pp.create_empty_network()
+
+
+def _keyed(frame, key):
+    """Map each row's source ID to its bus or line label; every row must have one."""
+    if len(frame) and ('source_id' not in frame.columns or frame['source_id'].isna().any()):
+        raise ValueError(f"Not every element has a source {key}; the net needs a full rebuild")
+    ids = frame['source_id'] if len(frame) else pd.Series(dtype=object)
+    return pd.Series(frame.index, index=ids.astype(str).to_numpy(), name=key)
+
+
+def apply_site_changes(net, bus_data, source, old_rows, new_rows):
+    """Apply the inserted, updated and deleted rows of a sites CSV to its live net and bus_data.
+
+    Existing buses keep their labels: updated sites are rewritten in place, new sites get new labels
+    after the highest one, and deleted sites are dropped with the lines connected to them. A site
+    whose coordinates become invalid is dropped; one that becomes valid is created. Returns
+    (bus_data, names, counts): the updated bus_data, the old and new names of every changed site
+    (lines between them need resolving again) and the number of inserted/updated/deleted buses.
+    """
+    inserted, updated, deleted = diff_rows(old_rows, new_rows, source.key)
+    bus_for = _keyed(net.bus, source.key)
+    old_names = old_rows.set_index(old_rows[source.key].astype(str))[source.name_col].astype(str)
+    names = set(old_names.reindex(updated.index.append(deleted)).dropna()) | \
+        set(updated[source.name_col].astype(str)) | set(inserted[source.name_col].astype(str))
+
+    # Project the updated rows on a scratch net, so they go through the same validation as new sites
+    scratch = copy.deepcopy(_empty_network())
+    rows = updated.reset_index()
+    attributes = source.attributes(rows) if source.attributes else None
+    fresh, _ = create_site_buses(scratch, rows, source.name_col, source.x_col, source.y_col,
+                                 attributes=attributes, label=source.label, id_col=source.key)
+    fresh.index = scratch.bus.loc[fresh['bus_idx'], 'source_id'].to_numpy() if len(fresh) else fresh.index.astype(str)
+
+    existing = bus_for.reindex(updated.index)
+    rewrite = existing.notna().to_numpy() & updated.index.isin(fresh.index)
+    invalid = existing.notna().to_numpy() & ~updated.index.isin(fresh.index)
+    drop = np.concatenate([bus_for.reindex(deleted).dropna().to_numpy(), existing[invalid].to_numpy()]).astype(np.int64)
+    create = pd.concat([inserted, updated[existing.isna().to_numpy()]])
+
+    if len(drop):
+        drop_buses(net, drop)
+    if rewrite.any():
+        labels = existing[rewrite].astype(np.int64).to_numpy()
+        rewritten = fresh.loc[updated.index[rewrite]]
+        geo = scratch.bus.set_index('source_id').loc[rewritten.index, 'geo'].to_numpy()
+        net.bus.loc[labels, 'name'] = rewritten['name'].to_numpy()
+        net.bus.loc[labels, 'geo'] = geo
+        bus_data = bus_data.set_index('bus_idx', drop=False)
+        for col in BUS_DATA_COLUMNS[1:]:
+            bus_data.loc[labels, col] = rewritten[col].to_numpy()
+        bus_data = bus_data.reset_index(drop=True)
+    bus_data = bus_data[~bus_data['bus_idx'].isin(drop)]
+    created = bus_data.iloc[:0]
+    if len(create):
+        rows = create.reset_index()
+        attributes = source.attributes(rows) if source.attributes else None
+        created, _ = create_site_buses(net, rows, source.name_col, source.x_col, source.y_col,
+                                       attributes=attributes, label=source.label, id_col=source.key)
+        bus_data = concat_chunks([bus_data, created], bus_data, ignore_index=True)
+    counts = {'inserted': len(created), 'updated': int(rewrite.sum()), 'deleted': len(drop)}
+    return bus_data.reset_index(drop=True), names, counts
+
+
+def apply_line_changes(net, source, old_rows, new_rows, names=()):
+    """Apply a lines CSV's changed rows to its live net, and re-resolve the lines touching `names`.
+
+    Lines are matched to rows by source_id: changed rows are re-pointed at their (possibly renamed)
+    end buses in place, rows that no longer resolve to two buses drop their line and rows that now
+    resolve get a new one. Returns the number of lines created, updated and dropped.
+    """
+    inserted, updated, deleted = diff_rows(old_rows, new_rows, source.key)
+    rows = new_rows.set_index(new_rows[source.key].astype(str).rename(source.key))
+    endpoints = parse_line_endpoints(rows[source.name_col])
+    touching = (endpoints['start'].isin(names) | endpoints['end'].isin(names)).to_numpy()
+    recheck = rows.index[touching | rows.index.isin(inserted.index) | rows.index.isin(updated.index)]
+
+    line_for = _keyed(net.line, source.key)
+    drop = list(line_for.reindex(deleted).dropna().astype(np.int64))
+    rows = rows.loc[recheck]
+    endpoints = parse_line_endpoints(rows[source.name_col])
+    lookup = bus_name_lookup(net)
+    from_buses, to_buses = endpoints['start'].map(lookup), endpoints['end'].map(lookup)
+    resolved = (from_buses.notna() & to_buses.notna()).to_numpy()
+    existing = line_for.reindex(rows.index)
+    has_line = existing.notna().to_numpy()
+
+    update = has_line & resolved
+    if update.any():
+        labels = existing[update].astype(np.int64).to_numpy()
+        net.line.loc[labels, 'from_bus'] = from_buses[update].astype(np.int64).to_numpy()
+        net.line.loc[labels, 'to_bus'] = to_buses[update].astype(np.int64).to_numpy()
+        net.line.loc[labels, 'name'] = rows[source.name_col].astype(str).to_numpy()[update]
+    drop += list(existing[has_line & ~resolved].astype(np.int64))
+    if drop:
+        drop_lines(net, drop)
+    create = ~has_line & resolved
+    if create.any():
+        _create_line_chunk(net, rows[create].reset_index(drop=True), lookup)
+    return {'inserted': int(create.sum()), 'updated': int(update.sum()), 'deleted': len(drop)}
@@ -0,0 +1,92 @@
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from data_parsing.profiling import timed_iter
+
+logger = logging.getLogger(__name__)
+
+# Rows per chunk with the pandas engine
+CHUNK_ROWS = 100_000
+
+# Bytes per block with the pyarrow engine (about 100k rows of a typical asset register)
+ARROW_BLOCK_BYTES = 16 << 20
+
+
+@dataclass(frozen=True)
+class CsvSchema:
+    """The columns read from one source CSV and the dtype each ends up as.
+
+    Float columns are parsed leniently: values that aren't numbers become NaN, so the builders can
+    reject those rows instead of the whole file failing. 'category' columns are dictionary-encoded;
+    anything else (e.g. 'str') is read as text. Columns not in the schema are never materialised.
+    """
+    name: str
+    dtypes: dict
+
+    @property
+    def columns(self):
+        return list(self.dtypes)
+
+
+def _is_float(dtype):
+    return dtype not in ('category', 'str', 'string', object) and np.dtype(dtype).kind == 'f'
+
+
+def _finish_chunk(chunk, schema, offset):
+    """Coerce a raw chunk to the schema's dtypes and give it row labels continuing across chunks."""
+    for col, dtype in schema.dtypes.items():
+        if _is_float(dtype):
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype(dtype)
+        elif dtype == 'category' and not isinstance(chunk[col].dtype, pd.CategoricalDtype):
+            chunk[col] = chunk[col].astype('category')
+    chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+    return chunk[schema.columns]
+
+
+def _pandas_chunks(path, schema, chunk_rows):
+    # Text and categorical columns are typed by the parser; float columns are coerced per chunk
+    dtypes = {col: ('category' if dtype == 'category' else str)
+              for col, dtype in schema.dtypes.items() if not _is_float(dtype)}
+    # utf-8-sig strips the byte order mark the ArcGIS exports start with (e.g. '﻿X')
+    yield from pd.read_csv(path, usecols=schema.columns, dtype=dtypes, encoding='utf-8-sig', chunksize=chunk_rows)
+
+
+def _arrow_chunks(path, schema, block_bytes):
+    # Floats are read as text and coerced like the pandas engine, so one bad value can't fail the stream
+    column_types = {col: pa.dictionary(pa.int32(), pa.string()) if dtype == 'category' else pa.string()
+                    for col, dtype in schema.dtypes.items()}
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=block_bytes),
+        convert_options=pa_csv.ConvertOptions(include_columns=schema.columns, column_types=column_types,
+                                              strings_can_be_null=True),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def read_csv_chunks(path, schema, chunk_rows=CHUNK_ROWS, engine='auto', block_bytes=ARROW_BLOCK_BYTES):
+    """Stream a source CSV as DataFrames with the schema's columns and dtypes, one bounded chunk at a time.
+
+    engine is 'pyarrow' (multi-threaded streaming reader, block_bytes of CSV per chunk; 'auto' is the
+    same) or 'pandas' (C parser, chunk_rows rows per chunk). Row labels run on across chunks, so they
+    are row positions in the file. Peak memory depends on the chunk size, not the file size.
+    """
+    if engine == 'pandas':
+        raw_chunks = _pandas_chunks(path, schema, chunk_rows)
+    else:
+        raw_chunks = _arrow_chunks(path, schema, block_bytes)
+    yield from timed_iter('csv_read', _typed_chunks(raw_chunks, schema))
+
+
+def _typed_chunks(raw_chunks, schema):
+    offset = 0
+    for chunk in raw_chunks:
+        yield _finish_chunk(chunk, schema, offset)
+        offset += len(chunk)
+
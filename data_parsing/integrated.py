@@ -0,0 +1,208 @@
+import copy
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+from pandapower.toolbox import merge_nets, reindex_buses
+from scipy.spatial import cKDTree
+
+from data_parsing.adjacency import build_adjacency
+from data_parsing.buses import BUS_DATA_COLUMNS
+from data_parsing.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+# Vector sites named like this are Vector's side of a Transpower grid exit point (GXP), as in the
+# FEEDER_TO_SUBSTATION names ('TPTAK' -> 'TP TAKANINI 220/33KV')
+GXP_PREFIX = 'TP '
+
+# Transpower site type that can supply a GXP (tees and HVDC sites can't)
+GXP_SITE_TYPE = 'ACSTN'
+
+# Furthest a Vector GXP site may be from the Transpower substation it is joined to, in NZTM metres
+MAX_GXP_DISTANCE_M = 5000.0
+
+# Furthest a Vector site may be from the GXP that supplies it; sites further away stay unjoined
+MAX_SUPPLY_DISTANCE_M = 30000.0
+
+# Nearest Transpower substations checked for a name match before falling back to the nearest one
+GXP_CANDIDATES = 4
+
+# Voltage levels in a site name, e.g. '220/33KV', '110/33 kV' or '220/110/33/22kV'
+VOLTAGE_PATTERN = r'(\d+(?:\.\d+)?(?:\s*/\s*\d+(?:\.\d+)?)*)\s*kV'
+
+# Bus voltage for Vector sites whose name has no voltage in it
+DEFAULT_VECTOR_KV = 33.0
+
+# Equivalent transformer parameters for every GXP and supply link (no nameplate data is available)
+TRAFO_SN_MVA = 120.0
+TRAFO_VK_PERCENT = 12.0
+TRAFO_VKR_PERCENT = 0.4
+
+LINK_COLUMNS = ['vector_bus', 'transpower_bus', 'vector_name', 'transpower_name', 'distance_m', 'method', 'trafo']
+
+
+def site_voltages(names):
+    """Parse the voltage levels out of site names column-wise.
+
+    Returns a DataFrame with hv_kv (first level) and lv_kv (last level), NaN where the name has none.
+    Example: 'TP PENROSE 220/110/33/22kV' -> 220, 22; 'MANUREWA 33/11KV' -> 33, 11.
+    """
+    levels = pd.Series(names, dtype=object).astype(str).str.extract(VOLTAGE_PATTERN, flags=re.IGNORECASE)[0]
+    levels = levels.str.replace(' ', '', regex=False).str.split('/')
+    return pd.DataFrame({'hv_kv': pd.to_numeric(levels.str[0], errors='coerce'),
+                         'lv_kv': pd.to_numeric(levels.str[-1], errors='coerce')})
+
+
+def gxp_hints(names):
+    """Return the place-name hint of GXP site names: 'TP Wairau Rd 220/33 kV' -> 'WAIRAU'."""
+    names = pd.Series(names, dtype=object).astype(str).str.upper().str.slice(len(GXP_PREFIX))
+    return names.str.replace(VOLTAGE_PATTERN, '', regex=True, flags=re.IGNORECASE).str.split().str[0].fillna('')
+
+
+def match_gxps(vector_bus_data, transpower_bus_data, max_distance_m=MAX_GXP_DISTANCE_M, candidates=GXP_CANDIDATES):
+    """Join each Vector GXP site to the Transpower substation it sits at.
+
+    One KD-tree query finds the nearest `candidates` Transpower substations within max_distance_m of
+    every Vector GXP site (NZTM x/y). Of those, the nearest whose description contains the site's
+    name hint is taken (method 'name'), else the nearest one (method 'nearest'). Sites with no
+    substation in range are left out. Returns a DataFrame with LINK_COLUMNS except 'trafo'.
+    """
+    names = vector_bus_data['name'].astype(str)
+    gxps = vector_bus_data[names.str.upper().str.startswith(GXP_PREFIX).to_numpy()]
+    substations = transpower_bus_data[(transpower_bus_data['type'] == GXP_SITE_TYPE).to_numpy()]
+    if not len(gxps) or not len(substations):
+        return pd.DataFrame(columns=LINK_COLUMNS[:-1])
+
+    k = min(candidates, len(substations))
+    tree = cKDTree(substations[['x', 'y']].to_numpy(dtype=float))
+    distance, pos = tree.query(gxps[['x', 'y']].to_numpy(dtype=float), k=k, distance_upper_bound=max_distance_m)
+    distance, pos = distance.reshape(len(gxps), k), pos.reshape(len(gxps), k)
+
+    # Missing neighbours come back as position len(substations); give them an empty description
+    descriptions = np.append(substations['description'].astype(str).str.upper().to_numpy(), '')[pos]
+    hints = gxp_hints(gxps['name']).to_numpy(dtype=str)
+    named = (np.char.find(descriptions.astype(str), hints[:, None]) >= 0) & (hints[:, None] != '')
+    named &= np.isfinite(distance)
+    choice = np.where(named.any(axis=1), named.argmax(axis=1), 0)
+    rows = np.arange(len(gxps))
+    distance, pos = distance[rows, choice], pos[rows, choice]
+
+    found = np.isfinite(distance)
+    if not found.all():
+        logger.warning(f"No Transpower substation within {max_distance_m:.0f} m of Vector GXP sites: "
+                       f"{', '.join(gxps['name'].astype(str).to_numpy()[~found])}")
+    substations = substations.iloc[pos[found]]
+    return pd.DataFrame({
+        'vector_bus': gxps['bus_idx'].to_numpy()[found],
+        'transpower_bus': substations['bus_idx'].to_numpy(),
+        'vector_name': gxps['name'].astype(str).to_numpy()[found],
+        'transpower_name': substations['name'].astype(str).to_numpy(),
+        'distance_m': distance[found],
+        'method': np.where(named[rows, choice][found], 'name', 'nearest'),
+    })
+
+
+def match_supply(vector_net, vector_bus_data, gxp_links, max_distance_m=MAX_SUPPLY_DISTANCE_M):
+    """Join the Vector sites that no GXP supplies to their nearest GXP.
+
+    A site is already supplied when an in-service Vector line path connects it to a joined GXP site.
+    The others are joined, in one KD-tree query, to the Transpower substation of the nearest joined
+    GXP site within max_distance_m (method 'supply'). Returns a DataFrame like match_gxps.
+    """
+    if not len(gxp_links):
+        return pd.DataFrame(columns=LINK_COLUMNS[:-1])
+    _, island = build_adjacency(vector_net, in_service_only=True).components()
+    island = pd.Series(island, index=vector_net.bus.index)
+    supplied = island.isin(island[gxp_links['vector_bus']].to_numpy())
+    sites = vector_bus_data[~supplied.reindex(vector_bus_data['bus_idx']).fillna(False).to_numpy(dtype=bool)]
+    if not len(sites):
+        return pd.DataFrame(columns=LINK_COLUMNS[:-1])
+
+    gxp_xy = vector_bus_data.set_index('bus_idx').loc[gxp_links['vector_bus'], ['x', 'y']].to_numpy(dtype=float)
+    distance, nearest = cKDTree(gxp_xy).query(sites[['x', 'y']].to_numpy(dtype=float),
+                                              distance_upper_bound=max_distance_m)
+    found = np.isfinite(distance)
+    if not found.all():
+        logger.warning(f"No GXP within {max_distance_m:.0f} m of Vector sites: "
+                       f"{', '.join(sites['name'].astype(str).to_numpy()[~found])}")
+    gxps = gxp_links.iloc[nearest[found]]
+    return pd.DataFrame({
+        'vector_bus': sites['bus_idx'].to_numpy()[found],
+        'transpower_bus': gxps['transpower_bus'].to_numpy(),
+        'vector_name': sites['name'].astype(str).to_numpy()[found],
+        'transpower_name': gxps['transpower_name'].to_numpy(),
+        # Measured to the GXP site, which stands in for its Transpower substation's position
+        'distance_m': distance[found],
+        'method': 'supply',
+    })
+
+
+def create_integrated_network(transpower_net, transpower_bus_data, vector_net, vector_bus_data):
+    """Merge the Transpower and Vector networks into one net joined by transformers at the GXPs.
+
+    Vector GXP sites are joined to their Transpower substation (match_gxps) and the remaining Vector
+    sites to their nearest GXP (match_supply); every link becomes one equivalent transformer, all
+    created in a single call. Vector buses take their voltage from the site name (a GXP site's
+    lowest level, any other site's highest), and a GXP's Transpower bus from the high side of the
+    GXP site's name, so each transformer steps from the Transpower bus voltage down to the Vector
+    one. The input nets are not modified.
+
+    Returns (net, bus_data, links): Transpower buses keep their labels, Vector buses are relabelled
+    after them; bus_data has both networks' rows with the new labels; links has LINK_COLUMNS with
+    the new labels and the created transformer's index.
+    """
+    with stage('gxp_matching', rows=len(vector_bus_data)):
+        gxp_links = match_gxps(vector_bus_data, transpower_bus_data)
+        links = pd.concat([gxp_links, match_supply(vector_net, vector_bus_data, gxp_links)], ignore_index=True)
+
+    with stage('integration', rows=len(transpower_net.bus) + len(vector_net.bus)):
+        # Relabel the Vector buses after the Transpower ones, keeping their order
+        start = int(transpower_net.bus.index.max()) + 1 if len(transpower_net.bus) else 0
+        relabel = pd.Series(np.arange(start, start + len(vector_net.bus), dtype=np.int64), index=vector_net.bus.index)
+        vector_copy = copy.deepcopy(vector_net)
+        reindex_buses(vector_copy, relabel.to_dict())
+        net = merge_nets(transpower_net, vector_copy, validate=False, merge_results=False,
+                         net2_reindex_log_level='debug')
+        net.name = 'IntegratedNet'
+        vector_buses = relabel.to_numpy()
+
+        voltages = site_voltages(vector_net.bus['name'])
+        is_gxp = vector_net.bus['name'].astype(str).str.upper().str.startswith(GXP_PREFIX).to_numpy()
+        vn_kv = np.where(is_gxp, voltages['lv_kv'], voltages['hv_kv'])
+        net.bus.loc[vector_buses, 'vn_kv'] = np.where(np.isfinite(vn_kv), vn_kv, DEFAULT_VECTOR_KV)
+
+        # Transpower buses are all created at one default voltage, so a GXP's substation takes the
+        # high side of the GXP site's name instead ('TP TAKANINI 220/33KV' -> 220 kV), the highest if several
+        gxp_kv = site_voltages(links['vector_name'])
+        gxp_kv = gxp_kv['hv_kv'].where((links['method'] != 'supply') & (gxp_kv['hv_kv'] > gxp_kv['lv_kv']))
+        hv_kv = gxp_kv.groupby(links['transpower_bus'].to_numpy()).max().dropna()
+        net.bus.loc[hv_kv.index, 'vn_kv'] = hv_kv.to_numpy(dtype=float)
+
+        links['vector_bus'] = relabel.reindex(links['vector_bus']).to_numpy()
+        links['trafo'] = pd.Series(dtype=np.int64)
+        if len(links):
+            hv_buses = links['transpower_bus'].to_numpy(dtype=np.int64)
+            lv_buses = links['vector_bus'].to_numpy(dtype=np.int64)
+            links['trafo'] = pp.create_transformers_from_parameters(
+                net,
+                hv_buses=hv_buses,
+                lv_buses=lv_buses,
+                sn_mva=TRAFO_SN_MVA,
+                vn_hv_kv=net.bus.loc[hv_buses, 'vn_kv'].to_numpy(dtype=float),
+                vn_lv_kv=net.bus.loc[lv_buses, 'vn_kv'].to_numpy(dtype=float),
+                vkr_percent=TRAFO_VKR_PERCENT,
+                vk_percent=TRAFO_VK_PERCENT,
+                pfe_kw=0.0,
+                i0_percent=0.0,
+                name=(links['transpower_name'] + ' - ' + links['vector_name']).to_numpy(),
+            )
+
+    vector_rows = vector_bus_data.assign(bus_idx=relabel.reindex(vector_bus_data['bus_idx']).to_numpy())
+    bus_data = pd.concat([transpower_bus_data, vector_rows], ignore_index=True)[BUS_DATA_COLUMNS]
+    counts = links['method'].value_counts()
+    logger.info(f"Integrated network joins {counts.get('name', 0) + counts.get('nearest', 0)} GXPs "
+                f"({counts.get('nearest', 0)} by distance only) and {counts.get('supply', 0)} supplied Vector sites")
+    return net, bus_data, links[LINK_COLUMNS]
@@ -1,147 +1,167 @@
 import pandas as pd
 import pandapower as pp
-from pyproj import Transformer
+from data_parsing.adjacency import build_adjacency
+from data_parsing.buses import create_site_buses_from_chunks
+from data_parsing.ingest import CsvSchema, read_csv_chunks
+from data_parsing.profiling import stage
 import logging
 import traceback
 import os
 import json
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
-def nztm_to_wgs84(x, y):
-    """Convert NZTM coordinates to WGS84 (latitude/longitude)"""
+SITES_CSV = 'data/Transpower/Sites.csv'
+SITES_SCHEMA = CsvSchema('Transpower site', {
+    'X': 'float32',
+    'Y': 'float32',
+    'MXLOCATION': 'str',
+    'type': 'category',
+    'status': 'category',
+    'description': 'str',
+    'GlobalID': 'str',
+})
+SUBSTATION_DIR = 'data/Transpower/substations'
+SUBSTATION_MANIFEST = '_manifest.json'
+
+def build_substation_records(net, bus_data):
+    """Build the per-substation export records (data and connections) for every bus in the network."""
+    adjacency = build_adjacency(net)
+    coords = dict(zip(bus_data['bus_idx'], zip(bus_data['x'], bus_data['y'], bus_data['lat'], bus_data['lon'])))
+    names = net.bus['name'].astype(str).to_numpy()
+    vn_kv = net.bus['vn_kv'].to_numpy(dtype=float)
+    line_names = net.line['name'].astype(str).to_numpy()
+    line_params = {
+        col: net.line[col].to_numpy(dtype=float)
+        for col in ('length_km', 'r_ohm_per_km', 'x_ohm_per_km', 'c_nf_per_km', 'max_i_ka')
+    }
+
+    records = {}
+    for pos, bus_idx in enumerate(adjacency.bus_index):
+        start, stop = adjacency.indptr[pos], adjacency.indptr[pos + 1]
+        connected_lines = []
+        for line_pos, other_pos in zip(adjacency.line_pos[start:stop], adjacency.other_pos[start:stop]):
+            connected_lines.append({
+                'id': int(adjacency.line_index[line_pos]),
+                'name': line_names[line_pos],
+                'connected_to': names[other_pos],
+                'voltage_kv': float(vn_kv[pos]),
+                **{col: float(values[line_pos]) for col, values in line_params.items()}
+            })
+
+        substation_data = {
+            'name': names[pos],
+            'voltage_kv': float(vn_kv[pos]),
+            'coordinates': {},
+            'connected_lines': connected_lines,
+            'type': 'transpower'
+        }
+        if bus_idx in coords:
+            x, y, lat, lon = coords[bus_idx]
+            substation_data['coordinates']['nztm'] = {'x': float(x), 'y': float(y)}
+            if pd.notna(lat) and pd.notna(lon):
+                substation_data['coordinates']['wgs84'] = {'lat': float(lat), 'lon': float(lon)}
+        records[names[pos]] = substation_data
+    return records
+
+def _write_atomic(path, content):
+    """Write bytes to path via a temporary file in the same directory and an atomic rename."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-', suffix='.json')
     try:
-        transformer = Transformer.from_crs("EPSG:2193", "EPSG:4326", always_xy=True)
-        lon, lat = transformer.transform(float(x), float(y))
-        return lat, lon
-    except Exception as e:
-        logger.error(f"Error converting coordinates: {e}")
-        logger.error(traceback.format_exc())
-        return None, None
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
-def create_substation_files(net, bus_data):
-    """Create individual files for each substation containing their data and connections."""
+def _load_manifest(substation_dir):
     try:
-        # Create directory for substation files if it doesn't exist
-        substation_dir = 'data/Transpower/substations'
-        os.makedirs(substation_dir, exist_ok=True)
-        
-        # Process each bus/substation
-        for idx, bus in net.bus.iterrows():
-            try:
-                # Get substation name
-                substation_name = str(bus['name'])
-                
-                # Find all lines connected to this substation
-                connected_lines = []
-                for line_idx, line in net.line.iterrows():
-                    if line['from_bus'] == idx or line['to_bus'] == idx:
-                        # Get the other end of the line
-                        other_bus_idx = line['to_bus'] if line['from_bus'] == idx else line['from_bus']
-                        other_bus = net.bus.iloc[other_bus_idx]
-                        
-                        connected_lines.append({
-                            'id': int(line_idx),
-                            'name': str(line['name']),
-                            'connected_to': str(other_bus['name']),
-                            'voltage_kv': float(bus['vn_kv']),
-                            'length_km': float(line['length_km']),
-                            'r_ohm_per_km': float(line['r_ohm_per_km']),
-                            'x_ohm_per_km': float(line['x_ohm_per_km']),
-                            'c_nf_per_km': float(line['c_nf_per_km']),
-                            'max_i_ka': float(line['max_i_ka'])
-                        })
-                
-                # Create substation data object
-                substation_data = {
-                    'name': substation_name,
-                    'voltage_kv': float(bus['vn_kv']),
-                    'coordinates': {
-                        'nztm': {
-                            'x': float(bus['geodata'][0]),
-                            'y': float(bus['geodata'][1])
-                        }
-                    },
-                    'connected_lines': connected_lines,
-                    'type': 'transpower'
-                }
-                
-                # Convert coordinates to WGS84
-                lat, lon = nztm_to_wgs84(bus['geodata'][0], bus['geodata'][1])
-                if lat is not None and lon is not None:
-                    substation_data['coordinates']['wgs84'] = {
-                        'lat': lat,
-                        'lon': lon
-                    }
-                
-                # Save to file
-                filename = f"{substation_dir}/{substation_name}.json"
-                with open(filename, 'w') as f:
-                    json.dump(substation_data, f, indent=2)
-                
-                logger.info(f"Created substation file for {substation_name}")
-                
-            except Exception as e:
-                logger.error(f"Error processing substation {bus['name']}: {e}")
-                logger.error(traceback.format_exc())
-                continue
-        
-        logger.info(f"Created substation files in {substation_dir}")
-        return True
+        with open(os.path.join(substation_dir, SUBSTATION_MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def create_substation_files(net, bus_data, substation_dir=SUBSTATION_DIR, max_workers=8):
+    """Write one JSON file per substation containing its data and connections.
+
+    The export is incremental: a manifest of content hashes is kept alongside the files and only
+    substations whose content changed (or whose file is missing) are rewritten. Writes are atomic
+    and run in parallel on a thread pool; files for substations that no longer exist are removed.
+    Returns a summary dict of written/unchanged/removed counts, or None on failure.
+    """
+    try:
+        with stage('substation_export') as timer:
+            summary = _export_substation_files(net, bus_data, substation_dir, max_workers)
+            timer.rows = summary['written']
+        logger.info(f"Exported substation files to {substation_dir}: {summary}")
+        return summary
     except Exception as e:
         logger.error(f"Error creating substation files: {e}")
         logger.error(traceback.format_exc())
-        return False
+        return None
 
-def create_transpower_network():
-    """Create a pandapower network and load Transpower sites as buses. Return the network and a list of bus info for mapping."""
+def _export_substation_files(net, bus_data, substation_dir, max_workers):
+    """Write the changed substation files and the manifest; return the written/unchanged/removed counts."""
+    # Create directory for substation files if it doesn't exist
+    os.makedirs(substation_dir, exist_ok=True)
+    records = build_substation_records(net, bus_data)
+    manifest = _load_manifest(substation_dir)
+
+    new_manifest = {}
+    pending = []
+    for substation_name, substation_data in records.items():
+        filename = f"{substation_name}.json"
+        content = json.dumps(substation_data, indent=2).encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        new_manifest[filename] = digest
+        path = os.path.join(substation_dir, filename)
+        if manifest.get(filename) != digest or not os.path.exists(path):
+            pending.append((path, content))
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(lambda item: _write_atomic(*item), pending))
+
+    removed = 0
+    for filename in set(manifest) - set(new_manifest):
+        try:
+            os.remove(os.path.join(substation_dir, filename))
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+    _write_atomic(os.path.join(substation_dir, SUBSTATION_MANIFEST),
+                  json.dumps(new_manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    return {'written': len(pending), 'unchanged': len(records) - len(pending), 'removed': removed}
+
+def transpower_site_attributes(sites_df):
+    """Build the bus_data type/description columns for a chunk of Transpower sites."""
+    return {'type': sites_df['type'], 'description': sites_df['description']}
+
+def create_transpower_network(sites_csv=SITES_CSV):
+    """Create a pandapower network and load Transpower sites as buses. Return the network and a columnar bus_data frame for mapping."""
     try:
         logger.info("Creating new pandapower network")
         net = pp.create_empty_network(name="TransNet")
         logger.info("Loading sites data from CSV")
-        sites_df = pd.read_csv('data/Transpower/Sites.csv')
-        logger.info(f"Loaded {len(sites_df)} sites")
-        bus_data = []
-        
-        # Add buses to the network
-        for idx, row in sites_df.iterrows():
-            try:
-                lat, lon = nztm_to_wgs84(row['X'], row['Y'])
-                if lat is None or lon is None:
-                    logger.warning(f"Could not convert coordinates for site {row['MXLOCATION']}")
-                    continue
-                
-                # Create bus with geodata as a tuple (x, y)
-                bus_idx = pp.create_bus(
-                    net,
-                    name=str(row['MXLOCATION']),
-                    vn_kv=110.0,  # Default voltage level
-                    in_service=True,
-                    geodata=(float(row['X']), float(row['Y']))  # Store NZTM coordinates
-                )
-                
-                # Store bus data with both coordinate systems
-                bus_data.append({
-                    'bus_idx': bus_idx,
-                    'name': str(row['MXLOCATION']),
-                    'type': str(row['type']),
-                    'description': str(row['description']),
-                    'lat': lat,
-                    'lon': lon,
-                    'x': float(row['X']),
-                    'y': float(row['Y'])
-                })
-                logger.debug(f"Created bus {bus_idx} for site {row['MXLOCATION']}")
-            except Exception as e:
-                logger.error(f"Error processing site {row['MXLOCATION']}: {e}")
-                logger.error(traceback.format_exc())
-                continue
-        
-        logger.info(f"Created {len(bus_data)} buses in the network")
-        
-        # Create individual files for each substation
-        create_substation_files(net, bus_data)
+        # Stream the sites in chunks; each chunk is validated, projected and added as buses in one pass
+        bus_data, rejected = create_site_buses_from_chunks(
+            net,
+            read_csv_chunks(sites_csv, SITES_SCHEMA),
+            name_col='MXLOCATION',
+            x_col='X',
+            y_col='Y',
+            attributes=transpower_site_attributes,
+            id_col='GlobalID'
+        )
+        logger.info(f"Loaded {len(bus_data) + len(rejected)} sites")
         
+        logger.info(f"Created {len(bus_data)} buses in the network ({len(rejected)} sites rejected)")
         return net, bus_data
     except Exception as e:
         logger.error(f"Error creating network: {e}")
@@ -2,51 +2,91 @@ import pandas as pd
 import logging
 import traceback
 import pandapower as pp
+from data_parsing.buses import bus_name_lookup, concat_chunks
+from data_parsing.ingest import CsvSchema, read_csv_chunks
+from data_parsing.profiling import stage
 
 logger = logging.getLogger(__name__)
 
-def load_transmission_lines(net):
-    """Load transmission lines from CSV and create pandapower lines connecting the corresponding buses."""
+LINES_CSV = 'data/Transpower/Transmission_Lines.csv'
+LINES_SCHEMA = CsvSchema('Transpower line', {
+    'MXLOCATION': 'str',
+    'designvolt': 'category',
+    'status': 'category',
+    'description': 'str',
+    'type': 'category',
+    'GlobalID': 'str',
+    'Shape__Length': 'float64',
+})
+
+# How many rejected line names to spell out in the summary warning
+MAX_REPORTED_REJECTS = 20
+
+def parse_line_endpoints(mxlocation):
+    """Split MXLOCATION codes into start and end site codes (e.g., 'AHA-DOB-A' -> 'AHA' and 'DOB').
+    Returns a DataFrame with 'start' and 'end' columns; rows without a '-' separator are NaN.
+    """
+    endpoints = mxlocation.astype(str).str.extract(r'^([^-]*)-([^-]*)')
+    endpoints.columns = ['start', 'end']
+    return endpoints
+
+def _create_line_chunk(net, lines_df, lookup):
+    """Create the lines of one CSV chunk in a single call; return the chunk's unmatched rows with a 'reason'."""
+    # Extract start and end bus names for every line at once
+    mxlocation = lines_df['MXLOCATION'].astype(str)
+    endpoints = parse_line_endpoints(mxlocation)
+    from_buses = endpoints['start'].map(lookup)
+    to_buses = endpoints['end'].map(lookup)
+
+    valid_format = endpoints['start'].notna()
+    matched = valid_format & from_buses.notna() & to_buses.notna()
+
+    rejected = lines_df[~matched].copy()
+    rejected['reason'] = 'unknown bus'
+    rejected.loc[~valid_format[~matched], 'reason'] = 'invalid MXLOCATION format'
+
+    if matched.any():
+        # Create all pandapower lines connecting the buses in one call
+        pp.create_lines_from_parameters(
+            net,
+            from_buses=from_buses[matched].astype(int).to_numpy(),
+            to_buses=to_buses[matched].astype(int).to_numpy(),
+            length_km=1.0,  # Default length
+            r_ohm_per_km=0.1,  # Default resistance
+            x_ohm_per_km=0.1,  # Default reactance
+            c_nf_per_km=10.0,  # Default capacitance
+            max_i_ka=1.0,  # Default max current
+            name=mxlocation[matched].to_numpy(),
+            source_id=lines_df['GlobalID'][matched].astype(str).to_numpy()
+        )
+    return rejected
+
+def load_transmission_lines(net, lines_csv=LINES_CSV):
+    """Load transmission lines from CSV and create pandapower lines connecting the corresponding buses.
+    The CSV is streamed in chunks and each chunk's lines are created in one call.
+    Returns a DataFrame of the CSV rows that could not be matched to two buses, with a 'reason' column.
+    """
     try:
         logger.info("Loading transmission lines from CSV")
-        lines_df = pd.read_csv('data/Transpower/Transmission_Lines.csv')
-        logger.info(f"Loaded {len(lines_df)} transmission lines")
-        for idx, row in lines_df.iterrows():
-            try:
-                # Extract start and end bus names from MXLOCATION (e.g., 'AHA-DOB-A' -> 'AHA' and 'DOB')
-                mxlocation = str(row['MXLOCATION'])
-                parts = mxlocation.split('-')
-                if len(parts) >= 2:
-                    start_bus_name = parts[0]
-                    end_bus_name = parts[1]
-                    # Find the bus indices by name
-                    start_bus_idx = net.bus[net.bus['name'] == start_bus_name].index
-                    end_bus_idx = net.bus[net.bus['name'] == end_bus_name].index
-                    if len(start_bus_idx) > 0 and len(end_bus_idx) > 0:
-                        start_bus_idx = start_bus_idx[0]
-                        end_bus_idx = end_bus_idx[0]
-                        # Create a pandapower line connecting the buses
-                        pp.create_line_from_parameters(
-                            net,
-                            from_bus=start_bus_idx,
-                            to_bus=end_bus_idx,
-                            length_km=1.0,  # Default length
-                            r_ohm_per_km=0.1,  # Default resistance
-                            x_ohm_per_km=0.1,  # Default reactance
-                            c_nf_per_km=10.0,  # Default capacitance
-                            max_i_ka=1.0,  # Default max current
-                            name=mxlocation
-                        )
-                        logger.debug(f"Created line {mxlocation} connecting buses {start_bus_name} and {end_bus_name}")
-                    else:
-                        logger.warning(f"Could not find bus indices for line {mxlocation}")
-                else:
-                    logger.warning(f"Invalid MXLOCATION format for line {mxlocation}")
-            except Exception as e:
-                logger.error(f"Error processing line {row['MXLOCATION']}: {e}")
-                logger.error(traceback.format_exc())
-                continue
+        # Resolve both ends through a name -> index hash map built once
+        lookup = bus_name_lookup(net)
+        rejected_parts = []
+        n_lines = 0
+        for lines_df in read_csv_chunks(lines_csv, LINES_SCHEMA):
+            n_lines += len(lines_df)
+            with stage('line_creation', rows=len(lines_df)):
+                rejected_parts.append(_create_line_chunk(net, lines_df, lookup))
+        logger.info(f"Loaded {n_lines} transmission lines")
+
+        rejected = concat_chunks(rejected_parts, pd.DataFrame(columns=LINES_SCHEMA.columns + ['reason']))
+        if len(rejected):
+            names = rejected['MXLOCATION'].astype(str)
+            shown = ', '.join(names.head(MAX_REPORTED_REJECTS))
+            more = f" (and {len(rejected) - MAX_REPORTED_REJECTS} more)" if len(rejected) > MAX_REPORTED_REJECTS else ""
+            logger.warning(f"Could not match {len(rejected)} transmission lines to buses: {shown}{more}")
         logger.info(f"Created {len(net.line)} lines in the network")
+        return rejected
     except Exception as e:
         logger.error(f"Error loading transmission lines: {e}")
-        logger.error(traceback.format_exc()) 
\ No newline at end of file
+        logger.error(traceback.format_exc())
+        return None
@@ -2,12 +2,19 @@ import pandas as pd
 import logging
 import traceback
 import pandapower as pp
-import re
+from data_parsing.buses import bus_name_lookup, concat_chunks
+from data_parsing.ingest import CsvSchema, read_csv_chunks
+from data_parsing.profiling import stage
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+VECTOR_LINES_CSV = 'data/Vector/distribution_feeder_network_and_zone_substations_4095785886967079183.csv'
+VECTOR_LINES_SCHEMA = CsvSchema('Vector line', {
+    'Feeder Name': 'str',
+    'OPVOLTAGE_': 'category',
+    'Shape__Length': 'float64',
+})
+
 # Mapping of feeder codes to substation names
 FEEDER_TO_SUBSTATION = {
     'BKBY': 'BROOKBY 33kV',
@@ -28,98 +35,115 @@ FEEDER_TO_SUBSTATION = {
     'MTW': 'MT WELLINGTON 33/11kV',
 }
 
+# How many rejected feeder names to spell out per reason in the summary warning
+MAX_REPORTED_REJECTS = 20
+
+# Feeder names must be '<FROM CODE>... - <TO CODE>...' with exactly one ' - ' separator
+FEEDER_PATTERN = r'^([A-Z]+).* - ([A-Z]+)'
+
+def parse_feeder_endpoints(feeder_names):
+    """Parse feeder names into their substation codes and names column-wise.
+    Example: 'BKBY H02 - MARA H06' -> from_code 'BKBY', to_code 'MARA', from_sub 'BROOKBY 33kV', to_sub 'MARAETAI 33/11kV'.
+    Returns a DataFrame with those columns and a 'reason' column that is NaN for fully parsed names.
+    """
+    names = feeder_names.astype(str)
+    codes = names.str.extract(FEEDER_PATTERN)
+    codes.columns = ['from_code', 'to_code']
+    # The separator has to occur exactly once, as in the original split(' - ') check
+    single_separator = names.str.count(' - ') == 1
+    codes = codes.where(single_separator)
+    parsed = pd.DataFrame({
+        'from_code': codes['from_code'],
+        'to_code': codes['to_code'],
+        'from_sub': codes['from_code'].map(FEEDER_TO_SUBSTATION),
+        'to_sub': codes['to_code'].map(FEEDER_TO_SUBSTATION),
+        'reason': pd.Series(pd.NA, index=names.index, dtype=object),
+    })
+    parsed.loc[parsed['from_sub'].isna() | parsed['to_sub'].isna(), 'reason'] = 'unknown substation code'
+    parsed.loc[single_separator & codes['from_code'].isna(), 'reason'] = 'no substation code'
+    parsed.loc[~single_separator, 'reason'] = "invalid format (no single ' - ' separator)"
+    return parsed
+
 def extract_substation_name(feeder_name):
-    """Extract the base substation name from a feeder name.
-    Example: 'BKBY H02 - MARA H06' -> ('BROOKBY 33kV', 'MARAETAI 33/11kV')
+    """Extract the base substation names from a single feeder name.
+    Example: 'BKBY H02 - MARA H06' -> ('BROOKBY 33kV', 'MARAETAI 33/11kV'); returns None if it can't be parsed.
     """
-    try:
-        # Split on ' - ' and take the first part
-        parts = feeder_name.split(' - ')
-        if len(parts) != 2:
-            logger.warning(f"Invalid feeder name format (no ' - ' separator): {feeder_name}")
-            return None
-        
-        # Extract the base code (before any numbers or spaces)
-        from_code = re.match(r'([A-Z]+)', parts[0])
-        to_code = re.match(r'([A-Z]+)', parts[1])
-        
-        if not from_code or not to_code:
-            logger.warning(f"Could not extract codes from feeder name: {feeder_name}")
-            return None
-        
-        from_code = from_code.group(1)
-        to_code = to_code.group(1)
-        
-        # Look up the actual substation names
-        from_sub = FEEDER_TO_SUBSTATION.get(from_code)
-        to_sub = FEEDER_TO_SUBSTATION.get(to_code)
-        
-        if not from_sub or not to_sub:
-            logger.warning(f"Unknown substation code in feeder name {feeder_name}: from={from_code}, to={to_code}")
-            return None
-        
-        return from_sub, to_sub
-    except Exception as e:
-        logger.error(f"Error parsing feeder name {feeder_name}: {e}")
+    parsed = parse_feeder_endpoints(pd.Series([feeder_name])).iloc[0]
+    if pd.notna(parsed['reason']):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Could not parse feeder name {feeder_name}: {parsed['reason']}")
         return None
+    return parsed['from_sub'], parsed['to_sub']
+
+def feeder_voltage(opvoltage):
+    """Return the feeder voltage in kV from OPVOLTAGE_ values: 11 kV if the value mentions 11, else 33 kV."""
+    return pd.Series(opvoltage).astype(str).str.contains('11', regex=False).map({True: 11.0, False: 33.0})
 
-def load_vector_lines(net):
-    """Load Vector distribution lines from CSV and add them to the network"""
+def _create_line_chunk(net, lines_df, lookup):
+    """Create the lines of one CSV chunk in a single call; return the chunk's rejected rows with a 'reason'."""
+    feeder_names = lines_df['Feeder Name'].astype(str)
+    parsed = parse_feeder_endpoints(feeder_names)
+    from_buses = parsed['from_sub'].map(lookup)
+    to_buses = parsed['to_sub'].map(lookup)
+    length_km = lines_df['Shape__Length'].astype(float) / 1000.0  # Convert to km
+
+    reason = parsed['reason'].copy()
+    reason[reason.isna() & (from_buses.isna() | to_buses.isna())] = 'unknown bus'
+    reason[reason.isna() & ~(length_km > 0)] = 'invalid Shape__Length'
+    matched = reason.isna()
+
+    rejected = lines_df[~matched].copy()
+    rejected['reason'] = reason[~matched]
+
+    if matched.any():
+        # Create all pandapower lines connecting the buses in one call
+        pp.create_lines_from_parameters(
+            net,
+            from_buses=from_buses[matched].astype(int).to_numpy(),
+            to_buses=to_buses[matched].astype(int).to_numpy(),
+            length_km=length_km[matched].to_numpy(),
+            r_ohm_per_km=0.1,  # Default resistance
+            x_ohm_per_km=0.3,  # Default reactance
+            c_nf_per_km=10.0,  # Default capacitance
+            max_i_ka=1.0,  # Default max current
+            name=feeder_names[matched].to_numpy(),
+            voltage_kv=feeder_voltage(lines_df['OPVOLTAGE_'])[matched].to_numpy()
+        )
+    return rejected
+
+def _report_rejected(rejected):
+    """Log one summary warning per rejection reason, naming up to MAX_REPORTED_REJECTS feeders."""
+    for reason, group in rejected.groupby('reason', sort=False):
+        names = group['Feeder Name'].astype(str)
+        shown = ', '.join(names.head(MAX_REPORTED_REJECTS))
+        more = f" (and {len(group) - MAX_REPORTED_REJECTS} more)" if len(group) > MAX_REPORTED_REJECTS else ""
+        logger.warning(f"Skipped {len(group)} Vector feeders, {reason}: {shown}{more}")
+
+def load_vector_lines(net, lines_csv=VECTOR_LINES_CSV):
+    """Load Vector distribution lines from CSV and add them to the network.
+    Feeder names, voltages (kept in a voltage_kv column on net.line) and lengths are parsed column-wise
+    and each CSV chunk's lines are created in one call. Unparseable or unmatched feeders are reported
+    in one summary per reason. Returns the network, or None on failure.
+    """
     try:
         logger.info("Loading Vector distribution lines from CSV")
-        lines_df = pd.read_csv('data/Vector/distribution_feeder_network_and_zone_substations_4095785886967079183.csv')
-        logger.info(f"Loaded {len(lines_df)} Vector lines")
-        
-        # Create a mapping of substation names to bus indices
-        substation_to_bus = {}
-        for bus_idx, bus in net.bus.iterrows():
-            substation_to_bus[bus['name']] = bus_idx
-            logger.debug(f"Mapped substation {bus['name']} to bus {bus_idx}")
-        
-        # Create lines between buses
-        for idx, row in lines_df.iterrows():
-            try:
-                # Parse feeder name to get from and to substations
-                feeder_name = row['Feeder Name']
-                substation_names = extract_substation_name(feeder_name)
-                
-                if not substation_names:
-                    continue
-                
-                from_sub, to_sub = substation_names
-                from_bus_idx = substation_to_bus.get(from_sub)
-                to_bus_idx = substation_to_bus.get(to_sub)
-                
-                if from_bus_idx is None or to_bus_idx is None:
-                    logger.warning(f"Could not find bus indices for line {feeder_name} (from: {from_sub}, to: {to_sub})")
-                    continue
-                
-                # Get voltage from OPVOLTAGE_ column
-                voltage = 33.0  # Default to 33kV
-                if '11' in str(row['OPVOLTAGE_']):
-                    voltage = 11.0
-                
-                # Create line with parameters
-                pp.create_line_from_parameters(
-                    net,
-                    from_bus=from_bus_idx,
-                    to_bus=to_bus_idx,
-                    length_km=float(row['Shape__Length']) / 1000.0,  # Convert to km
-                    r_ohm_per_km=0.1,  # Default resistance
-                    x_ohm_per_km=0.3,  # Default reactance
-                    c_nf_per_km=10.0,  # Default capacitance
-                    max_i_ka=1.0,  # Default max current
-                    name=feeder_name
-                )
-                
-                logger.debug(f"Created line {feeder_name} connecting buses {from_sub} and {to_sub}")
-            except Exception as e:
-                logger.error(f"Error processing line {feeder_name}: {e}")
-                continue
-        
-        logger.info(f"Created {len(net.line)} lines in the Vector network")
+        # Resolve both ends through a name -> index hash map built once
+        lookup = bus_name_lookup(net)
+        n_lines_before = len(net.line)
+        rejected_parts = []
+        n_lines = 0
+        for lines_df in read_csv_chunks(lines_csv, VECTOR_LINES_SCHEMA):
+            n_lines += len(lines_df)
+            with stage('line_creation', rows=len(lines_df)):
+                rejected_parts.append(_create_line_chunk(net, lines_df, lookup))
+        logger.info(f"Loaded {n_lines} Vector lines")
+
+        rejected = concat_chunks(rejected_parts, pd.DataFrame(columns=VECTOR_LINES_SCHEMA.columns + ['reason']))
+        if len(rejected):
+            _report_rejected(rejected)
+        logger.info(f"Created {len(net.line) - n_lines_before} lines in the Vector network")
         return net
     except Exception as e:
         logger.error(f"Error loading Vector lines: {e}")
         logger.error(traceback.format_exc())
-        return None 
\ No newline at end of file
+        return None
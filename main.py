@@ -1,105 +1,458 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, g, render_template, jsonify, request
 import logging
+import os
+import time
+import numpy as np
 import traceback
-from data_parsing.transpower.transpower_data_parser import create_transpower_network
-from data_parsing.transpower.transpower_lines import load_transmission_lines
-from data_parsing.vector.vector_data_parser import create_vector_network
+from analysis.spatial_index import to_json_columns
+from data_parsing.profiling import start_memory_tracing
+from services.fault_levels import fault_level_cache
+from services.hosting_capacity import heatmap_columns, hosting_capacity_store
+from services.jobs import NETWORKS, job_queue, resolve_scenario
+from services.metrics import REQUEST_LATENCY, render_metrics
+from services.network_cache import network_cache
+from services.payload import dumps
+from services.scenarios import scenario_store
+from services.shared_model import SharedModelCache
+from services.substation_store import DEFAULT_LIMIT, substation_store
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; LOG_LEVEL=DEBUG brings back the per-row parser logs
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
+# PIPELINE_TRACE_MEMORY=1 records peak allocations per pipeline stage (slows the build down)
+if os.environ.get('PIPELINE_TRACE_MEMORY'):
+    start_memory_tracing()
+
+# MODEL_SHARED_MEMORY=<name> makes this process a serving worker: instead of building its own model it
+# attaches to the one `python -m services.shared_model` publishes under that name (see run.sh)
+if os.environ.get('MODEL_SHARED_MEMORY'):
+    network_cache = SharedModelCache(os.environ['MODEL_SHARED_MEMORY'])
+
 app = Flask(__name__)
 
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def _payload_response(payload):
+    """Serve a precomputed EncodedPayload: 304 if the client's ETag matches, else the best precompressed body."""
+    encoding, body = payload.select(request.accept_encodings)
+    variants = [payload.variant_etag(e) for e in (None, *payload.encodings)]
+    if any(request.if_none_match.contains(etag) for etag in variants):
+        response = Response(status=304)
+    else:
+        # A shared-memory payload is a memoryview; hand it to the server as a one-chunk body, uncopied
+        response = Response(body if isinstance(body, bytes) else [body], mimetype='application/json')
+        response.content_length = len(body)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(payload.variant_etag(encoding))
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Let browsers keep the body but revalidate every time, so a rebuilt model is picked up at once
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _parse_bbox(value):
+    """Parse a 'west,south,east,north' bbox query parameter into four floats."""
+    bbox = [float(v) for v in value.split(',')]
+    if len(bbox) != 4 or not all(np.isfinite(bbox)) or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError("bbox must be west,south,east,north")
+    return bbox
+
 @app.route('/network_data')
 def get_network_data():
+    """The whole map payload, or with ?bbox=west,south,east,north&zoom=z only the features in that viewport.
+
+    Viewport mode clusters substations at low zoom and leaves out low-voltage layers below their
+    zoom thresholds (see services.viewport). An optional network parameter limits it to some networks.
+    """
     try:
-        logger.info("Starting to fetch network data...")
-        
-        # Create Transpower network
-        logger.info("Creating Transpower network...")
-        transpower_net, transpower_bus_data = create_transpower_network()
-        if transpower_net is None:
-            logger.error("Failed to create Transpower network")
-            return jsonify({"error": "Failed to create Transpower network"}), 500
-        logger.info(f"Successfully created Transpower network with {len(transpower_bus_data)} buses")
-
-        # Load Transpower transmission lines
-        logger.info("Loading Transpower transmission lines...")
-        load_transmission_lines(transpower_net)
-        logger.info(f"Loaded {len(transpower_net.line)} Transpower lines")
-
-        # Create Vector network
-        logger.info("Creating Vector network...")
-        vector_net, vector_bus_data = create_vector_network()
-        if vector_net is None:
-            logger.error("Failed to create Vector network")
-            return jsonify({"error": "Failed to create Vector network"}), 500
-        logger.info(f"Successfully created Vector network with {len(vector_bus_data)} buses")
-
-        # Prepare data for the map
-        map_data = {
-            'transpower': {
-                'substations': [],
-                'lines': []
-            },
-            'vector': {
-                'substations': [],
-                'lines': []
-            }
-        }
-
-        # Process Transpower data
-        logger.info("Processing Transpower data for map...")
-        for bus in transpower_bus_data:
-            map_data['transpower']['substations'].append({
-                'name': bus['name'],
-                'type': bus['type'],
-                'description': bus['description'],
-                'lat': bus['lat'],
-                'lon': bus['lon']
-            })
-
-        # Add Transpower lines
-        logger.info("Processing Transpower lines...")
-        logger.info(f"Line columns: {transpower_net.line.columns}")
-        for _, line in transpower_net.line.iterrows():
-            from_bus = transpower_net.bus.iloc[line['from_bus']]
-            to_bus = transpower_net.bus.iloc[line['to_bus']]
-            # Get voltage from the from_bus since that's where the line starts
-            voltage = str(from_bus['vn_kv'])
-            map_data['transpower']['lines'].append({
-                'name': line['name'],
-                'from_bus': from_bus['name'],
-                'to_bus': to_bus['name'],
-                'voltage': voltage,
-                'description': line.get('description', '')
-            })
-
-        # Process Vector data
-        logger.info("Processing Vector data for map...")
-        for bus in vector_bus_data:
-            map_data['vector']['substations'].append({
-                'name': bus['name'],
-                'type': bus['type'],
-                'description': bus['description'],
-                'lat': bus['lat'],
-                'lon': bus['lon']
-            })
-
-        logger.info(f"Prepared {len(map_data['transpower']['substations'])} Transpower substations for map")
-        logger.info(f"Prepared {len(map_data['transpower']['lines'])} Transpower lines for map")
-        logger.info(f"Prepared {len(map_data['vector']['substations'])} Vector substations for map")
-        
-        return jsonify(map_data)
+        logger.info("Fetching network data...")
+        model = network_cache.get()
+        if model is None:
+            logger.error("Failed to build network model")
+            return jsonify({"error": "Failed to build network model"}), 500
+        if request.args.get('bbox'):
+            try:
+                bbox = _parse_bbox(request.args['bbox'])
+                zoom = int(request.args.get('zoom', 0))
+            except ValueError as e:
+                return jsonify({"error": f"Invalid query: {e}"}), 400
+            return _payload_response(model.viewport.payload(bbox, zoom, _split_param(request.args.get('network'))))
+        return _payload_response(model.payload)
     except Exception as e:
         logger.error(f"Error in get_network_data: {e}")
         logger.error(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
+@app.route('/network_data/cache_stats')
+def get_cache_stats():
+    return jsonify(network_cache.stats())
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics: request latency, pipeline stage timings and network cache counters."""
+    gauges = {}
+    model = network_cache.peek()
+    if model is not None and model.payload is not None:
+        gauges['network_payload_bytes'] = ('Uncompressed size of the full /network_data body.', len(model.payload.body))
+        for encoding, body in model.payload.encodings.items():
+            gauges[f'network_payload_{encoding}_bytes'] = (f'{encoding} size of the full /network_data body.', len(body))
+    for status, count in job_queue.stats().items():
+        if isinstance(count, int):
+            gauges[f'study_jobs_{status}'] = (f'Study jobs {status} (see /jobs).', count)
+    return Response(render_metrics(network_cache.stats(), gauges), mimetype='text/plain; version=0.0.4')
+
+def _split_param(value):
+    """Split a comma-separated query parameter (or a JSON list) into a list, or None if empty."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [v.strip() for v in str(value).split(',') if v.strip()]
+
+def _nearest_query(params, lat, lon):
+    """Run a nearest or within-radius query against the cached spatial index and return the JSON body."""
+    model = network_cache.get()
+    if model is None or model.spatial_index is None:
+        raise RuntimeError("Network model is not available")
+    index = model.spatial_index
+    filters = {
+        'networks': _split_param(params.get('network')),
+        'types': _split_param(params.get('type')),
+        'vn_kv': float(params['vn_kv']) if params.get('vn_kv') not in (None, '') else None,
+    }
+    radius_km = params.get('radius_km')
+    if radius_km not in (None, ''):
+        results = index.within_wgs84(lat, lon, float(radius_km) * 1000.0, **filters)
+        return {'results': [to_json_columns(index.describe(rows, dist)) for rows, dist in results]}
+    k = int(params.get('k', 1))
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    rows, dist = index.nearest_wgs84(lat, lon, k=k, **filters)
+    return to_json_columns(index.describe(rows, dist))
+
+@app.route('/nearest', methods=['GET', 'POST'])
+def get_nearest():
+    """Nearest substations to a point (GET ?lat=&lon=&k=) or to a batch of points (POST {"lat": [...], "lon": [...]}).
+
+    Optional filters: network, type (comma-separated or list), vn_kv and radius_km (within-radius mode).
+    Nearest results are column arrays of shape (points, k); a single GET point returns one row.
+    """
+    try:
+        if request.method == 'POST':
+            params = request.get_json(silent=True) or {}
+            lat = np.asarray(params.get('lat', []), dtype=float)
+            lon = np.asarray(params.get('lon', []), dtype=float)
+            if lat.shape != lon.shape or lat.ndim != 1:
+                return jsonify({"error": "lat and lon must be lists of equal length"}), 400
+        else:
+            params = request.args
+            lat = np.array([float(params['lat'])])
+            lon = np.array([float(params['lon'])])
+        return jsonify(_nearest_query(params, lat, lon))
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error in get_nearest: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+def _topology(network, scenario_id=None):
+    """A network's topology, or with ?scenario=<id> the topology with that stored scenario applied."""
+    model = network_cache.get()
+    if model is None:
+        raise RuntimeError("Network model is not available")
+    if network not in model.topology:
+        raise ValueError(f"Unknown network: {network}")
+    if scenario_id is None:
+        return model.topology[network]
+    return model.scenario_topology(network, resolve_scenario(scenario_id, getattr(model, f'{network}_net')))
+
+@app.route('/topology')
+def get_topology():
+    """Island, radial/meshed and articulation point summary of a network (?network=transpower|vector&scenario=)."""
+    try:
+        return jsonify(_topology(request.args.get('network', 'transpower'), request.args.get('scenario')).summary())
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error in get_topology: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/topology/path')
+def get_topology_path():
+    """Shortest path between two substations (?from=&to=&network=&weight=hops|impedance&scenario=).
+
+    Returns the buses and lines along the path with its hop count and impedance in ohms, or 404 if
+    the substations are in different islands.
+    """
+    try:
+        topology = _topology(request.args.get('network', 'transpower'), request.args.get('scenario'))
+        path = topology.path(request.args['from'], request.args['to'], request.args.get('weight', 'hops'))
+        if path is None:
+            return jsonify({"error": "No path: the substations are in different islands"}), 404
+        return jsonify(path)
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error in get_topology_path: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/fault_levels')
+def get_fault_levels():
+    """Max/min three-phase fault levels of the Transpower buses, from the island-keyed fault level cache.
+
+    With ?bus=NAME or ?lat=&lon= (nearest Transpower substation) returns that bus only; otherwise
+    column arrays for every bus. Both include the network's topology_hash.
+    """
+    try:
+        model = network_cache.get()
+        if model is None:
+            raise RuntimeError("Network model is not available")
+        net = model.transpower_net
+        levels, topology_hash = fault_level_cache.levels(net)
+        if 'bus' in request.args or 'lat' in request.args:
+            if 'bus' in request.args:
+                matches = net.bus.index[net.bus['name'] == request.args['bus']]
+                if not len(matches):
+                    raise KeyError(request.args['bus'])
+                bus = matches[0]
+            else:
+                rows, _ = model.spatial_index.nearest_wgs84(np.array([float(request.args['lat'])]),
+                                                            np.array([float(request.args['lon'])]),
+                                                            networks=['transpower'])
+                if rows[0, 0] < 0:
+                    raise ValueError("No Transpower substation found")
+                bus = int(model.spatial_index.sites['bus_idx'].iloc[rows[0, 0]])
+            row = levels.loc[bus]
+            result = {'bus': int(bus), 'name': net.bus.at[bus, 'name'], 'vn_kv': float(net.bus.at[bus, 'vn_kv'])}
+            result.update({col: (float(v) if np.isfinite(v) else None) for col, v in row.items()})
+        else:
+            result = to_json_columns({'bus': levels.index.to_numpy(), 'name': net.bus['name'].to_numpy(dtype=object),
+                                      'vn_kv': net.bus['vn_kv'].to_numpy(dtype=float),
+                                      **{col: levels[col].to_numpy() for col in levels.columns}})
+        result['topology_hash'] = topology_hash
+        return jsonify(result)
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error in get_fault_levels: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/studies/<kind>', methods=['POST'])
+def submit_study(kind):
+    """Submit a study (power_flow, connection_study, contingency, timeseries or hosting_capacity) as a
+    background job.
+
+    The JSON body holds the study parameters (see services.jobs.parse_study), optionally with a
+    scenario id or inline scenario to run it on. Returns the job with 202, or with 200 if an
+    identical study already finished and its result is stored.
+    """
+    try:
+        model = network_cache.get()
+        if model is None:
+            raise RuntimeError("Network model is not available")
+        job = job_queue.submit(kind, request.get_json(silent=True) or {}, model)
+        return jsonify(job.describe()), 200 if job.status == 'done' else 202
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid study: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error in submit_study: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/scenarios', methods=['POST'])
+def create_scenario():
+    """Store a what-if scenario: {"network": ..., "add": [...], "set": [...], "out_of_service": [...]}.
+
+    The scenario is validated against the network and kept as a delta (see analysis.scenario); pass
+    the returned id as the "scenario" parameter of a study to run it.
+    """
+    try:
+        model = network_cache.get()
+        if model is None:
+            raise RuntimeError("Network model is not available")
+        spec = request.get_json(silent=True) or {}
+        network = spec.get('network', 'transpower')
+        if network not in NETWORKS:
+            raise ValueError(f"Unknown network: {network}")
+        scenario = resolve_scenario(spec, getattr(model, f'{network}_net'))
+        return jsonify({'id': scenario_store.put(scenario), 'scenario': scenario.to_dict()}), 201
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid scenario: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error in create_scenario: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/scenarios/<scenario_id>')
+def get_scenario(scenario_id):
+    scenario = scenario_store.get(scenario_id)
+    if scenario is None:
+        return jsonify({"error": f"Unknown scenario: {scenario_id}"}), 404
+    return jsonify({'id': scenario_id, 'scenario': scenario.to_dict()})
+
+@app.route('/jobs')
+def get_jobs():
+    return jsonify(job_queue.stats())
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job.describe())
+
+@app.route('/jobs/<job_id>/result')
+def get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    if job.status != 'done':
+        return jsonify({"error": f"Job is {job.status}", "job": job.describe()}), 409
+    return Response(job.result, mimetype='application/json')
+
+@app.route('/jobs/<job_id>/events')
+def get_job_events(job_id):
+    """Server-Sent Events for a job: started, progress, partial (connection studies), then done or failed.
+
+    Resumes after the Last-Event-ID header when the client reconnects.
+    """
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    start = int(request.headers.get('Last-Event-ID', -1)) + 1
+
+    def events():
+        for item in job_queue.stream(job_id, start):
+            if item is None:
+                yield ': keep-alive\n\n'
+                continue
+            position, event, data = item
+            yield f"id: {position}\nevent: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache',
+                                                                     'X-Accel-Buffering': 'no'})
+
+@app.route('/hosting_capacity')
+def get_hosting_capacity():
+    """Load and generation hosting capacity per substation of a network (?network=transpower|vector|integrated).
+
+    Served from the stored result arrays. When there are none yet, a hosting_capacity study job is
+    started (or joined) and returned with 202; follow /jobs/<id>/events and ask again when it is done.
+    """
+    try:
+        model = network_cache.get()
+        if model is None:
+            raise RuntimeError("Network model is not available")
+        network = request.args.get('network', 'transpower')
+        params = {'network': network}
+        key = job_queue.key('hosting_capacity', params, model)
+        result = hosting_capacity_store.get(key)
+        if result is None:
+            job = job_queue.submit('hosting_capacity', params, model)
+            if job.status == 'done':
+                result = hosting_capacity_store.get(job.id)
+                if result is None:
+                    # The job finished but its arrays are gone, so run it again
+                    job = job_queue.submit('hosting_capacity', params, model, rerun=True)
+            if result is None:
+                return jsonify(job.describe()), 202
+        columns = heatmap_columns(result, getattr(model, f'{network}_bus_data'))
+        columns.update({'network': network, 'settings': result.settings})
+        return jsonify(columns)
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error in get_hosting_capacity: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/gxp_links')
+def get_gxp_links():
+    """The transformers joining Vector sites to Transpower substations in the integrated network.
+
+    Column arrays with each link's buses, site names, distance, how it was matched (name, nearest or
+    supply) and the transformer's index in the integrated net.
+    """
+    try:
+        model = network_cache.get()
+        if model is None:
+            raise RuntimeError("Network model is not available")
+        links = model.gxp_links
+        return jsonify(to_json_columns({col: links[col].to_numpy() for col in links.columns}))
+    except Exception as e:
+        logger.error(f"Error in get_gxp_links: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+def _synced_store():
+    """The substation store, loaded with the current model first if it changed."""
+    model = network_cache.get()
+    if model is None:
+        raise RuntimeError("Network model is not available")
+    substation_store.sync(model)
+    return substation_store
+
+@app.route('/substation/<name>')
+def get_substation(name):
+    """One substation and its connected lines (?network=transpower|vector), from the indexed store."""
+    try:
+        record = _synced_store().substation(name, request.args.get('network', 'transpower'))
+        if record is None:
+            return jsonify({"error": f"Unknown substation: {name}"}), 404
+        return jsonify(record)
+    except Exception as e:
+        logger.error(f"Error in get_substation: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/substations')
+def get_substations():
+    """Substations matching indexed filters, as column arrays.
+
+    Filters (all optional, combined with AND): network, type, name (prefix), vn_kv, min_kv, max_kv,
+    min_connections and bbox=west,south,east,north; paged with limit and offset.
+    """
+    try:
+        args = request.args
+
+        def optional(key, cast):
+            return cast(args[key]) if key in args else None
+        result = _synced_store().query(
+            network=args.get('network'), site_type=args.get('type'), name=args.get('name'),
+            vn_kv=optional('vn_kv', float), min_kv=optional('min_kv', float), max_kv=optional('max_kv', float),
+            min_connections=optional('min_connections', int),
+            bbox=_parse_bbox(args['bbox']) if 'bbox' in args else None,
+            limit=min(int(args.get('limit', DEFAULT_LIMIT)), DEFAULT_LIMIT), offset=int(args.get('offset', 0)))
+        return jsonify(to_json_columns(result))
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error in get_substations: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5001) 
\ No newline at end of file
+    # Build the network model once at startup so the first request is served from cache
+    network_cache.get()
+    if hasattr(network_cache, 'watch'):
+        # Apply edits to the files under data/ as they happen rather than on the next request
+        network_cache.watch()
+    app.run(debug=True, port=5001)
@@ -4,5 +4,17 @@
 eval "$(conda shell.bash hook)"
 conda activate transpower
 
-# Run the Flask application
-python main.py 
\ No newline at end of file
+if [ -n "$WEB_WORKERS" ]; then
+    # Multi-worker serving: one parent builds and publishes the model in shared memory, the workers attach to it.
+    # Study jobs and scenarios are shared through data/results/jobs.sqlite and data/scenarios.sqlite, so any
+    # worker can answer for them, and the workers split JOB_WORKERS (studies at a time, in all) between them.
+    export WEB_WORKERS
+    export MODEL_SHARED_MEMORY="${MODEL_SHARED_MEMORY:-transpower-model}"
+    python -m services.shared_model &
+    publisher=$!
+    trap 'kill -INT $publisher' EXIT
+    gunicorn --workers "$WEB_WORKERS" --bind 0.0.0.0:5001 main:app
+else
+    # Run the Flask application
+    python main.py
+fi
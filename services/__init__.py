@@ -0,0 +1 @@
+# Network serving package
@@ -0,0 +1,127 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from analysis.fault_levels import FAULT_COLUMNS, calc_fault_levels, island_keys, prepare_fault_net, topology_hash
+from data_parsing.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+FAULT_LEVEL_DIR = 'data/fault_levels'
+
+# Islands kept in memory; the Transpower net has a handful, so this covers several network versions
+MAX_ISLANDS = 256
+
+
+class FaultLevelCache:
+    """Per-bus fault levels cached by island, in memory (LRU) and on disk.
+
+    Each island of the network is keyed on a hash of its buses, lines and sources (see island_keys),
+    so after a network edit only the islands whose key changed are recomputed; the rest come from
+    the cache. Results for an island are stored as one .npz file named after its key.
+    """
+
+    def __init__(self, cache_dir=FAULT_LEVEL_DIR, max_islands=MAX_ISLANDS):
+        self.cache_dir = cache_dir
+        self.max_islands = max_islands
+        self._islands = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _load(self, key):
+        """Return an island's cached values from disk, or None."""
+        if self.cache_dir is None or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with np.load(self._path(key)) as saved:
+                return saved['values']
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable fault level cache file {self._path(key)}: {e}")
+            return None
+
+    def _save(self, key, values):
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.fault-', suffix='.npz')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, values=values)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logger.error(f"Error saving fault levels to {self.cache_dir}: {e}")
+
+    def _remember(self, key, entry):
+        self._islands[key] = entry
+        self._islands.move_to_end(key)
+        while len(self._islands) > self.max_islands:
+            self._islands.popitem(last=False)
+
+    def _lookup(self, key):
+        entry = self._islands.get(key)
+        if entry is not None:
+            self._islands.move_to_end(key)
+            self.hits += 1
+            return entry
+        entry = self._load(key)
+        if entry is not None:
+            self._remember(key, entry)
+            self.disk_hits += 1
+        return entry
+
+    def levels(self, net):
+        """Return (DataFrame of FAULT_COLUMNS indexed by bus, topology hash) for every bus in net.
+
+        Only the buses of islands missing from the cache are faulted, in one calc_sc run per case.
+        """
+        with self._lock:
+            labels, keys = island_keys(net)
+            values = np.full((len(net.bus), len(FAULT_COLUMNS)), np.nan)
+            stale = []
+            for island, key in keys.items():
+                entry = self._lookup(key)
+                if entry is None:
+                    stale.append(island)
+                else:
+                    values[labels == island] = entry
+
+            if stale:
+                self.misses += len(stale)
+                members = np.flatnonzero(np.isin(labels, stale))
+                logger.info(f"Computing fault levels for {len(stale)} of {len(keys)} islands ({len(members)} buses)")
+                with stage('fault_levels', rows=len(members)):
+                    computed = calc_fault_levels(prepare_fault_net(net), net.bus.index[members])
+                values[members] = computed.to_numpy(dtype=float)
+                for island in stale:
+                    # The key covers the island's bus indices, so rows are stored in bus-table order
+                    island_values = values[labels == island]
+                    self._remember(keys[island], island_values)
+                    self._save(keys[island], island_values)
+            return pd.DataFrame(values, index=net.bus.index, columns=FAULT_COLUMNS), topology_hash(keys)
+
+    def clear(self):
+        """Drop the in-memory cache (the disk cache is kept)."""
+        with self._lock:
+            self._islands.clear()
+
+    def stats(self):
+        """Return the cache hit/miss counters."""
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'islands': len(self._islands),
+        }
+
+
+fault_level_cache = FaultLevelCache()
@@ -0,0 +1,74 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from analysis.hosting_capacity import HostingCapacityResult
+from analysis.spatial_index import to_json_columns
+
+logger = logging.getLogger(__name__)
+
+HOSTING_CAPACITY_DIR = 'data/hosting_capacity'
+
+# Results kept loaded in memory (one per network and study settings)
+MAX_LOADED = 8
+
+
+class HostingCapacityStore:
+    """Hosting capacity results as .npz arrays on disk, keyed by study hash (see services.jobs.study_key).
+
+    The last few results read are kept in memory, so serving the map layer does not touch the disk.
+    """
+
+    def __init__(self, directory=HOSTING_CAPACITY_DIR, max_loaded=MAX_LOADED):
+        self.directory = directory
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key):
+        """Return the stored HostingCapacityResult for key, or None."""
+        with self._lock:
+            result = self._loaded.get(key)
+            if result is None:
+                if not os.path.exists(self._path(key)):
+                    return None
+                try:
+                    result = HostingCapacityResult.load(self._path(key))
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable hosting capacity file {self._path(key)}: {e}")
+                    return None
+            self._loaded[key] = result
+            self._loaded.move_to_end(key)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+            return result
+
+    def put(self, key, result):
+        """Write a result under key (atomically)."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.hosting-', suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            result.save(f)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._loaded.pop(key, None)
+
+
+def heatmap_columns(result, bus_data):
+    """Column arrays for the map's hosting capacity layer: one point per substation in bus_data."""
+    sites = bus_data.set_index('bus_idx').reindex(result.bus_index)
+    capacity = result.frame()
+    return to_json_columns({
+        'name': sites['name'].to_numpy(dtype=object),
+        'lat': sites['lat'].to_numpy(dtype=float),
+        'lon': sites['lon'].to_numpy(dtype=float),
+        **{col: capacity[col].to_numpy() for col in capacity.columns},
+    })
+
+
+hosting_capacity_store = HostingCapacityStore()
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from services.payload import dumps
+
+logger = logging.getLogger(__name__)
+
+# File name of the registry, kept in the result store's directory
+REGISTRY_FILE = 'jobs.sqlite'
+
+# Job states that are still in progress; a job in one of them belongs to its owner until that process exits
+ACTIVE = ('queued', 'running')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY, kind TEXT, owner INTEGER NOT NULL, token TEXT NOT NULL, status TEXT NOT NULL, progress TEXT,
+    error TEXT, created_at REAL, finished_at REAL);
+CREATE TABLE IF NOT EXISTS events (
+    job_id TEXT NOT NULL, position INTEGER NOT NULL, event TEXT NOT NULL, data TEXT,
+    PRIMARY KEY (job_id, position));
+"""
+
+# Tokens of the registries opened by this process, to tell its own jobs from a previous process's with the same pid
+_TOKENS = set()
+
+
+def _alive(pid, token):
+    """Whether the registry that claimed a job is still open: in this process, or in a running one."""
+    if pid == os.getpid():
+        return token in _TOKENS
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobRegistry:
+    """Study job status and events shared by every web worker, in a SQLite file next to the result store.
+
+    A job is owned by the process that runs it: claim() hands each study to one worker, which
+    records its events and status here as they happen, and the other workers read them back to
+    answer /jobs/<id> and stream its events. A job whose owner has exited counts as failed and can
+    be claimed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.token = uuid.uuid4().hex
+        _TOKENS.add(self.token)
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def claim(self, job_id, kind):
+        """Make this process the owner of a job and return True, unless another live process is running it."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT owner, token, status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is not None and row['status'] in ACTIVE and _alive(row['owner'], row['token']):
+                conn.execute('COMMIT')
+                return False
+            conn.execute('DELETE FROM events WHERE job_id = ?', (job_id,))
+            conn.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, NULL, ?, NULL)',
+                         (job_id, kind, os.getpid(), self.token, 'queued', '{}', time.time()))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def record(self, job, event, data):
+        """Append an event of a job this process owns, along with the job's current status."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)',
+                         (job.id, len(job.events) - 1, event, dumps(data).decode('utf-8')))
+            conn.execute('UPDATE jobs SET status = ?, progress = ?, error = ?, finished_at = ? '
+                         'WHERE id = ? AND token = ?',
+                         (job.status, dumps(job.progress).decode('utf-8'), job.error, job.finished_at, job.id,
+                          self.token))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _status(self, row):
+        """A job row's status and error, with a job whose owner exited mid-run reported as failed."""
+        if row['status'] in ACTIVE and not _alive(row['owner'], row['token']):
+            return 'failed', 'The worker running this job exited'
+        return row['status'], row['error']
+
+    def get(self, job_id):
+        """Return a job's row as a dict (status, progress, error, ...), or None."""
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        status, error = self._status(row)
+        return {'id': row['id'], 'kind': row['kind'], 'status': status, 'progress': json.loads(row['progress'] or '{}'),
+                'error': error, 'created_at': row['created_at'], 'finished_at': row['finished_at']}
+
+    def events(self, job_id, start=0):
+        """Return (status, [(event, data), ...]) for a job's events from position start on; status None if unknown."""
+        conn = self._connect()
+        # One read transaction, so a final status is never seen without its final event
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            rows = conn.execute('SELECT event, data FROM events WHERE job_id = ? AND position >= ? ORDER BY position',
+                                (job_id, start)).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        if row is None:
+            return None, []
+        events = [(r['event'], json.loads(r['data'])) for r in rows]
+        status, error = self._status(row)
+        if status != row['status']:
+            events.append(('failed', {'id': job_id, 'error': error}))
+        return status, events
@@ -0,0 +1,582 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from analysis.connection_study import Candidate, add_island_slacks, resolve_candidate_buses, run_connection_study
+from analysis.contingency import run_contingency_analysis
+from analysis.hosting_capacity import MAX_HOSTING_MW, TOLERANCE_MW, run_hosting_capacity
+from analysis.scenario import materialize
+from analysis.timeseries import MAX_LOADING_PERCENT, VM_LIMITS, run_timeseries_study
+from services.hosting_capacity import HostingCapacityStore, hosting_capacity_store
+from services.job_registry import REGISTRY_FILE, JobRegistry
+from services.payload import dumps, frame_records
+from services.result_store import ResultStore
+from services.scenarios import parse_scenario, scenario_store
+
+logger = logging.getLogger(__name__)
+
+# Web worker processes on this machine (run.sh's WEB_WORKERS); they split the job and study pools between them
+WEB_WORKERS = max(1, int(os.environ.get('WEB_WORKERS', 1)))
+
+# Studies run at the same time in each web worker (JOB_WORKERS in all); later submissions wait in the pool's queue
+JOB_WORKERS = max(1, int(os.environ.get('JOB_WORKERS', 2)) // WEB_WORKERS)
+
+# Process pool size inside each study, so concurrent studies do not oversubscribe the CPUs
+STUDY_WORKERS = max(1, (os.cpu_count() or 1) // (JOB_WORKERS * WEB_WORKERS))
+
+# Times submit tries to claim a study, or find another web worker's run of it, before giving up
+CLAIM_ATTEMPTS = 3
+
+# How often a stream polls the job registry for events of a job another web worker runs
+REMOTE_POLL_S = 0.5
+
+# Minimum time between progress events from one job
+PROGRESS_INTERVAL_S = 0.5
+
+# Connection study candidates solved per partial result
+CONNECTION_BATCH = 50
+
+# Rows (outages, lines, buses) listed in a study result
+RESULT_ROWS = 50
+
+# Finished jobs kept in memory; older ones are dropped but their results stay in the result store
+MAX_FINISHED_JOBS = 500
+
+NETWORKS = ('transpower', 'vector', 'integrated')
+TERMINAL = ('done', 'failed')
+
+
+@dataclass
+class Job:
+    """One submitted study. events holds the (event, data) pairs streamed to subscribers, in order."""
+    id: str
+    kind: str
+    status: str = 'queued'  # 'queued', 'running', 'done' or 'failed'
+    cached: bool = False
+    progress: dict = field(default_factory=dict)
+    error: str = None
+    result: bytes = None
+    events: list = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = None
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'cached': self.cached,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+# --- Request parsing (web process) ---
+
+def _bus_label(net, bus):
+    """Return the bus label for a label or bus name."""
+    if isinstance(bus, str):
+        matches = net.bus.index[net.bus['name'] == bus]
+        if not len(matches):
+            raise ValueError(f"Unknown bus: {bus}")
+        return int(matches[0])
+    if int(bus) not in net.bus.index:
+        raise ValueError(f"Unknown bus: {bus}")
+    return int(bus)
+
+
+def _parse_candidates(specs, net, spatial_index, network):
+    """Turn candidate dicts into JSON-able dicts with a resolved bus label (lat/lon go to the nearest bus)."""
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("candidates must be a non-empty list")
+    candidates = []
+    for i, spec in enumerate(specs):
+        kind = spec.get('kind', 'load')
+        if kind not in ('load', 'sgen'):
+            raise ValueError(f"Unknown candidate kind: {kind}")
+        candidates.append(Candidate(
+            name=str(spec.get('name', f'candidate_{i}')),
+            p_mw=float(spec['p_mw']),
+            q_mvar=float(spec.get('q_mvar', 0.0)),
+            kind=kind,
+            bus=_bus_label(net, spec['bus']) if spec.get('bus') is not None else None,
+            lat=float(spec['lat']) if spec.get('bus') is None else None,
+            lon=float(spec['lon']) if spec.get('bus') is None else None,
+        ))
+    buses = resolve_candidate_buses(candidates, spatial_index, network)
+    return [{'name': c.name, 'p_mw': c.p_mw, 'q_mvar': c.q_mvar, 'kind': c.kind, 'bus': int(bus)}
+            for c, bus in zip(candidates, buses)]
+
+
+def resolve_scenario(spec, net):
+    """Return the Scenario a study's 'scenario' parameter names: a stored scenario id or an inline spec."""
+    if isinstance(spec, str):
+        scenario = scenario_store.get(spec)
+        if scenario is None:
+            raise ValueError(f"Unknown scenario: {spec}")
+        scenario.validate(net)
+        return scenario
+    return parse_scenario(spec, net, _bus_label)
+
+
+def parse_study(kind, params, model):
+    """Validate a study request against a NetworkModel.
+
+    Returns (network, net, normalized params). The normalized params are JSON-able, have every bus
+    resolved to a label and are what both the content hash and the worker see. With a 'scenario'
+    parameter the study runs on that scenario's overlay of the network (see analysis.scenario), and
+    its key is part of the normalized params, so results are cached per scenario.
+    """
+    if kind not in STUDIES:
+        raise ValueError(f"Unknown study: {kind}")
+    if not isinstance(params, dict):
+        raise ValueError("Study parameters must be a JSON object")
+    network = params.get('network', 'transpower')
+    if network not in NETWORKS:
+        raise ValueError(f"Unknown network: {network}")
+    net = getattr(model, f'{network}_net')
+    spatial_index = model.integrated_index if network == 'integrated' else model.spatial_index
+    scenario = None
+    if params.get('scenario') is not None:
+        scenario = resolve_scenario(params['scenario'], net)
+        net = materialize(net, scenario)
+    if kind == 'power_flow':
+        normalized = {}
+    elif kind == 'connection_study':
+        normalized = {'candidates': _parse_candidates(params.get('candidates'), net, spatial_index, network)}
+    elif kind == 'contingency':
+        kinds = params.get('kinds', ['line', 'bus'])
+        if not kinds or set(kinds) - {'line', 'trafo', 'bus'}:
+            raise ValueError("kinds must be a list of 'line', 'trafo' and/or 'bus'")
+        normalized = {'kinds': sorted(kinds), 'skip_radial': bool(params.get('skip_radial', True))}
+    elif kind == 'hosting_capacity':
+        normalized = {
+            'max_mw': float(params.get('max_mw', MAX_HOSTING_MW)),
+            'tolerance_mw': float(params.get('tolerance_mw', TOLERANCE_MW)),
+            # Where the worker writes the result arrays; not settable from the request
+            'store_dir': hosting_capacity_store.directory,
+        }
+        if not 0 < normalized['tolerance_mw'] < normalized['max_mw']:
+            raise ValueError("tolerance_mw must be positive and below max_mw")
+    else:
+        profile = np.asarray(params['profile'], dtype=float)
+        if profile.ndim != 1 or not len(profile):
+            raise ValueError("profile must be a non-empty list of per-unit values")
+        load_p_mw = {str(_bus_label(net, bus)): [float(v) for v in values]
+                     for bus, values in (params.get('load_p_mw') or {}).items()}
+        if any(len(values) != len(profile) for values in load_p_mw.values()):
+            raise ValueError(f"load_p_mw profiles must have {len(profile)} hours")
+        vm_min, vm_max = params.get('vm_limits', VM_LIMITS)
+        normalized = {
+            'candidate': _parse_candidates([params['candidate']], net, spatial_index, network)[0],
+            'profile': profile.tolist(),
+            'load_p_mw': load_p_mw,
+            'vm_limits': [float(vm_min), float(vm_max)],
+            'max_loading_percent': float(params.get('max_loading_percent', MAX_LOADING_PERCENT)),
+        }
+    if scenario is not None:
+        normalized['scenario'] = scenario.key
+    return network, net, normalized
+
+
+def study_key(kind, network, params, fingerprint):
+    """Content hash of a study: kind, normalized parameters and the network's source fingerprint."""
+    content = json.dumps([kind, network, params, fingerprint], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:24]
+
+
+# --- Studies (worker processes) ---
+
+class _Reporter:
+    """Sends one job's events back to the web process, throttling progress to one per PROGRESS_INTERVAL_S."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last_progress = 0.0
+
+    def __call__(self, event, data):
+        _event_queue.put((self.job_id, event, data))
+
+    def progress(self, done, total):
+        now = time.monotonic()
+        if done < total and now - self._last_progress < PROGRESS_INTERVAL_S:
+            return
+        self._last_progress = now
+        self('progress', {'done': int(done), 'total': int(total)})
+
+
+def _power_flow(net, params, report):
+    # The worker's net is its own unpickled copy, so slacks can be added to it directly
+    if net.ext_grid.empty:
+        add_island_slacks(net)
+    try:
+        pp.runpp(net)
+    except pp.LoadflowNotConverged:
+        return {'converged': False}
+    report.progress(1, 1)
+    buses = net.res_bus[['vm_pu', 'va_degree', 'p_mw', 'q_mvar']].join(net.bus['name']).dropna(subset=['vm_pu'])
+    lines = net.res_line[['loading_percent', 'p_from_mw', 'q_from_mvar']].join(net.line['name'])
+    lines = lines.dropna(subset=['loading_percent'])
+    return {
+        'converged': True,
+        'min_vm_pu': float(buses['vm_pu'].min()) if len(buses) else None,
+        'max_vm_pu': float(buses['vm_pu'].max()) if len(buses) else None,
+        'max_loading_percent': float(lines['loading_percent'].max()) if len(lines) else None,
+        'buses': frame_records(buses.sort_values('vm_pu').head(RESULT_ROWS).reset_index(names='bus')),
+        'lines': frame_records(lines.sort_values('loading_percent', ascending=False).head(RESULT_ROWS)
+                               .reset_index(names='line')),
+    }
+
+
+def _connection_study(net, params, report):
+    candidates = [Candidate(**c) for c in params['candidates']]
+    rows = []
+
+    def on_batch(summary):
+        batch = frame_records(summary)
+        rows.extend(batch)
+        report('partial', {'candidates': batch})
+        report.progress(len(rows), len(candidates))
+
+    # One prepared net and one process pool for the whole job; batches are reported as they finish
+    run_connection_study(net, candidates, max_workers=STUDY_WORKERS, batch_size=CONNECTION_BATCH, on_batch=on_batch)
+    return {'candidates': rows}
+
+
+def _contingency(net, params, report):
+    result = run_contingency_analysis(net, kinds=tuple(params['kinds']), max_workers=STUDY_WORKERS,
+                                      progress=report.progress, skip_radial=params['skip_radial'])
+    return {
+        'outages': len(result.outages),
+        'status_counts': {status: int(n) for status, n in result.outages['status'].value_counts().items()},
+        'worst': frame_records(result.worst(RESULT_ROWS)),
+        'timings': result.timings,
+    }
+
+
+def _timeseries(net, params, report):
+    load_p_mw = None
+    if params['load_p_mw']:
+        load_p_mw = pd.DataFrame({int(bus): values for bus, values in params['load_p_mw'].items()})
+    result = run_timeseries_study(net, Candidate(**params['candidate']), np.asarray(params['profile']),
+                                  load_p_mw=load_p_mw, max_workers=STUDY_WORKERS, vm_limits=tuple(params['vm_limits']),
+                                  max_loading_percent=params['max_loading_percent'], progress=report.progress)
+    lines = result.line_summary.sort_values('peak_loading_percent', ascending=False).head(RESULT_ROWS)
+    buses = result.bus_summary.sort_values('min_vm_pu').head(RESULT_ROWS)
+    return {
+        'summary': result.summary,
+        'lines': frame_records(lines.reset_index(names='line')),
+        'buses': frame_records(buses.reset_index(names='bus')),
+        'timings': result.timings,
+    }
+
+
+def _hosting_capacity(net, params, report):
+    result = run_hosting_capacity(net, max_mw=params['max_mw'], tolerance_mw=params['tolerance_mw'],
+                                  max_workers=STUDY_WORKERS, progress=report.progress)
+    HostingCapacityStore(params['store_dir']).put(report.job_id, result)
+    return {'buses': len(result.bus_index), 'solves': result.solves, 'settings': result.settings,
+            'timings': result.timings}
+
+
+STUDIES = {
+    'power_flow': _power_flow,
+    'connection_study': _connection_study,
+    'contingency': _contingency,
+    'timeseries': _timeseries,
+    'hosting_capacity': _hosting_capacity,
+}
+
+_event_queue = None
+
+
+def _init_worker(event_queue):
+    global _event_queue
+    _event_queue = event_queue
+
+
+def _run_job(job_id, kind, net, params):
+    """Run one study in a worker process and return its encoded JSON result."""
+    report = _Reporter(job_id)
+    report('started', {'pid': os.getpid()})
+    start = time.perf_counter()
+    try:
+        result = STUDIES[kind](net, params, report)
+    except Exception as e:
+        logger.error(f"Error running {kind} job {job_id}: {e}")
+        logger.error(traceback.format_exc())
+        raise
+    finally:
+        # Events travel separately from the result, so mark the last one; see JobQueue._completed
+        report('end', None)
+    logger.info(f"Finished {kind} job {job_id} in {time.perf_counter() - start:.3f}s")
+    return dumps(result)
+
+
+# --- Job queue (web process) ---
+
+class JobQueue:
+    """Runs studies on a local process pool, at most max_workers at a time, and tracks their progress.
+
+    A job's id is the content hash of its study (see study_key), so submitting an identical study
+    returns the queued/running job or the stored result instead of running it again. Workers send
+    progress and partial results back over a multiprocessing queue; a listener thread turns them
+    into job events for stream() subscribers. The pool is only started by the first submission.
+
+    Jobs are also recorded in a JobRegistry next to the result store, so with several web workers a
+    study runs in only one of them and the others report its status and stream its events from there.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, store=None, registry=None):
+        self.max_workers = max_workers
+        self.store = store if store is not None else ResultStore()
+        self.registry = registry if registry is not None else JobRegistry(os.path.join(self.store.directory,
+                                                                                       REGISTRY_FILE))
+        self._jobs = OrderedDict()
+        self._changed = threading.Condition()
+        self._pool = None
+        self._event_queue = None
+        self._listener = None
+        # Results of jobs whose 'end' event hasn't arrived yet, and jobs whose 'end' came before the result
+        self._pending = {}
+        self._ended = set()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.cached = 0
+
+    def _start(self):
+        if self._pool is not None:
+            return
+        if self._event_queue is None:
+            self._event_queue = multiprocessing.Queue()
+            self._listener = threading.Thread(target=self._listen, name='job-events', daemon=True)
+            self._listener.start()
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                         initargs=(self._event_queue,))
+
+    def _listen(self):
+        while True:
+            item = self._event_queue.get()
+            if item is None:
+                return
+            job_id, event, data = item
+            with self._changed:
+                job = self._jobs.get(job_id)
+                if job is None or job.status in TERMINAL:
+                    continue
+                if event == 'end':
+                    if job_id in self._pending:
+                        self._finish(job, 'done', result=self._pending.pop(job_id))
+                    else:
+                        self._ended.add(job_id)
+                    continue
+                if event == 'started':
+                    job.status = 'running'
+                elif event == 'progress':
+                    job.progress = data
+                job.events.append((event, data))
+                self._record(job, event, data)
+                self._changed.notify_all()
+
+    def _record(self, job, event, data):
+        """Share an event of a job this process runs with the other web workers."""
+        if job.cached:
+            return
+        try:
+            self.registry.record(job, event, data)
+        except Exception as e:
+            logger.error(f"Error recording {event} of job {job.id}: {e}")
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._changed:
+            job.status, job.result, job.error = status, result, error
+            job.finished_at = time.time()
+            if status == 'done':
+                job.events.append(('done', {'id': job.id, 'cached': job.cached}))
+            else:
+                job.events.append(('failed', {'id': job.id, 'error': error}))
+            self._record(job, *job.events[-1])
+            self._changed.notify_all()
+
+    def _completed(self, job, future):
+        try:
+            body = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died; start a fresh pool for the next submission
+                with self._changed:
+                    self._pool = None
+            logger.error(f"Study job {job.id} failed: {e}")
+            self._finish(job, 'failed', error=str(e) or type(e).__name__)
+            return
+        try:
+            self.store.put(job.id, body)
+        except Exception as e:
+            logger.error(f"Error storing result of job {job.id}: {e}")
+        # The worker's last events may still be in the event queue; the job is done once they are in
+        with self._changed:
+            if job.id in self._ended:
+                self._ended.discard(job.id)
+                self._finish(job, 'done', result=body)
+            else:
+                self._pending[job.id] = body
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in TERMINAL]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _from_store(self, job_id, kind=None):
+        body = self.store.get(job_id)
+        if body is None:
+            return None
+        job = Job(job_id, kind, cached=True)
+        self._jobs[job_id] = job
+        self._finish(job, 'done', result=body)
+        return job
+
+    def _from_registry(self, job_id):
+        """A snapshot of a job another web worker runs, or None."""
+        row = self.registry.get(job_id)
+        if row is None:
+            return None
+        job = Job(row['id'], row['kind'], status=row['status'], progress=row['progress'], error=row['error'],
+                  created_at=row['created_at'], finished_at=row['finished_at'])
+        if job.status == 'done':
+            job.result = self.store.get(job_id)
+            if job.result is None:
+                return None
+        return job
+
+    def key(self, kind, params, model):
+        """Return the job id a study would get, without submitting it."""
+        network, _, normalized = parse_study(kind, params, model)
+        return study_key(kind, network, normalized, model.fingerprint)
+
+    def submit(self, kind, params, model, rerun=False):
+        """Validate and submit a study on one of model's networks; return its Job.
+
+        With rerun, a finished job or stored result for the same study is ignored and it runs again.
+        Raises ValueError/KeyError/TypeError for invalid parameters.
+        """
+        network, net, normalized = parse_study(kind, params, model)
+        job_id = study_key(kind, network, normalized, model.fingerprint)
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status != 'failed' and not (rerun and job.status in TERMINAL):
+                self.deduplicated += 1
+                return job
+            for _ in range(CLAIM_ATTEMPTS):
+                job = None if rerun else self._from_store(job_id, kind)
+                if job is not None:
+                    self.cached += 1
+                    return job
+                if self.registry.claim(job_id, kind):
+                    break
+                # Another web worker is running this study. If it finished (or its result was evicted)
+                # between the claim and this lookup, look in the store and claim it again
+                job = self._from_registry(job_id)
+                if job is not None:
+                    self.deduplicated += 1
+                    return job
+            else:
+                raise RuntimeError(f"Could not claim job {job_id} or find the web worker running it")
+            job = Job(job_id, kind)
+            self._jobs[job_id] = job
+            self._prune()
+            self._start()
+            self.submitted += 1
+            future = self._pool.submit(_run_job, job_id, kind, net, normalized)
+        logger.info(f"Submitted {kind} job {job_id}")
+        future.add_done_callback(lambda f: self._completed(job, f))
+        return job
+
+    def get(self, job_id):
+        """Return a job by id (falling back to the result store, then to the job registry), or None."""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = self._from_store(job_id)
+        return job if job is not None else self._from_registry(job_id)
+
+    def stream(self, job_id, start=0, keepalive_s=15.0):
+        """Yield (position, event, data) for a job's events from start on until it finishes.
+
+        Waits for new events while the job runs, yielding None every keepalive_s without one so the
+        caller can keep the connection alive. Events of a job another web worker runs are polled
+        from the job registry.
+        """
+        with self._changed:
+            local = job_id in self._jobs
+        if not local:
+            yield from self._stream_remote(job_id, start, keepalive_s)
+            return
+        position = start
+        while True:
+            with self._changed:
+                job = self._jobs[job_id]
+                if position >= len(job.events) and job.status not in TERMINAL:
+                    self._changed.wait(keepalive_s)
+                pending = job.events[position:]
+                finished = job.status in TERMINAL
+            for event, data in pending:
+                yield position, event, data
+                position += 1
+            if finished:
+                return
+            if not pending:
+                yield None
+
+    def _stream_remote(self, job_id, position, keepalive_s):
+        idle = 0.0
+        while True:
+            status, pending = self.registry.events(job_id, position)
+            if status is None:
+                raise KeyError(job_id)
+            for event, data in pending:
+                yield position, event, data
+                position += 1
+            if status in TERMINAL:
+                return
+            idle = 0.0 if pending else idle + REMOTE_POLL_S
+            if idle >= keepalive_s:
+                idle = 0.0
+                yield None
+            time.sleep(REMOTE_POLL_S)
+
+    def stats(self):
+        """Return job counts by status and the submission/dedup counters."""
+        with self._changed:
+            counts = {status: 0 for status in ('queued', 'running') + TERMINAL}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {**counts, 'submitted': self.submitted, 'deduplicated': self.deduplicated, 'cached': self.cached,
+                'store': self.store.stats()}
+
+    def shutdown(self):
+        """Stop the pool (waiting for running jobs) and the listener thread."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._event_queue is not None:
+            self._event_queue.put(None)
+            self._listener.join()
+            self._event_queue = None
+
+
+job_queue = JobQueue()
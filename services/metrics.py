@@ -0,0 +1,111 @@
+import bisect
+import resource
+import sys
+import threading
+
+from data_parsing.profiling import stage_stats
+
+# Request latency buckets in seconds (Prometheus client defaults)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """A labelled Prometheus histogram (cumulative buckets, sum and count per label set)."""
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _labels(self.label_names + ('le',), key + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _family(name, kind, help_text, samples):
+    """Render a counter/gauge family from (labels dict, value) samples."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return lines
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by endpoint.',
+                            ('endpoint', 'method', 'status'))
+
+
+def peak_rss_bytes():
+    """Return the process's peak resident set size in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def render_metrics(cache_stats=None, extra_gauges=None):
+    """Render request latency, pipeline stage and network cache metrics in Prometheus text format."""
+    lines = REQUEST_LATENCY.render()
+
+    stats = sorted(stage_stats().values(), key=lambda s: s.name)
+    lines += _family('pipeline_stage_seconds_total', 'counter', 'Total time spent in each pipeline stage.',
+                     [({'stage': s.name}, s.seconds) for s in stats])
+    lines += _family('pipeline_stage_runs_total', 'counter', 'Number of times each pipeline stage ran.',
+                     [({'stage': s.name}, s.runs) for s in stats])
+    lines += _family('pipeline_stage_rows_total', 'counter', 'Rows (or bytes, for serialization) handled per stage.',
+                     [({'stage': s.name}, s.rows) for s in stats])
+    lines += _family('pipeline_stage_last_seconds', 'gauge', 'Duration of the latest run of each pipeline stage.',
+                     [({'stage': s.name}, s.last_seconds) for s in stats])
+    lines += _family('pipeline_stage_peak_bytes', 'gauge',
+                     'Peak Python allocation during a stage (0 unless memory tracing is on).',
+                     [({'stage': s.name}, s.peak_bytes) for s in stats])
+    lines += _family('process_peak_rss_bytes', 'gauge', 'Peak resident set size of the process.',
+                     [({}, peak_rss_bytes())])
+
+    if cache_stats is not None:
+        for key in ('hits', 'misses', 'rebuilds', 'snapshot_loads', 'incremental_updates'):
+            lines += _family(f'network_cache_{key}_total', 'counter', f'Network model cache {key.replace("_", " ")}.',
+                             [({}, cache_stats.get(key, 0))])
+        if cache_stats.get('last_build_seconds') is not None:
+            lines += _family('network_cache_last_build_seconds', 'gauge', 'Duration of the latest model build.',
+                             [({'source': cache_stats.get('last_build_source') or ''},
+                               cache_stats['last_build_seconds'])])
+    for name, (help_text, value) in (extra_gauges or {}).items():
+        lines += _family(name, 'gauge', help_text, [({}, value)])
+    return '\n'.join(lines) + '\n'
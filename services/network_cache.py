@@ -0,0 +1,523 @@
+import copy
+import hashlib
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from analysis.spatial_index import SpatialIndex
+from analysis.topology import NetworkTopology, scenario_topology
+from data_parsing.incremental import (TRANSPOWER_LINES, TRANSPOWER_SITES, VECTOR_SITES, SiteSource,
+                                      apply_line_changes, apply_site_changes, read_source_rows)
+from data_parsing.integrated import create_integrated_network
+from data_parsing.profiling import stage
+from data_parsing.transpower.transpower_data_parser import SITES_CSV, create_substation_files, create_transpower_network
+from data_parsing.transpower.transpower_lines import LINES_CSV, load_transmission_lines
+from data_parsing.vector.vector_data_parser import VECTOR_SITES_CSV, create_vector_network
+from services.payload import encode_payload, frame_records
+from services.snapshot import SNAPSHOT_DIR, load_snapshot, save_snapshot
+from services.viewport import LINE_FIELDS, ViewportIndex, line_frame
+
+logger = logging.getLogger(__name__)
+
+SOURCE_FILES = (SITES_CSV, LINES_CSV, VECTOR_SITES_CSV)
+
+# How each source file maps onto the networks, for applying its changed rows without a full rebuild
+INCREMENTAL_SOURCES = {
+    SITES_CSV: TRANSPOWER_SITES,
+    LINES_CSV: TRANSPOWER_LINES,
+    VECTOR_SITES_CSV: VECTOR_SITES,
+}
+
+# How often the background watcher checks the source files
+WATCH_INTERVAL_S = 2.0
+
+# After a failed rebuild, how long to keep serving the last good model before building again
+REBUILD_COOLDOWN_S = 30.0
+
+# Scenario topologies kept per model (see NetworkModel.scenario_topology)
+MAX_SCENARIO_TOPOLOGIES = 32
+
+# Networks whose lines are sent to the map
+MAP_LINE_NETWORKS = ('transpower',)
+
+# bus_data columns sent to the map for each substation
+SUBSTATION_FIELDS = ['name', 'type', 'description', 'lat', 'lon']
+
+
+@dataclass
+class NetworkModel:
+    """The built pandapower networks, their bus data and the map payload for one set of source files.
+
+    integrated_net joins both networks at the grid exit points (see data_parsing.integrated); its
+    buses have their own spatial index, integrated_index, and gxp_links lists the joins. They are
+    built on first use. sources holds the source rows the networks were built from, keyed by path,
+    for diffing the next change against (see update_model). scenario_topology() keeps the topologies
+    of the most recently queried scenarios.
+    """
+    transpower_net: object
+    transpower_bus_data: object
+    vector_net: object
+    vector_bus_data: object
+    map_data: object
+    spatial_index: object = None
+    payload: object = None
+    viewport: object = None
+    topology: dict = field(default_factory=dict)
+    fingerprint: tuple = ()
+    built_at: float = field(default_factory=time.time)
+    sources: dict = None
+    _integrated: tuple = field(default=None, repr=False)
+    _scenario_topologies: OrderedDict = field(default_factory=OrderedDict, repr=False)
+
+    def _integration(self):
+        if self._integrated is None:
+            net, bus_data, links = create_integrated_network(self.transpower_net, self.transpower_bus_data,
+                                                             self.vector_net, self.vector_bus_data)
+            index = SpatialIndex.from_networks([('integrated', net, bus_data)])
+            self._integrated = (net, bus_data, index, links)
+        return self._integrated
+
+    def scenario_topology(self, network, scenario):
+        """Return a network's topology with a scenario applied (see analysis.topology.scenario_topology)."""
+        key = (network, scenario.key)
+        topology = self._scenario_topologies.get(key)
+        if topology is None:
+            topology = scenario_topology(self.topology[network], getattr(self, f'{network}_net'), scenario)
+            self._scenario_topologies[key] = topology
+            while len(self._scenario_topologies) > MAX_SCENARIO_TOPOLOGIES:
+                self._scenario_topologies.popitem(last=False)
+        return topology
+
+    @property
+    def integrated_net(self):
+        return self._integration()[0]
+
+    @property
+    def integrated_bus_data(self):
+        return self._integration()[1]
+
+    @property
+    def integrated_index(self):
+        return self._integration()[2]
+
+    @property
+    def gxp_links(self):
+        return self._integration()[3]
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def map_section(label, net, bus_data):
+    """Build one network's part of the /network_data payload."""
+    return {
+        'substations': frame_records(bus_data[SUBSTATION_FIELDS]),
+        'lines': frame_records(line_frame(net)[LINE_FIELDS]) if label in MAP_LINE_NETWORKS else [],
+    }
+
+
+def build_map_data(transpower_net, transpower_bus_data, vector_net, vector_bus_data):
+    """Build the /network_data payload from the built networks."""
+    map_data = {
+        'transpower': map_section('transpower', transpower_net, transpower_bus_data),
+        'vector': map_section('vector', vector_net, vector_bus_data),
+    }
+    logger.info(f"Prepared {len(map_data['transpower']['substations'])} Transpower substations for map")
+    logger.info(f"Prepared {len(map_data['transpower']['lines'])} Transpower lines for map")
+    logger.info(f"Prepared {len(map_data['vector']['substations'])} Vector substations for map")
+    return map_data
+
+
+def read_sources(sources=INCREMENTAL_SOURCES):
+    """Read the rows of each incremental source file, keyed by path. Return None on failure."""
+    try:
+        return {path: read_source_rows(path, source) for path, source in sources.items()}
+    except Exception as e:
+        logger.error(f"Error reading source rows: {e}")
+        return None
+
+
+def build_network_model(export_substations=True):
+    """Build both networks and the map payload from the source CSVs. Return None on failure.
+
+    With export_substations, the per-substation JSON files are refreshed as a separate step once the
+    Transpower lines are loaded; only substations whose content changed are rewritten.
+    """
+    # Read before building, so a file edited mid-build shows up as a change against these rows
+    sources = read_sources()
+    logger.info("Creating Transpower network...")
+    transpower_net, transpower_bus_data = create_transpower_network()
+    if transpower_net is None:
+        logger.error("Failed to create Transpower network")
+        return None
+    logger.info(f"Successfully created Transpower network with {len(transpower_bus_data)} buses")
+
+    logger.info("Loading Transpower transmission lines...")
+    load_transmission_lines(transpower_net)
+    logger.info(f"Loaded {len(transpower_net.line)} Transpower lines")
+
+    if export_substations:
+        create_substation_files(transpower_net, transpower_bus_data)
+
+    logger.info("Creating Vector network...")
+    vector_net, vector_bus_data = create_vector_network()
+    if vector_net is None:
+        logger.error("Failed to create Vector network")
+        return None
+    logger.info(f"Successfully created Vector network with {len(vector_bus_data)} buses")
+
+    model = assemble_model(transpower_net, transpower_bus_data, vector_net, vector_bus_data)
+    model.sources = sources
+    return model
+
+
+def _writable_copy(net):
+    """Return a copy of a net whose element tables can be changed without touching net's.
+
+    Tables with rows are copied; empty ones and everything else (std_types, solver internals) are
+    shared, which is much cheaper than a deepcopy of the whole net.
+    """
+    result = copy.copy(net)
+    for key, value in net.items():
+        if isinstance(value, pd.DataFrame):
+            result[key] = value.copy(deep=len(value) > 0)
+    return result
+
+
+def update_model(model, changed_paths, sources=INCREMENTAL_SOURCES, export_substations=True):
+    """Apply only the rows that changed in changed_paths to a model's networks and return the new model.
+
+    The rows are diffed against model.sources by each source's key (see data_parsing.incremental), on
+    copies of the changed networks' tables so requests still using the old model are unaffected;
+    existing buses and lines keep their indices. Only the changed networks' indexes, topology and map
+    payload section are then rebuilt (see patch_model). Returns None if the change can't be applied
+    incrementally (a file that isn't an incremental source, or no baseline rows), in which case the
+    caller rebuilds from scratch.
+    """
+    if (model.sources is None or model.map_data is None or not changed_paths
+            or any(path not in sources for path in changed_paths)):
+        return None
+    rows = {path: read_source_rows(path, sources[path]) for path in changed_paths}
+    networks = {label: [_writable_copy(getattr(model, f'{label}_net')), getattr(model, f'{label}_bus_data')]
+                for label in {sources[path].network for path in changed_paths}}
+    counts = {}
+    names = {label: set() for label in networks}
+    with stage('incremental_update', rows=sum(len(frame) for frame in rows.values())):
+        # Sites first, so lines between renamed or re-created sites resolve against the new buses
+        for path, frame in rows.items():
+            source = sources[path]
+            if isinstance(source, SiteSource):
+                entry = networks[source.network]
+                entry[1], changed, counts[path] = apply_site_changes(entry[0], entry[1], source,
+                                                                     model.sources[path], frame)
+                names[source.network] |= changed
+        for path, source in sources.items():
+            if isinstance(source, SiteSource) or source.network not in networks:
+                continue
+            if path not in rows and not names[source.network]:
+                continue
+            new_rows = rows.get(path, model.sources[path])
+            counts[path] = apply_line_changes(networks[source.network][0], source, model.sources[path],
+                                              new_rows, names[source.network])
+    for path, count in counts.items():
+        logger.info(f"Applied changes to {path}: {count['inserted']} inserted, "
+                    f"{count['updated']} updated, {count['deleted']} deleted")
+
+    if export_substations and 'transpower' in networks:
+        create_substation_files(*networks['transpower'])
+    updated = patch_model(model, {label: tuple(entry) for label, entry in networks.items()})
+    updated.sources = {**model.sources, **rows}
+    return updated
+
+
+def patch_model(model, networks):
+    """Return a NetworkModel with some of model's networks replaced, given as {label: (net, bus_data)}.
+
+    The other networks' tables, topology, map payload section and index rows are reused from model;
+    only the replaced networks' are rebuilt. The payload body is still encoded and compressed whole.
+    """
+    map_data, topology = dict(model.map_data), dict(model.topology)
+    spatial_index, viewport = model.spatial_index, model.viewport
+    rows = sum(len(bus_data) for _, bus_data in networks.values())
+    with stage('map_payload', rows=rows):
+        for label, (net, bus_data) in networks.items():
+            map_data[label] = map_section(label, net, bus_data)
+        payload = encode_payload(map_data, '/network_data')
+    with stage('spatial_index', rows=rows):
+        for label, (net, bus_data) in networks.items():
+            spatial_index = spatial_index.with_network(label, net, bus_data)
+    with stage('viewport_index'):
+        for label, (net, bus_data) in networks.items():
+            viewport = viewport.with_network(spatial_index, label, net, bus_data)
+    with stage('topology', rows=sum(len(net.line) for net, _ in networks.values())):
+        for label, (net, _) in networks.items():
+            topology[label] = NetworkTopology(net)
+    tables = {label: networks.get(label, (getattr(model, f'{label}_net'), getattr(model, f'{label}_bus_data')))
+              for label in ('transpower', 'vector')}
+    return NetworkModel(*tables['transpower'], *tables['vector'], map_data, spatial_index=spatial_index,
+                        payload=payload, viewport=viewport, topology=topology)
+
+
+def assemble_model(transpower_net, transpower_bus_data, vector_net, vector_bus_data, payload=None):
+    """Build the derived map payload, its encoded response, the spatial/viewport indexes and each
+    network's topology into a NetworkModel.
+
+    An already encoded payload (e.g. one shared by services.shared_model) is used as-is; the map
+    payload is then not rebuilt and the model's map_data is None.
+    """
+    map_data = None
+    if payload is None:
+        with stage('map_payload', rows=len(transpower_bus_data) + len(vector_bus_data) + len(transpower_net.line)):
+            map_data = build_map_data(transpower_net, transpower_bus_data, vector_net, vector_bus_data)
+        payload = encode_payload(map_data, '/network_data')
+    networks = [
+        ('transpower', transpower_net, transpower_bus_data),
+        ('vector', vector_net, vector_bus_data),
+    ]
+    with stage('spatial_index', rows=len(transpower_bus_data) + len(vector_bus_data)):
+        spatial_index = SpatialIndex.from_networks(networks)
+    with stage('viewport_index'):
+        viewport = ViewportIndex.from_networks(networks, spatial_index)
+    with stage('topology', rows=len(transpower_net.line) + len(vector_net.line)):
+        topology = {label: NetworkTopology(net) for label, net, _ in networks}
+    return NetworkModel(transpower_net, transpower_bus_data, vector_net, vector_bus_data, map_data,
+                        spatial_index=spatial_index, payload=payload, viewport=viewport, topology=topology)
+
+
+def load_model_snapshot(fingerprint, snapshot_dir=SNAPSHOT_DIR):
+    """Return a NetworkModel from the snapshot in snapshot_dir if it matches fingerprint, else None."""
+    networks = load_snapshot(fingerprint, snapshot_dir)
+    if networks is None or set(networks) != {'transpower', 'vector'}:
+        return None
+    model = assemble_model(*networks['transpower'], *networks['vector'])
+    model.sources = read_sources()
+    return model
+
+
+def save_model_snapshot(model, fingerprint, snapshot_dir=SNAPSHOT_DIR):
+    """Persist a model's networks and bus data so the next cold start can skip the CSV build."""
+    return save_snapshot(fingerprint, {
+        'transpower': (model.transpower_net, model.transpower_bus_data),
+        'vector': (model.vector_net, model.vector_bus_data),
+    }, snapshot_dir)
+
+
+class NetworkCache:
+    """Holds one built NetworkModel and rebuilds it only when a source file changes.
+
+    Each source file is tracked by (mtime, size) and SHA-256 content hash. The stat check runs on
+    every lookup; the file is only re-hashed when its stat changes, and the model is only rebuilt
+    when a hash changes, so touching a file without editing it does not trigger a rebuild.
+
+    With a snapshot_dir, a miss first tries the binary snapshot saved for the same source hashes
+    and only falls back to the builder when there is none; models built by the builder are snapshotted.
+
+    With an updater, a change to some source files is first applied to the current model with
+    updater(model, changed_paths), e.g. update_model; a None result falls back to the builder.
+    watch() checks the files in the background, so changes are picked up between requests.
+
+    Hits don't take the build lock, and while a rebuild runs other callers keep getting the current
+    model instead of queueing behind it. A failed rebuild isn't retried for rebuild_cooldown_s
+    (unless the files change again); the last good model is served in the meantime.
+    """
+
+    def __init__(self, source_files=SOURCE_FILES, builder=build_network_model, snapshot_dir=None, updater=None,
+                 rebuild_cooldown_s=REBUILD_COOLDOWN_S):
+        self.source_files = tuple(source_files)
+        self.builder = builder
+        self.snapshot_dir = snapshot_dir
+        self.updater = updater
+        self.rebuild_cooldown_s = rebuild_cooldown_s
+        # Fingerprint and monotonic time of the last failed rebuild
+        self._failed = None
+        self._watcher = None
+        self._stop = threading.Event()
+        self._model = None
+        self._stats = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._fingerprint_lock = threading.Lock()
+        # Hits are counted outside the build lock, from every request thread, so they have their own
+        self._hits_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.snapshot_loads = 0
+        self.incremental_updates = 0
+        self.failed_rebuilds = 0
+        self.last_build_seconds = None
+        self.last_build_source = None
+
+    def _stat(self, path):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def fingerprint(self):
+        """Return a tuple of content hashes for the source files, re-hashing only files whose stat changed."""
+        with self._fingerprint_lock:
+            return self._fingerprint()
+
+    def _fingerprint(self):
+        digests = []
+        for path in self.source_files:
+            try:
+                stat = self._stat(path)
+            except OSError:
+                # Missing file: let the builder report it, and make sure we retry next time
+                self._stats.pop(path, None)
+                self._digests.pop(path, None)
+                digests.append((path, None))
+                continue
+            if self._stats.get(path) != stat:
+                self._digests[path] = file_digest(path)
+                self._stats[path] = stat
+            digests.append((path, self._digests[path]))
+        return tuple(digests)
+
+    def get(self):
+        """Return the cached NetworkModel, rebuilding it first if any source file changed."""
+        fingerprint = self.fingerprint()
+        model = self._model
+        if model is not None and model.fingerprint == fingerprint:
+            self._hit()
+            return model
+        if self._cooling_down(fingerprint):
+            return model
+        # Only one rebuild runs at a time; with a model to serve, other callers don't wait for it
+        if not self._lock.acquire(blocking=model is None):
+            return model
+        try:
+            return self._rebuild()
+        finally:
+            self._lock.release()
+
+    def _hit(self):
+        with self._hits_lock:
+            self.hits += 1
+
+    def _cooling_down(self, fingerprint):
+        """Whether the last rebuild failed for these same files less than rebuild_cooldown_s ago."""
+        failed = self._failed
+        return (failed is not None and failed[0] == fingerprint
+                and time.monotonic() - failed[1] < self.rebuild_cooldown_s)
+
+    def _rebuild(self):
+        """Rebuild the model for the current source files; call with the lock held."""
+        # Another caller may have rebuilt (or failed to) while this one waited for the lock
+        fingerprint = self.fingerprint()
+        if self._model is not None and self._model.fingerprint == fingerprint:
+            self._hit()
+            return self._model
+        if self._cooling_down(fingerprint):
+            return self._model
+
+        self.misses += 1
+        logger.info("Network cache miss, rebuilding network model")
+        start = time.perf_counter()
+        model, source = None, 'csv'
+        if self._model is not None and self.updater is not None:
+            model, source = self._update(fingerprint), 'incremental'
+        try:
+            if model is None and self.snapshot_dir is not None:
+                model = load_model_snapshot(fingerprint, self.snapshot_dir)
+                source = 'snapshot'
+            if model is None:
+                model, source = self.builder(), 'csv'
+            # Only full builds are saved; an incremental update is cheaper than writing a snapshot
+            if model is not None and source == 'csv' and self.snapshot_dir is not None:
+                save_model_snapshot(model, fingerprint, self.snapshot_dir)
+        except Exception as e:
+            logger.error(f"Error rebuilding network model: {e}")
+            logger.error(traceback.format_exc())
+            model = None
+        if model is None:
+            # Keep serving the previous model if there is one, and don't retry until the cooldown is up
+            self._failed = (fingerprint, time.monotonic())
+            self.failed_rebuilds += 1
+            logger.warning(f"Network model rebuild failed, retrying in {self.rebuild_cooldown_s:.0f}s")
+            return self._model
+        self._failed = None
+        model.fingerprint = fingerprint
+        self._model = model
+        self.rebuilds += 1
+        if source == 'snapshot':
+            self.snapshot_loads += 1
+        elif source == 'incremental':
+            self.incremental_updates += 1
+        self.last_build_seconds = time.perf_counter() - start
+        self.last_build_source = source
+        logger.info(f"Rebuilt network model from {source} in {self.last_build_seconds:.3f}s")
+        return model
+
+    def _update(self, fingerprint):
+        """Try the updater on the files whose hash changed; return the updated model or None."""
+        previous = dict(self._model.fingerprint)
+        changed = [path for path, digest in fingerprint if previous.get(path) != digest]
+        if any(digest is None for path, digest in fingerprint if path in changed):
+            return None
+        try:
+            return self.updater(self._model, changed)
+        except Exception as e:
+            logger.warning(f"Incremental update failed, rebuilding instead: {e}")
+            logger.debug(traceback.format_exc())
+            return None
+
+    def watch(self, interval_s=WATCH_INTERVAL_S):
+        """Check the source files every interval_s on a daemon thread, until stop() is called."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval_s):
+                try:
+                    self.get()
+                except Exception as e:
+                    logger.error(f"Error checking network sources: {e}")
+
+        self._watcher = threading.Thread(target=run, name='network-cache-watcher', daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    def stop(self):
+        """Stop the watch() thread."""
+        self._stop.set()
+
+    def invalidate(self):
+        """Drop the cached model so the next get() rebuilds it."""
+        with self._lock:
+            self._model = None
+            self._failed = None
+
+    def peek(self):
+        """Return the cached model (possibly stale) without checking sources or building, or None."""
+        return self._model
+
+    def stats(self):
+        """Return the cache hit/miss counters."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+            'snapshot_loads': self.snapshot_loads,
+            'incremental_updates': self.incremental_updates,
+            'failed_rebuilds': self.failed_rebuilds,
+            'last_build_seconds': self.last_build_seconds,
+            'last_build_source': self.last_build_source,
+            'built_at': self._model.built_at if self._model is not None else None,
+        }
+
+
+network_cache = NetworkCache(snapshot_dir=SNAPSHOT_DIR, updater=update_model)
@@ -0,0 +1,85 @@
+import gzip
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+
+from data_parsing.profiling import stage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = ('br', 'gzip')
+
+
+@dataclass
+class EncodedPayload:
+    """A JSON response body encoded once, with precompressed variants and a strong ETag.
+
+    encodings maps a Content-Encoding ('gzip', and 'br' when the brotli package is installed) to the
+    compressed body. The ETag is a content hash of the uncompressed body.
+    """
+    body: bytes
+    etag: str
+    encodings: dict = field(default_factory=dict)
+    encode_seconds: float = 0.0
+
+    def variant_etag(self, encoding):
+        """Return the ETag of one representation; each Content-Encoding is a distinct representation."""
+        return self.etag if encoding is None else f"{self.etag}-{encoding}"
+
+    def select(self, accept_encodings):
+        """Return (encoding, bytes) for the best encoding the client accepts, or (None, body)."""
+        for encoding in ENCODINGS:
+            if encoding in self.encodings and encoding in accept_encodings:
+                return encoding, self.encodings[encoding]
+        return None, self.body
+
+
+def dumps(data):
+    """Serialise data to JSON bytes with orjson, which also writes NaN as null.
+
+    Without orjson the stdlib encoder is used; it writes NaN as-is, so payload builders should
+    already have replaced missing values with None.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def frame_records(frame):
+    """Return a DataFrame as a list of row dicts with missing values as None (JSON null)."""
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def encode_payload(data, label='payload', level=logging.INFO):
+    """Encode data to JSON once, precompress it and hash it for the ETag. Logs size and encode time."""
+    start = time.perf_counter()
+    with stage('serialization') as timer:
+        body = dumps(data)
+        timer.rows = len(body)
+    encoded_s = time.perf_counter() - start
+    with stage('compression', rows=len(body)):
+        encodings = {'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            encodings['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    total_s = time.perf_counter() - start
+    sizes = ', '.join(f"{encoding} {len(value)} B" for encoding, value in encodings.items())
+    logger.log(level, f"Encoded {label}: {len(body)} B ({sizes}) in {encoded_s * 1000:.1f} ms, "
+                      f"{total_s * 1000:.1f} ms with compression")
+    return EncodedPayload(body, etag, encodings, total_s)
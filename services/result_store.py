@@ -0,0 +1,78 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RESULT_DIR = 'data/results'
+
+# Completed study results are kept this long, then evicted on the next store or lookup
+RESULT_TTL_SECONDS = 24 * 3600
+
+
+class ResultStore:
+    """Encoded study results on disk, one file per content hash, evicted after ttl_seconds.
+
+    A result's age is its file's mtime, so the TTL survives restarts.
+    """
+
+    def __init__(self, directory=RESULT_DIR, ttl_seconds=RESULT_TTL_SECONDS):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _expired(self, path, now):
+        return now - os.path.getmtime(path) > self.ttl_seconds
+
+    def get(self, key):
+        """Return the stored result bytes for key, or None if there is none or it has expired."""
+        path = self._path(key)
+        with self._lock:
+            try:
+                if self._expired(path, time.time()):
+                    os.remove(path)
+                    self.evictions += 1
+                    self.misses += 1
+                    return None
+                with open(path, 'rb') as f:
+                    body = f.read()
+            except OSError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        """Store result bytes under key (atomically) and evict expired results."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.result-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, self._path(key))
+            self._evict_expired()
+
+    def _evict_expired(self):
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                if self._expired(entry.path, now):
+                    os.remove(entry.path)
+                    self.evictions += 1
+            except OSError:
+                # Removed by another process in the meantime
+                continue
+
+    def stats(self):
+        """Return the store hit/miss/eviction counters."""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
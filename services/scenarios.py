@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from analysis.scenario import BUS_FIELDS, Scenario
+
+logger = logging.getLogger(__name__)
+
+# Scenarios kept in memory; each is a small delta (well under 1 KB for a handful of changes)
+MAX_SCENARIOS = 10000
+
+# Where the web workers share their scenarios (see SharedScenarioStore)
+STORE_PATH = 'data/scenarios.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (key TEXT PRIMARY KEY, spec TEXT NOT NULL, used INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS scenarios_used ON scenarios (used);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+def parse_scenario(spec, net, bus_label):
+    """Build a Scenario from a request's spec and validate it against net.
+
+    Bus fields of added elements may be bus names; bus_label(net, bus) resolves them to labels, so
+    the same change given by name or by label has the same key.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("scenario must be a JSON object or a scenario id")
+    added = []
+    for row in spec.get('add') or []:
+        added.append({column: bus_label(net, value) if column in BUS_FIELDS else value
+                      for column, value in row.items()})
+    scenario = Scenario.from_dict({**spec, 'add': added})
+    scenario.validate(net)
+    return scenario
+
+
+class ScenarioStore:
+    """Scenarios by key, least recently used dropped first once there are more than max_scenarios.
+
+    Scenarios are deltas against whichever network a study runs on, so one store serves all of them.
+    """
+
+    def __init__(self, max_scenarios=MAX_SCENARIOS):
+        self.max_scenarios = max_scenarios
+        self._scenarios = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def put(self, scenario):
+        """Keep a scenario and return its key."""
+        key = scenario.key
+        with self._lock:
+            self._scenarios[key] = scenario
+            self._scenarios.move_to_end(key)
+            while len(self._scenarios) > self.max_scenarios:
+                self._scenarios.popitem(last=False)
+                self.evictions += 1
+        return key
+
+    def get(self, key):
+        """Return the scenario stored under key, or None."""
+        with self._lock:
+            scenario = self._scenarios.get(key)
+            if scenario is not None:
+                self._scenarios.move_to_end(key)
+            return scenario
+
+    def stats(self):
+        with self._lock:
+            return {'scenarios': len(self._scenarios), 'evictions': self.evictions}
+
+
+class SharedScenarioStore(ScenarioStore):
+    """A ScenarioStore in a SQLite file, so a scenario posted to one web worker can be used in all of them.
+
+    Least recently used scenarios are dropped the same way; the eviction count is shared too.
+    """
+
+    def __init__(self, path=STORE_PATH, max_scenarios=MAX_SCENARIOS):
+        super().__init__(max_scenarios)
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def put(self, scenario):
+        key = scenario.key
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR REPLACE INTO scenarios VALUES (?, ?, ?)',
+                         (key, json.dumps(scenario.to_dict()), time.time_ns()))
+            (count,) = conn.execute('SELECT COUNT(*) FROM scenarios').fetchone()
+            excess = count - self.max_scenarios
+            if excess > 0:
+                conn.execute('DELETE FROM scenarios WHERE key IN (SELECT key FROM scenarios ORDER BY used LIMIT ?)',
+                             (excess,))
+                conn.execute("INSERT INTO meta VALUES ('evictions', ?) "
+                             "ON CONFLICT (key) DO UPDATE SET value = value + excluded.value", (excess,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return key
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute('SELECT spec FROM scenarios WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE scenarios SET used = ? WHERE key = ?', (time.time_ns(), key))
+        return Scenario.from_dict(json.loads(row[0]))
+
+    def stats(self):
+        conn = self._connect()
+        (count,) = conn.execute('SELECT COUNT(*) FROM scenarios').fetchone()
+        evictions = conn.execute("SELECT value FROM meta WHERE key = 'evictions'").fetchone()
+        return {'scenarios': count, 'evictions': evictions[0] if evictions else 0}
+
+
+scenario_store = SharedScenarioStore()
@@ -0,0 +1,354 @@
+import copy
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from services.network_cache import assemble_model, network_cache
+from services.payload import EncodedPayload
+from services.snapshot import NET_ATTRIBUTES, _empty_network, _json_value
+
+logger = logging.getLogger(__name__)
+
+# Name of the shared-memory control block; each published model is a data block '<name>-<generation>'
+SHARED_MODEL_NAME = 'transpower-model'
+
+# Networks published to the workers (the integrated network and indexes are derived from them)
+NETWORKS = ('transpower', 'vector')
+
+# Arrays in a data block start on this boundary
+ALIGNMENT = 64
+
+# Control block: current generation (int64, 0 = nothing published yet)
+CONTROL = struct.Struct('<q')
+# Data block: manifest length (int64), then the JSON manifest, then the aligned arrays
+HEADER = struct.Struct('<q')
+
+# How often the publisher re-checks the source files
+PUBLISH_INTERVAL_S = 5.0
+
+# Attempts to attach when the publisher replaces the block between reading the generation and attaching
+ATTACH_RETRIES = 3
+
+
+def _block_name(name, generation):
+    return f"{name}-{generation}"
+
+
+# Names of the blocks publishers in this process have created and not unlinked yet
+_published = set()
+
+
+class _AttachedBlock(shared_memory.SharedMemory):
+    """A shared-memory block that stays mapped for as long as any view of it is alive.
+
+    SharedMemory closes its mapping when the object is collected, which fails while NumPy arrays
+    still point into it; here the mapping is simply released with the last view instead.
+    """
+
+    def __del__(self):
+        pass
+
+
+def _attach(name):
+    """Attach to an existing shared-memory block without handing it to this process's resource tracker.
+
+    Python < 3.13 registers attached blocks too, and the tracker would unlink them when a worker exits.
+    Blocks a publisher in this same process created are left registered for the publisher.
+    """
+    block = _AttachedBlock(name=name)
+    if name not in _published:
+        resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+class _Packer:
+    """Lays out arrays and byte strings for one data block and records where each one goes."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def add(self, data):
+        """Reserve space for an array or bytes; return its manifest entry."""
+        array = np.ascontiguousarray(data) if isinstance(data, np.ndarray) else np.frombuffer(data, dtype=np.uint8)
+        offset = -(-self.size // ALIGNMENT) * ALIGNMENT
+        self.parts.append((offset, array))
+        self.size = offset + array.nbytes
+        return {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    def frame(self, frame):
+        """Numeric/bool columns go in the block; other columns are kept in the manifest as JSON lists."""
+        entry = {'index': self.add(frame.index.to_numpy(dtype=np.int64)), 'columns': []}
+        for col in frame.columns:
+            values = frame[col]
+            column = {'name': col, 'dtype': str(values.dtype)}
+            if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biuf':
+                column['array'] = self.add(values.to_numpy())
+            else:
+                column['values'] = [_json_value(v) for v in values.astype(object)]
+            entry['columns'].append(column)
+        return entry
+
+    def net(self, net):
+        entry = {'attributes': {attr: net[attr] for attr in NET_ATTRIBUTES}, 'tables': {}}
+        for table, frame in net.items():
+            if table.startswith('_') or table.startswith('res_') or not isinstance(frame, pd.DataFrame) or frame.empty:
+                continue
+            entry['tables'][table] = self.frame(frame)
+        return entry
+
+
+def _pack(model):
+    """Return (manifest, packer) for a NetworkModel's networks, bus data and encoded map payload."""
+    packer = _Packer()
+    payload = model.payload
+    manifest = {
+        'fingerprint': [list(item) for item in model.fingerprint],
+        'built_at': model.built_at,
+        'networks': {label: {'net': packer.net(getattr(model, f'{label}_net')),
+                             'bus_data': packer.frame(getattr(model, f'{label}_bus_data'))}
+                     for label in NETWORKS},
+        'payload': {'etag': payload.etag, 'encode_seconds': payload.encode_seconds, 'body': packer.add(payload.body),
+                    'encodings': {encoding: packer.add(body) for encoding, body in payload.encodings.items()}},
+    }
+    return manifest, packer
+
+
+class _Reader:
+    """Zero-copy, read-only views of one attached data block."""
+
+    def __init__(self, block):
+        self.block = block
+        (length,) = HEADER.unpack_from(block.buf, 0)
+        self.manifest = json.loads(bytes(block.buf[HEADER.size:HEADER.size + length]))
+        self.base = HEADER.size + length
+
+    def array(self, entry):
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        array = np.frombuffer(self.block.buf, dtype=dtype, count=count, offset=self.base + entry['offset'])
+        array.flags.writeable = False
+        return array.reshape(entry['shape'])
+
+    def bytes(self, entry):
+        start = self.base + entry['offset']
+        return self.block.buf[start:start + entry['shape'][0]].toreadonly()
+
+    def frame(self, entry):
+        data = {}
+        for column in entry['columns']:
+            if 'array' in column:
+                data[column['name']] = self.array(column['array'])
+            else:
+                values = pd.Series(column['values'], dtype=object)
+                data[column['name']] = values.astype(column['dtype']) if column['dtype'] != 'object' else values.to_numpy()
+        return pd.DataFrame(data, index=pd.Index(self.array(entry['index'])),
+                            columns=[c['name'] for c in entry['columns']], copy=False)
+
+    def net(self, entry):
+        net = copy.deepcopy(_empty_network())
+        for attr, value in entry['attributes'].items():
+            net[attr] = value
+        for table, table_entry in entry['tables'].items():
+            frame = self.frame(table_entry)
+            if table in net and isinstance(net[table], pd.DataFrame):
+                for col in net[table].columns:
+                    if col not in frame.columns:
+                        frame[col] = pd.Series(index=frame.index, dtype=net[table][col].dtype)
+            net[table] = frame
+        return net
+
+    def model(self):
+        """Assemble a NetworkModel over the shared tables, serving the shared payload as-is."""
+        networks = [(self.net(entry['net']), self.frame(entry['bus_data']))
+                    for entry in (self.manifest['networks'][label] for label in NETWORKS)]
+        info = self.manifest['payload']
+        payload = EncodedPayload(self.bytes(info['body']), info['etag'],
+                                 {encoding: self.bytes(e) for encoding, e in info['encodings'].items()},
+                                 info['encode_seconds'])
+        model = assemble_model(*networks[0], *networks[1], payload=payload)
+        model.fingerprint = tuple(tuple(item) for item in self.manifest['fingerprint'])
+        model.built_at = self.manifest['built_at']
+        return model
+
+
+class SharedModelPublisher:
+    """Publishes NetworkModels from a NetworkCache into shared memory for SharedModelCache workers.
+
+    Each model is written once into a new data block; the control block's generation is only
+    bumped after the block is complete, so workers swap to it atomically. The previous block is
+    unlinked straight away: workers still using it keep their mapping until they let go of it.
+    """
+
+    def __init__(self, name=SHARED_MODEL_NAME, cache=network_cache):
+        self.name = name
+        self.cache = cache
+        self.generation = 0
+        self._published = None
+        self._block = None
+        try:
+            self._control = shared_memory.SharedMemory(name=name, create=True, size=CONTROL.size)
+        except FileExistsError:
+            # Left over from a publisher that didn't shut down; take it over
+            self._control = shared_memory.SharedMemory(name=name)
+            (self.generation,) = CONTROL.unpack_from(self._control.buf, 0)
+        _published.add(name)
+        self._stop = threading.Event()
+
+    def publish(self, model):
+        """Write a model into a new data block and make it current. Returns the new generation."""
+        start = time.perf_counter()
+        manifest, packer = _pack(model)
+        header = json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+        base = HEADER.size + len(header)
+        generation = self.generation + 1
+        block = shared_memory.SharedMemory(name=_block_name(self.name, generation), create=True,
+                                           size=max(base + packer.size, 1))
+        _published.add(block.name)
+        HEADER.pack_into(block.buf, 0, len(header))
+        block.buf[HEADER.size:base] = header
+        for offset, array in packer.parts:
+            block.buf[base + offset:base + offset + array.nbytes] = array.reshape(-1).view(np.uint8)
+
+        CONTROL.pack_into(self._control.buf, 0, generation)
+        previous, self._block, self.generation = self._block, block, generation
+        if previous is not None:
+            self._unlink(previous)
+        logger.info(f"Published network model generation {generation} ({block.size} B) "
+                    f"in {time.perf_counter() - start:.3f}s")
+        return generation
+
+    def refresh(self):
+        """Publish the cache's model if it changed since the last publish. Returns True if it did."""
+        model = self.cache.get()
+        if model is None or model is self._published:
+            return False
+        self.publish(model)
+        self._published = model
+        return True
+
+    def serve(self, interval_s=PUBLISH_INTERVAL_S):
+        """Refresh every interval_s until stop() is called."""
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error publishing network model: {e}")
+                logger.error(traceback.format_exc())
+            self._stop.wait(interval_s)
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        """Unlink the current data block and the control block."""
+        self.stop()
+        for block in (self._block, self._control):
+            if block is not None:
+                self._unlink(block)
+        self._block = self._control = None
+
+    @staticmethod
+    def _unlink(block):
+        _published.discard(block.name)
+        block.close()
+        block.unlink()
+
+
+class SharedModelCache:
+    """Drop-in for NetworkCache in a serving worker: the model comes from a SharedModelPublisher.
+
+    get() checks the published generation and, when it moved on, attaches to the new block and
+    assembles a model over it: table columns and the /network_data payload are read-only views of
+    the shared buffers, and only the derived indexes are built per worker. An older model's block
+    stays mapped until the last request using it lets go.
+    """
+
+    def __init__(self, name=SHARED_MODEL_NAME):
+        self.name = name
+        self.generation = 0
+        self._control = None
+        self._model = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.last_build_seconds = None
+
+    def _published_generation(self):
+        if self._control is None:
+            try:
+                self._control = _attach(self.name)
+            except FileNotFoundError:
+                return 0
+        (generation,) = CONTROL.unpack_from(self._control.buf, 0)
+        return generation
+
+    def get(self):
+        """Return the current published model, attaching to a new generation first if there is one."""
+        with self._lock:
+            for _ in range(ATTACH_RETRIES):
+                generation = self._published_generation()
+                if generation == self.generation:
+                    self.hits += 1
+                    return self._model
+                self.misses += 1
+                start = time.perf_counter()
+                try:
+                    block = _attach(_block_name(self.name, generation))
+                except FileNotFoundError:
+                    # Replaced again before we got to it; read the generation again
+                    continue
+                try:
+                    model = _Reader(block).model()
+                except Exception as e:
+                    logger.error(f"Error attaching to network model generation {generation}: {e}")
+                    logger.error(traceback.format_exc())
+                    return self._model
+                self._model, self.generation = model, generation
+                self.rebuilds += 1
+                self.last_build_seconds = time.perf_counter() - start
+                logger.info(f"Attached to network model generation {generation} in {self.last_build_seconds:.3f}s")
+                return model
+            return self._model
+
+    def invalidate(self):
+        """Forget the attached model so the next get() attaches again."""
+        with self._lock:
+            self.generation = 0
+
+    def peek(self):
+        return self._model
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+            'snapshot_loads': 0,
+            'incremental_updates': 0,
+            'last_build_seconds': self.last_build_seconds,
+            'last_build_source': 'shared_memory',
+            'built_at': self._model.built_at if self._model is not None else None,
+            'generation': self.generation,
+        }
+
+
+if __name__ == '__main__':
+    # Parent process for multi-worker serving: build the model once and keep it published
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+    publisher = SharedModelPublisher(os.environ.get('MODEL_SHARED_MEMORY', SHARED_MODEL_NAME))
+    try:
+        publisher.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
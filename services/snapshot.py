@@ -0,0 +1,181 @@
+import copy
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import traceback
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from data_parsing.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = 'data/snapshot'
+SNAPSHOT_VERSION = 2
+MANIFEST = 'manifest.json'
+
+# Network attributes restored onto the empty net before the element tables
+NET_ATTRIBUTES = ('name', 'f_hz', 'sn_mva', 'std_types')
+
+
+def _json_value(value):
+    """Convert a cell of a non-numeric column to a JSON-serialisable value (missing values become None)."""
+    if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _save_frame(frame, directory, prefix):
+    """Save a DataFrame column by column: numeric/bool columns as .npy, everything else as one JSON file.
+
+    Returns the manifest entry describing how to load it back.
+    """
+    entry = {'index': f"{prefix}.index.npy", 'columns': []}
+    np.save(os.path.join(directory, entry['index']), frame.index.to_numpy(dtype=np.int64))
+    objects = {}
+    for i, col in enumerate(frame.columns):
+        values = frame[col]
+        if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biuf':
+            filename = f"{prefix}.{i}.npy"
+            np.save(os.path.join(directory, filename), values.to_numpy())
+            entry['columns'].append({'name': col, 'dtype': str(values.dtype), 'file': filename})
+        else:
+            objects[col] = [_json_value(v) for v in values.astype(object)]
+            entry['columns'].append({'name': col, 'dtype': str(values.dtype), 'file': None})
+    if objects:
+        entry['objects'] = f"{prefix}.objects.json"
+        with open(os.path.join(directory, entry['objects']), 'w') as f:
+            json.dump(objects, f)
+    return entry
+
+
+def _load_frame(entry, directory):
+    """Load a frame saved by _save_frame, memory-mapping the numeric columns (copy-on-write)."""
+    index = np.load(os.path.join(directory, entry['index']))
+    objects = {}
+    if entry.get('objects'):
+        with open(os.path.join(directory, entry['objects'])) as f:
+            objects = json.load(f)
+    data = {}
+    for column in entry['columns']:
+        if column['file'] is not None:
+            data[column['name']] = np.load(os.path.join(directory, column['file']), mmap_mode='c')
+        else:
+            values = pd.Series(objects[column['name']], dtype=object)
+            data[column['name']] = values.astype(column['dtype']) if column['dtype'] != 'object' else values.to_numpy()
+    return pd.DataFrame(data, index=pd.Index(index), columns=[c['name'] for c in entry['columns']], copy=False)
+
+
+def _save_net(net, directory, prefix):
+    entry = {'attributes': {attr: net[attr] for attr in NET_ATTRIBUTES}, 'tables': {}}
+    for table, frame in net.items():
+        if table.startswith('_') or table.startswith('res_') or not isinstance(frame, pd.DataFrame) or frame.empty:
+            continue
+        entry['tables'][table] = _save_frame(frame, directory, f"{prefix}.{table}")
+    return entry
+
+
+@lru_cache(maxsize=1)
+def _empty_network():
+    # create_empty_network builds every element table from scratch (~0.15s); copying a template is ~10x cheaper
+    return pp.create_empty_network()
+
+
+def _load_net(entry, directory):
+    net = copy.deepcopy(_empty_network())
+    for attr, value in entry['attributes'].items():
+        net[attr] = value
+    for table, table_entry in entry['tables'].items():
+        frame = _load_frame(table_entry, directory)
+        if table in net and isinstance(net[table], pd.DataFrame):
+            # Keep any default columns the saved table didn't have, with the empty table's dtypes
+            for col in net[table].columns:
+                if col not in frame.columns:
+                    frame[col] = pd.Series(index=frame.index, dtype=net[table][col].dtype)
+        net[table] = frame
+    return net
+
+
+def save_snapshot(fingerprint, networks, snapshot_dir=SNAPSHOT_DIR):
+    """Persist built networks and their bus_data as .npy/.json files with a manifest.
+
+    networks maps a label (e.g. 'transpower') to a (pandapowerNet, bus_data) tuple. fingerprint
+    is the source files' ((path, sha256), ...) tuple from the network cache; a snapshot is only
+    loaded back for the same fingerprint. The snapshot is written to a temporary directory and
+    swapped in, so readers never see a half-written snapshot.
+    """
+    try:
+        start = time.perf_counter()
+        parent = os.path.dirname(os.path.abspath(snapshot_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.snapshot-')
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'pandapower_version': pp.__version__,
+            'sources': [list(item) for item in fingerprint],
+            'created_at': time.time(),
+            'networks': {},
+        }
+        with stage('snapshot_save', rows=sum(len(bus_data) for _, bus_data in networks.values())):
+            for label, (net, bus_data) in networks.items():
+                manifest['networks'][label] = {
+                    'net': _save_net(net, tmp_dir, label),
+                    'bus_data': _save_frame(bus_data, tmp_dir, f"{label}.bus_data"),
+                }
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        old_dir = None
+        if os.path.exists(snapshot_dir):
+            old_dir = tempfile.mkdtemp(dir=parent, prefix='.snapshot-old-')
+            os.rmdir(old_dir)
+            os.replace(snapshot_dir, old_dir)
+        os.replace(tmp_dir, snapshot_dir)
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        logger.info(f"Saved network snapshot to {snapshot_dir} in {time.perf_counter() - start:.3f}s")
+        return True
+    except Exception as e:
+        logger.error(f"Error saving network snapshot: {e}")
+        logger.error(traceback.format_exc())
+        return False
+
+
+def load_snapshot(fingerprint, snapshot_dir=SNAPSHOT_DIR):
+    """Load the networks saved by save_snapshot if the snapshot matches fingerprint, else return None.
+
+    Returns a dict mapping each label to a (pandapowerNet, bus_data) tuple.
+    """
+    manifest_path = os.path.join(snapshot_dir, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != SNAPSHOT_VERSION or manifest.get('pandapower_version') != pp.__version__:
+        logger.info("Network snapshot was written by a different version, ignoring it")
+        return None
+    if [tuple(item) for item in manifest.get('sources', [])] != [tuple(item) for item in fingerprint]:
+        logger.info("Network snapshot is stale (source files changed), ignoring it")
+        return None
+    try:
+        start = time.perf_counter()
+        networks = {}
+        with stage('snapshot_load') as timer:
+            for label, entry in manifest['networks'].items():
+                networks[label] = (_load_net(entry['net'], snapshot_dir), _load_frame(entry['bus_data'], snapshot_dir))
+            timer.rows = sum(len(bus_data) for _, bus_data in networks.values())
+        logger.info(f"Loaded network snapshot from {snapshot_dir} in {time.perf_counter() - start:.3f}s")
+        return networks
+    except Exception as e:
+        logger.error(f"Error loading network snapshot: {e}")
+        logger.error(traceback.format_exc())
+        return None
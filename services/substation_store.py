@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from data_parsing.adjacency import build_adjacency
+from data_parsing.geo import wgs84_to_nztm_array
+from data_parsing.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = 'data/substations.sqlite'
+
+# Networks whose buses and lines are loaded into the store
+NETWORKS = ('transpower', 'vector')
+
+# Line parameters kept per line (the same ones the per-substation JSON files carry)
+LINE_PARAMS = ('length_km', 'r_ohm_per_km', 'x_ohm_per_km', 'c_nf_per_km', 'max_i_ka')
+
+# Most rows /substations returns when no limit is given
+DEFAULT_LIMIT = 1000
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS substations (
+    id INTEGER PRIMARY KEY, network TEXT NOT NULL, bus INTEGER NOT NULL, name TEXT NOT NULL, type TEXT,
+    description TEXT, vn_kv REAL, x REAL, y REAL, lat REAL, lon REAL, connections INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS substations_name ON substations (name, network);
+CREATE INDEX IF NOT EXISTS substations_type ON substations (type, vn_kv);
+CREATE INDEX IF NOT EXISTS substations_vn_kv ON substations (vn_kv, connections);
+CREATE TABLE IF NOT EXISTS lines (
+    network TEXT NOT NULL, line INTEGER NOT NULL, name TEXT, from_id INTEGER NOT NULL, to_id INTEGER NOT NULL,
+    {', '.join(f'{col} REAL' for col in LINE_PARAMS)}, PRIMARY KEY (network, line));
+CREATE TABLE IF NOT EXISTS connections (
+    substation_id INTEGER NOT NULL, network TEXT NOT NULL, line INTEGER NOT NULL, other_id INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS connections_substation ON connections (substation_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS substations_rtree USING rtree (id, min_x, max_x, min_y, max_y);
+"""
+
+# Cleared and reloaded on every build, children first
+TABLES = ('connections', 'substations_rtree', 'lines', 'substations')
+
+# Columns /substations returns, in order
+QUERY_COLUMNS = ('name', 'network', 'type', 'description', 'vn_kv', 'lat', 'lon', 'connections')
+
+
+def _rows(*columns):
+    """Zip column arrays into rows of plain Python values (NaN becomes NULL)."""
+    return zip(*(np.asarray(col).tolist() for col in columns))
+
+
+class SubstationStore:
+    """The networks' substations, lines and connections in an indexed SQLite file.
+
+    Substations are indexed on name, type and voltage, and their NZTM coordinates are in an R-tree,
+    so filtered and area queries don't have to scan the per-substation JSON files. sync() reloads
+    the store in one transaction whenever the model's source fingerprint changes; readers (one
+    connection per thread, WAL mode) keep seeing the previous build until that commits.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self.loads = 0
+        self.last_load_seconds = None
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def sync(self, model):
+        """Load the model's networks into the store unless it already holds this fingerprint.
+
+        Returns True if the store was reloaded. Safe across processes: the fingerprint is checked
+        again inside the write transaction, so only one of several workers does the load.
+        """
+        fingerprint = json.dumps([list(item) for item in model.fingerprint])
+        if self._fingerprint == fingerprint:
+            return False
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                stored = conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+                if stored is not None and stored[0] == fingerprint:
+                    conn.execute('COMMIT')
+                    self._fingerprint = fingerprint
+                    return False
+                start = time.perf_counter()
+                with stage('substation_store') as timer:
+                    timer.rows = self._load(conn, model)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            self._fingerprint = fingerprint
+            self.loads += 1
+            self.last_load_seconds = time.perf_counter() - start
+            logger.info(f"Loaded {timer.rows} substations into {self.path} in {self.last_load_seconds:.3f}s")
+            return True
+
+    def _load(self, conn, model):
+        """Replace the stored tables with the model's networks; return the number of substations."""
+        for table in TABLES:
+            conn.execute(f'DELETE FROM {table}')
+        offset = 0
+        for network in NETWORKS:
+            net, bus_data = getattr(model, f'{network}_net'), getattr(model, f'{network}_bus_data')
+            adjacency = build_adjacency(net)
+            # Substation ids are unique across networks: bus-table positions after the previous network's
+            ids = offset + np.arange(len(net.bus))
+            data = bus_data.set_index('bus_idx').reindex(net.bus.index)
+            conn.executemany('INSERT INTO substations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', _rows(
+                ids, np.full(len(ids), network), net.bus.index, net.bus['name'].astype(str), data['type'].astype(object),
+                data['description'].astype(object), net.bus['vn_kv'].astype(float), data['x'].astype(float),
+                data['y'].astype(float), data['lat'].astype(float), data['lon'].astype(float), np.diff(adjacency.indptr)))
+            located = np.isfinite(data['x'].to_numpy(dtype=float)) & np.isfinite(data['y'].to_numpy(dtype=float))
+            x, y = data['x'].to_numpy(dtype=float)[located], data['y'].to_numpy(dtype=float)[located]
+            conn.executemany('INSERT INTO substations_rtree VALUES (?, ?, ?, ?, ?)', _rows(ids[located], x, x, y, y))
+
+            bus_pos = net.bus.index.get_indexer
+            conn.executemany(f'INSERT INTO lines VALUES ({", ".join("?" * (5 + len(LINE_PARAMS)))})', _rows(
+                np.full(len(net.line), network), net.line.index, net.line['name'].astype(str),
+                offset + bus_pos(net.line['from_bus']), offset + bus_pos(net.line['to_bus']),
+                *(net.line[col].astype(float) for col in LINE_PARAMS)))
+            owner = np.repeat(np.arange(len(net.bus)), np.diff(adjacency.indptr))
+            conn.executemany('INSERT INTO connections VALUES (?, ?, ?, ?)', _rows(
+                offset + owner, np.full(len(owner), network), adjacency.line_index[adjacency.line_pos],
+                offset + adjacency.other_pos))
+            offset += len(net.bus)
+        return offset
+
+    def substation(self, name, network='transpower'):
+        """Return one substation with its connected lines, in the per-substation JSON file's layout, or None."""
+        conn = self._connect()
+        row = conn.execute('SELECT * FROM substations WHERE name = ? AND network = ?', (name, network)).fetchone()
+        if row is None:
+            return None
+        lines = conn.execute(f"""
+            SELECT l.line, l.name, o.name AS connected_to, {', '.join(f'l.{col}' for col in LINE_PARAMS)}
+            FROM connections c JOIN lines l ON l.network = c.network AND l.line = c.line
+            JOIN substations o ON o.id = c.other_id
+            WHERE c.substation_id = ? ORDER BY c.rowid""", (row['id'],)).fetchall()
+        coordinates = {}
+        if row['x'] is not None and row['y'] is not None:
+            coordinates['nztm'] = {'x': row['x'], 'y': row['y']}
+        if row['lat'] is not None and row['lon'] is not None:
+            coordinates['wgs84'] = {'lat': row['lat'], 'lon': row['lon']}
+        return {
+            'name': row['name'],
+            'voltage_kv': row['vn_kv'],
+            'coordinates': coordinates,
+            'connected_lines': [{'id': line['line'], 'name': line['name'], 'connected_to': line['connected_to'],
+                                 'voltage_kv': row['vn_kv'], **{col: line[col] for col in LINE_PARAMS}}
+                                for line in lines],
+            'type': network,
+            'site_type': row['type'],
+            'description': row['description'],
+        }
+
+    def query(self, network=None, site_type=None, name=None, vn_kv=None, min_kv=None, max_kv=None,
+              min_connections=None, bbox=None, limit=DEFAULT_LIMIT, offset=0):
+        """Return the substations matching every given filter as column lists (QUERY_COLUMNS).
+
+        name matches a prefix; bbox is (west, south, east, north) in WGS84 and is looked up in the
+        R-tree by its NZTM envelope, then checked exactly against the substations' lat/lon.
+        """
+        clauses, params = [], []
+        for clause, value in (('s.network = ?', network), ('s.type = ?', site_type), ('s.vn_kv = ?', vn_kv),
+                              ('s.vn_kv >= ?', min_kv), ('s.vn_kv <= ?', max_kv),
+                              ('s.connections >= ?', min_connections)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        if name:
+            clauses.append("s.name LIKE ? ESCAPE '\\'")
+            params.append(name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        source = 'substations s'
+        if bbox is not None:
+            west, south, east, north = bbox
+            x, y = wgs84_to_nztm_array([south, south, north, north], [west, east, west, east])
+            source = 'substations_rtree r JOIN substations s ON s.id = r.id'
+            clauses += ['r.max_x >= ?', 'r.min_x <= ?', 'r.max_y >= ?', 'r.min_y <= ?',
+                        's.lat BETWEEN ? AND ?', 's.lon BETWEEN ? AND ?']
+            params += [np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y), south, north, west, east]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._connect().execute(
+            f"SELECT {', '.join(f's.{col}' for col in QUERY_COLUMNS)} FROM {source} {where} "
+            f"ORDER BY s.id LIMIT ? OFFSET ?", (*params, int(limit), int(offset))).fetchall()
+        return {col: [row[i] for row in rows] for i, col in enumerate(QUERY_COLUMNS)}
+
+    def stats(self):
+        return {'loads': self.loads, 'last_load_seconds': self.last_load_seconds}
+
+
+substation_store = SubstationStore()
@@ -0,0 +1,209 @@
+import logging
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from data_parsing.integrated import site_voltages
+from services.payload import encode_payload, frame_records
+
+logger = logging.getLogger(__name__)
+
+# Features at or below a voltage (kV) are only sent from the given zoom level upwards
+LAYER_MIN_ZOOM = {66.0: 9, 33.0: 10, 11.0: 12}
+
+# Substations are clustered at and below this zoom level
+CLUSTER_MAX_ZOOM = 8
+
+# Cluster cell size in screen pixels. It divides the 256 px tile, so a cluster never straddles two tiles
+TILE_SIZE = 256
+CLUSTER_CELL_PX = 64
+
+MAX_ZOOM = 22
+
+# Encoded tile responses kept per model
+TILE_CACHE_SIZE = 1024
+
+LINE_FIELDS = ['name', 'from_bus', 'to_bus', 'voltage', 'description']
+
+
+def line_frame(net, bus_data=None):
+    """Return one row per line with its end-bus names and voltage, plus end coordinates when bus_data is given.
+
+    Built column-wise from net.line and net.bus; the voltage is that of the from_bus, where the line starts.
+    """
+    lines = net.line
+    from_bus = net.bus.reindex(lines['from_bus'].to_numpy())
+    to_bus = net.bus.reindex(lines['to_bus'].to_numpy())
+    frame = pd.DataFrame({
+        'id': lines.index.to_numpy(),
+        'name': lines['name'].to_numpy(),
+        'from_bus': from_bus['name'].to_numpy(),
+        'to_bus': to_bus['name'].to_numpy(),
+        'voltage': from_bus['vn_kv'].astype(str).to_numpy(),
+        'description': lines['description'].to_numpy() if 'description' in lines else '',
+        'vn_kv': from_bus['vn_kv'].to_numpy(dtype=float),
+    })
+    if bus_data is not None:
+        coords = bus_data.set_index('bus_idx')[['lat', 'lon']]
+        for end in ('from', 'to'):
+            end_coords = coords.reindex(lines[f'{end}_bus'].to_numpy())
+            frame[f'{end}_lat'] = end_coords['lat'].to_numpy(dtype=float)
+            frame[f'{end}_lon'] = end_coords['lon'].to_numpy(dtype=float)
+    return frame
+
+
+def min_zoom_for_voltage(vn_kv, thresholds=LAYER_MIN_ZOOM):
+    """Return the lowest zoom level each feature is shown at, given its voltage and the layer thresholds."""
+    vn_kv = np.asarray(vn_kv, dtype=float)
+    min_zoom = np.zeros(vn_kv.shape, dtype=np.int64)
+    for kv, zoom in thresholds.items():
+        min_zoom = np.where(vn_kv <= kv, np.maximum(min_zoom, zoom), min_zoom)
+    return min_zoom
+
+
+def display_voltage(names, vn_kv):
+    """Return the voltage (kV) a feature is layered by: the highest level in its site name, else vn_kv.
+
+    Sites are created at one default bus voltage, so the name ('MANUREWA 33/11KV' -> 33) is what
+    tells a zone substation from a transmission one.
+    """
+    hv_kv = site_voltages(names)['hv_kv'].to_numpy(dtype=float)
+    return np.where(np.isfinite(hv_kv), hv_kv, np.asarray(vn_kv, dtype=float))
+
+
+def mercator_pixels(lat, lon, zoom):
+    """Project WGS84 coordinates to Web Mercator pixel coordinates at a zoom level (256 px tiles)."""
+    scale = TILE_SIZE * 2.0 ** zoom
+    sin_lat = np.sin(np.radians(np.clip(lat, -85.05112878, 85.05112878)))
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0 * scale
+    y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)) * scale
+    return x, y
+
+
+class ViewportIndex:
+    """Serves the map features inside a bounding box, with zoom-based level of detail.
+
+    Substations are found with the model's SpatialIndex and lines by their bounding boxes.
+    Features at or below a voltage in layer_min_zoom (see display_voltage; a line goes by its
+    from_bus) are dropped below that zoom. At and below
+    cluster_max_zoom, substations sharing a CLUSTER_CELL_PX grid cell are merged into one cluster.
+    Encoded responses are cached per (bbox, zoom), so repeated tile requests cost nothing.
+    """
+
+    def __init__(self, spatial_index, site_details, lines, layer_min_zoom=LAYER_MIN_ZOOM,
+                 cluster_max_zoom=CLUSTER_MAX_ZOOM):
+        self.spatial_index = spatial_index
+        sites = spatial_index.sites
+        details = site_details.set_index(['network', 'bus_idx'])['description']
+        self.descriptions = details.reindex(pd.MultiIndex.from_frame(sites[['network', 'bus_idx']])).to_numpy()
+        self.site_min_zoom = min_zoom_for_voltage(display_voltage(sites['name'], sites['vn_kv']), layer_min_zoom)
+
+        self.lines = lines.dropna(subset=['from_lat', 'from_lon', 'to_lat', 'to_lon']).reset_index(drop=True)
+        self.line_min_zoom = min_zoom_for_voltage(display_voltage(self.lines['from_bus'], self.lines['vn_kv']),
+                                                  layer_min_zoom)
+        lat = self.lines[['from_lat', 'to_lat']].to_numpy(dtype=float)
+        lon = self.lines[['from_lon', 'to_lon']].to_numpy(dtype=float)
+        self._line_south, self._line_north = lat.min(axis=1), lat.max(axis=1)
+        self._line_west, self._line_east = lon.min(axis=1), lon.max(axis=1)
+
+        self.networks = sorted(set(sites['network']) | set(self.lines['network']))
+        self.layer_min_zoom = layer_min_zoom
+        self.cluster_max_zoom = cluster_max_zoom
+        self._payload = lru_cache(maxsize=TILE_CACHE_SIZE)(self._encode)
+
+    @classmethod
+    def from_networks(cls, networks, spatial_index, **kwargs):
+        """Build from (network label, pandapowerNet, bus_data) tuples and the SpatialIndex built from them."""
+        details, lines = [], []
+        for label, net, bus_data in networks:
+            details.append(bus_data[['bus_idx', 'description']].assign(network=label))
+            lines.append(line_frame(net, bus_data).assign(network=label))
+        return cls(spatial_index, pd.concat(details, ignore_index=True), pd.concat(lines, ignore_index=True),
+                   **kwargs)
+
+    def with_network(self, spatial_index, label, net, bus_data):
+        """Return a viewport over spatial_index (see SpatialIndex.with_network) with one network's
+        substation details and lines rebuilt; the other networks' are reused. Cached tiles are not kept."""
+        sites = self.spatial_index.sites
+        details = pd.DataFrame({'network': sites['network'].to_numpy(), 'bus_idx': sites['bus_idx'].to_numpy(),
+                                'description': self.descriptions})
+        details = pd.concat([details[details['network'] != label],
+                             bus_data[['bus_idx', 'description']].assign(network=label)], ignore_index=True)
+        fresh = line_frame(net, bus_data).assign(network=label)
+        order = list(dict.fromkeys([*self.lines['network'], label]))
+        lines = pd.concat([fresh if network == label else self.lines[self.lines['network'] == network]
+                           for network in order], ignore_index=True)
+        return ViewportIndex(spatial_index, details, lines, layer_min_zoom=self.layer_min_zoom,
+                             cluster_max_zoom=self.cluster_max_zoom)
+
+    def _substations(self, rows, zoom):
+        sites = self.spatial_index.sites
+        frame = pd.DataFrame({
+            'network': sites['network'].to_numpy()[rows],
+            'id': sites['bus_idx'].to_numpy()[rows],
+            'name': sites['name'].to_numpy()[rows],
+            'type': sites['type'].to_numpy()[rows],
+            'description': self.descriptions[rows],
+            'lat': sites['lat'].to_numpy(dtype=float)[rows],
+            'lon': sites['lon'].to_numpy(dtype=float)[rows],
+        })
+        clusters = pd.DataFrame(columns=['network', 'id', 'lat', 'lon', 'count'])
+        if zoom <= self.cluster_max_zoom and len(frame):
+            px, py = mercator_pixels(frame['lat'].to_numpy(), frame['lon'].to_numpy(), zoom)
+            cell_x = np.floor(px / CLUSTER_CELL_PX).astype(np.int64)
+            cell_y = np.floor(py / CLUSTER_CELL_PX).astype(np.int64)
+            keys = pd.DataFrame({'network': frame['network'], 'cx': cell_x, 'cy': cell_y})
+            group = keys.groupby(['network', 'cx', 'cy'], sort=False).ngroup().to_numpy()
+            counts = np.bincount(group)
+            in_cluster = counts[group] > 1
+            if in_cluster.any():
+                grouped = frame.assign(cx=cell_x, cy=cell_y)[in_cluster].groupby(['network', 'cx', 'cy'], sort=False)
+                clusters = grouped.agg(lat=('lat', 'mean'), lon=('lon', 'mean'), count=('name', 'size')).reset_index()
+                clusters['id'] = [f"{zoom}/{x}/{y}" for x, y in zip(clusters['cx'], clusters['cy'])]
+                clusters = clusters[['network', 'id', 'lat', 'lon', 'count']]
+            frame = frame[~in_cluster]
+        return frame, clusters
+
+    def query(self, bbox, zoom, networks=None):
+        """Return the map payload for the features inside bbox = (west, south, east, north) at a zoom level.
+
+        The result has one entry per network with 'substations', 'clusters' and 'lines'. Line records
+        carry their end coordinates, since their substations may be outside the box or clustered.
+        """
+        west, south, east, north = bbox
+        zoom = int(min(max(zoom, 0), MAX_ZOOM))
+        rows = self.spatial_index.within_bbox(west, south, east, north, networks=networks)
+        rows = rows[self.site_min_zoom[rows] <= zoom]
+        substations, clusters = self._substations(rows, zoom)
+
+        line_mask = ((self._line_west <= east) & (self._line_east >= west) &
+                     (self._line_south <= north) & (self._line_north >= south) & (self.line_min_zoom <= zoom))
+        if networks:
+            line_mask &= self.lines['network'].isin(networks).to_numpy()
+        lines = self.lines[line_mask]
+
+        result = {'bbox': [west, south, east, north], 'zoom': zoom, 'clustered': zoom <= self.cluster_max_zoom}
+        for network in (networks or self.networks):
+            network_lines = lines[lines['network'] == network]
+            records = frame_records(network_lines[['id'] + LINE_FIELDS])
+            coords = network_lines[['from_lat', 'from_lon', 'to_lat', 'to_lon']].to_numpy().tolist()
+            for record, (from_lat, from_lon, to_lat, to_lon) in zip(records, coords):
+                record['coords'] = [[from_lat, from_lon], [to_lat, to_lon]]
+            result[network] = {
+                'substations': frame_records(substations[substations['network'] == network].drop(columns='network')),
+                'clusters': frame_records(clusters[clusters['network'] == network].drop(columns='network')),
+                'lines': records,
+            }
+        return result
+
+    def _encode(self, bbox, zoom, networks):
+        return encode_payload(self.query(bbox, zoom, list(networks) if networks else None),
+                              f"viewport {bbox} z{zoom}", level=logging.DEBUG)
+
+    def payload(self, bbox, zoom, networks=None):
+        """Return the EncodedPayload for a viewport query, encoding it only the first time it is asked for."""
+        bbox = tuple(round(float(v), 6) for v in bbox)
+        zoom = int(min(max(int(zoom), 0), MAX_ZOOM))
+        return self._payload(bbox, zoom, tuple(sorted(networks)) if networks else None)
+
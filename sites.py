@@ -1,22 +1,12 @@
+import numpy as np
 import pandas as pd
 import pandapower as pp
-from pyproj import Transformer
+from data_parsing.geo import nztm_to_wgs84_array
 import logging
 import traceback
 
 logger = logging.getLogger(__name__)
 
-def nztm_to_wgs84(x, y):
-    """Convert NZTM coordinates to WGS84 (latitude/longitude)"""
-    try:
-        transformer = Transformer.from_crs("EPSG:2193", "EPSG:4326", always_xy=True)
-        lon, lat = transformer.transform(float(x), float(y))
-        return lat, lon
-    except Exception as e:
-        logger.error(f"Error converting coordinates: {e}")
-        logger.error(traceback.format_exc())
-        return None, None
-
 def create_transpower_network():
     """Create a pandapower network and load Transpower sites as buses. Return the network and a list of bus info for mapping."""
     try:
@@ -27,11 +17,14 @@ def create_transpower_network():
         logger.info(f"Loaded {len(sites_df)} sites")
         bus_data = []
         
+        # Project all site coordinates to WGS84 in one call
+        lats, lons = nztm_to_wgs84_array(sites_df['X'], sites_df['Y'])
+        
         # Add buses to the network
-        for idx, row in sites_df.iterrows():
+        for pos, (idx, row) in enumerate(sites_df.iterrows()):
             try:
-                lat, lon = nztm_to_wgs84(row['X'], row['Y'])
-                if lat is None or lon is None:
+                lat, lon = float(lats[pos]), float(lons[pos])
+                if np.isnan(lat) or np.isnan(lon):
                     logger.warning(f"Could not convert coordinates for site {row['MXLOCATION']}")
                     continue
                 
@@ -55,7 +48,8 @@ def create_transpower_network():
                     'x': float(row['X']),
                     'y': float(row['Y'])
                 })
-                logger.debug(f"Created bus {bus_idx} for site {row['MXLOCATION']}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Created bus {bus_idx} for site {row['MXLOCATION']}")
             except Exception as e:
                 logger.error(f"Error processing site {row['MXLOCATION']}: {e}")
                 logger.error(traceback.format_exc())
@@ -41,129 +41,170 @@ function hideSubstationInfo() {
     document.getElementById('substation-info').style.display = 'none';
 }
 
-// Store substation coordinates for line drawing
-const substationCoords = {
-    transpower: {},
-    vector: {}
+const networkLayers = {
+    transpower: transpowerLayers,
+    vector: vectorLayers
 };
 
-// Fetch network data from the backend
-console.log('Fetching network data...');
-fetch('/network_data')
-    .then(response => {
-        console.log('Received response:', response.status);
-        return response.json();
-    })
-    .then(data => {
-        console.log('Received network data:', data);
-
-        // Process Transpower data
-        if (data.transpower) {
-            console.log('Processing Transpower data...');
-            // Process substations
-            if (data.transpower.substations) {
-                console.log(`Found ${data.transpower.substations.length} Transpower substations`);
-                data.transpower.substations.forEach(substation => {
-                    console.log('Creating marker for substation:', substation.name);
-                    const marker = L.marker([substation.lat, substation.lon], { icon: substationIcon })
-                        .bindPopup(`
-                            <strong>${substation.name}</strong><br>
-                            Type: ${substation.type}<br>
-                            Description: ${substation.description}
-                        `);
-                    
-                    marker.on('click', () => showSubstationInfo(substation));
-                    transpowerLayers.substations.addLayer(marker);
-                    
-                    // Store coordinates for line drawing
-                    substationCoords.transpower[substation.name] = [substation.lat, substation.lon];
-                });
-            }
+const networkColors = {
+    transpower: '#FF0000',
+    vector: '#0000FF'
+};
 
-            // Process lines
-            if (data.transpower.lines) {
-                console.log(`Found ${data.transpower.lines.length} Transpower lines`);
-                data.transpower.lines.forEach(line => {
-                    console.log('Processing line:', line.name);
-                    const fromCoords = substationCoords.transpower[line.from_bus];
-                    const toCoords = substationCoords.transpower[line.to_bus];
-                    
-                    if (fromCoords && toCoords) {
-                        const polyline = L.polyline([fromCoords, toCoords], {
-                            color: '#FF0000',
-                            weight: 2,
-                            opacity: 0.8
-                        }).bindPopup(`
-                            <strong>${line.name}</strong><br>
-                            Voltage: ${line.voltage} kV<br>
-                            From: ${line.from_bus}<br>
-                            To: ${line.to_bus}
-                        `);
-                        transpowerLayers.lines.addLayer(polyline);
-                    } else {
-                        console.warn('Could not find coordinates for line:', line.name);
-                    }
-                });
+// Create a cluster icon showing how many substations it stands for
+function clusterIcon(count, color) {
+    return L.divIcon({
+        className: 'cluster-icon',
+        html: `<div style="background-color: ${color};">${count}</div>`,
+        iconSize: [28, 28],
+        iconAnchor: [14, 14]
+    });
+}
+
+// The viewport is requested as 256px tiles, so panning back over an area reuses earlier requests
+const TILE_SIZE = 256;
+const MAX_CACHED_TILES = 512;
+
+// "z/x/y" -> promise of the tile's network data, kept in least-recently-used order
+const tileCache = new Map();
+
+// Features already drawn at the current zoom; lines and clusters can appear in several tiles
+let drawnFeatures = new Set();
+let drawnZoom = null;
+
+function tileBBox(z, x, y) {
+    const northWest = map.unproject([x * TILE_SIZE, y * TILE_SIZE], z);
+    const southEast = map.unproject([(x + 1) * TILE_SIZE, (y + 1) * TILE_SIZE], z);
+    return [northWest.lng, southEast.lat, southEast.lng, northWest.lat].map(v => v.toFixed(6)).join(',');
+}
+
+function fetchTile(z, x, y) {
+    const key = `${z}/${x}/${y}`;
+    if (tileCache.has(key)) {
+        const cached = tileCache.get(key);
+        tileCache.delete(key);
+        tileCache.set(key, cached);
+        return cached;
+    }
+    const request = fetch(`/network_data?bbox=${tileBBox(z, x, y)}&zoom=${z}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Tile ${key} failed with status ${response.status}`);
             }
-        } else {
-            console.warn('No Transpower data found');
+            return response.json();
+        })
+        .catch(error => {
+            // Don't cache failures; the next pan retries the tile
+            tileCache.delete(key);
+            throw error;
+        });
+    tileCache.set(key, request);
+    if (tileCache.size > MAX_CACHED_TILES) {
+        tileCache.delete(tileCache.keys().next().value);
+    }
+    return request;
+}
+
+function clearNetworkLayers() {
+    Object.values(networkLayers).forEach(layers => {
+        layers.substations.clearLayers();
+        layers.lines.clearLayers();
+    });
+    drawnFeatures = new Set();
+}
+
+// Draw a feature only once per zoom level
+function firstTime(id) {
+    if (drawnFeatures.has(id)) {
+        return false;
+    }
+    drawnFeatures.add(id);
+    return true;
+}
+
+function drawTile(data) {
+    Object.keys(networkLayers).forEach(network => {
+        const features = data[network];
+        if (!features) {
+            return;
         }
+        const layers = networkLayers[network];
+        const color = networkColors[network];
 
-        // Process Vector data
-        if (data.vector) {
-            console.log('Processing Vector data...');
-            // Process substations
-            if (data.vector.substations) {
-                console.log(`Found ${data.vector.substations.length} Vector substations`);
-                data.vector.substations.forEach(substation => {
-                    console.log('Creating marker for substation:', substation.name);
-                    const marker = L.marker([substation.lat, substation.lon], { icon: substationIcon })
-                        .bindPopup(`
-                            <strong>${substation.name}</strong><br>
-                            Type: ${substation.type}<br>
-                            Description: ${substation.description}
-                        `);
-                    
-                    marker.on('click', () => showSubstationInfo(substation));
-                    vectorLayers.substations.addLayer(marker);
-                    
-                    // Store coordinates for line drawing
-                    substationCoords.vector[substation.name] = [substation.lat, substation.lon];
-                });
+        features.substations.forEach(substation => {
+            if (!firstTime(`${network}:substation:${substation.id}`)) {
+                return;
+            }
+            const marker = L.marker([substation.lat, substation.lon], { icon: substationIcon })
+                .bindPopup(`
+                    <strong>${substation.name}</strong><br>
+                    Type: ${substation.type}<br>
+                    Description: ${substation.description}
+                `);
+            marker.on('click', () => showSubstationInfo(substation));
+            layers.substations.addLayer(marker);
+        });
+
+        features.clusters.forEach(cluster => {
+            if (!firstTime(`${network}:cluster:${cluster.id}`)) {
+                return;
             }
+            const marker = L.marker([cluster.lat, cluster.lon], { icon: clusterIcon(cluster.count, color) })
+                .bindTooltip(`${cluster.count} substations`);
+            // Zoom in far enough for the cluster to break up
+            marker.on('click', () => map.setView([cluster.lat, cluster.lon], data.zoom + 2));
+            layers.substations.addLayer(marker);
+        });
 
-            // Process lines
-            if (data.vector.lines) {
-                console.log(`Found ${data.vector.lines.length} Vector lines`);
-                data.vector.lines.forEach(line => {
-                    console.log('Processing line:', line.name);
-                    const fromCoords = substationCoords.vector[line.from_bus];
-                    const toCoords = substationCoords.vector[line.to_bus];
-                    
-                    if (fromCoords && toCoords) {
-                        const polyline = L.polyline([fromCoords, toCoords], {
-                            color: '#0000FF',
-                            weight: 2,
-                            opacity: 0.8
-                        }).bindPopup(`
-                            <strong>${line.name}</strong><br>
-                            Voltage: ${line.voltage} kV<br>
-                            From: ${line.from_bus}<br>
-                            To: ${line.to_bus}
-                        `);
-                        vectorLayers.lines.addLayer(polyline);
-                    } else {
-                        console.warn('Could not find coordinates for line:', line.name);
+        features.lines.forEach(line => {
+            if (!firstTime(`${network}:line:${line.id}`)) {
+                return;
+            }
+            const polyline = L.polyline(line.coords, {
+                color: color,
+                weight: 2,
+                opacity: 0.8
+            }).bindPopup(`
+                <strong>${line.name}</strong><br>
+                Voltage: ${line.voltage} kV<br>
+                From: ${line.from_bus}<br>
+                To: ${line.to_bus}
+            `);
+            layers.lines.addLayer(polyline);
+        });
+    });
+}
+
+// Fetch (or reuse) the tiles covering the viewport and draw them
+function updateNetworkData() {
+    const z = Math.round(map.getZoom());
+    if (z !== drawnZoom) {
+        // Clustering and voltage layers depend on the zoom, so redraw from scratch
+        clearNetworkLayers();
+        drawnZoom = z;
+    }
+    const bounds = map.getBounds();
+    const topLeft = map.project(bounds.getNorthWest(), z).divideBy(TILE_SIZE).floor();
+    const bottomRight = map.project(bounds.getSouthEast(), z).divideBy(TILE_SIZE).floor();
+    const maxTile = Math.pow(2, z) - 1;
+    for (let x = Math.max(0, topLeft.x); x <= Math.min(maxTile, bottomRight.x); x++) {
+        for (let y = Math.max(0, topLeft.y); y <= Math.min(maxTile, bottomRight.y); y++) {
+            fetchTile(z, x, y)
+                .then(data => {
+                    // Ignore tiles that arrive after the user has zoomed elsewhere
+                    if (z === drawnZoom) {
+                        drawTile(data);
                     }
+                })
+                .catch(error => {
+                    console.error('Error fetching network data:', error);
                 });
-            }
-        } else {
-            console.warn('No Vector data found');
         }
-    })
-    .catch(error => {
-        console.error('Error fetching network data:', error);
-    });
+    }
+}
+
+map.on('moveend', updateNetworkData);
+updateNetworkData();
 
 // Add event listeners for checkboxes
 document.getElementById('transpower-substations').addEventListener('change', function(e) {
@@ -199,4 +240,93 @@ document.getElementById('vector-lines').addEventListener('change', function(e) {
 });
 
 // Hide substation info when clicking on the map
-map.on('click', hideSubstationInfo); 
\ No newline at end of file
+map.on('click', hideSubstationInfo); 
+
+// Hosting capacity layer: one circle per substation, coloured from red (little room) to green
+const hostingCapacityLayer = L.layerGroup();
+const HOSTING_CAPACITY_NETWORKS = ['transpower', 'vector'];
+const hostingCapacityData = {};
+
+function capacityColor(mw, maxMw) {
+    const hue = Math.round(120 * Math.min(1, Math.sqrt(Math.max(0, mw) / maxMw)));
+    return `hsl(${hue}, 85%, 45%)`;
+}
+
+function setHostingCapacityStatus(text) {
+    document.getElementById('hosting-capacity-status').textContent = text;
+}
+
+function drawHostingCapacity() {
+    const kind = document.getElementById('hosting-capacity-kind').value;
+    hostingCapacityLayer.clearLayers();
+    Object.values(hostingCapacityData).forEach(data => {
+        const capacity = data[`${kind}_mw`];
+        const limits = data[`${kind}_limit`];
+        data.name.forEach((name, i) => {
+            if (capacity[i] === null || data.lat[i] === null || data.lon[i] === null) {
+                return;
+            }
+            L.circleMarker([data.lat[i], data.lon[i]], {
+                radius: 8,
+                stroke: false,
+                fillColor: capacityColor(capacity[i], data.settings.max_mw),
+                fillOpacity: 0.7
+            }).bindTooltip(`${name}: ${capacity[i].toFixed(0)} MW ${kind} (${limits[i].replace('_', ' ')})`)
+              .addTo(hostingCapacityLayer);
+        });
+    });
+}
+
+// Fetch a network's hosting capacity; while it is still being computed, follow the job's progress
+function loadHostingCapacity(network) {
+    return fetch(`/hosting_capacity?network=${network}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Hosting capacity failed with status ${response.status}`);
+            }
+            return response.json().then(body => ({ status: response.status, body: body }));
+        })
+        .then(({ status, body }) => {
+            if (status === 200) {
+                hostingCapacityData[network] = body;
+                drawHostingCapacity();
+                return;
+            }
+            return new Promise((resolve, reject) => {
+                const events = new EventSource(`/jobs/${body.id}/events`);
+                events.addEventListener('progress', e => {
+                    const progress = JSON.parse(e.data);
+                    setHostingCapacityStatus(`Computing ${network}: ${progress.done}/${progress.total} buses`);
+                });
+                events.addEventListener('done', () => {
+                    events.close();
+                    resolve(loadHostingCapacity(network));
+                });
+                events.addEventListener('failed', e => {
+                    events.close();
+                    reject(new Error(JSON.parse(e.data).error));
+                });
+            });
+        });
+}
+
+document.getElementById('hosting-capacity').addEventListener('change', function(e) {
+    if (!e.target.checked) {
+        map.removeLayer(hostingCapacityLayer);
+        return;
+    }
+    map.addLayer(hostingCapacityLayer);
+    const missing = HOSTING_CAPACITY_NETWORKS.filter(network => !(network in hostingCapacityData));
+    if (missing.length === 0) {
+        return;
+    }
+    setHostingCapacityStatus('Loading...');
+    Promise.all(missing.map(loadHostingCapacity))
+        .then(() => setHostingCapacityStatus(''))
+        .catch(error => {
+            console.error('Error fetching hosting capacity:', error);
+            setHostingCapacityStatus('Hosting capacity is unavailable');
+        });
+});
+
+document.getElementById('hosting-capacity-kind').addEventListener('change', drawHostingCapacity);
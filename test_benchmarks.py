@@ -0,0 +1,46 @@
+import pandas as pd
+
+from benchmarks.bench_pipeline import compare
+from benchmarks.synthetic import BASE_COUNTS, generate_dataset
+from data_parsing.transpower.transpower_data_parser import create_transpower_network
+from data_parsing.transpower.transpower_lines import load_transmission_lines
+from data_parsing.vector.vector_data_parser import create_vector_network
+from data_parsing.vector.vector_lines import load_vector_lines
+
+
+def test_synthetic_dataset_feeds_the_builders(tmp_path):
+    paths = generate_dataset(str(tmp_path), scale=2, seed=1)
+    sites = pd.read_csv(paths['sites'], encoding='utf-8-sig')
+    assert len(sites) == 2 * BASE_COUNTS['sites']
+    assert sites['MXLOCATION'].is_unique
+
+    net, bus_data = create_transpower_network(paths['sites'])
+    assert len(bus_data) == len(sites)
+    rejected = load_transmission_lines(net, paths['lines'])
+    # Only the deliberately unmatched lines are rejected
+    assert set(rejected['MXLOCATION']) <= {'ZZ-YY-A'}
+    assert len(net.line) + len(rejected) == 2 * BASE_COUNTS['lines']
+
+    vector_net, vector_bus_data = create_vector_network(paths['vector_sites'])
+    assert load_vector_lines(vector_net, paths['vector_lines']) is vector_net
+    assert 0.9 * 2 * BASE_COUNTS['vector_lines'] < len(vector_net.line) < 2 * BASE_COUNTS['vector_lines']
+
+
+def test_generate_dataset_is_deterministic(tmp_path):
+    first = generate_dataset(str(tmp_path / 'a'), scale=1, seed=3)
+    second = generate_dataset(str(tmp_path / 'b'), scale=1, seed=3)
+    for kind in first:
+        assert open(first[kind], 'rb').read() == open(second[kind], 'rb').read()
+
+
+def test_compare_flags_regressions_over_threshold():
+    def result(seconds, peak_bytes):
+        return {'scales': {'10': {'stages': {'load_transmission_lines': {'seconds': seconds,
+                                                                         'peak_bytes': peak_bytes}}}}}
+
+    baseline = result(0.100, 50 << 20)
+    assert compare(baseline, result(0.110, 50 << 20), threshold=0.25) == []
+    assert len(compare(baseline, result(0.200, 50 << 20), threshold=0.25)) == 1
+    assert len(compare(baseline, result(0.100, 80 << 20), threshold=0.25)) == 1
+    # Tiny absolute differences are noise even when the ratio is large
+    assert compare(result(0.001, None), result(0.003, None), threshold=0.25) == []
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from data_parsing.buses import BUS_DATA_COLUMNS, create_site_buses
+
+
+def test_create_site_buses_bulk_and_rejects_bad_coordinates(caplog):
+    net = pp.create_empty_network()
+    sites_df = pd.DataFrame({
+        'MXLOCATION': ['ALB', 'BAD', 'APS', 'NAN'],
+        'X': [1750929.0001, 'oops', 1483256.0001, None],
+        'Y': [5932699.0001, 5.0, 5243850.0001, 5243850.0001],
+        'type': ['ACSTN', 'ACSTN', 'HVDC', 'ACSTN'],
+    })
+    with caplog.at_level('WARNING'):
+        bus_data, rejected = create_site_buses(net, sites_df, 'MXLOCATION', 'X', 'Y',
+                                               attributes={'type': sites_df['type']})
+
+    assert list(bus_data.columns) == BUS_DATA_COLUMNS
+    assert list(bus_data['name']) == ['ALB', 'APS']
+    assert list(bus_data['type']) == ['ACSTN', 'HVDC']
+    assert list(rejected['MXLOCATION']) == ['BAD', 'NAN']
+    assert list(net.bus['name']) == ['ALB', 'APS']
+    assert np.array_equal(bus_data['bus_idx'].to_numpy(), net.bus.index.to_numpy())
+    # One summary line for all bad rows rather than one per row
+    warnings = [r for r in caplog.records if 'invalid coordinates' in r.getMessage()]
+    assert len(warnings) == 1
+    assert 'BAD, NAN' in warnings[0].getMessage()
+
+
+def test_create_site_buses_all_rejected_returns_empty_frame():
+    net = pp.create_empty_network()
+    sites_df = pd.DataFrame({'name': ['A'], 'x': [None], 'y': [None]})
+    bus_data, rejected = create_site_buses(net, sites_df, 'name', 'x', 'y')
+    assert bus_data.empty and list(bus_data.columns) == BUS_DATA_COLUMNS
+    assert len(rejected) == 1
+    assert net.bus.empty
@@ -0,0 +1,88 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from analysis.connection_study import Candidate, prepare_study_net, run_connection_study
+from analysis.spatial_index import SITE_COLUMNS, SpatialIndex
+from data_parsing.geo import wgs84_to_nztm_array
+
+
+def _direct_solve(study_net, candidate):
+    net = copy.deepcopy(study_net)
+    element = net.sgen if candidate.kind == 'sgen' else net.load
+    idx = element.index[element['bus'] == candidate.bus][0]
+    element.at[idx, 'p_mw'] = candidate.p_mw
+    pp.runpp(net)
+    return net
+
+
+def test_recycled_runs_match_fresh_power_flows(ring_net):
+    net = ring_net
+    study_net = prepare_study_net(net)
+    assert len(study_net.ext_grid) == 1
+    candidates = [Candidate('gen', 80.0, kind='sgen', bus=3), Candidate('load', 40.0, bus=2),
+                  Candidate('idle', 0.0, bus=1), Candidate('gen2', 30.0, kind='sgen', bus=1)]
+    result = run_connection_study(net, candidates, study_net=study_net, max_workers=1)
+
+    assert result.vm_delta_pu.shape == (4, 5)
+    assert result.loading_percent.shape == (4, 4)
+    assert result.summary['converged'].all()
+    for row, candidate in enumerate(candidates):
+        expected = _direct_solve(study_net, candidate)
+        assert np.allclose(result.loading_percent[row], expected.res_line['loading_percent'], equal_nan=True)
+        assert np.allclose(result.vm_delta_pu[row] + result.base_vm_pu, expected.res_bus['vm_pu'], equal_nan=True)
+    assert np.allclose(result.vm_delta_pu[2, :4], 0.0)
+    # The isolated bus has no slack, so it has no voltage result
+    assert np.isnan(result.vm_delta_pu[:, 4]).all()
+
+
+def test_process_pool_matches_serial(ring_net):
+    net = ring_net
+    candidates = [Candidate(f'c{i}', 10.0 * (i + 1), kind='sgen' if i % 2 else 'load', bus=i % 4) for i in range(10)]
+    serial = run_connection_study(net, candidates, max_workers=1)
+    pooled = run_connection_study(net, candidates, max_workers=2)
+    assert np.allclose(serial.vm_delta_pu, pooled.vm_delta_pu, equal_nan=True)
+    assert np.allclose(serial.loading_percent, pooled.loading_percent, equal_nan=True)
+    assert list(pooled.summary['bus_name']) == [['A', 'B', 'C', 'D'][i % 4] for i in range(10)]
+
+
+def test_batches_are_reported_from_one_pool(monkeypatch, ring_net):
+    from analysis import connection_study
+
+    pools = []
+
+    class CountingPool(connection_study.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(1)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(connection_study, 'ProcessPoolExecutor', CountingPool)
+    net = ring_net
+    candidates = [Candidate(f'c{i}', 10.0 * (i + 1), bus=i % 4) for i in range(10)]
+    batches = []
+    result = run_connection_study(net, candidates, max_workers=2, batch_size=3, on_batch=batches.append)
+    assert len(pools) == 1
+    assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+    assert list(pd.concat(batches)['name']) == list(result.summary['name'])
+    assert np.allclose(pd.concat(batches)['max_loading_percent'], result.summary['max_loading_percent'])
+
+
+def test_lat_lon_candidates_snap_to_the_studied_network(ring_net):
+    net = ring_net
+    lat = np.array([-36.80, -36.85, -36.90, -36.95, -37.00, -36.951])
+    lon = np.array([174.70, 174.75, 174.80, 174.85, 174.90, 174.851])
+    x, y = wgs84_to_nztm_array(lat, lon)
+    sites = pd.DataFrame({
+        'network': ['vector'] * 5 + ['transpower'],
+        'bus_idx': [0, 1, 2, 3, 4, 0],
+        'name': ['A', 'B', 'C', 'D', 'E', 'TP'],
+        'type': ['Substation'] * 5 + ['ACSTN'],
+        'vn_kv': 110.0, 'x': x, 'y': y, 'lat': lat, 'lon': lon,
+    })[SITE_COLUMNS]
+    # The Transpower site is nearer the candidate, but the study is on the Vector net
+    candidate = Candidate('gen', 20.0, kind='sgen', lat=-36.9505, lon=174.8505)
+    result = run_connection_study(net, [candidate], spatial_index=SpatialIndex(sites), max_workers=1,
+                                  network='vector')
+    assert list(result.summary['bus_name']) == ['D']
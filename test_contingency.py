@@ -0,0 +1,82 @@
+import numpy as np
+import pandapower as pp
+
+from analysis.contingency import run_contingency_analysis
+
+
+def _meshed_net_with_radial_spur():
+    net = pp.create_empty_network()
+    pp.create_buses(net, nr_buses=7, vn_kv=110.0, name=['A', 'B', 'C', 'D', 'E', 'F', 'G'])
+    # Ring A-B-C-A, radial spur C-D-E (passive), radial feeder A-F with a load at F; G isolated
+    pp.create_lines_from_parameters(net, from_buses=[0, 1, 2, 2, 3, 0], to_buses=[1, 2, 0, 3, 4, 5], length_km=10.0,
+                                    r_ohm_per_km=0.1, x_ohm_per_km=0.4, c_nf_per_km=10.0, max_i_ka=0.5,
+                                    name=['A-B', 'B-C', 'C-A', 'C-D', 'D-E', 'A-F'])
+    pp.create_ext_grid(net, bus=0)
+    pp.create_load(net, bus=1, p_mw=40.0, q_mvar=10.0)
+    pp.create_load(net, bus=5, p_mw=20.0)
+    return net
+
+
+def test_radial_skip_matches_full_solve():
+    net = _meshed_net_with_radial_spur()
+    skipped = run_contingency_analysis(net, max_workers=1)
+    solved = run_contingency_analysis(net, max_workers=1, skip_radial=False)
+
+    assert list(skipped.outages['name']) == list(solved.outages['name'])
+    status = dict(zip(skipped.outages['kind'] + ':' + skipped.outages['name'], skipped.outages['status']))
+    # Passive spur outages are skipped; the loaded feeder and the meshed ring are solved
+    assert status['line:C-D'] == 'radial'
+    assert status['line:D-E'] == 'radial'
+    assert status['bus:E'] == 'radial'
+    assert status['line:A-F'] == 'solved'
+    assert status['line:A-B'] == 'solved'
+    assert status['bus:B'] == 'solved'
+    assert (solved.outages['status'] == 'solved').all()
+
+    assert skipped.loading_percent.dtype == np.float32
+    assert skipped.loading_percent.shape == (len(skipped.outages), len(net.line))
+    # Skipped outages neglect the dropped branch's line charging, hence the loose tolerances
+    assert np.allclose(skipped.loading_percent, solved.loading_percent, atol=0.5, equal_nan=True)
+    assert np.allclose(skipped.vm_pu, solved.vm_pu, atol=1e-3, equal_nan=True)
+
+
+def test_pool_matches_serial_and_reports_progress():
+    net = _meshed_net_with_radial_spur()
+    calls = []
+    serial = run_contingency_analysis(net, max_workers=1, progress=lambda done, total: calls.append((done, total)))
+    pooled = run_contingency_analysis(net, kinds=('line', 'bus'), max_workers=2)
+    assert calls[-1][0] == calls[-1][1] == (serial.outages['status'] != 'radial').sum()
+    assert np.allclose(serial.loading_percent, pooled.loading_percent, equal_nan=True)
+    assert serial.worst(1)['name'].iloc[0] in ('C-A', 'A-B', 'B-C', 'A', 'C')
+
+
+def _net_behind_transformers():
+    net = pp.create_empty_network()
+    pp.create_bus(net, vn_kv=220.0, name='HV')
+    pp.create_buses(net, nr_buses=4, vn_kv=110.0, name=['X', 'Y', 'Z', 'W'])
+    pp.create_ext_grid(net, bus=0)
+    # HV feeds the X-Y-Z mesh through one transformer and the passive bus W through another
+    pp.create_transformer(net, hv_bus=0, lv_bus=1, std_type='100 MVA 220/110 kV', name='T1')
+    pp.create_transformer(net, hv_bus=0, lv_bus=4, std_type='100 MVA 220/110 kV', name='T2')
+    pp.create_lines_from_parameters(net, from_buses=[1, 2, 3], to_buses=[2, 3, 1], length_km=10.0,
+                                    r_ohm_per_km=0.1, x_ohm_per_km=0.4, c_nf_per_km=10.0, max_i_ka=0.5,
+                                    name=['X-Y', 'Y-Z', 'Z-X'])
+    pp.create_load(net, bus=2, p_mw=30.0, q_mvar=5.0)
+    pp.create_load(net, bus=3, p_mw=20.0)
+    return net
+
+
+def test_buses_behind_a_transformer_are_energised():
+    net = _net_behind_transformers()
+    skipped = run_contingency_analysis(net, kinds=('line', 'trafo', 'bus'), max_workers=1)
+    solved = run_contingency_analysis(net, kinds=('line', 'trafo', 'bus'), max_workers=1, skip_radial=False)
+
+    status = dict(zip(skipped.outages['kind'] + ':' + skipped.outages['name'], skipped.outages['status']))
+    assert status['line:X-Y'] == status['line:Z-X'] == 'solved'
+    assert status['trafo:T1'] == 'solved' and status['trafo:T2'] == 'radial'
+    assert status['bus:HV'] == 'solved' and status['bus:W'] == 'radial'
+    hv = skipped.outages.set_index('name').loc['HV']
+    assert hv['lines_out'] == 0 and hv['trafos_out'] == 2
+    assert np.isfinite(skipped.base_vm_pu).all()
+    assert np.allclose(skipped.loading_percent, solved.loading_percent, atol=0.5, equal_nan=True)
+    assert np.allclose(skipped.vm_pu, solved.vm_pu, atol=1e-3, equal_nan=True)
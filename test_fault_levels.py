@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pandapower.shortcircuit as sc
+
+from analysis.fault_levels import island_keys, prepare_fault_net
+from services.fault_levels import FaultLevelCache
+
+
+def test_fault_levels_match_calc_sc(tmp_path, small_net):
+    net = small_net
+    cache = FaultLevelCache(cache_dir=str(tmp_path))
+    levels, topology_hash = cache.levels(net)
+
+    reference = prepare_fault_net(net)
+    sc.calc_sc(reference, case='max')
+    assert np.allclose(levels['ikss_max_ka'], reference.res_bus_sc['ikss_ka'], equal_nan=True)
+    sc.calc_sc(reference, case='min')
+    assert np.allclose(levels['ikss_min_ka'], reference.res_bus_sc['ikss_ka'], equal_nan=True)
+    assert (levels['ikss_min_ka'] < levels['ikss_max_ka']).sum() == 6
+    assert levels.loc[4].isna().all()
+
+    # Second call is served from memory, a fresh cache from disk
+    assert cache.levels(net)[1] == topology_hash
+    assert cache.stats()['misses'] == 3 and cache.stats()['hits'] == 3
+    fresh = FaultLevelCache(cache_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(fresh.levels(net)[0], levels)
+    assert fresh.stats()['disk_hits'] == 3 and fresh.stats()['misses'] == 0
+
+
+def test_only_changed_island_is_recomputed(small_net):
+    net = small_net
+    cache = FaultLevelCache(cache_dir=None)
+    levels, topology_hash = cache.levels(net)
+    _, keys = island_keys(net)
+
+    # Opening one side of the ring weakens the A-B-C-D island; F-G is untouched
+    net.line.at[1, 'in_service'] = False
+    changed, changed_hash = cache.levels(net)
+    assert changed_hash != topology_hash
+    assert cache.stats()['misses'] == 4
+    assert set(island_keys(net)[1].values()) & set(keys.values()) == {keys[i] for i in (1, 2)}
+    assert (changed.loc[[1, 2], 'ikss_max_ka'] < levels.loc[[1, 2], 'ikss_max_ka']).all()
+    pd.testing.assert_frame_equal(changed.loc[[4, 5, 6]], levels.loc[[4, 5, 6]])
+
+    reference = prepare_fault_net(net)
+    sc.calc_sc(reference, case='max')
+    assert np.allclose(changed['ikss_max_ka'], reference.res_bus_sc['ikss_ka'], equal_nan=True)
+
+
+def test_fault_level_endpoint(monkeypatch, model_cache):
+    import main
+
+    monkeypatch.setattr(main, 'network_cache', model_cache)
+    monkeypatch.setattr(main, 'fault_level_cache', FaultLevelCache(cache_dir=None))
+    client = main.app.test_client()
+
+    levels = client.get('/fault_levels').get_json()
+    assert levels['name'] == list('ABCDEFG') and levels['ikss_max_ka'][4] is None
+    bus = client.get('/fault_levels?bus=D').get_json()
+    assert bus['ikss_max_ka'] == levels['ikss_max_ka'][3] and bus['topology_hash'] == levels['topology_hash']
+    assert client.get('/fault_levels?bus=NOPE').status_code == 400
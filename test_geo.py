@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from data_parsing.geo import get_transformer, nztm_to_wgs84, nztm_to_wgs84_array, wgs84_to_nztm_array
+
+
+def test_batch_projection_matches_scalar():
+    x = pd.Series([1750929.0001, 1483256.0001])
+    y = pd.Series([5932699.0001, 5243850.0001])
+    lats, lons = nztm_to_wgs84_array(x, y)
+    for pos in range(len(x)):
+        lat, lon = nztm_to_wgs84(x[pos], y[pos])
+        assert np.isclose(lats[pos], lat)
+        assert np.isclose(lons[pos], lon)
+
+
+def test_batch_projection_marks_bad_rows_as_nan():
+    lats, lons = nztm_to_wgs84_array(['1750929.0001', 'bad', None], [5932699.0001, 1.0, 5.0])
+    assert np.isfinite(lats[0]) and np.isfinite(lons[0])
+    assert np.isnan(lats[1:]).all() and np.isnan(lons[1:]).all()
+
+
+def test_round_trip_and_transformer_is_cached():
+    assert get_transformer() is get_transformer()
+    lats, lons = nztm_to_wgs84_array([1750929.0], [5932699.0])
+    x, y = wgs84_to_nztm_array(lats, lons)
+    assert np.allclose(x, [1750929.0], atol=0.01)
+    assert np.allclose(y, [5932699.0], atol=0.01)
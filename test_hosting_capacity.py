@@ -0,0 +1,71 @@
+import numpy as np
+
+import analysis.hosting_capacity as hosting_capacity
+from analysis.connection_study import prepare_study_net
+from analysis.hosting_capacity import WITHIN_LIMITS, HostingCapacityResult, _HostingRunner, run_hosting_capacity
+from services.hosting_capacity import HostingCapacityStore
+
+
+def test_search_finds_the_limit_and_warm_starts_save_solves(small_net):
+    runner = _HostingRunner(prepare_study_net(small_net))
+    capacity, limit = runner.search('load', 3, max_mw=500.0, tolerance_mw=1.0)
+    assert runner.check('load', 3, capacity)[0] == WITHIN_LIMITS
+    assert runner.check('load', 3, capacity + 1.0)[0] == limit != WITHIN_LIMITS
+
+    runner.solves = 0
+    warm, warm_limit = runner.search('load', 3, guess=capacity * 1.02, max_mw=500.0, tolerance_mw=1.0)
+    assert abs(warm - capacity) <= 1.0 and warm_limit == limit
+    assert runner.solves <= 4
+
+
+def test_parallel_search_matches_serial(tmp_path, monkeypatch, small_net):
+    net = small_net
+    serial = run_hosting_capacity(net, max_mw=500.0, tolerance_mw=2.0, max_workers=1)
+    frame = serial.frame()
+    # Slack buses take anything; the isolated bus has no result
+    assert list(frame.loc[[0, 5], 'load_limit']) == ['max_mw', 'max_mw']
+    assert np.isnan(serial.load_mw[4]) and frame.at[4, 'load_limit'] is None
+    assert (serial.generation_mw[[1, 2, 3, 6]] < 500.0).all()
+
+    monkeypatch.setattr(hosting_capacity, 'MIN_PARALLEL_BUSES', 1)
+    done = []
+    parallel = run_hosting_capacity(net, max_mw=500.0, tolerance_mw=2.0, max_workers=2,
+                                    progress=lambda d, t: done.append((d, t)))
+    assert np.allclose(parallel.load_mw, serial.load_mw, atol=2.0, equal_nan=True)
+    assert np.allclose(parallel.generation_mw, serial.generation_mw, atol=2.0, equal_nan=True)
+    assert done[-1] == (6, 6)
+
+    store = HostingCapacityStore(str(tmp_path))
+    store.put('key', serial)
+    loaded = HostingCapacityStore(str(tmp_path)).get('key')
+    assert isinstance(loaded, HostingCapacityResult)
+    assert np.array_equal(loaded.load_mw, serial.load_mw, equal_nan=True)
+    assert loaded.settings == serial.settings and loaded.solves == serial.solves
+
+
+def test_hosting_capacity_endpoint(tmp_path, monkeypatch, model_cache):
+    import main
+    import services.jobs
+    from services.jobs import JobQueue
+    from services.result_store import ResultStore
+
+    store = HostingCapacityStore(str(tmp_path / 'hosting'))
+    queue = JobQueue(max_workers=1, store=ResultStore(str(tmp_path / 'results')))
+    monkeypatch.setattr(main, 'network_cache', model_cache)
+    monkeypatch.setattr(main, 'job_queue', queue)
+    monkeypatch.setattr(main, 'hosting_capacity_store', store)
+    monkeypatch.setattr(services.jobs, 'hosting_capacity_store', store)
+    client = main.app.test_client()
+    try:
+        response = client.get('/hosting_capacity')
+        assert response.status_code == 202
+        job_id = response.get_json()['id']
+        assert 'event: done' in client.get(f'/jobs/{job_id}/events').get_data(as_text=True)
+
+        layer = client.get('/hosting_capacity').get_json()
+        assert layer['name'] == list('ABCDEFG') and layer['network'] == 'transpower'
+        assert layer['load_mw'][4] is None and layer['load_limit'][0] == 'max_mw'
+        assert queue.stats()['submitted'] == 1
+        assert client.get('/hosting_capacity?network=nope').status_code == 400
+    finally:
+        queue.shutdown()
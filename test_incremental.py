@@ -0,0 +1,138 @@
+import functools
+import shutil
+import time
+
+import pandas as pd
+import pytest
+
+from data_parsing.incremental import TRANSPOWER_LINES, TRANSPOWER_SITES, VECTOR_SITES, diff_rows
+from data_parsing.transpower.transpower_data_parser import SITES_CSV, create_transpower_network
+from data_parsing.transpower.transpower_lines import LINES_CSV, load_transmission_lines
+from data_parsing.vector.vector_data_parser import VECTOR_SITES_CSV, create_vector_network
+from services.network_cache import NetworkCache, assemble_model, read_sources, update_model
+
+
+def test_diff_rows_by_key():
+    old = pd.DataFrame({'GlobalID': ['a', 'b', 'c'], 'name': ['A', 'B', 'C'], 'x': [1.0, 2.0, 3.0]})
+    new = pd.DataFrame({'GlobalID': ['d', 'c', 'a'], 'name': ['D', 'C', 'A2'], 'x': [4.0, 3.0, 1.0]})
+    inserted, updated, deleted = diff_rows(old, new, 'GlobalID')
+    assert list(inserted.index) == ['d'] and list(updated.index) == ['a'] and list(deleted) == ['b']
+    assert updated.loc['a', 'name'] == 'A2'
+    with pytest.raises(ValueError):
+        diff_rows(old, pd.concat([new, new]), 'GlobalID')
+
+
+@pytest.fixture
+def sources(tmp_path):
+    paths = {}
+    for path, source in ((SITES_CSV, TRANSPOWER_SITES), (LINES_CSV, TRANSPOWER_LINES),
+                         (VECTOR_SITES_CSV, VECTOR_SITES)):
+        copied = tmp_path / path.rsplit('/', 1)[-1]
+        shutil.copy(path, copied)
+        paths[str(copied)] = source
+    return paths
+
+
+def _build(sources):
+    sites, lines, vector = sources
+    transpower_net, transpower_bus_data = create_transpower_network(sites)
+    load_transmission_lines(transpower_net, lines)
+    vector_net, vector_bus_data = create_vector_network(vector)
+    model = assemble_model(transpower_net, transpower_bus_data, vector_net, vector_bus_data)
+    model.sources = read_sources(sources)
+    return model
+
+
+def _edit(path, edit):
+    rows = pd.read_csv(path, encoding='utf-8-sig')
+    edit(rows)
+    rows.to_csv(path, index=False)
+
+
+def _lines(net):
+    names = net.bus['name']
+    return sorted(zip(net.line['name'], names[net.line['from_bus']], names[net.line['to_bus']]))
+
+
+def test_changed_rows_are_applied_in_place(sources):
+    sites, lines, vector = sources
+    cache = NetworkCache(source_files=list(sources), builder=functools.partial(_build, sources),
+                         updater=functools.partial(update_model, sources=sources, export_substations=False))
+    first = cache.get()
+    before = first.transpower_net.bus.copy()
+    kept = before.set_index('name').index.difference(['ALB', 'APS', 'OTA'])
+
+    def edit_sites(rows):
+        rows.loc[rows['MXLOCATION'] == 'ALB', 'description'] = 'Albany (renamed)'
+        rows.loc[rows['MXLOCATION'] == 'APS', 'MXLOCATION'] = 'APX'
+        rows.loc[len(rows)] = rows.iloc[0].copy()
+        rows.loc[len(rows) - 1, ['MXLOCATION', 'GlobalID', 'X']] = ['NEW', 'new-site', 1752000.0]
+        rows.drop(rows.index[rows['MXLOCATION'] == 'OTA'], inplace=True)
+
+    def edit_lines(rows):
+        rows.loc[len(rows)] = [len(rows) + 1, 'ALB-NEW-A', 110, 'COMMISSIONED', 'Albany - New A', 'TRANSLINE',
+                               '110 TRANSLINE', 'new-line', 1500.0]
+    _edit(sites, edit_sites)
+    _edit(lines, edit_lines)
+
+    updated = cache.get()
+    assert cache.stats()['incremental_updates'] == 1 and cache.stats()['last_build_source'] == 'incremental'
+    net = updated.transpower_net
+    # Untouched buses keep their indices; the old model's net is left as it was
+    after = net.bus.reset_index().set_index('name')
+    assert (after.loc[kept, 'index'] == before.reset_index().set_index('name').loc[kept, 'index']).all()
+    assert first.transpower_net.bus.equals(before)
+    assert 'OTA' not in set(net.bus['name']) and net.bus.index.max() == before.index.max() + 1
+    bus_data = updated.transpower_bus_data.set_index('name')
+    assert bus_data.loc['ALB', 'description'] == 'Albany (renamed)'
+    assert 'APX' in bus_data.index and 'APS' not in bus_data.index
+    rows, _ = updated.spatial_index.nearest_wgs84(*bus_data.loc['NEW', ['lat', 'lon']], networks=['transpower'])
+    assert updated.spatial_index.describe(rows, _)['name'][0, 0] == 'NEW'
+
+    # Same buses and lines as a full rebuild of the edited files
+    rebuilt = _build(sources).transpower_net
+    assert sorted(net.bus['name']) == sorted(rebuilt.bus['name'])
+    assert _lines(net) == _lines(rebuilt)
+    assert ('ALB-NEW-A', 'ALB', 'NEW') in _lines(net)
+
+
+def test_vector_sites_update_without_touching_transpower(sources):
+    sites, lines, vector = sources
+    model = _build(sources)
+    _edit(vector, lambda rows: rows.drop(rows.index[:2], inplace=True))
+    updated = update_model(model, [vector], sources=sources, export_substations=False)
+    assert len(updated.vector_net.bus) == len(model.vector_net.bus) - 2
+    assert updated.transpower_net.bus.equals(model.transpower_net.bus)
+    assert update_model(model, ['data/other.csv'], sources=sources) is None
+
+
+def test_update_is_cheaper_than_a_rebuild(sources):
+    sites, lines, vector = sources
+    model = _build(sources)
+    _edit(vector, lambda rows: rows.drop(rows.index[:1], inplace=True))
+
+    def best_of(run, repeat=3):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - start)
+        return result, min(timings)
+
+    updated, update_s = best_of(lambda: update_model(model, [vector], sources=sources, export_substations=False))
+    _, rebuild_s = best_of(lambda: _build(sources))
+    assert update_s < rebuild_s, (update_s, rebuild_s)
+    # Only the Vector parts were rebuilt; the Transpower ones are the old model's
+    assert updated.transpower_net is model.transpower_net
+    assert updated.topology['transpower'] is model.topology['transpower']
+    assert updated.map_data['transpower'] is model.map_data['transpower']
+
+    # The patched model matches one derived in full from the same tables
+    full = assemble_model(updated.transpower_net, updated.transpower_bus_data, updated.vector_net,
+                          updated.vector_bus_data)
+    assert updated.map_data == full.map_data
+    assert updated.payload.body == full.payload.body
+    pd.testing.assert_frame_equal(updated.spatial_index.sites, full.spatial_index.sites)
+    pd.testing.assert_frame_equal(updated.viewport.lines, full.viewport.lines)
+    bbox = (170.0, -45.0, 180.0, -35.0)
+    assert updated.viewport.query(bbox, 12) == full.viewport.query(bbox, 12)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from data_parsing.buses import concat_chunks, create_site_buses_from_chunks
+from data_parsing.ingest import read_csv_chunks
+from data_parsing.transpower.transpower_data_parser import SITES_SCHEMA
+
+SITES_CSV_TEXT = (
+    '﻿X,Y,OBJECTID,MXLOCATION,type,status,description,GlobalID\n'
+    '1750929.0001,5932699.0001,1,ALB,ACSTN,COMMISSIONED,Albany,a\n'
+    'oops,5243850.0001,2,BAD,ACSTN,COMMISSIONED,Bad,b\n'
+    '1483256.0001,5243850.0001,3,APS,ACSTN,COMMISSIONED,Arthurs Pass,c\n'
+    '1757000,5920000,4,AKL,TEE,DECOMMISSIONED,Auckland,d\n'
+    '1749000,5428000,5,WLG,HVDC,COMMISSIONED,Wellington,e\n'
+)
+
+
+def test_read_csv_chunks_applies_schema(tmp_path):
+    path = tmp_path / 'Sites.csv'
+    path.write_text(SITES_CSV_TEXT, encoding='utf-8')
+
+    chunks = list(read_csv_chunks(str(path), SITES_SCHEMA, chunk_rows=2, engine='pandas'))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    sites = pd.concat(chunks)
+    # The BOM is stripped from the first header and unused columns (OBJECTID) are never read
+    assert list(sites.columns) == SITES_SCHEMA.columns
+    assert list(sites.index) == [0, 1, 2, 3, 4]
+    assert sites['X'].dtype == np.float32
+    assert isinstance(chunks[0]['type'].dtype, pd.CategoricalDtype)
+    # Unparseable coordinates become NaN rather than failing the file
+    assert np.isnan(sites['X'].iloc[1])
+    assert list(sites['MXLOCATION']) == ['ALB', 'BAD', 'APS', 'AKL', 'WLG']
+
+
+def test_pyarrow_engine_matches_pandas(tmp_path):
+    path = tmp_path / 'Sites.csv'
+    path.write_text(SITES_CSV_TEXT, encoding='utf-8')
+
+    chunks = list(read_csv_chunks(str(path), SITES_SCHEMA, engine='pyarrow', block_bytes=128))
+    assert len(chunks) > 1
+    sites = concat_chunks(chunks, None)
+    # BOM stripped, schema columns and dtypes, row labels running on across chunks
+    assert list(sites.columns) == SITES_SCHEMA.columns
+    assert list(sites.index) == [0, 1, 2, 3, 4]
+    assert sites['X'].dtype == np.float32 and np.isnan(sites['X'].iloc[1])
+    # Chunks with different categories still concatenate to one categorical column
+    assert {tuple(c['type'].cat.categories) for c in chunks} != {('ACSTN', 'HVDC', 'TEE')}
+    assert isinstance(sites['type'].dtype, pd.CategoricalDtype)
+    assert list(sites['type']) == ['ACSTN', 'ACSTN', 'ACSTN', 'TEE', 'HVDC']
+
+    reference = concat_chunks(list(read_csv_chunks(str(path), SITES_SCHEMA, chunk_rows=2, engine='pandas')), None)
+    pd.testing.assert_frame_equal(sites, reference, check_categorical=False)
+
+
+def test_create_site_buses_from_chunks(tmp_path):
+    path = tmp_path / 'Sites.csv'
+    path.write_text(SITES_CSV_TEXT, encoding='utf-8')
+    net = pp.create_empty_network()
+
+    bus_data, rejected = create_site_buses_from_chunks(
+        net, read_csv_chunks(str(path), SITES_SCHEMA, chunk_rows=2, engine='pandas'),
+        name_col='MXLOCATION', x_col='X', y_col='Y',
+        attributes=lambda chunk: {'type': chunk['type'], 'description': chunk['description']})
+
+    assert list(bus_data['name']) == ['ALB', 'APS', 'AKL', 'WLG']
+    assert list(bus_data['type']) == ['ACSTN', 'ACSTN', 'TEE', 'HVDC']
+    assert list(rejected['MXLOCATION']) == ['BAD']
+    assert np.array_equal(bus_data['bus_idx'].to_numpy(), net.bus.index.to_numpy())
+    # float32 coordinates keep sub-metre precision at NZTM magnitudes
+    assert abs(bus_data['x'].iloc[0] - 1750929.0001) < 0.25
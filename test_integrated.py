@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from analysis.connection_study import prepare_study_net
+from data_parsing.buses import create_site_buses
+from data_parsing.integrated import create_integrated_network, site_voltages
+from services.jobs import parse_study
+from services.network_cache import assemble_model
+
+X0, Y0 = 1768000.0, 5900000.0
+
+
+def _nets():
+    transpower = pp.create_empty_network()
+    sites = pd.DataFrame({'MXLOCATION': ['TAK', 'WIR', 'WRT'], 'X': [X0, X0 + 500, X0 + 10], 'Y': Y0,
+                          'type': ['ACSTN', 'ACSTN', 'TEE'], 'description': ['Takanini', 'Wiri', 'Wiri Tee']})
+    tp_bd, _ = create_site_buses(transpower, sites, 'MXLOCATION', 'X', 'Y',
+                                 attributes={'type': sites['type'], 'description': sites['description']})
+    pp.create_line_from_parameters(transpower, 0, 1, 1.0, 0.1, 0.4, 10.0, 1.0, name='TAK-WIR')
+
+    vector = pp.create_empty_network()
+    names = ['TP TAKANINI 220/33KV', 'MANUREWA 33/11KV', 'HORSESHOE BUSH', 'LICHFIELD 110/11KV', 'TP NOWHERE 110/33KV']
+    sites = pd.DataFrame({'name': names, 'x': [X0 + 400, X0 + 3000, X0, X0, X0 + 100000],
+                          'y': [Y0, Y0, Y0 + 1000, Y0 + 200000, Y0]})
+    v_bd, _ = create_site_buses(vector, sites, 'name', 'x', 'y')
+    pp.create_line_from_parameters(vector, 0, 2, 1.0, 0.1, 0.3, 10.0, 1.0, name='TPTAK H01 - HORS H01')
+    return transpower, tp_bd, vector, v_bd
+
+
+def test_site_voltages():
+    voltages = site_voltages(['TP PENROSE 220/110/33/22kV', 'TP Wellsford 110/33 kV POS', 'BROOKBY 33kV', 'ROSEDALE'])
+    assert list(voltages['hv_kv'][:3]) == [220.0, 110.0, 33.0] and list(voltages['lv_kv'][:3]) == [22.0, 33.0, 33.0]
+    assert voltages.iloc[3].isna().all()
+
+
+def test_integrated_network_joins_gxps_and_supplied_sites():
+    transpower, tp_bd, vector, v_bd = _nets()
+    net, bus_data, links = create_integrated_network(transpower, tp_bd, vector, v_bd)
+
+    # The name hint beats the nearer Wiri substation; the tee is never a GXP
+    gxp = links.iloc[0]
+    assert (gxp['vector_name'], gxp['transpower_name'], gxp['method']) == ('TP TAKANINI 220/33KV', 'TAK', 'name')
+    # Manurewa has no line to a GXP so gets its own supply transformer; Horseshoe Bush is fed over the
+    # Vector line; Lichfield is too far from any GXP and the second GXP from any substation
+    assert list(links['vector_name']) == ['TP TAKANINI 220/33KV', 'MANUREWA 33/11KV']
+    assert list(links['method']) == ['name', 'supply'] and list(links['transpower_bus']) == [0, 0]
+    assert np.allclose(links['distance_m'], [400.0, 2600.0])
+
+    # Vector buses are relabelled after the Transpower ones and take their voltages from their names
+    vector_buses = bus_data['bus_idx'].to_numpy()[3:]
+    assert list(vector_buses) == [3, 4, 5, 6, 7] and list(links['vector_bus']) == [3, 4]
+    assert list(net.bus.loc[vector_buses, 'vn_kv']) == [33.0, 33.0, 33.0, 110.0, 33.0]
+    assert list(net.line['from_bus']) == [0, 3] and list(net.line['to_bus']) == [1, 5]
+    assert list(net.trafo.index) == list(links['trafo'])
+    # The GXP's substation is at the high side of its name; the Wiri substation keeps its voltage
+    assert list(net.bus.loc[[0, 1], 'vn_kv']) == [220.0, 110.0]
+    assert list(net.trafo['vn_hv_kv']) == [220.0, 220.0] and list(net.trafo['vn_lv_kv']) == [33.0, 33.0]
+    assert len(transpower.trafo) == 0 and (transpower.bus['vn_kv'] == 110.0).all()
+    assert (vector.bus['vn_kv'] == 110.0).all()
+
+    # One solve covers both networks: a Vector load is carried through the GXP transformer
+    study = prepare_study_net(net)
+    pp.create_load(study, 5, p_mw=10.0)
+    pp.runpp(study)
+    assert study.res_trafo.at[0, 'p_hv_mw'] > 9.9
+
+
+def test_integrated_study_resolves_lat_lon(tmp_path):
+    transpower, tp_bd, vector, v_bd = _nets()
+    model = assemble_model(transpower, tp_bd, vector, v_bd)
+    site = model.integrated_bus_data.iloc[4]
+    network, net, params = parse_study('connection_study', {
+        'network': 'integrated', 'candidates': [{'p_mw': 5.0, 'lat': site['lat'], 'lon': site['lon']}]}, model)
+    assert network == 'integrated' and net is model.integrated_net
+    assert params['candidates'][0]['bus'] == 4 and net.bus.at[4, 'name'] == 'MANUREWA 33/11KV'
@@ -0,0 +1,150 @@
+import json
+import os
+import time
+
+import pytest
+
+from services.jobs import JobQueue
+from services.result_store import ResultStore
+
+
+def test_jobs_run_stream_and_deduplicate(tmp_path, model_cache, wait_for_job):
+    model = model_cache.get()
+    queue = JobQueue(max_workers=1, store=ResultStore(str(tmp_path / 'results')))
+    try:
+        params = {'candidates': [{'name': 'wind', 'p_mw': 50.0, 'kind': 'sgen', 'bus': 'D'},
+                                 {'name': 'data centre', 'p_mw': 30.0, 'bus': 1}]}
+        job = queue.submit('connection_study', params, model)
+        assert queue.submit('connection_study', params, model) is job
+        events = wait_for_job(queue, job)
+        assert [e[1] for e in events] == ['started', 'partial', 'progress', 'done']
+        assert [e[0] for e in events] == list(range(4))
+        result = json.loads(job.result)
+        assert [c['bus_name'] for c in result['candidates']] == ['D', 'B']
+        assert events[1][2]['candidates'] == result['candidates']
+
+        # Same study with the bus given by label has the same content hash
+        params['candidates'][0]['bus'] = 3
+        assert queue.submit('connection_study', params, model) is job
+        assert queue.stats()['submitted'] == 1 and queue.stats()['deduplicated'] == 2
+
+        contingency = queue.submit('contingency', {'kinds': ['line']}, model)
+        events = wait_for_job(queue, contingency)
+        assert [e[1] for e in events[-2:]] == ['progress', 'done']
+        assert events[-2][2]['done'] == events[-2][2]['total']
+        assert json.loads(contingency.result)['outages'] == 5
+    finally:
+        queue.shutdown()
+
+    # A new queue on the same store serves the stored result without running anything
+    fresh = JobQueue(max_workers=1, store=ResultStore(str(tmp_path / 'results')))
+    cached = fresh.submit('connection_study', params, model)
+    assert cached.status == 'done' and cached.cached and cached.result == job.result
+    assert fresh.stats()['submitted'] == 0 and fresh._pool is None
+
+
+def test_bad_study_requests(tmp_path, model_cache):
+    model = model_cache.get()
+    queue = JobQueue(max_workers=1, store=ResultStore(str(tmp_path / 'results')))
+    try:
+        for kind, params in [('nope', {}), ('contingency', {'kinds': ['switch']}),
+                             ('connection_study', {'candidates': [{'p_mw': 1.0, 'bus': 'NOPE'}]}),
+                             ('timeseries', {'candidate': {'p_mw': 1.0, 'bus': 0}, 'profile': [1.0, 0.5],
+                                             'load_p_mw': {'B': [1.0]}})]:
+            try:
+                queue.submit(kind, params, model)
+            except (KeyError, ValueError, TypeError):
+                continue
+            raise AssertionError(f"{kind} {params} was accepted")
+        assert queue.stats()['submitted'] == 0 and queue._pool is None
+    finally:
+        queue.shutdown()
+
+
+def test_result_store_ttl(tmp_path):
+    store = ResultStore(str(tmp_path), ttl_seconds=60)
+    store.put('a', b'{}')
+    assert store.get('a') == b'{}'
+    old = time.time() - 120
+    os.utime(tmp_path / 'a.json', (old, old))
+    store.put('b', b'[]')
+    assert not (tmp_path / 'a.json').exists() and store.get('a') is None
+    assert store.stats() == {'hits': 1, 'misses': 1, 'evictions': 1}
+
+
+def test_study_endpoints(tmp_path, monkeypatch, model_cache):
+    import main
+
+    monkeypatch.setattr(main, 'network_cache', model_cache)
+    queue = JobQueue(max_workers=1, store=ResultStore(str(tmp_path / 'results')))
+    monkeypatch.setattr(main, 'job_queue', queue)
+    client = main.app.test_client()
+    try:
+        response = client.post('/studies/timeseries', json={'candidate': {'p_mw': 20.0, 'kind': 'sgen', 'bus': 'C'},
+                                                            'profile': [0.0, 0.5, 1.0], 'load_p_mw': {'B': [5, 5, 5]}})
+        assert response.status_code == 202
+        job_id = response.get_json()['id']
+        stream = client.get(f'/jobs/{job_id}/events').get_data(as_text=True)
+        assert 'event: started' in stream and stream.rstrip().split('\n')[-2] == 'event: done'
+        result = client.get(f'/jobs/{job_id}/result').get_json()
+        assert result['summary']['hours'] == 3 and result['summary']['converged_hours'] == 3
+
+        resumed = client.get(f'/jobs/{job_id}/events', headers={'Last-Event-ID': '1'}).get_data(as_text=True)
+        assert 'event: started' not in resumed and 'event: done' in resumed
+        assert client.get(f'/jobs/{job_id}').get_json()['status'] == 'done'
+        assert client.get('/jobs/unknown/result').status_code == 404
+        assert client.post('/studies/contingency', json={'network': 'nope'}).status_code == 400
+        assert 'study_jobs_done 1' in client.get('/metrics').get_data(as_text=True)
+    finally:
+        queue.shutdown()
+
+
+def test_jobs_are_shared_between_web_workers(tmp_path, model_cache, wait_for_job):
+    model = model_cache.get()
+    # Two queues on one result directory stand in for two web workers
+    first = JobQueue(max_workers=1, store=ResultStore(str(tmp_path / 'results')))
+    second = JobQueue(max_workers=1, store=ResultStore(str(tmp_path / 'results')))
+    try:
+        params = {'candidates': [{'name': 'wind', 'p_mw': 50.0, 'kind': 'sgen', 'bus': 'D'}]}
+        job = first.submit('connection_study', params, model)
+        remote = second.submit('connection_study', params, model)
+        assert remote.id == job.id and second._pool is None
+        assert second.get(job.id).status in ('queued', 'running', 'done')
+        events = wait_for_job(second, remote)
+        assert [e[1] for e in events] == [e[1] for e in wait_for_job(first, job)]
+        assert events[-1][1] == 'done' and second.get(job.id).result == job.result
+    finally:
+        first.shutdown()
+        second.shutdown()
+
+
+def test_submit_claims_again_when_the_other_worker_left_no_result(tmp_path, monkeypatch, model_cache, wait_for_job):
+    model = model_cache.get()
+    queue = JobQueue(max_workers=1, store=ResultStore(str(tmp_path / 'results')))
+    claims = [False]
+    claim = queue.registry.claim
+    # The first claim loses to a worker whose registry row and result are gone by the time they are looked up
+    monkeypatch.setattr(queue.registry, 'claim', lambda *args: claims.pop() if claims else claim(*args))
+    try:
+        job = queue.submit('power_flow', {}, model)
+        assert job is not None and wait_for_job(queue, job)[-1][1] == 'done'
+        claims.extend([False] * 3)
+        monkeypatch.setattr(queue.registry, 'get', lambda job_id: None)
+        with pytest.raises(RuntimeError):
+            queue.submit('power_flow', {}, model, rerun=True)
+    finally:
+        queue.shutdown()
+
+
+def test_jobs_of_an_exited_worker_can_be_run_again(tmp_path):
+    import subprocess
+    import sys
+    from services.job_registry import JobRegistry
+
+    registry = JobRegistry(str(tmp_path / 'jobs.sqlite'))
+    registry.claim('abc', 'contingency')
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    registry._connect().execute('UPDATE jobs SET owner = ?, status = ?', (int(exited.stdout), 'running'))
+    assert registry.get('abc')['status'] == 'failed'
+    assert registry.events('abc')[1][-1][0] == 'failed'
+    assert registry.claim('abc', 'contingency') and registry.get('abc')['status'] == 'queued'
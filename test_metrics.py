@@ -0,0 +1,45 @@
+import main
+from data_parsing.profiling import reset_stage_stats, stage, stage_stats
+from services.metrics import Histogram
+from services.network_cache import NetworkCache
+
+
+def test_stage_stats_accumulate():
+    reset_stage_stats()
+    for rows in (3, 4):
+        with stage('bus_creation') as timer:
+            timer.rows = rows
+    stats = stage_stats()['bus_creation']
+    assert stats.runs == 2
+    assert stats.rows == 7
+    assert stats.seconds >= stats.last_seconds > 0
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Test latency.', ('endpoint',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, endpoint='a')
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{endpoint="a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="a",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{endpoint="a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{endpoint="a"} 3' in lines
+
+
+def test_metrics_endpoint(tmp_path, monkeypatch, two_site_builder):
+    source = tmp_path / 'Sites.csv'
+    source.write_text('X,Y\n1,2\n')
+    monkeypatch.setattr(main, 'network_cache', NetworkCache(source_files=[str(source)], builder=two_site_builder))
+    client = main.app.test_client()
+    reset_stage_stats()
+
+    assert client.get('/network_data').status_code == 200
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert ('http_request_duration_seconds_count{endpoint="get_network_data",method="GET",status="200"}'
+            in text)
+    assert 'pipeline_stage_runs_total{stage="serialization"} 1' in text
+    assert 'network_cache_misses_total 1' in text
+    assert 'network_payload_gzip_bytes' in text
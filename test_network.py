@@ -1,64 +1,50 @@
 import pandas as pd
 import pandapower as pp
 import logging
+from data_parsing.transpower.transpower_data_parser import create_transpower_network
+from data_parsing.transpower.transpower_lines import load_transmission_lines, parse_line_endpoints
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 def test_network_creation():
-    try:
-        # Create network
-        net = pp.create_empty_network(name="TestNet")
-        logger.info("Created empty network")
-
-        # Load sites
-        sites_df = pd.read_csv('data/Transpower/Sites.csv')
-        logger.info(f"Loaded {len(sites_df)} sites")
-
-        # Create buses
-        for idx, row in sites_df.iterrows():
-            pp.create_bus(
-                net,
-                name=str(row['MXLOCATION']),
-                vn_kv=110.0,
-                in_service=True
-            )
-        logger.info(f"Created {len(net.bus)} buses")
-
-        # Load lines
-        lines_df = pd.read_csv('data/Transpower/Transmission_Lines.csv')
-        logger.info(f"Loaded {len(lines_df)} lines")
-
-        # Create lines
-        for idx, row in lines_df.iterrows():
-            mxlocation = str(row['MXLOCATION'])
-            parts = mxlocation.split('-')
-            if len(parts) >= 2:
-                start_bus_name = parts[0]
-                end_bus_name = parts[1]
-                start_bus_idx = net.bus[net.bus['name'] == start_bus_name].index
-                end_bus_idx = net.bus[net.bus['name'] == end_bus_name].index
-                if len(start_bus_idx) > 0 and len(end_bus_idx) > 0:
-                    start_bus_idx = start_bus_idx[0]
-                    end_bus_idx = end_bus_idx[0]
-                    pp.create_line_from_parameters(
-                        net,
-                        from_bus=start_bus_idx,
-                        to_bus=end_bus_idx,
-                        length_km=1.0,
-                        r_ohm_per_km=0.1,
-                        x_ohm_per_km=0.1,
-                        c_nf_per_km=10.0,
-                        max_i_ka=1.0,
-                        name=mxlocation
-                    )
-        logger.info(f"Created {len(net.line)} lines")
-
-        return True
-    except Exception as e:
-        logger.error(f"Error in test: {e}")
-        return False
-
-if __name__ == "__main__":
-    success = test_network_creation()
-    print(f"Test {'succeeded' if success else 'failed'}") 
\ No newline at end of file
+    net, bus_data = create_transpower_network()
+    assert net is not None and len(net.bus) == len(bus_data)
+    logger.info(f"Created {len(net.bus)} buses")
+
+    rejected = load_transmission_lines(net)
+    lines_df = pd.read_csv('data/Transpower/Transmission_Lines.csv')
+    logger.info(f"Created {len(net.line)} lines")
+
+    assert len(net.line) > 0 and len(net.line) + len(rejected) == len(lines_df)
+    assert set(rejected['reason']) <= {'unknown bus', 'invalid MXLOCATION format'}
+    # Lines only join buses of this network, and carry the source GlobalID they were built from
+    assert net.line['from_bus'].isin(net.bus.index).all() and net.line['to_bus'].isin(net.bus.index).all()
+    assert set(net.line['source_id']) <= set(lines_df['GlobalID'])
+    # Rejected rows name at least one site that isn't a bus
+    endpoints = parse_line_endpoints(rejected['MXLOCATION'])
+    names = set(net.bus['name'])
+    assert not (endpoints['start'].isin(names) & endpoints['end'].isin(names)).any()
+
+def test_load_transmission_lines_bulk():
+    net = pp.create_empty_network(name="TestNet")
+    sites_df = pd.read_csv('data/Transpower/Sites.csv')
+    pp.create_buses(net, nr_buses=len(sites_df), vn_kv=110.0, name=sites_df['MXLOCATION'].astype(str))
+
+    rejected = load_transmission_lines(net)
+    lines_df = pd.read_csv('data/Transpower/Transmission_Lines.csv')
+
+    assert len(net.line) + len(rejected) == len(lines_df)
+    assert set(rejected['reason']) <= {'unknown bus', 'invalid MXLOCATION format'}
+    # Every created line joins the buses named in its MXLOCATION
+    bus_names = net.bus['name']
+    for _, line in net.line.iterrows():
+        start, end = line['name'].split('-')[:2]
+        assert bus_names[line['from_bus']] == start
+        assert bus_names[line['to_bus']] == end
+
+def test_parse_line_endpoints():
+    endpoints = parse_line_endpoints(pd.Series(['AHA-DOB-A', 'AHA-DOB-A1-CBL', 'NODASH']))
+    assert list(endpoints['start'][:2]) == ['AHA', 'AHA']
+    assert list(endpoints['end'][:2]) == ['DOB', 'DOB']
+    assert endpoints.iloc[2].isna().all()
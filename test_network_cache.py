@@ -0,0 +1,86 @@
+import os
+
+from services.network_cache import NetworkCache, NetworkModel
+
+
+def _counting_builder():
+    calls = []
+
+    def builder():
+        calls.append(1)
+        return NetworkModel(None, [], None, [], {'build': len(calls)})
+    return builder, calls
+
+
+def test_cache_rebuilds_only_when_content_changes(tmp_path):
+    source = tmp_path / 'Sites.csv'
+    source.write_text('X,Y\n1,2\n')
+    builder, calls = _counting_builder()
+    cache = NetworkCache(source_files=[str(source)], builder=builder)
+
+    first = cache.get()
+    assert cache.get() is first
+    assert len(calls) == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+    # Touching the file without changing its content must not trigger a rebuild
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cache.get() is first
+    assert len(calls) == 1
+
+    source.write_text('X,Y\n1,2\n3,4\n')
+    second = cache.get()
+    assert second is not first
+    assert second.map_data == {'build': 2}
+    assert cache.stats()['rebuilds'] == 2
+
+
+def test_cache_keeps_previous_model_when_rebuild_fails(tmp_path):
+    source = tmp_path / 'Sites.csv'
+    source.write_text('a\n')
+    models = [NetworkModel(None, [], None, [], {}), None]
+    cache = NetworkCache(source_files=[str(source)], builder=lambda: models.pop(0))
+
+    first = cache.get()
+    source.write_text('b\n')
+    assert cache.get() is first
+
+
+def test_cache_waits_out_a_cooldown_after_a_failed_rebuild(tmp_path, monkeypatch):
+    from services import network_cache
+
+    clock = [1000.0]
+    monkeypatch.setattr(network_cache.time, 'monotonic', lambda: clock[0])
+    source = tmp_path / 'Sites.csv'
+    source.write_text('a\n')
+    calls = []
+
+    def builder():
+        calls.append(1)
+        return NetworkModel(None, [], None, [], {}) if len(calls) in (1, 3) else None
+    cache = NetworkCache(source_files=[str(source)], builder=builder, rebuild_cooldown_s=30.0)
+
+    first = cache.get()
+    source.write_text('b\n')
+    # The failed build isn't retried by every request; they get the last good model
+    assert all(cache.get() is first for _ in range(5))
+    assert len(calls) == 2 and cache.stats()['failed_rebuilds'] == 1
+    clock[0] += 31.0
+    second = cache.get()
+    assert second is not first and len(calls) == 3
+    assert cache.get() is second and len(calls) == 3
+
+
+def test_concurrent_hits_are_all_counted(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    source = tmp_path / 'Sites.csv'
+    source.write_text('X,Y\n1,2\n')
+    builder, _ = _counting_builder()
+    cache = NetworkCache(source_files=[str(source)], builder=builder)
+    cache.get()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: [cache.get() for _ in range(500)], range(8)))
+    assert cache.stats()['hits'] == 8 * 500
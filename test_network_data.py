@@ -0,0 +1,53 @@
+import gzip
+import json
+
+import brotli
+
+import main
+from services.network_cache import NetworkCache
+from services.payload import dumps
+
+
+def test_network_data_is_precompressed_and_etag_cached(tmp_path, monkeypatch, two_site_builder):
+    source = tmp_path / 'Sites.csv'
+    source.write_text('X,Y\n1,2\n')
+    monkeypatch.setattr(main, 'network_cache', NetworkCache(source_files=[str(source)], builder=two_site_builder))
+    client = main.app.test_client()
+
+    plain = client.get('/network_data')
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+    data = json.loads(plain.data)
+    assert data['transpower']['lines'] == [
+        {'name': 'A-B', 'from_bus': 'A', 'to_bus': 'B', 'voltage': '110.0', 'description': ''}]
+
+    compressed = client.get('/network_data', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(compressed.data)) == data
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+
+    for response in (plain, compressed):
+        cached = client.get('/network_data', headers={'If-None-Match': response.headers['ETag'],
+                                                      'Accept-Encoding': 'gzip'})
+        assert cached.status_code == 304
+        assert cached.data == b''
+
+
+def test_network_data_prefers_brotli(tmp_path, monkeypatch, two_site_builder):
+    source = tmp_path / 'Sites.csv'
+    source.write_text('X,Y\n1,2\n')
+    monkeypatch.setattr(main, 'network_cache', NetworkCache(source_files=[str(source)], builder=two_site_builder))
+    client = main.app.test_client()
+
+    plain = client.get('/network_data')
+    response = client.get('/network_data', headers={'Accept-Encoding': 'gzip, deflate, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.data) == plain.data
+    assert response.headers['ETag'] != plain.headers['ETag']
+    assert client.get('/network_data', headers={'If-None-Match': response.headers['ETag'],
+                                                'Accept-Encoding': 'br'}).status_code == 304
+
+
+def test_dumps_writes_nan_as_null():
+    # NaN is not valid JSON, so missing coordinates must reach the browser as null
+    assert json.loads(dumps({'lat': float('nan'), 'name': 'A'})) == {'lat': None, 'name': 'A'}
@@ -0,0 +1,113 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+import pytest
+
+from analysis.connection_study import add_island_slacks
+from analysis.scenario import Scenario, materialize
+from services.jobs import JobQueue
+from services.result_store import ResultStore
+from services.scenarios import ScenarioStore, SharedScenarioStore
+
+
+def test_scenarios_are_immutable_deltas_with_content_keys(small_net):
+    base = Scenario()
+    first = base.add('sgen', bus=np.int64(3), p_mw=50.0).set('line', 1, 'length_km', 5.0).switch_out('line', 0)
+    second = base.switch_out('line', 0).set('line', 1, 'length_km', 2.0).add('sgen', p_mw=50.0, bus=3)
+    assert base == Scenario() and first.key != second.key
+    assert second.set('line', 1, 'length_km', 5.0).key == first.key
+    assert Scenario.from_dict(json.loads(json.dumps(first.to_dict()))) == first
+    assert first.tables() == {'sgen', 'line'}
+    with pytest.raises(ValueError):
+        base.add('switch', bus=0)
+    with pytest.raises(ValueError):
+        base.switch_out('line', 99).validate(small_net)
+    base.add('bus', vn_kv=110.0).add('line', from_bus=0, to_bus=7, length_km=1.0, r_ohm_per_km=0.1,
+                                     x_ohm_per_km=0.4, c_nf_per_km=10.0, max_i_ka=0.5).validate(small_net)
+
+
+def test_materialize_leaves_the_base_untouched_and_shares_unchanged_tables(small_net):
+    base = small_net
+    add_island_slacks(base)
+    pp.create_load(base, 3, p_mw=20.0)
+    before = {table: base[table].copy() for table in ('bus', 'line', 'load', 'ext_grid')}
+    for table in before:
+        for col in base[table].columns:
+            if base[table][col].dtype.kind in 'biuf':
+                base[table][col].to_numpy().flags.writeable = False
+
+    scenario = Scenario().add('sgen', bus=3, p_mw=30.0).set('load', 0, 'p_mw', 40.0).switch_out('line', 0)
+    net = materialize(base, scenario)
+    pp.runpp(net)
+    assert net.res_bus.loc[3, 'p_mw'] == pytest.approx(10.0)
+    assert not net.line.at[0, 'in_service'] and len(net.sgen) == 1
+    for table, frame in before.items():
+        pd.testing.assert_frame_equal(base[table], frame)
+    assert base.sgen.empty and base.res_bus.empty
+    assert np.shares_memory(net.bus['vn_kv'].to_numpy(), base.bus['vn_kv'].to_numpy())
+    assert not np.shares_memory(net.line['in_service'].to_numpy(), base.line['in_service'].to_numpy())
+
+
+def test_store_keeps_the_most_recent_scenarios():
+    store = ScenarioStore(max_scenarios=1000)
+    keys = [store.put(Scenario().add('load', bus=i % 7, p_mw=float(i))) for i in range(1500)]
+    assert store.stats() == {'scenarios': 1000, 'evictions': 500}
+    assert store.get(keys[0]) is None and store.get(keys[-1]).added[0][1] == (('bus', 1), ('p_mw', 1499.0))
+
+
+def test_shared_store_is_seen_by_every_worker(tmp_path):
+    # Two stores on one file stand in for two web workers
+    first = SharedScenarioStore(str(tmp_path / 'scenarios.sqlite'), max_scenarios=3)
+    second = SharedScenarioStore(str(tmp_path / 'scenarios.sqlite'), max_scenarios=3)
+    scenarios = [Scenario().add('load', bus=i, p_mw=1.0).switch_out('line', 0) for i in range(4)]
+    keys = [first.put(scenario) for scenario in scenarios[:3]]
+    assert second.get(keys[0]) == scenarios[0]
+    second.put(scenarios[3])
+    # keys[0] was used last, so keys[1] is the one evicted
+    assert first.get(keys[1]) is None and first.get(keys[0]).key == keys[0]
+    assert first.stats() == second.stats() == {'scenarios': 3, 'evictions': 1}
+
+
+def test_power_flow_results_are_cached_per_scenario(tmp_path, monkeypatch, model_cache, wait_for_job):
+    import main
+    from services import jobs
+
+    model = model_cache.get()
+    monkeypatch.setattr(main, 'network_cache', model_cache)
+    store = ScenarioStore()
+    monkeypatch.setattr(main, 'scenario_store', store)
+    monkeypatch.setattr(jobs, 'scenario_store', store)
+    queue = JobQueue(max_workers=1, store=ResultStore(str(tmp_path / 'results')))
+    client = main.app.test_client()
+    try:
+        response = client.post('/scenarios', json={'add': [{'table': 'load', 'bus': 'D', 'p_mw': 30.0}],
+                                                   'out_of_service': [{'table': 'line', 'index': 2}]})
+        assert response.status_code == 201
+        scenario_id = response.get_json()['id']
+        assert client.get(f'/scenarios/{scenario_id}').get_json()['scenario']['add'][0]['bus'] == 3
+        assert client.post('/scenarios', json={'set': [{'table': 'line', 'index': 99, 'column': 'length_km',
+                                                        'value': 1.0}]}).status_code == 400
+        # A new load without p_mw, or with a column no load has, is rejected before it is stored
+        for row in ({'table': 'load', 'bus': 'D'}, {'table': 'load', 'bus': 'D', 'p_mw': 1.0, 'colour': 'red'},
+                    {'table': 'load', 'bus': 'D', 'p_mw': 'lots'}):
+            assert client.post('/scenarios', json={'add': [row]}).status_code == 400
+        assert store.stats()['scenarios'] == 1
+
+        base = queue.submit('power_flow', {}, model)
+        loaded = queue.submit('power_flow', {'scenario': scenario_id}, model)
+        # The same delta given inline, with the bus as a label, is the same study
+        inline = {'add': [{'table': 'load', 'bus': 3, 'p_mw': 30.0}], 'out_of_service': [{'table': 'line', 'index': 2}]}
+        assert queue.submit('power_flow', {'scenario': inline}, model) is loaded
+        assert loaded.id != base.id
+        for job in (base, loaded):
+            wait_for_job(queue, job)
+        base_result, loaded_result = json.loads(base.result), json.loads(loaded.result)
+        assert base_result['min_vm_pu'] == pytest.approx(1.0)
+        assert loaded_result['converged'] and loaded_result['min_vm_pu'] < 1.0
+        assert loaded_result['buses'][0]['name'] == 'D'
+        # The study ran on an overlay; the model's net never saw the scenario
+        assert model.transpower_net.load.empty and model.transpower_net.line['in_service'].all()
+    finally:
+        queue.shutdown()
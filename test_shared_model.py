@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from services.shared_model import SharedModelCache, SharedModelPublisher
+
+
+@pytest.fixture
+def publisher(model_cache):
+    publisher = SharedModelPublisher(f"test-model-{os.getpid()}", cache=model_cache)
+    yield publisher
+    publisher.close()
+
+
+def test_workers_attach_to_the_published_model(publisher):
+    worker = SharedModelCache(publisher.name)
+    assert worker.get() is None
+    assert publisher.refresh() and not publisher.refresh()
+
+    model = worker.get()
+    source = publisher.cache.get()
+    assert worker.get() is model and worker.stats()['generation'] == 1
+    assert model.fingerprint == source.fingerprint and model.map_data is None
+    for table in ('bus', 'line'):
+        assert model.transpower_net[table].equals(source.transpower_net[table])
+    assert model.transpower_bus_data.equals(source.transpower_bus_data)
+    # Shared columns are read-only views; studies work on their own copies
+    assert not model.transpower_net.line['length_km'].to_numpy().flags.writeable
+    with pytest.raises(ValueError):
+        model.transpower_net.line.loc[0, 'length_km'] = 2.0
+    assert len(model.integrated_net.bus) == 2 * len(source.transpower_net.bus)
+
+    import main
+    client = main.app.test_client()
+    main_cache, main.network_cache = main.network_cache, worker
+    try:
+        response = client.get('/network_data', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.get_data() == source.payload.encodings['gzip']
+        assert client.get('/network_data', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+        assert client.get('/topology').get_json()['islands'] == source.topology['transpower'].summary()['islands']
+    finally:
+        main.network_cache = main_cache
+
+
+def test_workers_swap_to_a_new_generation(publisher):
+    worker = SharedModelCache(publisher.name)
+    publisher.refresh()
+    first = worker.get()
+    publisher.cache.invalidate()
+    assert publisher.refresh() and publisher.generation == 2
+
+    second = worker.get()
+    assert second is not first and worker.generation == 2
+    # The first block is unlinked but stays mapped while its model is still in use
+    if sys.platform == 'linux':
+        assert not os.path.exists(f"/dev/shm/{publisher.name}-1")
+    assert first.transpower_net.bus['vn_kv'].sum() == second.transpower_net.bus['vn_kv'].sum()
+    assert bytes(first.payload.body) == bytes(second.payload.body)
+
+
+def test_worker_process_exit_leaves_the_model_published(publisher):
+    publisher.refresh()
+    code = ("from services.shared_model import SharedModelCache; "
+            f"model = SharedModelCache({publisher.name!r}).get(); print(len(model.transpower_net.bus))")
+    for _ in range(2):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        assert result.stdout.strip().splitlines()[-1] == '7'
+    assert np.isfinite(SharedModelCache(publisher.name).get().transpower_bus_data['x']).all()
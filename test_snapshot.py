@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from data_parsing.buses import create_site_buses
+from services.network_cache import NetworkCache, NetworkModel
+from services.snapshot import load_snapshot, save_snapshot
+
+
+def _small_net():
+    net = pp.create_empty_network(name='test')
+    sites = pd.DataFrame({'name': ['A', 'B', 'C'], 'x': [1748000.0, 1749000.0, 1750000.0],
+                          'y': [5920000.0, 5921000.0, 5922000.0], 'type': ['SUB', 'SUB', None]})
+    bus_data, _ = create_site_buses(net, sites, 'name', 'x', 'y', attributes={'type': sites['type']})
+    pp.create_lines_from_parameters(net, from_buses=[0, 1], to_buses=[1, 2], length_km=[1.0, 2.0],
+                                    r_ohm_per_km=0.1, x_ohm_per_km=0.1, c_nf_per_km=10, max_i_ka=1,
+                                    name=['A-B', 'B-C'])
+    return net, bus_data
+
+
+def test_snapshot_round_trip(tmp_path):
+    net, bus_data = _small_net()
+    fingerprint = (('Sites.csv', 'abc'),)
+    assert save_snapshot(fingerprint, {'transpower': (net, bus_data)}, str(tmp_path / 'snap'))
+
+    loaded_net, loaded_bus_data = load_snapshot(fingerprint, str(tmp_path / 'snap'))['transpower']
+    # equals() rather than assert_frame_equal: the numeric columns are np.memmap, not plain ndarrays
+    for table in ('bus', 'line'):
+        assert loaded_net[table].equals(net[table])
+        assert loaded_net[table].dtypes.equals(net[table].dtypes)
+    assert loaded_bus_data.equals(bus_data)
+    assert loaded_net.name == 'test'
+
+    # Memory-mapped columns are copy-on-write: editing the loaded net must work and leave the files alone
+    loaded_net.line.at[0, 'length_km'] = 5.0
+    reloaded_net, _ = load_snapshot(fingerprint, str(tmp_path / 'snap'))['transpower']
+    assert reloaded_net.line.at[0, 'length_km'] == 1.0
+
+    pp.create_ext_grid(loaded_net, bus=0)
+    pp.runpp(loaded_net)
+    assert np.isfinite(loaded_net.res_bus['vm_pu']).all()
+
+
+def test_snapshot_ignored_when_sources_change(tmp_path):
+    net, bus_data = _small_net()
+    save_snapshot((('Sites.csv', 'abc'),), {'transpower': (net, bus_data)}, str(tmp_path / 'snap'))
+    assert load_snapshot((('Sites.csv', 'def'),), str(tmp_path / 'snap')) is None
+    assert load_snapshot((('Sites.csv', 'abc'),), str(tmp_path / 'missing')) is None
+
+
+def test_cache_loads_snapshot_instead_of_rebuilding(tmp_path):
+    source = tmp_path / 'Sites.csv'
+    source.write_text('X,Y\n1,2\n')
+    net, bus_data = _small_net()
+    calls = []
+
+    def builder():
+        calls.append(1)
+        return NetworkModel(net, bus_data, net, bus_data, {})
+
+    snapshot_dir = str(tmp_path / 'snap')
+    first = NetworkCache(source_files=[str(source)], builder=builder, snapshot_dir=snapshot_dir)
+    first.get()
+    assert first.stats()['last_build_source'] == 'csv'
+
+    # A fresh cache (i.e. a restarted server) picks up the snapshot without calling the builder
+    second = NetworkCache(source_files=[str(source)], builder=builder, snapshot_dir=snapshot_dir)
+    model = second.get()
+    assert len(calls) == 1
+    assert second.stats()['last_build_source'] == 'snapshot'
+    assert list(model.transpower_bus_data['name']) == ['A', 'B', 'C']
+    assert model.spatial_index is not None
+
+    source.write_text('X,Y\n1,2\n3,4\n')
+    third = NetworkCache(source_files=[str(source)], builder=builder, snapshot_dir=snapshot_dir)
+    third.get()
+    assert len(calls) == 2
+    assert third.stats()['last_build_source'] == 'csv'
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from analysis.spatial_index import SITE_COLUMNS, SpatialIndex, to_json_columns
+
+
+def _index():
+    sites = pd.DataFrame({
+        'network': ['transpower', 'transpower', 'vector'],
+        'bus_idx': [0, 1, 0],
+        'name': ['AAA', 'BBB', 'CCC 33/11KV'],
+        'type': ['ACSTN', 'HVDC', 'Substation'],
+        'vn_kv': [220.0, 110.0, 33.0],
+        'x': [0.0, 1000.0, 5000.0],
+        'y': [0.0, 0.0, 0.0],
+        'lat': [-36.0, -36.1, -36.2],
+        'lon': [174.0, 174.1, 174.2],
+    })[SITE_COLUMNS]
+    return SpatialIndex(sites)
+
+
+def test_nearest_batch_and_filters():
+    index = _index()
+    rows, dist = index.nearest([100.0, 4900.0], [0.0, 0.0], k=2)
+    assert rows.shape == (2, 2)
+    assert list(index.sites['name'][rows[0]]) == ['AAA', 'BBB']
+    assert np.allclose(dist[1], [100.0, 3900.0])
+
+    rows, dist = index.nearest([4900.0], [0.0], k=1, networks=['transpower'], types=['ACSTN'])
+    assert index.sites['name'][rows[0, 0]] == 'AAA'
+
+    # Fewer matches than k pads with -1 / inf, which describe() turns into None
+    rows, dist = index.nearest([0.0], [0.0], k=3, vn_kv=33.0)
+    described = to_json_columns(index.describe(rows, dist))
+    assert described['name'] == [['CCC 33/11KV', None, None]]
+    assert described['distance_km'] == [[5.0, None, None]]
+
+
+def test_within_radius_sorted_by_distance():
+    index = _index()
+    (rows, dist), = index.within([900.0], [0.0], radius_m=1000.0)
+    assert list(index.sites['name'][rows]) == ['BBB', 'AAA']
+    assert np.allclose(dist, [100.0, 900.0])
+
+
+def test_invalid_query_points_get_no_neighbours():
+    index = _index()
+    rows, dist = index.nearest([np.nan, 0.0], [0.0, 0.0], k=1)
+    assert rows[0, 0] == -1 and np.isinf(dist[0, 0])
+    assert rows[1, 0] == 0
@@ -0,0 +1,50 @@
+import json
+import os
+
+import numpy as np
+import pandapower as pp
+import pandas as pd
+
+from data_parsing.adjacency import build_adjacency
+from data_parsing.transpower.transpower_data_parser import create_substation_files
+
+
+def _small_net():
+    net = pp.create_empty_network()
+    pp.create_buses(net, nr_buses=3, vn_kv=110.0, name=['AAA', 'BBB', 'CCC'])
+    pp.create_lines_from_parameters(net, from_buses=[0, 1, 2], to_buses=[1, 2, 0], length_km=1.0,
+                                    r_ohm_per_km=0.1, x_ohm_per_km=0.1, c_nf_per_km=10.0, max_i_ka=1.0,
+                                    name=['AAA-BBB-A', 'BBB-CCC-A', 'CCC-AAA-A'])
+    bus_data = pd.DataFrame({'bus_idx': [0, 1, 2], 'x': [1.0, 2.0, 3.0], 'y': [4.0, 5.0, 6.0],
+                             'lat': [-36.0, -37.0, -38.0], 'lon': [174.0, 175.0, 176.0]})
+    return net, bus_data
+
+
+def test_adjacency_matches_line_scan():
+    net, _ = _small_net()
+    adjacency = build_adjacency(net)
+    assert np.array_equal(adjacency.degree(), [2, 2, 2])
+    lines, others = adjacency.incident(1)
+    assert list(lines) == [0, 1]
+    assert list(others) == [0, 2]
+
+
+def test_export_is_incremental(tmp_path):
+    net, bus_data = _small_net()
+    out = str(tmp_path)
+
+    assert create_substation_files(net, bus_data, substation_dir=out) == {'written': 3, 'unchanged': 0, 'removed': 0}
+    with open(os.path.join(out, 'BBB.json')) as f:
+        record = json.load(f)
+    assert [line['connected_to'] for line in record['connected_lines']] == ['AAA', 'CCC']
+    assert record['coordinates']['wgs84'] == {'lat': -37.0, 'lon': 175.0}
+
+    assert create_substation_files(net, bus_data, substation_dir=out)['written'] == 0
+
+    net.line.loc[1, 'length_km'] = 2.0
+    assert create_substation_files(net, bus_data, substation_dir=out) == {'written': 2, 'unchanged': 1, 'removed': 0}
+
+    net.bus.loc[2, 'name'] = 'DDD'
+    summary = create_substation_files(net, bus_data, substation_dir=out)
+    assert summary['removed'] == 1
+    assert not os.path.exists(os.path.join(out, 'CCC.json'))
@@ -0,0 +1,64 @@
+import pytest
+
+from data_parsing.transpower.transpower_data_parser import build_substation_records
+from services.substation_store import SubstationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SubstationStore(str(tmp_path / 'substations.sqlite'))
+
+
+def test_store_matches_substation_files_and_reloads_per_build(store, model_cache):
+    cache = model_cache
+    model = cache.get()
+    assert store.sync(model) and not store.sync(model)
+    # Another process opening the same file sees it's already loaded
+    assert not SubstationStore(store.path).sync(model)
+
+    records = build_substation_records(model.transpower_net, model.transpower_bus_data)
+    for name, record in records.items():
+        stored = store.substation(name)
+        assert {key: stored[key] for key in record} == record
+    assert store.substation('nowhere') is None
+
+    old_name = model.transpower_net.bus.at[0, 'name']
+    model.fingerprint = (('Sites.csv', 'changed'),)
+    model.transpower_net.bus.loc[0, 'name'] = 'A2'
+    assert store.sync(model) and store.loads == 2
+    assert store.substation('A2')['connected_lines'] and store.substation(old_name) is None
+
+
+def test_store_queries(store, model_cache):
+    model = model_cache.get()
+    store.sync(model)
+    net = model.transpower_net
+    everything = store.query(network='transpower')
+    assert everything['name'] == list(net.bus['name'])
+
+    busy = store.query(network='transpower', min_connections=2)
+    connections = dict(zip(everything['name'], everything['connections']))
+    assert busy['name'] == [name for name, n in connections.items() if n >= 2]
+    assert store.query(network='transpower', name=net.bus['name'].iloc[0])['name'][0] == net.bus['name'].iloc[0]
+    assert store.query(site_type='SUB', min_kv=1000)['name'] == []
+    assert len(store.query(limit=3, offset=1)['name']) == 3
+
+    # bus_data puts every site at lat -36.8, lon 174.7
+    assert len(store.query(bbox=(174.6, -36.9, 174.8, -36.7))['name']) == 2 * len(net.bus)
+    assert store.query(bbox=(175.0, -37.5, 175.5, -37.0))['name'] == []
+
+
+def test_substation_endpoints(store, model_cache):
+    import main
+    client = main.app.test_client()
+    saved = main.network_cache, main.substation_store
+    main.network_cache, main.substation_store = model_cache, store
+    try:
+        name = main.network_cache.get().transpower_net.bus['name'].iloc[0]
+        assert client.get(f'/substation/{name}').get_json()['name'] == name
+        assert client.get('/substation/nowhere').status_code == 404
+        result = client.get('/substations?network=transpower&min_connections=1&bbox=174.6,-36.9,174.8,-36.7')
+        assert result.status_code == 200 and name in result.get_json()['name']
+        assert client.get('/substations?min_kv=high').status_code == 400
+    finally:
+        main.network_cache, main.substation_store = saved
@@ -0,0 +1,55 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from analysis.connection_study import Candidate, add_island_slacks
+from analysis.timeseries import read_profile, run_timeseries_study
+
+
+def test_hourly_solves_match_pandapower(tmp_path, ring_net):
+    net = ring_net
+    hours = 30
+    rng = np.random.default_rng(1)
+    profile = rng.uniform(0.0, 1.0, hours)
+    background = pd.DataFrame({'B': rng.uniform(10.0, 60.0, hours), 'C': rng.uniform(10.0, 60.0, hours)})
+    np.save(tmp_path / 'profile.npy', profile)
+    candidate = Candidate('wind', 120.0, q_mvar=10.0, kind='sgen', bus=3)
+
+    result = run_timeseries_study(net, candidate, read_profile(str(tmp_path / 'profile.npy')), load_p_mw=background,
+                                  max_workers=1, chunk_hours=7, output=str(tmp_path / 'result.npz'))
+    assert result.converged.all()
+    assert result.vm_pu.shape == (hours, 5) and result.loading_percent.shape == (hours, 4)
+
+    reference = copy.deepcopy(net)
+    add_island_slacks(reference)
+    loads = pp.create_loads(reference, buses=[1, 2], p_mw=0.0)
+    sgen = pp.create_sgen(reference, 3, p_mw=0.0)
+    for hour in range(hours):
+        reference.load.loc[loads, 'p_mw'] = background.iloc[hour].to_numpy()
+        reference.load.loc[loads, 'q_mvar'] = background.iloc[hour].to_numpy() * np.tan(np.arccos(0.95))
+        reference.sgen.loc[sgen, ['p_mw', 'q_mvar']] = [120.0 * profile[hour], 10.0 * profile[hour]]
+        pp.runpp(reference)
+        assert np.allclose(result.vm_pu[hour], reference.res_bus['vm_pu'], atol=1e-6, equal_nan=True)
+        assert np.allclose(result.loading_percent[hour], reference.res_line['loading_percent'], atol=1e-4)
+
+    peak_hour = int(np.argmax(result.loading_percent.max(axis=1)))
+    assert result.summary['peak_loading_hour'] == peak_hour
+    assert result.summary['peak_loading_percent'] == result.loading_percent.max()
+    assert (result.line_summary['hours_over_limit'] == (result.loading_percent > 100.0).sum(axis=0)).all()
+    # Isolated bus E has no voltage
+    assert np.isnan(result.bus_summary.at[4, 'max_vm_pu'])
+
+    with np.load(tmp_path / 'result.npz') as saved:
+        assert np.array_equal(saved['loading_percent'], result.loading_percent)
+        assert saved['vm_pu'].flags['F_CONTIGUOUS']
+
+
+def test_background_profiles_by_label_array(ring_net):
+    net = ring_net
+    candidate = Candidate('load', 0.0, bus=1)
+    result = run_timeseries_study(net, candidate, np.ones(4), load_p_mw=np.full((4, 1), 400.0), load_buses=[3],
+                                  max_workers=1, vm_limits=(0.99, 1.01))
+    assert result.summary['hours_with_voltage_excursion'] == 4
+    assert result.bus_summary.at[3, 'hours_under_voltage'] == 4
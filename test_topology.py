@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+from analysis.scenario import Scenario
+from analysis.topology import NetworkTopology, scenario_topology
+
+
+def _net():
+    # Triangle A-B-C, radial tail C-D-E, parallel pair E=F, separate island G-H, isolated I and an open A-D tie
+    net = pp.create_empty_network()
+    pp.create_buses(net, 9, vn_kv=110.0, name=list('ABCDEFGHI'))
+    ends = [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 5), (4, 5), (6, 7), (0, 3)]
+    pp.create_lines_from_parameters(net, from_buses=[a for a, _ in ends], to_buses=[b for _, b in ends],
+                                    length_km=[1, 1, 1, 1, 1, 1, 1, 1, 10], r_ohm_per_km=0.3, x_ohm_per_km=0.4,
+                                    c_nf_per_km=10.0, max_i_ka=1.0, name=[f'L{i}' for i in range(len(ends))],
+                                    in_service=[True] * 8 + [False])
+    return net
+
+
+def test_topology_summary():
+    topology = NetworkTopology(_net())
+    assert list(np.flatnonzero(topology.bridges)) == [3, 4, 7]
+    assert list(topology.bus_names[topology.articulation_points]) == ['C', 'D', 'E']
+    assert list(topology.bus_names[topology.meshed]) == ['A', 'B', 'C', 'E', 'F']
+    summary = topology.summary()
+    assert (summary['islands'], summary['isolated_buses'], summary['largest_island_buses']) == (2, 1, 6)
+    assert (summary['radial_lines'], summary['meshed_lines']) == (3, 5)
+    assert list(topology.islands()['buses']) == [6, 2, 1]
+
+
+def test_topology_paths_follow_switching():
+    topology = NetworkTopology(_net())
+    path = topology.path('A', 'F')
+    assert path['bus_names'] == ['A', 'C', 'D', 'E', 'F']
+    assert path['line_names'] == ['L2', 'L3', 'L4', 'L5']
+    assert np.isclose(path['impedance_ohm'], 4 * 0.5)
+    assert topology.path('A', 'G') is None
+
+    # Closing the tie meshes A-C-D: it is the shorter route by hops but not by impedance
+    topology.set_in_service([8], True)
+    assert topology.path('A', 'F')['bus_names'] == ['A', 'D', 'E', 'F']
+    assert topology.path('A', 'F', weight='impedance')['bus_names'] == ['A', 'C', 'D', 'E', 'F']
+    assert not topology.bridges[3]
+    assert list(topology.bus_names[topology.articulation_points]) == ['D', 'E']
+
+    topology.set_in_service([4], False)
+    assert topology.path('A', 'F') is None
+    assert topology.summary()['islands'] == 3
+
+
+def _same_partition(a, b):
+    return np.array_equal(pd.factorize(a)[0], pd.factorize(b)[0])
+
+
+def test_incremental_updates_match_a_rebuild():
+    rng = np.random.default_rng(7)
+    net = pp.create_empty_network()
+    n_bus, n_line = 40, 60
+    pp.create_buses(net, n_bus, vn_kv=33.0, name=[f'B{i}' for i in range(n_bus)])
+    from_bus = rng.integers(0, n_bus, n_line)
+    to_bus = (from_bus + rng.integers(1, 4, n_line)) % n_bus
+    pp.create_lines_from_parameters(net, from_buses=from_bus, to_buses=to_bus, length_km=rng.uniform(1, 5, n_line),
+                                    r_ohm_per_km=0.1, x_ohm_per_km=0.3, c_nf_per_km=10.0, max_i_ka=1.0,
+                                    name=[f'L{i}' for i in range(n_line)])
+    topology = NetworkTopology(net)
+    for line in rng.integers(0, n_line, 80):
+        in_service = not net.line.at[line, 'in_service']
+        net.line.at[line, 'in_service'] = in_service
+        topology.set_in_service([line], in_service)
+
+        rebuilt = NetworkTopology(net)
+        assert np.array_equal(topology.bridges, rebuilt.bridges)
+        assert np.array_equal(topology.articulation_points, rebuilt.articulation_points)
+        assert _same_partition(topology.component, rebuilt.component)
+        assert _same_partition(topology.section, rebuilt.section)
+        for source, target in rng.integers(0, n_bus, (3, 2)):
+            path = topology.path(int(source), int(target), 'impedance')
+            expected = rebuilt.path(int(source), int(target), 'impedance')
+            assert (path is None) == (expected is None)
+            if path is not None:
+                assert np.isclose(path['distance'], expected['distance'], rtol=1e-5)
+
+
+def test_scenario_topology_switches_a_copy():
+    net = _net()
+    base = NetworkTopology(net)
+    before = base.summary()
+    # Close the A-D tie and open C-D: the tail is still fed, now through the tie
+    scenario = Scenario().set('line', 8, 'in_service', True).switch_out('line', 3)
+    switched = scenario_topology(base, net, scenario)
+    assert base.summary() == before and base.path('A', 'D')['bus_names'] == ['A', 'C', 'D']
+    net.line.loc[8, 'in_service'], net.line.loc[3, 'in_service'] = True, False
+    rebuilt = NetworkTopology(net)
+    assert switched.summary() == rebuilt.summary()
+    assert switched.path('A', 'D')['bus_names'] == ['A', 'D']
+    # Adding a line changes the graph itself, so the topology is rebuilt from the scenario's net
+    added = Scenario().add('line', from_bus=5, to_bus=6, length_km=1.0, r_ohm_per_km=0.3, x_ohm_per_km=0.4,
+                           c_nf_per_km=10.0, max_i_ka=1.0)
+    assert scenario_topology(base, _net(), added).path('A', 'H') is not None
+
+
+def test_buses_out_of_service_isolate_their_lines():
+    net = _net()
+    base = NetworkTopology(net)
+    # Switching C out leaves A-B on its own and D-E-F as a separate island
+    isolated = scenario_topology(base, net, Scenario().switch_out('bus', 2))
+    assert isolated.path('A', 'D') is None and isolated.path('A', 'B') is not None
+    net.bus.loc[2, 'in_service'] = False
+    rebuilt = NetworkTopology(net)
+    assert isolated.summary() == rebuilt.summary() and rebuilt.path('D', 'F') is not None
+    # Switching it back in rebuilds from the scenario's net
+    restored = scenario_topology(rebuilt, net, Scenario().set('bus', 2, 'in_service', True))
+    assert restored.path('A', 'D') is not None
+
+
+def test_topology_endpoints(tmp_path, monkeypatch):
+    import main
+    from services.network_cache import NetworkCache, assemble_model
+
+    net = _net()
+    bus_data = pd.DataFrame({'bus_idx': net.bus.index, 'name': net.bus['name'], 'type': 'SUB', 'description': '',
+                             'x': 1748000.0 + 1000 * net.bus.index, 'y': 5920000.0, 'lat': -36.8, 'lon': 174.7})
+    source = tmp_path / 'Sites.csv'
+    source.write_text('X,Y\n1,2\n')
+    monkeypatch.setattr(main, 'network_cache', NetworkCache(source_files=[str(source)],
+                                                            builder=lambda: assemble_model(net, bus_data, net, bus_data)))
+    from services import jobs
+    from services.scenarios import SharedScenarioStore
+    store = SharedScenarioStore(str(tmp_path / 'scenarios.sqlite'))
+    monkeypatch.setattr(main, 'scenario_store', store)
+    monkeypatch.setattr(jobs, 'scenario_store', store)
+    client = main.app.test_client()
+
+    assert client.get('/topology?network=vector').get_json()['articulation_points'] == ['C', 'D', 'E']
+    path = client.get('/topology/path?from=A&to=F&weight=impedance').get_json()
+    assert path['bus_names'] == ['A', 'C', 'D', 'E', 'F']
+    assert client.get('/topology/path?from=A&to=G').status_code == 404
+    assert client.get('/topology/path?from=A&to=NOPE').status_code == 400
+
+    scenario_id = client.post('/scenarios', json={'out_of_service': [{'table': 'line', 'index': 3}]}).get_json()['id']
+    assert client.get(f'/topology/path?from=A&to=E&scenario={scenario_id}').status_code == 404
+    assert client.get(f'/topology?scenario={scenario_id}').get_json()['islands'] == 3
+    assert client.get('/topology/path?from=A&to=E').status_code == 200
+    assert client.get('/topology?scenario=nope').status_code == 400
@@ -0,0 +1,42 @@
+import pandapower as pp
+
+from data_parsing.vector.vector_lines import extract_substation_name, load_vector_lines
+
+LINES_CSV_TEXT = (
+    '﻿Feeder Name,OPVOLTAGE_,Shape__Length\n'
+    'BKBY H02 - MARA H06,11kV,2500\n'
+    'MARA H01 - CLEV H03,33kV,1200.5\n'
+    'BKBY H02,11kV,100\n'
+    'ZZZZ H01 - MARA H02,11kV,100\n'
+    'TTAK H01 - MARA H02,11kV,100\n'
+    'CLEV H01 - BKBY H02,11kV,\n'
+)
+
+
+def test_extract_substation_name():
+    assert extract_substation_name('BKBY H02 - MARA H06') == ('BROOKBY 33kV', 'MARAETAI 33/11kV')
+    assert extract_substation_name('BKBY H02') is None
+    assert extract_substation_name('ZZZZ H01 - MARA H02') is None
+
+
+def test_load_vector_lines_bulk(tmp_path, caplog):
+    path = tmp_path / 'lines.csv'
+    path.write_text(LINES_CSV_TEXT, encoding='utf-8')
+    net = pp.create_empty_network()
+    pp.create_buses(net, 3, vn_kv=110.0, name=['BROOKBY 33kV', 'MARAETAI 33/11kV', 'CLEVEDON 33/11kV'])
+
+    with caplog.at_level('WARNING'):
+        assert load_vector_lines(net, str(path)) is net
+
+    assert list(net.line['name']) == ['BKBY H02 - MARA H06', 'MARA H01 - CLEV H03']
+    assert list(net.line['from_bus']) == [0, 1]
+    assert list(net.line['to_bus']) == [1, 2]
+    assert list(net.line['length_km']) == [2.5, 1.2005]
+    assert list(net.line['voltage_kv']) == [11.0, 33.0]
+    # One summary per reason instead of one warning per feeder
+    warnings = sorted(r.getMessage() for r in caplog.records if r.levelname == 'WARNING')
+    assert len(warnings) == 4
+    assert any('invalid format' in w and 'BKBY H02' in w for w in warnings)
+    assert any('unknown substation code' in w and 'ZZZZ H01 - MARA H02' in w for w in warnings)
+    assert any('unknown bus' in w and 'TTAK H01 - MARA H02' in w for w in warnings)
+    assert any('invalid Shape__Length' in w for w in warnings)
@@ -0,0 +1,93 @@
+import json
+
+import pandas as pd
+import pandapower as pp
+
+import main
+from analysis.spatial_index import SpatialIndex
+from data_parsing.buses import create_site_buses
+from services.network_cache import NetworkCache, assemble_model
+from services.viewport import ViewportIndex, min_zoom_for_voltage
+
+# NZTM coordinates: three sites around Auckland, one in Wellington
+SITES = pd.DataFrame({
+    'name': ['AKL1', 'AKL2', 'AKL3', 'WLG'],
+    'x': [1757000.0, 1757500.0, 1758000.0, 1749000.0],
+    'y': [5920000.0, 5920500.0, 5921000.0, 5428000.0],
+    'type': ['SUB', 'SUB', 'SUB', 'SUB'],
+})
+
+
+def _networks(vn_kv=110.0):
+    net = pp.create_empty_network()
+    bus_data, _ = create_site_buses(net, SITES, 'name', 'x', 'y', attributes={'type': SITES['type']}, vn_kv=vn_kv)
+    pp.create_lines_from_parameters(net, from_buses=[0, 2], to_buses=[1, 3], length_km=1.0, r_ohm_per_km=0.1,
+                                    x_ohm_per_km=0.1, c_nf_per_km=10, max_i_ka=1, name=['AKL1-AKL2', 'AKL3-WLG'])
+    return [('transpower', net, bus_data)]
+
+
+def _viewport(vn_kv=110.0):
+    networks = _networks(vn_kv)
+    return ViewportIndex.from_networks(networks, SpatialIndex.from_networks(networks))
+
+
+AUCKLAND = (174.5, -37.2, 175.2, -36.6)
+
+
+def test_viewport_returns_only_features_in_bbox():
+    result = _viewport().query(AUCKLAND, 14)
+    network = result['transpower']
+    assert sorted(s['name'] for s in network['substations']) == ['AKL1', 'AKL2', 'AKL3']
+    assert network['clusters'] == []
+    # Both lines touch the box, including the one that runs on to Wellington
+    assert sorted(line['name'] for line in network['lines']) == ['AKL1-AKL2', 'AKL3-WLG']
+    assert len(network['lines'][0]['coords']) == 2
+
+    wellington = _viewport().query((174.6, -41.5, 175.0, -41.1), 14)['transpower']
+    assert [s['name'] for s in wellington['substations']] == ['WLG']
+
+
+def test_viewport_clusters_at_low_zoom():
+    network = _viewport().query((165.0, -48.0, 179.0, -34.0), 5)['transpower']
+    assert [s['name'] for s in network['substations']] == ['WLG']
+    assert len(network['clusters']) == 1
+    assert network['clusters'][0]['count'] == 3
+
+
+def test_low_voltage_layers_dropped_below_threshold():
+    assert list(min_zoom_for_voltage([220.0, 66.0, 33.0, 11.0])) == [0, 9, 10, 12]
+    viewport = _viewport(vn_kv=11.0)
+    assert viewport.query(AUCKLAND, 11)['transpower'] == {'substations': [], 'clusters': [], 'lines': []}
+
+
+def test_layers_follow_the_voltage_in_site_names(monkeypatch):
+    # Every bus is at the default 110 kV; a zone substation's name gives its real voltage
+    monkeypatch.setitem(SITES, 'name', ['AKL1 33/11KV', 'AKL2', 'AKL3', 'WLG'])
+    viewport = _viewport()
+    hidden = viewport.query(AUCKLAND, 9)['transpower']
+    assert sorted(s['name'] for s in hidden['substations']) == ['AKL2', 'AKL3']
+    assert [line['name'] for line in hidden['lines']] == ['AKL3-WLG']
+    shown = viewport.query(AUCKLAND, 10)['transpower']
+    assert len(shown['substations']) == 3 and len(shown['lines']) == 2
+    assert len(viewport.query(AUCKLAND, 12)['transpower']['substations']) == 3
+
+
+def test_network_data_bbox_endpoint(tmp_path, monkeypatch):
+    source = tmp_path / 'Sites.csv'
+    source.write_text('X,Y\n1,2\n')
+    networks = _networks()
+    _, net, bus_data = networks[0]
+    builder = lambda: assemble_model(net, bus_data, net, bus_data)
+    monkeypatch.setattr(main, 'network_cache', NetworkCache(source_files=[str(source)], builder=builder))
+    client = main.app.test_client()
+
+    response = client.get('/network_data?bbox=174.5,-37.2,175.2,-36.6&zoom=14&network=transpower')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert set(data) == {'bbox', 'zoom', 'clustered', 'transpower'}
+    assert len(data['transpower']['substations']) == 3
+    repeat = client.get('/network_data?bbox=174.5,-37.2,175.2,-36.6&zoom=14&network=transpower',
+                        headers={'If-None-Match': response.headers['ETag']})
+    assert repeat.status_code == 304
+
+    assert client.get('/network_data?bbox=1,2,3&zoom=4').status_code == 400